@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Motor de alertas clínicas con histéresis, deduplicación y escalado.
+
+Antes, mientras un paciente superaba un umbral se enviaba la alerta completa
+a todos los médicos cada 30 segundos (releyendo el archivo de roles en cada
+envío). Ahora:
+
+- cada regla tiene un umbral de entrada y otro de salida (histéresis): una
+  alerta se abre al cruzar el primero y solo se cierra al volver del segundo,
+  así un valor que oscila en el límite no abre y cierra alertas sin parar;
+- una alerta que se reabre dentro de la ventana de deduplicación no se
+  vuelve a notificar;
+- las notificaciones se agrupan en un resumen por destinatario cada
+  DIGEST_INTERVAL segundos (las críticas salen en el acto);
+- si nadie confirma una alerta con `/ack`, escala al siguiente nivel
+  (por defecto, del personal médico al administrador).
+
+Las comparaciones contra los umbrales son vectoriales sobre las columnas del
+motor de signos vitales; solo las filas que abren o cierran una alerta pasan
+por Python.
+"""
+import os
+import threading
+import time
+from collections import deque, namedtuple
+
+import numpy as np
+
+DEDUP_WINDOW = int(os.getenv("ALERT_DEDUP_WINDOW", "300"))
+DIGEST_INTERVAL = int(os.getenv("ALERT_DIGEST_INTERVAL", "60"))
+ESCALATE_AFTER = int(os.getenv("ALERT_ESCALATE_AFTER", "300"))
+# Segundos sin lecturas tras los que un monitor real se da por caído
+SENSOR_STALE_AFTER = int(os.getenv("TELEMETRY_STALE_SECONDS", "60"))
+
+# (segundos sin confirmar, rol destinatario)
+ESCALATION_TIERS = ((0, "medico"), (ESCALATE_AFTER, "admin"))
+
+Rule = namedtuple("Rule", "name field op enter exit label severity")
+
+_OPS = {">": np.greater, "<": np.less}
+_SEVERITY = {"media": 0, "alta": 1, "critica": 2}
+
+DEFAULT_RULES = (
+    Rule("taquicardia", "heart_rate", ">", 110, 105, "💓 Taquicardia: {:.0f} bpm", "alta"),
+    Rule("fiebre", "temperature", ">", 38.5, 38.0, "🌡️ Fiebre Alta: {}°C", "media"),
+    Rule("hipoxia", "spo2", "<", 92, 94, "🫁 Hipoxia: {:.0f}%", "alta"),
+    Rule("hipoxia_critica", "spo2", "<", 85, 88, "🫁 Hipoxia crítica: {:.0f}%", "critica"),
+    # Puntuación NEWS2 y su tendencia (columnas de early_warning.EarlyWarning)
+    Rule("news2_medio", "news2", ">", 4, 3, "🧮 NEWS2: {:.0f} (riesgo medio)", "alta"),
+    Rule("news2_alto", "news2", ">", 6, 4, "🧮 NEWS2: {:.0f} (riesgo alto)", "critica"),
+    Rule("deterioro", "news2_trend", ">", 4, 1, "📈 Deterioro: NEWS2 {:+.1f}/h", "media"),
+    # Camas con sensor real (columna de VitalsEngine.sensor_silence): sus valores ya no son actuales
+    Rule("monitor_sin_datos", "sensor_silence", ">", SENSOR_STALE_AFTER, SENSOR_STALE_AFTER / 2,
+         "📡 Monitor sin datos hace {:.0f} s", "alta"),
+)
+
+
+class Alert:
+    """Una alerta abierta (paciente + regla)."""
+
+    __slots__ = ("pid", "name", "rule", "value", "opened_at", "tier", "acked_by", "resolved_at", "notify")
+
+    def __init__(self, pid, name, rule, value, opened_at, notify):
+        self.pid = pid
+        self.name = name
+        self.rule = rule
+        self.value = value
+        self.opened_at = opened_at
+        self.tier = 0              # último nivel de escalado notificado
+        self.acked_by = None
+        self.resolved_at = None
+        self.notify = notify       # False si se reabrió dentro de la ventana de deduplicación
+
+    @property
+    def text(self):
+        return self.rule.label.format(self.value)
+
+
+class AlertEngine:
+    """Mantiene las alertas abiertas y genera los resúmenes para cada destinatario."""
+
+    def __init__(self, recipients, rules=DEFAULT_RULES, dedup_window=DEDUP_WINDOW,
+                 digest_interval=DIGEST_INTERVAL, tiers=ESCALATION_TIERS, clock=time.time):
+        self.recipients = recipients        # rol -> [chat_id]
+        self.rules = rules
+        self.dedup_window = dedup_window
+        self.digest_interval = digest_interval
+        self.tiers = tiers
+        self.clock = clock
+        self.active = {}                    # (pid, regla) -> Alert
+        self._active_rows = {}              # regla -> máscara de filas con la alerta abierta
+        self._last_notified = {}            # (pid, regla) -> instante de la última notificación
+        self._pending = {tier: [] for tier in range(len(tiers))}
+        # Alertas notificadas que esperan al siguiente nivel, en orden de apertura
+        self._waiting = {tier: deque() for tier in range(1, len(tiers))}
+        self._pruned = 0.0
+        self._resolved = []
+        self._last_digest = 0.0
+        self._lock = threading.Lock()
+        self.stats_counters = {"opened": 0, "resolved": 0, "deduped": 0, "escalated": 0, "digests": 0, "acked": 0}
+
+    # --- Evaluación ---
+
+    def observe(self, ids, columns, names=None, now=None):
+        """
+        Evalúa las reglas sobre las columnas de signos vitales (una fila por paciente).
+
+        `ids[i]` es el paciente de la fila i (las filas no se reordenan entre
+        llamadas) y `names(i)` su nombre para los mensajes. Las reglas sobre
+        columnas que no vienen en `columns` se omiten.
+        Devuelve (alertas abiertas, alertas resueltas) en esta evaluación.
+        """
+        now = self.clock() if now is None else now
+        opened, resolved = [], []
+        with self._lock:
+            n = len(ids)
+            for rule in self.rules:
+                values = columns.get(rule.field)
+                if values is None:
+                    continue
+                values = values[:n]
+                active = self._mask(rule.name, n)
+                op = _OPS[rule.op]
+                # Solo las transiciones vuelven a Python: entra al cruzar el umbral de
+                # entrada y sale al volver del de salida
+                entering = np.flatnonzero(op(values, rule.enter) & ~active)
+                leaving = np.flatnonzero(active & ~op(values, rule.exit))
+                active[entering] = True
+                active[leaving] = False
+
+                for row in entering.tolist():
+                    key = (ids[row], rule.name)
+                    recent = now - self._last_notified.get(key, -1e18) < self.dedup_window
+                    alert = Alert(ids[row], names(row) if names else ids[row], rule, values[row].item(), now,
+                                  notify=not recent)
+                    self.active[key] = alert
+                    opened.append(alert)
+                    self.stats_counters["opened"] += 1
+                    if recent:
+                        self.stats_counters["deduped"] += 1
+                    else:
+                        self._last_notified[key] = now
+                        self._pending[0].append(alert)
+                        if 1 in self._waiting:
+                            self._waiting[1].append(alert)
+
+                for row in leaving.tolist():
+                    alert = self.active.pop((ids[row], rule.name), None)
+                    if alert is None:
+                        continue
+                    alert.resolved_at = now
+                    resolved.append(alert)
+                    self.stats_counters["resolved"] += 1
+                    if alert.notify:
+                        self._resolved.append(alert)
+        return opened, resolved
+
+    def _mask(self, rule_name, n):
+        """Filas con la regla abierta (crece junto con el motor de signos vitales)."""
+        mask = self._active_rows.get(rule_name)
+        if mask is None or len(mask) < n:
+            grown = np.zeros(max(n, 64, 2 * len(mask) if mask is not None else 0), dtype=bool)
+            if mask is not None:
+                grown[:len(mask)] = mask
+            mask = self._active_rows[rule_name] = grown
+        return mask[:n]
+
+    def ack(self, pid=None, by=None):
+        """Confirma las alertas abiertas de un paciente (o todas). Devuelve cuántas se confirmaron."""
+        with self._lock:
+            count = 0
+            for (apid, _), alert in self.active.items():
+                if (pid is None or apid == pid) and alert.acked_by is None:
+                    alert.acked_by = by or "?"
+                    count += 1
+            self.stats_counters["acked"] += count
+            return count
+
+    # --- Notificación ---
+
+    def take_digests(self, now=None, force=False):
+        """[(chat_id, texto)] con los resúmenes pendientes; respeta DIGEST_INTERVAL salvo alertas críticas."""
+        now = self.clock() if now is None else now
+        with self._lock:
+            self._collect_escalations(now)
+            critical = any(a.rule.severity == "critica" for a in self._pending[0])
+            has_pending = any(self._pending.values()) or self._resolved
+            if not has_pending or not (force or critical or now - self._last_digest >= self.digest_interval):
+                return []
+            self._last_digest = now
+            messages = []
+            for tier, (delay, role) in enumerate(self.tiers):
+                alerts = [a for a in self._pending[tier] if a.resolved_at is None or tier == 0]
+                resolved = self._resolved if tier == 0 else []
+                self._pending[tier] = []
+                if not alerts and not resolved:
+                    continue
+                text = self._format(alerts, resolved, escalated=tier > 0, now=now)
+                for chat_id in self.recipients(role):
+                    messages.append((chat_id, text))
+            self._resolved = []
+            if now - self._pruned >= self.dedup_window:
+                # Olvidar notificaciones que ya quedaron fuera de la ventana de deduplicación
+                self._last_notified = {k: t for k, t in self._last_notified.items()
+                                       if now - t < self.dedup_window or k in self.active}
+                self._pruned = now
+            if messages:
+                self.stats_counters["digests"] += 1
+            return messages
+
+    def _collect_escalations(self, now):
+        for tier, waiting in self._waiting.items():
+            delay = self.tiers[tier][0]
+            while waiting and now - waiting[0].opened_at >= delay:
+                alert = waiting.popleft()
+                if alert.acked_by is not None or alert.resolved_at is not None:
+                    continue
+                alert.tier = tier
+                self._pending[tier].append(alert)
+                self.stats_counters["escalated"] += 1
+                if tier + 1 in self._waiting:
+                    self._waiting[tier + 1].append(alert)
+
+    def _format(self, alerts, resolved, escalated, now):
+        by_patient = {}
+        for alert in alerts:
+            by_patient.setdefault((alert.pid, alert.name), []).append(alert)
+        if escalated:
+            oldest = int((now - min(a.opened_at for a in alerts)) // 60)
+            text = f"⏫ *ALERTAS SIN CONFIRMAR* ({len(by_patient)} paciente(s), hace {oldest} min)\n"
+        else:
+            text = f"🚨 *ALERTA DE TELEMETRÍA* ({len(by_patient)} paciente(s))\n" if by_patient else "🩺 *Actualización de Telemetría*\n"
+        for (pid, name), items in by_patient.items():
+            # Con varias reglas sobre el mismo signo (hipoxia / hipoxia crítica) basta la más grave
+            worst = {}
+            for a in items:
+                if a.rule.field not in worst or _SEVERITY[a.rule.severity] > _SEVERITY[worst[a.rule.field].rule.severity]:
+                    worst[a.rule.field] = a
+            items = list(worst.values())
+            text += f"\n👤 *{name}* (`{pid}`)\n" + "\n".join(f"   {a.text}" for a in items) + "\n"
+        if resolved:
+            text += "\n✅ *Normalizadas:* " + ", ".join(f"{a.name} ({a.pid}) {a.rule.name}" for a in resolved) + "\n"
+        if by_patient:
+            text += "\n_Se requiere revisión médica. Confirma con `/ack [ID]` o `/ack todos`._"
+        return text
+
+    def stats(self):
+        with self._lock:
+            return dict(self.stats_counters, active=len(self.active),
+                        unacked=sum(1 for a in self.active.values() if a.acked_by is None))
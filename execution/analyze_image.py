@@ -6,7 +6,7 @@ import json
 
 # Intentar importar SDK de Google y Pillow
 try:
-    import google.generativeai as genai
+    import google.generativeai  # noqa: F401
     import PIL.Image
 except ImportError:
     print(json.dumps({"status": "error", "message": "Faltan librerías. Ejecuta: pip install google-generativeai pillow"}), file=sys.stderr)
@@ -15,11 +15,14 @@ except ImportError:
 from dotenv import load_dotenv
 load_dotenv()
 
-def main():
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from gemini_client import DEFAULT_MODEL, get_gemini  # noqa: E402
+
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Analizar una imagen usando Gemini Vision.")
     parser.add_argument("--image", required=True, help="Ruta local de la imagen.")
     parser.add_argument("--prompt", default="Describe esta imagen en detalle.", help="Instrucción para el modelo.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     api_key = os.getenv("GOOGLE_API_KEY")
     if not api_key:
@@ -31,10 +34,9 @@ def main():
         sys.exit(1)
 
     try:
-        genai.configure(api_key=api_key)
-        
-        # Usamos gemini-flash-latest que es el alias más estable y compatible
-        model = genai.GenerativeModel('gemini-flash-latest')
+        # Usamos gemini-flash-latest que es el alias más estable y compatible.
+        # El cliente compartido evita reconfigurar el SDK en cada análisis.
+        model = get_gemini().model(DEFAULT_MODEL)
         
         img = PIL.Image.open(args.image)
         
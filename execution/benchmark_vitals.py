@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Benchmark del motor de signos vitales: coste por tick con 10k y 100k pacientes.
+
+Compara el bucle original (un diccionario por paciente en Python puro) con
+`VitalsEngine` (columnas NumPy) más la puntuación NEWS2 de `EarlyWarning`
+y la evaluación de umbrales de `AlertEngine`. Todos los pacientes se actualizan en cada tick para medir el
+peor caso. Aparte se mide lo que cuesta guardar el tick en el histórico
+(`VitalsTSDB.append_many`) y repartir después por paciente lo acumulado en
+esos ticks (lo que hace `flush()` cada minuto).
+
+Uso: python execution/benchmark_vitals.py [--patients 10000 100000] [--ticks 10]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from alert_engine import AlertEngine  # noqa: E402
+from early_warning import EarlyWarning  # noqa: E402
+from vitals_engine import SIM_INTERVAL, VitalsEngine  # noqa: E402
+from vitals_tsdb import VitalsTSDB  # noqa: E402
+
+
+def make_patients(n):
+    rnd = random.Random(42)
+    return {
+        f"SIM-{i:06d}": {
+            "name": f"Paciente {i}",
+            "heart_rate": rnd.randint(60, 130),
+            "temperature": round(rnd.uniform(36.0, 39.5), 1),
+            "spo2": rnd.randint(88, 100),
+            "systolic": 120,
+            "diastolic": 80,
+            "last_update": 0,
+            "last_alert": 0,
+        }
+        for i in range(n)
+    }
+
+
+def legacy_tick(patients, now):
+    """Réplica del bucle original de simulate_and_monitor_vitals (sin E/S)."""
+    alerts = 0
+    for vitals in patients.values():
+        if now - vitals.get("last_update", 0) > SIM_INTERVAL:
+            vitals["heart_rate"] = vitals["heart_rate"] + (75 - vitals["heart_rate"]) * 0.1
+            vitals["temperature"] = vitals["temperature"] + (36.5 - vitals["temperature"]) * 0.1
+            vitals["spo2"] = vitals["spo2"] + (98 - vitals["spo2"]) * 0.2
+            vitals["heart_rate"] = int(vitals["heart_rate"] + random.randint(-2, 2))
+            vitals["temperature"] = round(vitals["temperature"] + random.uniform(-0.1, 0.1), 1)
+            vitals["spo2"] = int(vitals["spo2"] + random.randint(-1, 1))
+            vitals["systolic"] = int(vitals["systolic"] + random.randint(-2, 2))
+            vitals["diastolic"] = int(vitals["diastolic"] + random.randint(-2, 2))
+            vitals["heart_rate"] = max(40, min(180, vitals["heart_rate"]))
+            vitals["temperature"] = max(35.0, min(42.0, vitals["temperature"]))
+            vitals["spo2"] = max(80, min(100, vitals["spo2"]))
+            vitals["last_update"] = now
+        if now - vitals.get("last_alert", 0) > 30:
+            if vitals["heart_rate"] > 110 or vitals["temperature"] > 38.5 or vitals["spo2"] < 92:
+                vitals["last_alert"] = now
+                alerts += 1
+    return alerts
+
+
+def engine_tick(engine, scores, alerts, now):
+    """Tick del motor + NEWS2 + umbrales con histéresis, como en simulate_and_monitor_vitals."""
+    engine.tick(now)
+    columns = engine.columns()
+    scores.update(columns)
+    columns.update(scores.columns())
+    alerts.observe(engine.ids, columns, engine.name, now=now)
+    alerts.take_digests(now)
+
+
+def history_tick(engine, tsdb, now):
+    """Guarda en el histórico una lectura por paciente, como tras cada tick de la simulación."""
+    pids, values, _ = engine.snapshot(range(engine.size))
+    tsdb.append_many(pids, now, values)
+
+
+def measure(tick, ticks):
+    """Milisegundos por tick (mediana), avanzando el reloj lo suficiente para que todos se actualicen."""
+    samples = []
+    now = time.time()
+    for _ in range(ticks):
+        now += SIM_INTERVAL + 31
+        start = time.perf_counter()
+        tick(now)
+        samples.append((time.perf_counter() - start) * 1000)
+    samples.sort()
+    return round(samples[len(samples) // 2], 2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mide el coste por tick de la simulación de signos vitales.")
+    parser.add_argument("--patients", type=int, nargs="+", default=[10000, 100000])
+    parser.add_argument("--ticks", type=int, default=10)
+    parser.add_argument("--skip-legacy", action="store_true", help="No medir el bucle original (lento con 100k).")
+    args = parser.parse_args()
+
+    print("\n🩺 BENCHMARK DEL MOTOR DE SIGNOS VITALES")
+    print("========================================")
+    results = []
+    for n in args.patients:
+        patients = make_patients(n)
+        engine = VitalsEngine.from_patients(patients, seed=42)
+        scores, alerts = EarlyWarning(), AlertEngine(lambda role: [])
+        engine_ms = measure(lambda now: engine_tick(engine, scores, alerts, now), args.ticks)
+        with tempfile.TemporaryDirectory() as root:
+            tsdb = VitalsTSDB(root)
+            history_ms = measure(lambda now: history_tick(engine, tsdb, now), args.ticks)
+            start = time.perf_counter()
+            tsdb.flush(max_age=float("inf"))    # solo reparte las tandas; no escribe bloques
+            drain_ms = round((time.perf_counter() - start) * 1000, 2)
+        row = {"patients": n, "numpy_ms_per_tick": engine_ms,
+               "history_ms_per_tick": history_ms, "history_drain_ms": drain_ms}
+        if not args.skip_legacy:
+            legacy_ms = measure(lambda now: legacy_tick(patients, now), max(1, args.ticks // 5))
+            row["legacy_ms_per_tick"] = legacy_ms
+            row["speedup"] = round(legacy_ms / engine_ms, 1) if engine_ms else None
+        print(f"   {n:>7} pacientes: NumPy {engine_ms} ms/tick | histórico {history_ms} ms/tick"
+              f" + {drain_ms} ms al repartir {args.ticks} ticks" +
+              (f" | Python {row['legacy_ms_per_tick']} ms/tick (x{row['speedup']})" if "speedup" in row else ""))
+        results.append(row)
+
+    print(json.dumps({"status": "success", "results": results}))
+
+
+if __name__ == "__main__":
+    main()
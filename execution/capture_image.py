@@ -12,14 +12,14 @@ except ImportError:
     print(json.dumps({"status": "error", "message": "Librería 'requests' no encontrada. Instala: pip install requests"}), file=sys.stderr)
     sys.exit(1)
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Capturar una imagen desde un dispositivo ESP32-CAM.")
     parser.add_argument("--ip", required=True, help="Dirección IP de la cámara (ej. 192.168.1.100).")
     parser.add_argument("--output-file", required=True, help="Ruta donde guardar la imagen capturada.")
     parser.add_argument("--timeout", type=int, default=5, help="Tiempo de espera en segundos.")
     parser.add_argument("--retries", type=int, default=3, help="Número de reintentos.")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Construir URL (asumiendo endpoint estándar '/capture' común en ejemplos de Arduino/ESP32)
     # Si tu firmware usa otro endpoint (ej. /cam-hi.jpg), cámbialo aquí.
@@ -0,0 +1,255 @@
+#!/usr/bin/env python3
+"""
+Despachador asyncio de mensajes por chat.
+
+Cada chat tiene su propia cola FIFO (se respeta el orden de los mensajes de un
+mismo usuario), los chats distintos se procesan en paralelo y un semáforo
+global limita cuántos handlers se ejecutan a la vez. Los handlers son funciones
+bloqueantes y corren en un ejecutor de hilos.
+
+Opcionalmente los trabajos pasan por un `PriorityScheduler`: las alertas
+médicas y los recordatorios se atienden antes que el análisis de documentos y
+el chat general, y disponen de trabajadores reservados para que su latencia
+quede acotada aunque haya una cola larga de consultas al LLM.
+
+El objetivo de latencia de las alertas (ALERT_SLO_SECONDS) se mide con
+`DeliveryLatency` hasta que la cola de salida confirma el envío a Telegram,
+tanto en modo asíncrono como en el bucle clásico.
+"""
+import asyncio
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+# Prioridades (menor = más urgente)
+PRIORITY_ALERT = 0
+PRIORITY_REMINDER = 1
+PRIORITY_COMMAND = 2
+PRIORITY_DOCUMENT = 3
+PRIORITY_CHAT = 4
+
+PRIORITY_NAMES = {
+    PRIORITY_ALERT: "alert",
+    PRIORITY_REMINDER: "reminder",
+    PRIORITY_COMMAND: "command",
+    PRIORITY_DOCUMENT: "document",
+    PRIORITY_CHAT: "chat",
+}
+
+# Objetivo de latencia (aviso generado -> enviado a Telegram) para las alertas médicas
+ALERT_SLO_SECONDS = float(os.getenv("ALERT_SLO_SECONDS", "5"))
+
+
+def chat_key(msg):
+    """Extrae el CHAT_ID del formato "CHAT_ID|CONTENIDO" que devuelve telegram_tool."""
+    return msg.split("|", 1)[0] if "|" in msg else ""
+
+
+def classify_message(msg):
+    """Prioridad de un mensaje entrante: comandos antes que documentos y chat libre."""
+    content = msg.split("|", 1)[1] if "|" in msg else msg
+    if content.startswith("__DOCUMENT__:") or content.startswith("__PHOTO__:"):
+        return PRIORITY_DOCUMENT
+    if content.startswith("/"):
+        return PRIORITY_COMMAND
+    return PRIORITY_CHAT
+
+
+def _percentile(values, pct):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(pct / 100 * (len(ordered) - 1))))]
+
+
+class DeliveryLatency:
+    """Latencia de los avisos proactivos hasta su envío real, por prioridad, y violaciones del SLO de alertas."""
+
+    def __init__(self, slo_seconds=ALERT_SLO_SECONDS, samples=500):
+        self.slo_seconds = slo_seconds
+        self.latencies = {name: deque(maxlen=samples) for name in PRIORITY_NAMES.values()}
+        self.slo_violations = 0
+        self._lock = threading.Lock()
+
+    def record(self, priority, latency):
+        """Se llama al confirmarse el envío (p. ej. desde el on_sent de la cola de salida)."""
+        with self._lock:
+            self.latencies[PRIORITY_NAMES.get(priority, "chat")].append(latency)
+            violated = priority == PRIORITY_ALERT and latency > self.slo_seconds
+            if violated:
+                self.slo_violations += 1
+        if violated:
+            print(f"   ⏱️  [SLO] Alerta entregada en {latency:.1f}s (objetivo {self.slo_seconds:.0f}s).")
+
+    def stats(self):
+        with self._lock:
+            alert = list(self.latencies["alert"])
+            violations = self.slo_violations
+        return {
+            "alert_latency_p50_s": round(_percentile(alert, 50), 2),
+            "alert_latency_p95_s": round(_percentile(alert, 95), 2),
+            "alert_latency_max_s": round(max(alert), 2) if alert else 0.0,
+            "alert_slo_s": self.slo_seconds,
+            "alert_slo_violations": violations,
+        }
+
+
+class PriorityScheduler:
+    """Cola de trabajo con prioridad y trabajadores reservados para lo urgente."""
+
+    def __init__(self, workers=4, reserved=1, executor=None, urgent_max=PRIORITY_REMINDER, samples=500):
+        self.workers = workers
+        self.reserved = reserved
+        self.executor = executor
+        self.urgent_max = urgent_max
+        self._heap = []
+        self._seq = itertools.count()
+        self._cond = None
+        self._tasks = []
+        self._loop = None
+        # Encolado -> trabajo terminado (para un aviso, hasta que queda en la cola de salida)
+        self.latencies = {name: deque(maxlen=samples) for name in PRIORITY_NAMES.values()}
+
+    def start(self):
+        """Arranca los trabajadores (debe llamarse dentro del event loop)."""
+        self._loop = asyncio.get_running_loop()
+        self._cond = asyncio.Condition()
+        for _ in range(self.workers):
+            self._tasks.append(asyncio.create_task(self._worker(PRIORITY_CHAT)))
+        # Los reservados solo aceptan alertas y recordatorios: siempre hay alguien libre para ellos
+        for _ in range(self.reserved):
+            self._tasks.append(asyncio.create_task(self._worker(self.urgent_max)))
+        return self
+
+    def submit(self, priority, fn, *args):
+        """Encola fn(*args) y devuelve un Future con su resultado (llamar desde el event loop)."""
+        future = self._loop.create_future()
+        heapq.heappush(self._heap, (priority, next(self._seq), time.time(), fn, args, future))
+        self._loop.create_task(self._notify())
+        return future
+
+    def submit_threadsafe(self, priority, fn, *args):
+        """Igual que submit() pero invocable desde hilos del ejecutor (tareas de fondo)."""
+        self._loop.call_soon_threadsafe(self.submit, priority, fn, *args)
+
+    async def _notify(self):
+        async with self._cond:
+            self._cond.notify_all()
+
+    async def _worker(self, max_priority):
+        while True:
+            async with self._cond:
+                # El heap está ordenado por prioridad: si el primero no es aceptable, ninguno lo es
+                await self._cond.wait_for(lambda: self._heap and self._heap[0][0] <= max_priority)
+                priority, _, enqueued_at, fn, args, future = heapq.heappop(self._heap)
+            if future.cancelled():
+                continue
+            try:
+                result = await self._loop.run_in_executor(self.executor, fn, *args)
+                if not future.done():
+                    future.set_result(result)
+            except Exception as e:
+                if not future.done():
+                    future.set_exception(e)
+            finally:
+                self.latencies[PRIORITY_NAMES.get(priority, "chat")].append(time.time() - enqueued_at)
+
+    def queue_depth(self):
+        depth = {name: 0 for name in PRIORITY_NAMES.values()}
+        for item in self._heap:
+            depth[PRIORITY_NAMES.get(item[0], "chat")] += 1
+        return depth
+
+    def stats(self):
+        alert = list(self.latencies["alert"])
+        return {
+            "queue_depth": self.queue_depth(),
+            "alert_dispatch_p95_s": round(_percentile(alert, 95), 2),
+            "alert_dispatch_max_s": round(max(alert), 2) if alert else 0.0,
+        }
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+
+class ChatDispatcher:
+    """Colas ordenadas por chat con un límite global de concurrencia."""
+
+    def __init__(self, handler, max_concurrency=8, executor=None, key=chat_key,
+                 scheduler=None, classify=classify_message):
+        self.handler = handler
+        self.executor = executor
+        self.key = key
+        self.scheduler = scheduler
+        self.classify = classify
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._queues = {}
+        self._workers = {}
+        self.in_flight = 0
+        self.processed = 0
+        self.max_wait = 0.0
+
+    def submit(self, item):
+        """Encola un mensaje en la cola de su chat (debe llamarse desde el event loop)."""
+        chat_id = self.key(item)
+        queue = self._queues.get(chat_id)
+        if queue is None:
+            queue = self._queues[chat_id] = asyncio.Queue()
+        queue.put_nowait((time.time(), item))
+        if chat_id not in self._workers:
+            self._workers[chat_id] = asyncio.create_task(self._chat_worker(chat_id))
+
+    async def _chat_worker(self, chat_id):
+        loop = asyncio.get_running_loop()
+        queue = self._queues[chat_id]
+        try:
+            while not queue.empty():
+                enqueued_at, item = queue.get_nowait()
+                if self.scheduler is not None:
+                    # El orden por chat se mantiene porque esperamos a que termine antes del siguiente
+                    self.in_flight += 1
+                    try:
+                        await self.scheduler.submit(self.classify(item), self.handler, item)
+                    except Exception as e:
+                        print(f"❌ Error en handler del chat {chat_id}: {e}")
+                    finally:
+                        self.in_flight -= 1
+                        self.processed += 1
+                    continue
+                async with self._semaphore:
+                    self.max_wait = max(self.max_wait, time.time() - enqueued_at)
+                    self.in_flight += 1
+                    try:
+                        await loop.run_in_executor(self.executor, self.handler, item)
+                    except Exception as e:
+                        print(f"❌ Error en handler del chat {chat_id}: {e}")
+                    finally:
+                        self.in_flight -= 1
+                        self.processed += 1
+        finally:
+            # Sin awaits entre la comprobación de cola vacía y el borrado: no se pierden mensajes
+            self._workers.pop(chat_id, None)
+            self._queues.pop(chat_id, None)
+
+    def pending(self):
+        return sum(q.qsize() for q in self._queues.values())
+
+    def stats(self):
+        return {
+            "active_chats": len(self._workers),
+            "pending": self.pending(),
+            "in_flight": self.in_flight,
+            "processed": self.processed,
+            "max_wait_s": round(self.max_wait, 2),
+        }
+
+    async def drain(self, timeout=None):
+        """Espera a que terminen las colas activas (útil al apagar)."""
+        workers = list(self._workers.values())
+        if workers:
+            await asyncio.wait(workers, timeout=timeout)
@@ -0,0 +1,201 @@
+#!/usr/bin/env python3
+"""
+Historial de conversación con el LLM, separado por chat.
+
+Antes había un único `.tmp/chat_history.json` para todos los usuarios de
+Telegram: se leía entero, se truncaba a 10 mensajes y se reescribía en cada
+llamada, así que el contexto de un paciente se filtraba a la conversación de
+otro y el archivo era un punto de contención con varios chats a la vez.
+
+Ahora cada chat tiene su propio archivo `.tmp/chat_history/<chat_id>.jsonl`
+de solo-añadir (un mensaje JSON por línea). Las conversaciones activas se
+mantienen en memoria en un LRU de `HISTORY_CACHE_SIZE` chats con los últimos
+`HISTORY_LIMIT` mensajes; al expulsar un chat basta con releer la cola de su
+archivo la próxima vez. Cuando un archivo acumula muchas líneas se compacta
+reescribiendo solo los mensajes que siguen en la ventana.
+
+Los mensajes que salen de la ventana se entregan a `on_evict` (si está
+definido) para condensarlos en un resumen por chat, que se guarda junto al
+historial en `<chat_id>.summary.json` (ver `context_builder.py`). Cada
+`clear` avanza la generación del chat, y un resumen calculado para una
+generación anterior ya no se guarda.
+
+Las llamadas sin chat (CLI, scripts) usan el chat `local`. El historial
+global antiguo se importa una vez en ese chat y se conserva como `.bak`.
+"""
+import json
+import os
+import re
+import threading
+from collections import OrderedDict, deque
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HISTORY_DIR = os.getenv("CHAT_HISTORY_DIR", os.path.join(BASE_DIR, ".tmp", "chat_history"))
+LEGACY_FILE = os.path.join(BASE_DIR, ".tmp", "chat_history.json")
+
+# Mensajes candidatos a contexto por chat; cuántos se envían lo decide el presupuesto de tokens
+HISTORY_LIMIT = int(os.getenv("HISTORY_LIMIT", "20"))
+HISTORY_CACHE_SIZE = int(os.getenv("HISTORY_CACHE_SIZE", "256"))
+# Líneas a partir de las cuales se compacta el archivo de un chat
+COMPACT_LINES = 200
+
+DEFAULT_CHAT = "local"
+
+
+def _shard_name(chat_id):
+    # Los IDs de Telegram son enteros (negativos en grupos); por si acaso, nada de rutas
+    return re.sub(r"[^0-9A-Za-z_-]", "_", str(chat_id))
+
+
+class ChatHistory:
+    """Historiales por chat: LRU en memoria sobre archivos de solo-añadir."""
+
+    def __init__(self, root=HISTORY_DIR, limit=HISTORY_LIMIT, capacity=HISTORY_CACHE_SIZE,
+                 legacy_file=LEGACY_FILE):
+        self.root = root
+        self.limit = limit
+        self.capacity = capacity
+        self._cache = OrderedDict()     # chat_id -> [deque de mensajes, líneas en el archivo, resumen]
+        self._locks = {}
+        self._generations = {}          # chat_id -> veces que se ha borrado
+        self.on_evict = None            # on_evict(chat_id, mensajes que salen de la ventana, generación)
+        self._lock = threading.Lock()
+        os.makedirs(root, exist_ok=True)
+        self._import_legacy(legacy_file)
+
+    def _path(self, chat_id, suffix=".jsonl"):
+        return os.path.join(self.root, _shard_name(chat_id) + suffix)
+
+    def _chat_lock(self, chat_id):
+        with self._lock:
+            lock = self._locks.get(chat_id)
+            if lock is None:
+                lock = self._locks[chat_id] = threading.Lock()
+            return lock
+
+    def _entry(self, chat_id):
+        """Entrada del LRU (la carga desde disco si no estaba). Llamar con el lock del chat."""
+        with self._lock:
+            entry = self._cache.get(chat_id)
+            if entry is not None:
+                self._cache.move_to_end(chat_id)
+                return entry
+        messages, lines = deque(maxlen=self.limit), 0
+        try:
+            with open(self._path(chat_id), "r", encoding="utf-8") as f:
+                for line in f:
+                    lines += 1
+                    try:
+                        messages.append(json.loads(line))
+                    except ValueError:
+                        continue    # línea a medio escribir tras un corte
+        except FileNotFoundError:
+            pass
+        try:
+            with open(self._path(chat_id, ".summary.json"), "r", encoding="utf-8") as f:
+                summary = json.load(f).get("summary")
+        except (OSError, ValueError, AttributeError):
+            summary = None
+        entry = [messages, lines, summary]
+        with self._lock:
+            self._cache[chat_id] = entry
+            while len(self._cache) > self.capacity:
+                self._cache.popitem(last=False)
+        return entry
+
+    def get(self, chat_id=DEFAULT_CHAT):
+        """Últimos mensajes del chat (copias, en orden)."""
+        chat_id = str(chat_id)
+        with self._chat_lock(chat_id):
+            return [dict(m) for m in self._entry(chat_id)[0]]
+
+    def append(self, chat_id, *messages):
+        """Añade mensajes ({"role", "content"}) al chat, en memoria y al final de su archivo."""
+        chat_id = str(chat_id)
+        with self._chat_lock(chat_id):
+            entry = self._entry(chat_id)
+            overflow = len(entry[0]) + len(messages) - self.limit
+            evicted = (list(entry[0]) + list(messages))[:overflow] if overflow > 0 else []
+            entry[0].extend(messages)
+            with open(self._path(chat_id), "a", encoding="utf-8") as f:
+                f.write("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in messages))
+            entry[1] += len(messages)
+            if entry[1] >= COMPACT_LINES:
+                self._compact(chat_id, entry)
+            generation = self._generations.get(chat_id, 0)
+        if evicted and self.on_evict is not None:
+            self.on_evict(chat_id, evicted, generation)
+
+    def _compact(self, chat_id, entry):
+        path = self._path(chat_id)
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write("".join(json.dumps(m, ensure_ascii=False) + "\n" for m in entry[0]))
+        os.replace(tmp, path)
+        entry[1] = len(entry[0])
+
+    def get_summary(self, chat_id=DEFAULT_CHAT):
+        """Resumen de lo que ya salió de la ventana (None si no hay)."""
+        chat_id = str(chat_id)
+        with self._chat_lock(chat_id):
+            return self._entry(chat_id)[2]
+
+    def generation(self, chat_id=DEFAULT_CHAT):
+        """Contador que avanza con cada `clear` del chat."""
+        with self._chat_lock(str(chat_id)):
+            return self._generations.get(str(chat_id), 0)
+
+    def set_summary(self, chat_id, summary, generation=None):
+        """Guarda el resumen; si se indica `generation` y el chat se borró desde entonces, lo descarta."""
+        chat_id = str(chat_id)
+        with self._chat_lock(chat_id):
+            if generation is not None and generation != self._generations.get(chat_id, 0):
+                return False
+            self._entry(chat_id)[2] = summary
+            path = self._path(chat_id, ".summary.json")
+            with open(path + ".tmp", "w", encoding="utf-8") as f:
+                json.dump({"summary": summary}, f, ensure_ascii=False)
+            os.replace(path + ".tmp", path)
+        return True
+
+    def clear(self, chat_id=DEFAULT_CHAT):
+        """Borra el historial (y el resumen) de un solo chat."""
+        chat_id = str(chat_id)
+        with self._chat_lock(chat_id):
+            self._generations[chat_id] = self._generations.get(chat_id, 0) + 1
+            with self._lock:
+                self._cache.pop(chat_id, None)
+            for suffix in (".jsonl", ".summary.json"):
+                try:
+                    os.remove(self._path(chat_id, suffix))
+                except FileNotFoundError:
+                    pass
+
+    def _import_legacy(self, legacy_file):
+        if not legacy_file or not os.path.exists(legacy_file):
+            return
+        try:
+            with open(legacy_file, "r", encoding="utf-8") as f:
+                history = json.load(f)
+        except (OSError, ValueError):
+            history = []
+        if isinstance(history, list) and history:
+            self.append(DEFAULT_CHAT, *history[-self.limit:])
+        os.replace(legacy_file, legacy_file + ".bak")
+
+    def stats(self):
+        with self._lock:
+            return {"cached_chats": len(self._cache), "limit": self.limit}
+
+
+_history = None
+_history_lock = threading.Lock()
+
+
+def get_history():
+    """Historial compartido por todo el proceso."""
+    global _history
+    with _history_lock:
+        if _history is None:
+            _history = ChatHistory()
+        return _history
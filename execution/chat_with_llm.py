@@ -3,30 +3,19 @@ import os
 import sys
 import json
 import argparse
-import requests
+import threading
+import time
 import warnings
 
 # Suppress warnings to ensure clean JSON output
 warnings.filterwarnings("ignore")
 
-# Intentar importar SDK de Google
-try:
-    import google.generativeai as genai
-except ImportError:
-    genai = None
-
 # Intentar importar ChromaDB para memoria a largo plazo
 try:
     import chromadb
 except ImportError:
     chromadb = None
 
-# Intentar importar Pillow para manejo de imágenes
-try:
-    from PIL import Image
-except ImportError:
-    Image = None
-
 # Intentar cargar variables de entorno si python-dotenv está instalado
 try:
     from dotenv import load_dotenv, find_dotenv
@@ -34,23 +23,17 @@ try:
 except ImportError:
     pass
 
-HISTORY_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tmp", "chat_history.json")
-
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from chat_history import DEFAULT_CHAT, get_history  # noqa: E402
+from context_builder import RollingSummarizer, budget_for, build_context  # noqa: E402
+from gemini_client import get_gemini  # noqa: E402
+from llm_clients import (SSE_DONE, STREAM_DELTAS, async_available, build_request, check_stream_event,  # noqa: E402
+                         gemini_models, gemini_request, gemini_usage, get_async_llm, get_prompt_cache_stats,
+                         http_session, parse_response, parse_sse_line, record_usage)
+from llm_hedging import Cancelled, get_runner  # noqa: E402
+from provider_health import get_health  # noqa: E402
+from response_cache import get_cache, scope_key  # noqa: E402
 
-def load_history():
-    if os.path.exists(HISTORY_FILE):
-        try:
-            with open(HISTORY_FILE, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        except Exception:
-            return []
-    return []
-
-
-def save_history(history):
-    os.makedirs(os.path.dirname(HISTORY_FILE), exist_ok=True)
-    with open(HISTORY_FILE, 'w', encoding='utf-8') as f:
-        json.dump(history, f, indent=2, ensure_ascii=False)
 
 def get_memory_context(query):
     """Busca contexto relevante en la memoria vectorial (ChromaDB)."""
@@ -93,159 +76,102 @@ def get_memory_context(query):
         print(f"❌ [RAG] Error al consultar memoria: {e}", file=sys.stderr)
     return None
 
-def chat_openai(messages, model="gpt-4o-mini", system_instruction=None):
-    api_key = os.getenv("OPENAI_API_KEY")
-    if not api_key:
-        return {"error": "Falta OPENAI_API_KEY en .env"}
-
-    sys_msg = system_instruction or "Eres un asistente de IA útil actuando como la capa de Orquestación en una arquitectura de 3 capas."
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": sys_msg}
-        ] + messages,
-        "temperature": 0.7
-    }
+def _iter_sse(resp):
+    """Itera los eventos `data:` de una respuesta Server-Sent Events como diccionarios."""
+    resp.encoding = "utf-8"
+    for line in resp.iter_lines(decode_unicode=True):
+        event = parse_sse_line(line)
+        if event is SSE_DONE:
+            break
+        if event is not None:
+            yield event
 
-    try:
-        resp = requests.post("https://api.openai.com/v1/chat/completions", headers=headers, json=data, timeout=30)
-        resp.raise_for_status()
-        result = resp.json()
-        return {"content": result['choices'][0]['message']['content']}
-    except Exception as e:
-        return {"error": str(e)}
 
+def _stream_text(events, extract, on_partial, observe=None):
+    """Acumula los fragmentos de texto de un stream y llama a on_partial con el texto acumulado."""
+    text = ""
+    for event in events:
+        check_stream_event(event)
+        if observe is not None:
+            observe(event)
+        piece = extract(event)
+        if piece:
+            text += piece
+            on_partial(text)
+    return text
 
-def chat_anthropic(messages, model="claude-3-5-sonnet-20240620", system_instruction=None):
-    api_key = os.getenv("ANTHROPIC_API_KEY")
-    if not api_key:
-        return {"error": "Falta ANTHROPIC_API_KEY en .env"}
-
-    headers = {
-        "x-api-key": api_key,
-        "anthropic-version": "2023-06-01",
-        "content-type": "application/json"
-    }
-    sys_msg = system_instruction or "Eres un asistente de IA útil actuando como la capa de Orquestación en una arquitectura de 3 capas."
-    data = {
-        "model": model,
-        "max_tokens": 1024,
-        "messages": messages,
-        "system": sys_msg
-    }
 
-    try:
-        resp = requests.post("https://api.anthropic.com/v1/messages", headers=headers, json=data, timeout=30)
-        resp.raise_for_status()
-        result = resp.json()
-        return {"content": result['content'][0]['text']}
-    except Exception as e:
-        return {"error": str(e)}
+PROVIDER_NAMES = {"openai": "OpenAI", "anthropic": "Anthropic", "groq": "Groq"}
 
-def chat_groq(messages, model="llama-3.3-70b-versatile", system_instruction=None):
-    api_key = os.getenv("GROQ_API_KEY")
-    if not api_key:
-        return {"error": "Falta GROQ_API_KEY en .env"}
 
-    headers = {
-        "Authorization": f"Bearer {api_key}",
-        "Content-Type": "application/json"
-    }
-    
-    # Sanitizar mensajes para evitar errores de formato (ej. campos extra o nulos)
-    clean_messages = []
-    for m in messages:
-        clean_messages.append({
-            "role": m.get("role", "user"),
-            "content": str(m.get("content", ""))
-        })
-
-    sys_msg = system_instruction or "Eres un asistente de IA útil (Llama 3 en Groq) actuando como la capa de Orquestación. Si en el historial ves que te llamaste 'Gemini', ignóralo; ahora eres Llama 3."
-    # Groq usa un endpoint compatible con OpenAI
-    data = {
-        "model": model,
-        "messages": [
-            {"role": "system", "content": sys_msg}
-        ] + clean_messages,
-        "temperature": 0.7
-    }
+def _chat_http(provider, messages, model, system_instruction, on_partial, system_extra=None):
+    """Llamada síncrona a OpenAI, Anthropic o Groq por la sesión compartida (conexiones reutilizadas)."""
+    try:
+        url, headers, data = build_request(provider, messages, model, system_instruction, stream=bool(on_partial),
+                                           system_extra=system_extra)
+    except ValueError as e:
+        return {"error": str(e)}
 
     try:
-        resp = requests.post("https://api.groq.com/openai/v1/chat/completions", headers=headers, json=data, timeout=30)
-        
+        resp = http_session().post(url, headers=headers, json=data, timeout=30, stream=bool(on_partial))
         if not resp.ok:
-            return {"error": f"Groq API Error ({resp.status_code}): {resp.text}"}
-            
+            return {"error": f"{PROVIDER_NAMES[provider]} API Error ({resp.status_code}): {resp.text}"}
+        if on_partial:
+            return {"content": _stream_text(_iter_sse(resp), STREAM_DELTAS[provider], on_partial,
+                                            observe=lambda event: record_usage(provider, event))}
         result = resp.json()
-        return {"content": result['choices'][0]['message']['content']}
+        record_usage(provider, result)
+        return {"content": parse_response(provider, result)}
     except Exception as e:
         return {"error": str(e)}
 
-def chat_gemini(messages, model="gemini-flash-latest", system_instruction=None, image_path=None):
-    if not genai:
-        return {"error": "Librería 'google-generativeai' no instalada. Ejecuta: pip install -r requirements.txt"}
 
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if not api_key:
-        return {"error": "Falta GOOGLE_API_KEY en .env"}
+def chat_openai(messages, model="gpt-4o-mini", system_instruction=None, on_partial=None, system_extra=None):
+    return _chat_http("openai", messages, model, system_instruction, on_partial, system_extra)
 
-    try:
-        genai.configure(api_key=api_key)
-
-        # Preparar historial y system instruction
-        sys_msg = system_instruction or "Eres Gemini, un modelo de IA de Google, actuando como la capa de Orquestación en una arquitectura de 3 capas. Identifícate siempre como Gemini/Google si te preguntan."
-        history = []
 
-        for msg in messages:
-            if msg["role"] == "system":
-                system_instruction = msg["content"]
-            elif msg["role"] == "user":
-                history.append({"role": "user", "parts": [msg["content"]]})
-            elif msg["role"] == "assistant":
-                history.append({"role": "model", "parts": [msg["content"]]})
+def chat_anthropic(messages, model="claude-3-5-sonnet-20240620", system_instruction=None, on_partial=None, system_extra=None):
+    return _chat_http("anthropic", messages, model, system_instruction, on_partial, system_extra)
 
-        # Extraer el último mensaje del usuario para enviarlo (el SDK maneja el historial aparte)
-        if not history or history[-1]["role"] != "user":
-            return {"error": "El historial debe terminar con un mensaje del usuario."}
 
-        last_message = history.pop()
+def chat_groq(messages, model="llama-3.3-70b-versatile", system_instruction=None, on_partial=None, system_extra=None):
+    return _chat_http("groq", messages, model, system_instruction, on_partial, system_extra)
 
-        # Preparar contenido (Texto + Imagen si existe)
-        content_to_send = last_message["parts"] # Lista actual con el texto
 
-        if image_path:
-            if not Image:
-                return {"error": "Librería 'Pillow' no instalada. Ejecuta: pip install Pillow"}
-            try:
-                img = Image.open(image_path)
-                content_to_send.append(img)
-            except Exception as e:
-                return {"error": f"Error cargando imagen: {e}"}
-
-        # Estrategia de Fallback: Intentar modelos alternativos si el principal falla
-        models_to_try = [model]
-        # Lista de modelos seguros para probar en orden si el principal falla
-        # Si hay imagen, evitamos gemini-pro (1.0) que es solo texto
-        if image_path:
-            fallbacks = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.5-flash-latest"]
-        else:
-            fallbacks = ["gemini-1.5-flash", "gemini-pro"]
-        for fb in fallbacks:
-            if fb != model:
-                models_to_try.append(fb)
+def chat_gemini(messages, model="gemini-flash-latest", system_instruction=None, image_path=None, on_partial=None,
+                system_extra=None):
+    # Cliente compartido: el SDK se configura una vez y los modelos se reutilizan
+    client = get_gemini()
+    try:
+        client.configure()
+        sys_msg, contents, models_to_try = gemini_request(messages, system_instruction, image_path, model, system_extra)
+    except (RuntimeError, ValueError) as e:
+        return {"error": str(e)}
 
+    try:
+        # Los modelos con el circuito abierto (429, caídas) pasan al final y se saltan si queda otro
+        health = get_health()
         last_error = None
-        for target_model in models_to_try:
+        for key, target_model in gemini_models(models_to_try):
+            start = time.time()
             try:
-                model_instance = genai.GenerativeModel(model_name=target_model, system_instruction=sys_msg)
-                chat = model_instance.start_chat(history=history)
-                response = chat.send_message(content_to_send)
-                return {"content": response.text}
+                model_instance = client.model(target_model, sys_msg)
+                response = model_instance.generate_content(contents, stream=bool(on_partial))
+                if on_partial:
+                    text = ""
+                    for chunk in response:
+                        text += chunk.text
+                        on_partial(text)
+                else:
+                    text = response.text
+                health.record(key, True, time.time() - start)
+                get_prompt_cache_stats().record("gemini", gemini_usage(response))
+                return {"content": text}
+            except Cancelled:
+                health.release(key)
+                raise   # otro proveedor ganó la carrera: no probar más modelos
             except Exception as e:
+                health.record(key, False, error=str(e))
                 print(f"⚠️  Advertencia: Falló {target_model} ({e}). Intentando siguiente...", file=sys.stderr)
                 last_error = e
                 continue
@@ -256,41 +182,117 @@ def chat_gemini(messages, model="gemini-flash-latest", system_instruction=None,
         return {"error": str(e)}
 
 
-def main():
+def available_providers(forced=None):
+    """Proveedores a intentar, en orden de preferencia (solo el forzado si se indica)."""
+    if forced:
+        # Si el usuario fuerza uno, solo intentamos ese
+        return [forced]
+    # Orden de preferencia: Groq (Rápido) -> Gemini (Backup robusto) -> Otros
+    keys = (("groq", "GROQ_API_KEY"), ("gemini", "GOOGLE_API_KEY"), ("openai", "OPENAI_API_KEY"), ("anthropic", "ANTHROPIC_API_KEY"))
+    return [provider for provider, key in keys if os.getenv(key, "").strip()]
+
+
+def call_provider(provider, messages, system=None, image_path=None, on_partial=None, system_extra=None):
+    """`system` es la parte fija de la instrucción (cacheable en el proveedor); `system_extra`, la variable."""
+    if async_available() and provider in ("openai", "anthropic", "groq", "gemini"):
+        # Cliente asíncrono compartido: todas las conversaciones usan el mismo pool de conexiones
+        return get_async_llm().run(provider, messages, system, image_path, on_partial, system_extra)
+    if provider == "openai":
+        return chat_openai(messages, system_instruction=system, on_partial=on_partial, system_extra=system_extra)
+    if provider == "anthropic":
+        return chat_anthropic(messages, system_instruction=system, on_partial=on_partial, system_extra=system_extra)
+    if provider == "groq":
+        return chat_groq(messages, system_instruction=system, on_partial=on_partial, system_extra=system_extra)
+    if provider == "gemini":
+        return chat_gemini(messages, system_instruction=system, image_path=image_path, on_partial=on_partial,
+                           system_extra=system_extra)
+    return {"error": f"Proveedor desconocido: {provider}"}
+
+
+SUMMARY_SYSTEM = ("Resumes conversaciones entre un usuario y un asistente. Conserva datos concretos "
+                  "(nombres, síntomas, fechas, decisiones y pendientes) y descarta saludos y relleno. "
+                  "Responde solo con el resumen, en viñetas breves y en el idioma de la conversación.")
+
+
+def summarize_turns(previous, messages):
+    """Nuevo resumen acumulado a partir del anterior y de los mensajes que salen de la ventana."""
+    transcript = "\n".join(f"{'Usuario' if m.get('role') == 'user' else 'Asistente'}: {m.get('content', '')}"
+                           for m in messages)
+    prompt = (f"Resumen hasta ahora:\n{previous or '(vacío)'}\n\nNuevos mensajes:\n{transcript}\n\n"
+              "Escribe el resumen actualizado (máximo 200 palabras).")
+    health = get_health()
+    for provider in health.order(available_providers()):
+        if not health.allow(provider):
+            continue
+        messages_for_llm, _ = build_context([], {"role": "user", "content": prompt}, budget_for(provider),
+                                            system=SUMMARY_SYSTEM)
+        start = time.time()
+        result = call_provider(provider, messages_for_llm, SUMMARY_SYSTEM)
+        health.record(provider, bool(result.get("content")), time.time() - start, result.get("error"))
+        if result.get("content"):
+            return result["content"].strip()
+    return None
+
+
+_summarizer = None
+_summarizer_lock = threading.Lock()
+
+
+def get_summarizer():
+    """Resumidor en segundo plano conectado al historial del proceso."""
+    global _summarizer
+    with _summarizer_lock:
+        if _summarizer is None:
+            history = get_history()
+            _summarizer = RollingSummarizer(history, summarize_turns)
+            history.on_evict = _summarizer.on_evict
+        return _summarizer
+
+
+def build_parser():
     parser = argparse.ArgumentParser(description="Enviar un prompt a un LLM (OpenAI/Anthropic).")
     parser.add_argument("--prompt", required=True, help="El mensaje para el LLM.")
     parser.add_argument("--provider", choices=["openai", "anthropic", "gemini", "groq"], help="Proveedor de IA.")
     parser.add_argument("--memory-query", help="Texto específico para buscar en memoria (si es diferente al prompt).")
     parser.add_argument("--image", help="Ruta a una imagen local para analizar (Solo Gemini).")
     parser.add_argument("--memory-only", action="store_true", help="Solo consulta la memoria y devuelve el resultado directo sin llamar al LLM.")
-    parser.add_argument("--system", help="Instrucción del sistema (personalidad).")
-    args = parser.parse_args()
+    parser.add_argument("--system", help="Instrucción del sistema (personalidad). Parte fija: el proveedor la cachea.")
+    parser.add_argument("--system-extra", help="Parte variable de la instrucción del sistema (fecha, idioma...).")
+    parser.add_argument("--chat-id", default=DEFAULT_CHAT, help="Conversación a la que pertenece el mensaje (historial propio).")
+    parser.add_argument("--cache", action="store_true", help="El prompt es autocontenido: se puede responder desde la caché de respuestas.")
+    parser.add_argument("--cache-key", help="Texto con el que se indexa la respuesta en caché (por defecto, el prompt).")
+    return parser
+
+
+def complete(argv=None, on_partial=None):
+    """Igual que la CLI pero devuelve el resultado como dict en lugar de imprimirlo.
+
+    Si se pasa `on_partial`, los proveedores responden en streaming y se llama
+    on_partial(texto_acumulado) a medida que llegan los tokens. Si un proveedor
+    falla a mitad y se pasa al siguiente, el texto acumulado vuelve a empezar.
+    """
+    args = build_parser().parse_args(argv)
 
     # --- MODO MEMORY-ONLY ---
     if args.memory_only:
         memory_context = get_memory_context(args.prompt)
         if memory_context:
             # Si se encuentra algo, se devuelve directamente formateado.
-            result = {"content": f"🧠 Según mi memoria:\n\n{memory_context}"}
-        else:
-            # Si no, se devuelve un error especial para que el orquestador sepa que debe continuar.
-            result = {"error": "no_memory_found"}
-        print(json.dumps(result))
-        return
+            return {"content": f"🧠 Según mi memoria:\n\n{memory_context}"}
+        # Si no, se devuelve un error especial para que el orquestador sepa que debe continuar.
+        return {"error": "no_memory_found"}
 
-    # Gestión de historial
+    # Gestión de historial (cada chat tiene el suyo)
+    chat_history = get_history()
+    summarizer = get_summarizer()
     if args.prompt.strip().lower() == "/clear":
-        if os.path.exists(HISTORY_FILE):
-            os.remove(HISTORY_FILE)
-        print(json.dumps({"content": "Historial de conversación borrado."}))
-        return
-
-    history = load_history()
-    # Mantener contexto corto (últimos 10 mensajes) para evitar errores de tokens
-    if len(history) > 10:
-        history = history[-10:]
+        summarizer.discard(args.chat_id)
+        chat_history.clear(args.chat_id)
+        return {"content": "Historial de conversación borrado."}
 
-    history.append({"role": "user", "content": args.prompt})
+    history = chat_history.get(args.chat_id)
+    summary = chat_history.get_summary(args.chat_id)
+    user_message = {"role": "user", "content": args.prompt}
 
     # --- RAG: Inyección de Memoria ---
     # Si se proporciona --memory-query, usarla para la búsqueda. Si no, usar el prompt completo.
@@ -299,15 +301,14 @@ def main():
     if args.memory_query:
         print(f"🧠 [RAG] Usando query optimizada: '{query_for_memory}'", file=sys.stderr)
 
-    # Creamos una copia de los mensajes para enviar al LLM con el contexto inyectado,
-    # pero SIN ensuciar el historial guardado en disco.
-    messages_for_llm = [dict(msg) for msg in history] # Deep copy simple
+    # El contexto de memoria va solo en el mensaje enviado al LLM,
+    # SIN ensuciar el historial guardado en disco.
+    prompt_for_llm = dict(user_message)
     
     memory_context = get_memory_context(query_for_memory)
     if memory_context:
         # Inyectamos el contexto en el último mensaje del usuario
-        last_msg = messages_for_llm[-1]
-        last_msg['content'] = f"""Usa el siguiente CONTEXTO DE MEMORIA solo si es directamente relevante para la PREGUNTA DEL USUARIO. Si no es relevante, ignóralo por completo.
+        prompt_for_llm['content'] = f"""Usa el siguiente CONTEXTO DE MEMORIA solo si es directamente relevante para la PREGUNTA DEL USUARIO. Si no es relevante, ignóralo por completo.
 
 CONTEXTO DE MEMORIA (Recuerdos relevantes):
 {memory_context}
@@ -316,57 +317,54 @@ CONTEXTO DE MEMORIA (Recuerdos relevantes):
 PREGUNTA DEL USUARIO:
 {args.prompt}"""
 
-    # Definir lista de proveedores a intentar en orden de prioridad
-    providers_to_try = []
-    
-    if args.provider:
-        # Si el usuario fuerza uno, solo intentamos ese
-        providers_to_try.append(args.provider)
-    else:
-        # Orden de preferencia: Groq (Rápido) -> Gemini (Backup robusto) -> Otros
-        if os.getenv("GROQ_API_KEY") and os.getenv("GROQ_API_KEY").strip():
-            providers_to_try.append("groq")
-        if os.getenv("GOOGLE_API_KEY") and os.getenv("GOOGLE_API_KEY").strip():
-            providers_to_try.append("gemini")
-        if os.getenv("OPENAI_API_KEY") and os.getenv("OPENAI_API_KEY").strip():
-            providers_to_try.append("openai")
-        if os.getenv("ANTHROPIC_API_KEY") and os.getenv("ANTHROPIC_API_KEY").strip():
-            providers_to_try.append("anthropic")
-            
+    providers_to_try = available_providers(args.provider)
     if not providers_to_try:
-        print(json.dumps({"error": "No hay API Keys configuradas en .env"}))
-        return
-
-    result = {}
-    for provider in providers_to_try:
-        try:
-            if provider == "openai":
-                result = chat_openai(messages_for_llm, system_instruction=args.system)
-            elif provider == "anthropic":
-                result = chat_anthropic(messages_for_llm, system_instruction=args.system)
-            elif provider == "groq":
-                result = chat_groq(messages_for_llm, system_instruction=args.system)
-            elif provider == "gemini":
-                result = chat_gemini(messages_for_llm, system_instruction=args.system, image_path=args.image)
-            
-            # Si tuvimos éxito (hay contenido y no error), salimos del bucle
-            if "content" in result and "error" not in result:
-                break
-            
-            # Si falló, logueamos en stderr (para no ensuciar el JSON de stdout) y seguimos
-            error_msg = result.get("error", "Error desconocido")
-            print(f"⚠️ Proveedor '{provider}' falló: {error_msg}. Intentando siguiente...", file=sys.stderr)
-            
-        except Exception as e:
-            print(f"⚠️ Excepción crítica en '{provider}': {e}. Intentando siguiente...", file=sys.stderr)
-            result = {"error": str(e)}
+        return {"error": "No hay API Keys configuradas en .env"}
+
+    # Caché de respuestas: solo prompts autocontenidos y sin imagen. La memoria
+    # inyectada y la instrucción de sistema forman parte de la clave.
+    cache = get_cache() if args.cache and not args.image else None
+    if cache is not None:
+        cache_prompt = args.cache_key or args.prompt
+        scope = scope_key(args.system, args.system_extra, memory_context)
+        hit = cache.get(cache_prompt, scope, providers_to_try)
+        if hit is not None:
+            content, provider, kind = hit
+            print(f"♻️  [CACHE] Acierto {kind} ({provider}) | {cache.stats()['hit_rate']:.0%} de aciertos", file=sys.stderr)
+            if on_partial is not None:
+                on_partial(content)
+            chat_history.append(args.chat_id, user_message, {"role": "assistant", "content": content})
+            return {"content": content}
+        # Lo que se guarda se sirve a cualquier chat: la respuesta no puede salir del
+        # historial ni del resumen de esta conversación
+        history, summary = [], None
+
+    # Para el presupuesto cuentan las dos partes de la instrucción de sistema
+    full_system = "\n".join(part for part in (args.system, args.system_extra) if part) or None
+
+    def attempt(provider, partial):
+        # El historial que cabe depende del presupuesto de cada proveedor
+        messages_for_llm, tokens = build_context(history, prompt_for_llm, budget_for(provider),
+                                                 system=full_system, summary=summary)
+        print(f"🧮 [CTX] {provider}: ~{tokens} tokens ({len(messages_for_llm)} mensajes"
+              f"{', con resumen' if summary else ''})", file=sys.stderr)
+        return call_provider(provider, messages_for_llm, args.system, args.image, partial, args.system_extra)
+
+    # Fallback en orden y, con LLM_HEDGE=1, réplica al siguiente si el actual va lento
+    _, prompt_tokens = build_context(history, prompt_for_llm, budget_for(providers_to_try[0]),
+                                     system=full_system, summary=summary)
+    provider, result = get_runner().run(providers_to_try, attempt, on_partial=on_partial, tokens=prompt_tokens)
 
     if "content" in result:
-        history.append({"role": "assistant", "content": result["content"]})
-        save_history(history)
+        if cache is not None and "error" not in result:
+            cache.put(cache_prompt, scope, provider, result["content"])
+        chat_history.append(args.chat_id, user_message, {"role": "assistant", "content": result["content"]})
+    return result
+
 
+def main(argv=None):
     # Salida en JSON para que el orquestador la consuma
-    print(json.dumps(result))
+    print(json.dumps(complete(argv)))
 
 
 if __name__ == "__main__":
@@ -0,0 +1,223 @@
+#!/usr/bin/env python3
+"""
+Router de comandos del listener de Telegram.
+
+Sustituye la cadena de `if/elif msg_logic.startswith(...)`: los comandos se
+guardan en un trie de caracteres y cada mensaje se resuelve con una sola
+pasada por su prefijo, quedándose con la coincidencia más larga (así
+`/reset_patient` ya no lo captura `/reset`). Los alias apuntan a la misma
+ruta y las estadísticas se agrupan por el nombre canónico.
+
+Los handlers viven en el paquete `handlers`, se importan la primera vez que
+se usan y se recargan si su archivo cambia (`ROUTER_HOT_RELOAD=0` lo
+desactiva), de modo que se pueden corregir sin reiniciar el bot.
+"""
+import functools
+import importlib
+import os
+import sys
+import threading
+import time
+
+HOT_RELOAD = os.getenv("ROUTER_HOT_RELOAD", "1") != "0"
+
+# Un handler devuelve REDISPATCH cuando reescribe ctx.text (p. ej. una nota de
+# voz transcrita) y el nuevo texto debe volver a pasar por el router.
+REDISPATCH = object()
+
+
+class MessageContext:
+    """Datos de un mensaje entrante que comparten los handlers."""
+
+    def __init__(self, bot, chat_id, text):
+        self.bot = bot                # módulo del listener (run_tool, send_text, load_patients...)
+        self.chat_id = chat_id
+        self.text = text
+        self.is_voice = False         # responder también con nota de voz
+        self.voice_lang = "es"
+        self.stream_reply = None      # respuesta en streaming abierta por el handler
+        self._role = None
+
+    @property
+    def role(self):
+        if self._role is None:
+            self._role = self.bot.get_role(self.chat_id)
+        return self._role
+
+
+def requires_role(*roles, denied="⛔ Acceso denegado."):
+    """Decorador: solo ejecuta el handler si el usuario tiene uno de los roles indicados."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(ctx):
+            if ctx.role not in roles:
+                return denied
+            return fn(ctx)
+        wrapper.required_roles = roles
+        return wrapper
+    return decorator
+
+
+class Route:
+    """Comando canónico, sus alias y el handler (módulo, función) que lo atiende."""
+
+    __slots__ = ("name", "aliases", "module", "func")
+
+    def __init__(self, names, module, func):
+        self.name = names[0]
+        self.aliases = tuple(names[1:])
+        self.module = module
+        self.func = func
+
+
+class CommandRouter:
+    """Resuelve mensajes a handlers por prefijo más largo, coincidencia exacta o ruta por defecto."""
+
+    def __init__(self, package="handlers", hot_reload=HOT_RELOAD):
+        self.package = package
+        self.hot_reload = hot_reload
+        self._trie = {}
+        self._exact = {}
+        self._fallback = None
+        self._modules = {}    # nombre -> (módulo, mtime al cargarlo)
+        self._lock = threading.Lock()
+        self._stats = {}
+        self.reloads = 0
+
+    # --- Registro ---
+
+    def add(self, names, module, func):
+        """Registra un comando por prefijo (con sus alias)."""
+        route = Route(names, module, func)
+        for name in names:
+            node = self._trie
+            for ch in name:
+                node = node.setdefault(ch, {})
+            node[None] = route
+        return route
+
+    def add_exact(self, names, module, func):
+        """Registra mensajes que deben coincidir completos (saludos, agradecimientos)."""
+        route = Route(names, module, func)
+        for name in names:
+            self._exact[name.lower().strip()] = route
+        return route
+
+    def set_fallback(self, module, func):
+        self._fallback = Route(("chat",), module, func)
+
+    @classmethod
+    def from_manifest(cls, package="handlers", **kwargs):
+        """Construye el router con las tablas COMMANDS, EXACT y FALLBACK del paquete de handlers."""
+        router = cls(package, **kwargs)
+        manifest = importlib.import_module(package)
+        for names, module, func in manifest.COMMANDS:
+            router.add(names, module, func)
+        for names, module, func in manifest.EXACT:
+            router.add_exact(names, module, func)
+        router.set_fallback(*manifest.FALLBACK)
+        return router
+
+    # --- Resolución ---
+
+    def match(self, text):
+        """Ruta para el texto (o None si solo aplica la ruta por defecto)."""
+        route = self._exact.get(text.lower().strip())
+        if route is not None:
+            return route
+        node = self._trie
+        for ch in text:
+            node = node.get(ch)
+            if node is None:
+                break
+            route = node.get(None, route)
+        return route
+
+    def _module(self, name):
+        """Importa el módulo de handlers la primera vez y lo recarga si cambió en disco."""
+        qualified = f"{self.package}.{name}"
+        with self._lock:
+            entry = self._modules.get(name)
+            if entry is None:
+                module = importlib.import_module(qualified)
+                self._modules[name] = (module, self._mtime(module))
+                return module
+            module, mtime = entry
+            if self.hot_reload:
+                current = self._mtime(module)
+                if current != mtime:
+                    try:
+                        module = importlib.reload(module)
+                        self.reloads += 1
+                        print(f"   ♻️  [ROUTER] Recargado {qualified}.")
+                    except Exception as e:
+                        # Un error de sintaxis en caliente no debe tumbar el bot: seguimos con la versión anterior
+                        print(f"   ❌ [ROUTER] No se pudo recargar {qualified}: {e}", file=sys.stderr)
+                    self._modules[name] = (module, current)
+            return module
+
+    @staticmethod
+    def _mtime(module):
+        try:
+            return os.path.getmtime(module.__file__)
+        except (OSError, TypeError):
+            return None
+
+    def handler(self, route):
+        return getattr(self._module(route.module), route.func)
+
+    def reload(self):
+        """Fuerza la recarga de todos los módulos ya cargados."""
+        with self._lock:
+            names = list(self._modules)
+            for name in names:
+                module = importlib.reload(self._modules[name][0])
+                self._modules[name] = (module, self._mtime(module))
+                self.reloads += 1
+        return names
+
+    def dispatch(self, ctx):
+        """Ejecuta el handler que corresponde a ctx.text y devuelve su respuesta."""
+        for _ in range(2):
+            route = self.match(ctx.text) or self._fallback
+            result = self._call(route, ctx)
+            if result is not REDISPATCH:
+                return result
+        return None
+
+    def _call(self, route, ctx):
+        start = time.time()
+        error = False
+        try:
+            return self.handler(route)(ctx)
+        except Exception:
+            error = True
+            raise
+        finally:
+            self._record(route.name, time.time() - start, error)
+
+    # --- Métricas ---
+
+    def _record(self, name, elapsed, error):
+        with self._lock:
+            s = self._stats.setdefault(name, {"calls": 0, "errors": 0, "total_ms": 0.0, "max_ms": 0.0})
+            s["calls"] += 1
+            s["total_ms"] += elapsed * 1000
+            s["max_ms"] = max(s["max_ms"], elapsed * 1000)
+            if error:
+                s["errors"] += 1
+
+    def stats(self, top=None):
+        """Llamadas, errores y latencia media/máxima (ms) por comando, de más lento a más rápido."""
+        with self._lock:
+            rows = [
+                (name, {
+                    "calls": s["calls"],
+                    "errors": s["errors"],
+                    "avg_ms": round(s["total_ms"] / s["calls"], 1),
+                    "max_ms": round(s["max_ms"], 1),
+                })
+                for name, s in self._stats.items()
+            ]
+        rows.sort(key=lambda r: r[1]["avg_ms"], reverse=True)
+        return dict(rows[:top] if top else rows)
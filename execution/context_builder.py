@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+"""
+Contexto para el LLM con presupuesto de tokens y resumen acumulado.
+
+`chat_with_llm` enviaba siempre los últimos 10 mensajes: un solo análisis de
+PDF pegado en el chat podía desbordar la ventana del modelo, y en chats de
+mensajes cortos se perdía contexto útil. Ahora:
+
+- cada mensaje se mide en tokens (con `tiktoken` si está instalado o con una
+  estimación por caracteres; el recuento se cachea por texto);
+- se rellena el presupuesto del proveedor (CONTEXT_BUDGETS) desde el mensaje
+  más reciente hacia atrás, recortando los mensajes enormes;
+- los mensajes que salen de la ventana del historial se condensan en un
+  resumen por chat que se recalcula en segundo plano (`RollingSummarizer`) y
+  viaja al principio del contexto.
+
+Así el tamaño del prompt (y la latencia) se mantiene acotado aunque la
+conversación crezca.
+"""
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+try:
+    import tiktoken
+except ImportError:
+    tiktoken = None
+
+# Tokens para historial + prompt por proveedor (CONTEXT_BUDGET fija uno común)
+CONTEXT_BUDGETS = {"groq": 6000, "gemini": 24000, "openai": 12000, "anthropic": 12000}
+DEFAULT_BUDGET = 6000
+# Coste fijo aproximado de cada mensaje (rol y separadores)
+MESSAGE_OVERHEAD = 4
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "400"))
+# Mensajes desalojados de la ventana que disparan una actualización del resumen
+SUMMARY_BATCH = int(os.getenv("SUMMARY_BATCH", "4"))
+
+TRUNCATED_MARK = "\n[…recortado…]"
+
+_encoding = None
+if tiktoken is not None:
+    try:
+        _encoding = tiktoken.get_encoding("cl100k_base")
+    except Exception:
+        _encoding = None
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    """Tokens de un texto: exacto con tiktoken; si no, ~3 caracteres por token (conservador en español)."""
+    if not text:
+        return 0
+    if _encoding is not None:
+        return len(_encoding.encode(text, disallowed_special=()))
+    return (len(text) + 2) // 3
+
+
+def budget_for(provider):
+    common = os.getenv("CONTEXT_BUDGET")
+    if common:
+        return int(common)
+    return int(os.getenv(f"CONTEXT_BUDGET_{provider.upper()}", CONTEXT_BUDGETS.get(provider, DEFAULT_BUDGET)))
+
+
+def truncate_to_tokens(text, tokens):
+    """Recorta un texto para que quepa en `tokens` (se conserva el principio)."""
+    total = count_tokens(text)
+    if total <= tokens:
+        return text
+    keep = max(0, int(len(text) * tokens / total) - len(TRUNCATED_MARK))
+    return text[:keep] + TRUNCATED_MARK
+
+
+def _message_tokens(message):
+    return count_tokens(str(message.get("content", ""))) + MESSAGE_OVERHEAD
+
+
+def summary_messages(summary):
+    """El resumen viaja como un primer intercambio usuario/asistente (válido para todos los proveedores)."""
+    if not summary:
+        return []
+    return [{"role": "user", "content": f"Resumen de nuestra conversación anterior:\n{summary}"},
+            {"role": "assistant", "content": "De acuerdo, lo tengo en cuenta."}]
+
+
+def build_context(history, prompt_message, budget, system=None, summary=None):
+    """
+    Mensajes a enviar: resumen, los más recientes del historial que quepan y el prompt.
+
+    Devuelve (mensajes, tokens estimados). El prompt se recorta solo si él
+    solo ya supera el presupuesto.
+    """
+    fixed = summary_messages(summary)
+    remaining = budget - count_tokens(system or "") - sum(_message_tokens(m) for m in fixed)
+
+    prompt = dict(prompt_message)
+    if _message_tokens(prompt) > remaining:
+        prompt["content"] = truncate_to_tokens(prompt["content"], max(remaining - MESSAGE_OVERHEAD, 0))
+    remaining -= _message_tokens(prompt)
+
+    # Ningún mensaje antiguo puede ocupar más de la mitad de lo que queda
+    cap = max(remaining // 2, 64)
+    selected = []
+    for message in reversed(history):
+        tokens = _message_tokens(message)
+        if tokens > cap + MESSAGE_OVERHEAD:
+            message = dict(message, content=truncate_to_tokens(str(message.get("content", "")), cap))
+            tokens = _message_tokens(message)
+        if tokens > remaining:
+            break
+        selected.append(message)
+        remaining -= tokens
+    selected.reverse()
+    # Anthropic y Gemini exigen que la conversación empiece por el usuario
+    while selected and selected[0].get("role") != "user":
+        selected.pop(0)
+
+    messages = fixed + selected + [prompt]
+    return messages, budget - remaining
+
+
+def extractive_summary(previous, messages, max_tokens=SUMMARY_MAX_TOKENS):
+    """Resumen de emergencia sin LLM: resumen previo + el arranque de cada mensaje."""
+    lines = [previous] if previous else []
+    for m in messages:
+        who = "Usuario" if m.get("role") == "user" else "Asistente"
+        lines.append(f"- {who}: {truncate_to_tokens(str(m.get('content', '')).strip(), 40)}")
+    text = "\n".join(lines)
+    # Si no cabe, se sacrifican las líneas más antiguas
+    while count_tokens(text) > max_tokens and len(lines) > 1:
+        lines.pop(0)
+        text = "\n".join(lines)
+    return truncate_to_tokens(text, max_tokens)
+
+
+class RollingSummarizer:
+    """
+    Condensa en segundo plano los mensajes que salen de la ventana del historial.
+
+    `summarize_fn(resumen_previo, mensajes)` devuelve el nuevo resumen (o None
+    si falla, y se usa `extractive_summary`). Se conecta al historial como
+    `history.on_evict`. Lo pendiente se agrupa por generación del chat: si se
+    borra el historial mientras se resume, el resultado se descarta.
+    """
+
+    def __init__(self, history, summarize_fn, batch=SUMMARY_BATCH, max_tokens=SUMMARY_MAX_TOKENS):
+        self.history = history
+        self.summarize_fn = summarize_fn
+        self.batch = batch
+        self.max_tokens = max_tokens
+        self._pending = {}              # chat_id -> (generación, mensajes)
+        self._running = set()
+        self._lock = threading.Lock()
+        self._idle = threading.Condition(self._lock)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="summary")
+
+    def on_evict(self, chat_id, messages, generation=None):
+        if generation is None:
+            generation = self.history.generation(chat_id)
+        with self._lock:
+            pending_generation, pending = self._pending.get(chat_id, (generation, []))
+            if pending_generation != generation:
+                pending = []        # mensajes de antes de un borrado
+            self._pending[chat_id] = (generation, pending)
+            pending.extend(messages)
+            if len(pending) < self.batch or chat_id in self._running:
+                return
+            self._running.add(chat_id)
+        self._executor.submit(self._run, chat_id)
+
+    def discard(self, chat_id):
+        """Olvida lo pendiente de un chat (al borrar su historial)."""
+        with self._lock:
+            self._pending.pop(chat_id, None)
+
+    def _run(self, chat_id):
+        while True:
+            with self._lock:
+                generation, batch = self._pending.pop(chat_id, (None, []))
+                if not batch:
+                    self._running.discard(chat_id)
+                    self._idle.notify_all()
+                    return
+            previous = self.history.get_summary(chat_id)
+            try:
+                text = self.summarize_fn(previous, batch)
+            except Exception as e:
+                print(f"⚠️  [CTX] No se pudo resumir el chat {chat_id}: {e}", file=sys.stderr)
+                text = None
+            text = truncate_to_tokens(text, self.max_tokens) if text else extractive_summary(previous, batch, self.max_tokens)
+            if not self.history.set_summary(chat_id, text, generation=generation):
+                print(f"🧹 [CTX] Resumen descartado: el chat {chat_id} se borró mientras se resumía", file=sys.stderr)
+
+    def wait(self, timeout=None):
+        """Espera a que terminen los resúmenes en curso (pruebas y apagado)."""
+        with self._lock:
+            return self._idle.wait_for(lambda: not self._running, timeout)
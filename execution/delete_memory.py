@@ -9,12 +9,12 @@ except ImportError:
     print("Error: Missing 'chromadb'.", file=sys.stderr)
     sys.exit(10)
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Eliminar un recuerdo por ID.")
     parser.add_argument("--id", help="ID del recuerdo a eliminar.")
     parser.add_argument("--text", help="Texto contenido en el recuerdo a eliminar (borra coincidencias).")
     parser.add_argument("--db-path", default=".tmp/chroma_db", help="Ruta a ChromaDB.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     if not args.id and not args.text:
         print(json.dumps({"status": "error", "message": "Debes proporcionar --id o --text."}))
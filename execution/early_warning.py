@@ -0,0 +1,148 @@
+#!/usr/bin/env python3
+"""
+Puntuación de alerta temprana (estilo NEWS2) y tendencias de signos vitales.
+
+Los tres umbrales fijos del monitor solo avisan cuando un signo ya está muy
+alterado. NEWS2 suma puntos por cada signo fuera de su rango normal, así que
+un paciente con varios signos ligeramente alterados sube de riesgo antes de
+cruzar ningún umbral. Se puntúan los parámetros que tenemos en las columnas
+del motor (pulso, SpO2 en escala 1, presión sistólica y temperatura); la
+frecuencia respiratoria, el oxígeno suplementario y el nivel de conciencia
+no se miden, así que la puntuación es una cota inferior de la NEWS2 real.
+
+Además de la puntuación se mantienen, por paciente y signo, rasgos de
+tendencia que se actualizan de forma incremental con cada lectura nueva
+(medias móviles exponenciales con constante TREND_TAU):
+
+- pendiente (unidades por hora);
+- varianza;
+- tiempo fuera de rango (segundos con puntos NEWS2 > 0, con el mismo decaimiento).
+
+Todo se calcula por lotes sobre las filas de `VitalsEngine` que recibieron
+una lectura desde la llamada anterior; no hay bucles por paciente.
+"""
+import os
+
+import numpy as np
+
+TREND_TAU = float(os.getenv("NEWS2_TREND_TAU", "900"))
+
+# Bandas NEWS2: límites superiores (inclusive) de cada banda y puntos de cada una
+NEWS2_BANDS = {
+    "heart_rate": ((40, 50, 90, 110, 130), (3, 1, 0, 1, 2, 3)),
+    "spo2": ((91, 93, 95), (3, 2, 1, 0)),
+    "systolic": ((90, 100, 110, 219), (3, 2, 1, 0, 3)),
+    "temperature": ((35.0, 36.0, 38.0, 39.0), (3, 1, 0, 1, 2)),
+}
+SCORED_FIELDS = tuple(NEWS2_BANDS)
+# Columnas de tendencia: los signos puntuados y la propia puntuación
+TREND_FIELDS = SCORED_FIELDS + ("news2",)
+NEWS2_COL = len(SCORED_FIELDS)
+
+# Niveles de riesgo: 0 bajo, 1 bajo-medio (algún signo con 3 puntos), 2 medio (5-6), 3 alto (>=7)
+RISK_LABELS = ("🟢 Bajo", "🟡 Bajo-medio", "🟠 Medio", "🔴 Alto")
+
+
+def news2_components(columns, rows=None):
+    """Puntos NEWS2 de cada signo: matriz (filas, SCORED_FIELDS)."""
+    out = []
+    for field in SCORED_FIELDS:
+        limits, points = NEWS2_BANDS[field]
+        values = columns[field] if rows is None else columns[field][rows]
+        out.append(np.asarray(points, dtype=np.int8)[np.digitize(values, limits, right=True)])
+    return np.column_stack(out)
+
+
+def risk_level(total, components):
+    """Nivel de riesgo NEWS2 a partir de la suma y de los puntos por signo."""
+    return np.select([total >= 7, total >= 5, (components == 3).any(axis=1)], [3, 2, 1], 0).astype(np.int8)
+
+
+class EarlyWarning:
+    """Puntuación y tendencias por fila de `VitalsEngine` (las filas crecen con el motor)."""
+
+    def __init__(self, capacity=64, tau=TREND_TAU):
+        self.tau = tau
+        self.size = 0
+        k = len(TREND_FIELDS)
+        self.score = np.zeros(capacity, dtype=np.int16)
+        self.level = np.zeros(capacity, dtype=np.int8)
+        self.last_ts = np.full(capacity, np.nan)              # lectura ya procesada de cada fila
+        self.last = np.full((capacity, k), np.nan)            # último valor de cada columna de tendencia
+        self.abnormal = np.zeros((capacity, k), dtype=bool)   # ¿fuera de rango en la última lectura?
+        self.mean = np.zeros((capacity, k))
+        self.var = np.zeros((capacity, k))
+        self.slope = np.zeros((capacity, k))                  # por hora
+        self.above = np.zeros((capacity, k))                  # segundos fuera de rango (con decaimiento)
+
+    def _grow(self, n):
+        capacity = max(n, 2 * len(self.score))
+        for attr in ("score", "level", "last_ts", "last", "abnormal", "mean", "var", "slope", "above"):
+            old = getattr(self, attr)
+            fill = np.nan if attr in ("last_ts", "last") else 0
+            new = np.full((capacity,) + old.shape[1:], fill, dtype=old.dtype)
+            new[:len(old)] = old
+            setattr(self, attr, new)
+
+    def update(self, columns):
+        """
+        Recalcula las filas con una lectura nueva (su `last_update` cambió).
+
+        `columns` son las columnas del motor de signos vitales. Devuelve las filas actualizadas.
+        """
+        n = len(columns["last_update"])
+        if n > len(self.score):
+            self._grow(n)
+        self.size = n
+        ts = columns["last_update"]
+        rows = np.flatnonzero(ts != self.last_ts[:n])
+        if not rows.size:
+            return rows
+
+        # Con todas las filas cambiadas (tick de simulación) se opera sobre la columna entera
+        sel = slice(0, n) if rows.size == n else rows
+        comps = news2_components(columns, sel)
+        total = comps.sum(axis=1, dtype=np.int16)
+        self.score[sel] = total
+        self.level[sel] = risk_level(total, comps)
+
+        values = np.column_stack([columns[f][sel] for f in SCORED_FIELDS] + [total])
+        t = ts[sel]
+        prev_t = self.last_ts[sel]
+        first = np.isnan(prev_t)[:, None]
+        dt = (t - prev_t)[:, None]
+        # Si el reloj retrocede (valor fijado a mano) solo se actualiza la puntuación
+        step = ~first & (dt > 0)
+        d = np.where(step, dt, 1.0)
+        decay = np.where(step, np.exp(-d / self.tau), 1.0)
+        alpha = 1 - decay
+        last, mean = self.last[sel], self.mean[sel]
+        delta = values - mean
+        self.mean[sel] = np.where(first, values, mean + alpha * delta)
+        self.var[sel] = np.where(first, 0.0, decay * (self.var[sel] + alpha * delta ** 2))
+        slope = self.slope[sel]
+        self.slope[sel] = np.where(first, 0.0, slope + alpha * ((values - last) / d * 3600 - slope))
+        # El intervalo cuenta como fuera de rango si lo estaba la lectura anterior
+        self.above[sel] = np.where(first, 0.0, self.above[sel] * decay + np.where(step, d, 0.0) * self.abnormal[sel])
+
+        self.last[sel] = values
+        self.abnormal[sel] = np.column_stack([comps > 0, total >= 5])
+        self.last_ts[sel] = t
+        return rows
+
+    def columns(self):
+        """Columnas derivadas para el motor de alertas: `news2` y `news2_trend` (puntos/hora)."""
+        return {"news2": self.score[:self.size], "news2_trend": self.slope[:self.size, NEWS2_COL]}
+
+    def features(self, row):
+        """Puntuación, nivel y tendencias de una fila, para mostrar en /monitorear."""
+        if row >= self.size or np.isnan(self.last_ts[row]):
+            return None
+        trends = {
+            field: {"slope_per_hour": round(self.slope[row, i].item(), 2),
+                    "std": round(float(np.sqrt(self.var[row, i])), 2),
+                    "seconds_out_of_range": int(self.above[row, i])}
+            for i, field in enumerate(TREND_FIELDS)
+        }
+        level = int(self.level[row])
+        return {"score": int(self.score[row]), "level": level, "label": RISK_LABELS[level], "trends": trends}
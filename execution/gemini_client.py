@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Cliente de Gemini compartido por el proceso.
+
+`chat_gemini()` y `analyze_image.py` llamaban a `genai.configure()` y creaban
+un `GenerativeModel` (más un `start_chat()`) en cada petición y en cada
+modelo de respaldo. `configure()` descarta los clientes internos del SDK, así
+que cada mensaje volvía a abrir el transporte con Google. Aquí:
+
+- el SDK se configura una sola vez por API key;
+- los `GenerativeModel` se reutilizan, en un LRU de GEMINI_MODEL_CACHE
+  entradas por (modelo, instrucción de sistema);
+- la conversación va entera en `generate_content` (sin sesión de chat por
+  petición);
+- `warm_up()` deja el cliente y la conexión listos al arrancar el listener;
+- las instrucciones de sistema largas (GEMINI_CACHE_MIN_TOKENS o más) se
+  suben una vez como contenido cacheado (`CachedContent`) durante
+  GEMINI_CACHE_TTL segundos y los modelos se crean a partir de él, así no se
+  reenvían ni se cobran completas en cada llamada.
+"""
+import datetime
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+
+try:
+    import google.generativeai as genai
+except ImportError:
+    genai = None
+
+DEFAULT_MODEL = "gemini-flash-latest"
+MODEL_CACHE_SIZE = int(os.getenv("GEMINI_MODEL_CACHE", "32"))
+# Caché de prompts del proveedor (aquí y en llm_clients.py): PROMPT_CACHE=0 la desactiva
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "1") != "0"
+# Gemini exige un mínimo de tokens para el contenido cacheado
+CACHE_MIN_TOKENS = int(os.getenv("GEMINI_CACHE_MIN_TOKENS", "4096"))
+CACHE_TTL = int(os.getenv("GEMINI_CACHE_TTL", "3600"))
+
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from context_builder import count_tokens  # noqa: E402
+
+
+class GeminiClient:
+    """Configuración única del SDK y caché de instancias de modelo."""
+
+    def __init__(self, capacity=MODEL_CACHE_SIZE, sdk=None, prompt_cache=PROMPT_CACHE,
+                 cache_min_tokens=CACHE_MIN_TOKENS, cache_ttl=CACHE_TTL, clock=time.time):
+        self.capacity = capacity
+        self.sdk = sdk or genai
+        self.prompt_cache = prompt_cache
+        self.cache_min_tokens = cache_min_tokens
+        self.cache_ttl = cache_ttl
+        self.clock = clock
+        self._api_key = None
+        self._models = OrderedDict()    # (modelo, instrucción de sistema) -> (GenerativeModel, caduca)
+        self._uncacheable = set()       # modelos que rechazaron el contenido cacheado
+        self._lock = threading.Lock()
+        self.counters = {"configured": 0, "model_hits": 0, "model_misses": 0, "warmups": 0,
+                         "cached_contents": 0, "cache_failures": 0}
+
+    def configure(self, api_key=None):
+        """Configura el SDK si aún no lo está con esta key (cambiarla invalida los modelos)."""
+        if self.sdk is None:
+            raise RuntimeError("Librería 'google-generativeai' no instalada. Ejecuta: pip install -r requirements.txt")
+        api_key = api_key or os.getenv("GOOGLE_API_KEY")
+        if not api_key:
+            raise RuntimeError("Falta GOOGLE_API_KEY en .env")
+        with self._lock:
+            if api_key != self._api_key:
+                self.sdk.configure(api_key=api_key)
+                self._api_key = api_key
+                self._models.clear()
+                self.counters["configured"] += 1
+
+    def model(self, model_name=DEFAULT_MODEL, system_instruction=None):
+        """`GenerativeModel` reutilizable para (modelo, instrucción de sistema)."""
+        self.configure()
+        key = (model_name, system_instruction)
+        now = self.clock()
+        with self._lock:
+            cached = self._models.get(key)
+            if cached is not None and cached[1] > now:
+                self._models.move_to_end(key)
+                self.counters["model_hits"] += 1
+                return cached[0]
+            self.counters["model_misses"] += 1
+            cacheable = (self.prompt_cache and system_instruction and model_name not in self._uncacheable
+                         and count_tokens(system_instruction) >= self.cache_min_tokens)
+        instance, expires = None, float("inf")
+        if cacheable:
+            instance = self._from_cached_content(model_name, system_instruction)
+            # Se renueva un poco antes de que caduque en el servidor
+            expires = now + max(self.cache_ttl - 60, 0)
+        if instance is None:
+            instance, expires = self.sdk.GenerativeModel(model_name=model_name, system_instruction=system_instruction), float("inf")
+        with self._lock:
+            self._models[key] = (instance, expires)
+            while len(self._models) > self.capacity:
+                self._models.popitem(last=False)
+        return instance
+
+    def _from_cached_content(self, model_name, system_instruction):
+        """Modelo sobre la instrucción de sistema subida como contenido cacheado (None si no se puede)."""
+        try:
+            cache = self.sdk.caching.CachedContent.create(
+                model=model_name if model_name.startswith("models/") else f"models/{model_name}",
+                system_instruction=system_instruction,
+                ttl=datetime.timedelta(seconds=self.cache_ttl),
+            )
+            instance = self.sdk.GenerativeModel.from_cached_content(cached_content=cache)
+        except Exception as e:
+            # Los alias (p. ej. *-latest) no admiten caché explícita: no se reintenta con ese modelo
+            print(f"⚠️  [GEMINI] Sin caché de contexto para {model_name}: {e}", file=sys.stderr)
+            with self._lock:
+                self._uncacheable.add(model_name)
+                self.counters["cache_failures"] += 1
+            return None
+        with self._lock:
+            self.counters["cached_contents"] += 1
+        return instance
+
+    def warm_up(self, models=(DEFAULT_MODEL,)):
+        """Configura el SDK y abre la conexión antes del primer mensaje. No lanza excepciones."""
+        try:
+            for name in models:
+                self.model(name)
+                # Consulta ligera de metadatos: crea el cliente interno y su canal
+                self.sdk.get_model(name if name.startswith("models/") else f"models/{name}")
+            with self._lock:
+                self.counters["warmups"] += 1
+            print(f"   ♊ Gemini listo ({', '.join(models)}).")
+        except Exception as e:
+            print(f"⚠️  [GEMINI] No se pudo precalentar el cliente: {e}", file=sys.stderr)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, models=len(self._models))
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_gemini():
+    """Cliente compartido por todo el proceso."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = GeminiClient()
+        return _client
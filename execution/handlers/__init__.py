@@ -0,0 +1,83 @@
+"""
+Handlers de comandos del listener de Telegram.
+
+Cada módulo agrupa comandos relacionados; `command_router` solo importa un
+módulo la primera vez que se usa uno de sus comandos y lo recarga si el
+archivo cambia en disco. Los handlers reciben un `MessageContext` (con
+`ctx.bot` apuntando al módulo del listener) y devuelven el texto de respuesta.
+
+Para añadir un comando basta con escribir la función en el módulo que
+corresponda y declararla aquí; el primer nombre es el canónico y el resto,
+alias.
+"""
+import os
+import re
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def chat_tmp_path(chat_id, name):
+    """
+    Ruta de trabajo `.tmp/chats/<chat_id>/<name>`, relativa como el resto.
+
+    Los chats distintos se atienden en paralelo, así que ningún handler debe
+    usar un archivo fijo compartido; dentro de un chat los mensajes van en orden.
+    """
+    folder = os.path.join(".tmp", "chats", re.sub(r"[^0-9A-Za-z_-]", "_", str(chat_id)))
+    os.makedirs(folder, exist_ok=True)
+    return os.path.join(folder, re.sub(r"[^\w.-]", "_", os.path.basename(name)) or "archivo")
+
+
+def remove_quietly(path):
+    """Borra un archivo temporal si existe."""
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+# (nombres, módulo, función). Se comparan como prefijo del mensaje; gana el más largo.
+COMMANDS = [
+    (("__PHOTO__:",), "media", "foto_recibida"),
+    (("__DOCUMENT__:",), "media", "documento_recibido"),
+    (("__VOICE__:",), "media", "nota_de_voz"),
+    (("/investigar", "/research"), "research", "investigar"),
+    (("/reporte", "/report"), "research", "reporte"),
+    (("/recordatorio", "/remind"), "agenda", "recordatorio"),
+    (("/borrar_recordatorios", "/clear_reminders"), "agenda", "borrar_recordatorios"),
+    (("/cita", "/appointment"), "agenda", "cita"),
+    (("/mis_citas", "/my_appointments"), "agenda", "mis_citas"),
+    (("/traducir", "/translate"), "documents", "traducir"),
+    (("/resumir_archivo", "/summarize_file"), "documents", "resumir_archivo"),
+    (("/resumir", "/summarize"), "documents", "resumir"),
+    (("/recordar", "/remember"), "memory", "recordar"),
+    (("/memorias", "/memories"), "memory", "memorias"),
+    (("/olvidar", "/forget"), "memory", "olvidar"),
+    (("/broadcast", "/anuncio"), "admin", "broadcast"),
+    (("/status",), "admin", "status"),
+    (("/usuarios", "/users"), "admin", "usuarios"),
+    (("/modo",), "admin", "modo"),
+    (("/reiniciar", "/reset"), "admin", "reiniciar"),
+    (("/rol", "/role"), "admin", "rol"),
+    (("/foto", "/camara", "/photo"), "clinical", "foto"),
+    (("/monitorear", "/monitor"), "clinical", "monitorear"),
+    (("/simular_crisis",), "clinical", "simular_crisis"),
+    (("/estabilizar", "/stabilize"), "clinical", "estabilizar"),
+    (("/paciente_reset", "/reset_patient"), "clinical", "paciente_reset"),
+    (("/historial_alertas", "/alert_history"), "clinical", "historial_alertas"),
+    (("/ack", "/confirmar"), "clinical", "ack"),
+    (("/nuevo_paciente", "/ingresar"), "clinical", "nuevo_paciente"),
+    (("/pacientes",), "clinical", "pacientes"),
+    (("/idioma", "/lang"), "general", "idioma"),
+    (("/ayuda_medica",), "general", "ayuda_medica"),
+    (("/ayuda", "/help"), "general", "ayuda"),
+    (("/py ",), "general", "py"),
+]
+
+# Mensajes que deben coincidir completos (sin distinguir mayúsculas ni espacios)
+EXACT = [
+    (("hola", "hola!", "hi", "hello", "/start"), "general", "saludo"),
+    (("gracias", "gracias!", "thanks", "thank you"), "general", "gracias"),
+]
+
+# Cualquier otro mensaje va al chat general con el LLM
+FALLBACK = ("general", "conversar")
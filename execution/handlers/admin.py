@@ -0,0 +1,117 @@
+"""Administración del bot: anuncios, estado del servidor, usuarios, personalidad y roles."""
+
+
+def broadcast(ctx):
+    """/broadcast [mensaje]: anuncio para todos los usuarios registrados."""
+    bot = ctx.bot
+    reply_text = ""
+    announcement = ctx.text.split(" ", 1)[1] if " " in ctx.text else ""
+    if not announcement:
+        reply_text = "⚠️ Uso: /broadcast [mensaje para todos]"
+    else:
+        recipients = bot.list_users()
+        if recipients:
+            if bot.OUTBOX is not None:
+                # La cola reparte los envíos al ritmo que permite Telegram sin bloquear el chat
+                count = bot.OUTBOX.broadcast(recipients, f"📢 *ANUNCIO:*\n{announcement}")
+                reply_text = f"✅ Anuncio encolado para {count} usuarios."
+            else:
+                for uid in recipients:
+                    bot.send_text(uid, f"📢 *ANUNCIO:*\n{announcement}")
+                reply_text = f"✅ Mensaje enviado a {len(recipients)} usuarios."
+        else:
+            reply_text = "⚠️ No tengo usuarios registrados aún."
+    return reply_text
+
+
+def status(ctx):
+    """/status: CPU, RAM y disco del servidor."""
+    bot = ctx.bot
+    reply_text = ""
+    print("   📊 Verificando estado del sistema...")
+    bot.send_progress(ctx.chat_id, "🔍 Escaneando sistema...")
+
+    res = bot.run_tool("monitor_resources.py", [])
+    # monitor_resources devuelve JSON incluso si hay alertas (exit code 1)
+    if res:
+        metrics = res.get("metrics", {})
+        alerts = res.get("alerts", [])
+
+        status_emoji = "✅" if not alerts else "⚠️"
+        reply_text = (
+            f"{status_emoji} *Estado del Servidor:*\n\n"
+            f"💻 *CPU:* {metrics.get('cpu_percent', 0)}%\n"
+            f"🧠 *RAM:* {metrics.get('memory_percent', 0)}% ({metrics.get('memory_used_gb', 0)}GB / {metrics.get('memory_total_gb', 0)}GB)\n"
+            f"💾 *Disco:* {metrics.get('disk_percent', 0)}% (Libre: {metrics.get('disk_free_gb', 0)}GB)\n"
+        )
+        if alerts:
+            reply_text += "\n🚨 *Alertas:*\n" + "\n".join([f"- {a}" for a in alerts])
+    else:
+        reply_text = "❌ Error al obtener métricas."
+    return reply_text
+
+
+def usuarios(ctx):
+    """/usuarios: últimos usuarios registrados."""
+    bot = ctx.bot
+    reply_text = ""
+    last_users = bot.list_users(limit=5)
+    if last_users:
+        reply_text = f"👥 *Últimos {len(last_users)} usuarios registrados:*\n" + "\n".join([f"- `{u}`" for u in last_users])
+    else:
+        reply_text = "📭 No hay usuarios registrados."
+    return reply_text
+
+
+def modo(ctx):
+    """/modo [persona]: cambia la personalidad del bot."""
+    bot = ctx.bot
+    reply_text = ""
+    mode = ctx.text.split(" ", 1)[1].lower().strip() if " " in ctx.text else ""
+    if mode in bot.PERSONAS:
+        bot.set_persona(mode)
+        reply_text = f"🎭 *Modo cambiado a:* {mode.capitalize()}\n\n_{bot.PERSONAS[mode]}_"
+    else:
+        opts = ", ".join([f"`{k}`" for k in bot.PERSONAS.keys()])
+        reply_text = (
+            "⚠️ Modo no reconocido.\n"
+            f"Opciones disponibles: {opts}\n"
+            "Uso: `/modo [opcion]`"
+        )
+    return reply_text
+
+
+def reiniciar(ctx):
+    """/reiniciar: borra el historial y restablece la personalidad."""
+    bot = ctx.bot
+    reply_text = ""
+    print("   🔄 Reiniciando sesión...")
+    # 1. Borrar historial de chat
+    bot.run_tool("chat_with_llm.py", ["--prompt", "/clear", "--chat-id", ctx.chat_id])
+
+    # 2. Resetear personalidad
+    bot.set_persona("default")
+
+    reply_text = "🔄 *Sistema reiniciado.*\n\n- Historial de conversación borrado.\n- Personalidad restablecida a 'Default'."
+    return reply_text
+
+
+def rol(ctx):
+    """/rol [medico|paciente]: consulta o cambia el rol del usuario."""
+    bot = ctx.bot
+    reply_text = ""
+    parts = ctx.text.split(" ", 1)
+    if len(parts) < 2:
+        current_role = bot.get_role(ctx.chat_id)
+        reply_text = f"👤 Tu rol actual es: *{current_role.upper()}*.\n\nPara cambiarlo, usa:\n`/rol medico`\n`/rol paciente`"
+    else:
+        new_role = parts[1].lower().strip()
+        if new_role in ["medico", "médico", "doctor"]:
+            bot.set_role(ctx.chat_id, "medico")
+            reply_text = "👨‍⚕️ *Rol actualizado a MÉDICO.*\nAhora tienes acceso a herramientas de monitoreo y gestión clínica."
+        elif new_role in ["paciente", "usuario"]:
+            bot.set_role(ctx.chat_id, "paciente")
+            reply_text = "👤 *Rol actualizado a PACIENTE.*\nEl bot se enfocará en tu recuperación y seguimiento personal."
+        else:
+            reply_text = "⚠️ Rol no reconocido. Usa `medico` o `paciente`."
+    return reply_text
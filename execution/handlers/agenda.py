@@ -0,0 +1,92 @@
+"""Recordatorios diarios y citas médicas."""
+import datetime
+
+
+def recordatorio(ctx):
+    """/recordatorio HH:MM Mensaje: recordatorio diario."""
+    bot = ctx.bot
+    reply_text = ""
+    try:
+        parts = ctx.text.split(" ", 2)
+        if len(parts) < 3:
+            reply_text = "⚠️ Uso: /recordatorio HH:MM Mensaje\nEj: `/recordatorio 08:00 Tomar antibiótico`"
+        else:
+            time_str = parts[1]
+            note = parts[2]
+            # Validar formato de hora
+            datetime.datetime.strptime(time_str, "%H:%M")
+
+            bot.add_reminder(ctx.chat_id, time_str, note)
+            reply_text = f"✅ Recordatorio configurado.\nTe avisaré todos los días a las {time_str}: '{note}'."
+    except ValueError:
+        reply_text = "❌ Hora inválida. Usa formato 24h (HH:MM), ej: 14:30."
+    return reply_text
+
+
+def borrar_recordatorios(ctx):
+    """/borrar_recordatorios: elimina los recordatorios del usuario."""
+    bot = ctx.bot
+    reply_text = ""
+    # Solo se borran los del usuario; los de otros chats no se tocan
+    if not bot.delete_reminders(ctx.chat_id):
+        reply_text = "🤔 No tienes recordatorios configurados para borrar."
+    else:
+        reply_text = "✅ Todos tus recordatorios han sido eliminados."
+    return reply_text
+
+
+def cita(ctx):
+    """/cita DD/MM HH:MM Motivo: agenda una cita."""
+    bot = ctx.bot
+    reply_text = ""
+    try:
+        # Formato esperado: /cita DD/MM HH:MM Motivo
+        parts = ctx.text.split(" ", 3)
+        if len(parts) < 4:
+            reply_text = "⚠️ Uso: /cita DD/MM HH:MM Motivo\nEj: `/cita 25/10 15:30 Revisión general`"
+        else:
+            date_str = parts[1]
+            time_str = parts[2]
+            reason = parts[3]
+
+            # Validación simple de formato de fecha/hora
+            datetime.datetime.strptime(f"{date_str} {time_str}", "%d/%m %H:%M")
+
+            bot.add_appointment(ctx.chat_id, date_str, time_str, reason)
+
+            reply_text = f"✅ *Cita Agendada*\n\n📅 Fecha: {date_str}\n⏰ Hora: {time_str}\n📝 Motivo: {reason}\n\nHe registrado esta cita en el sistema."
+    except ValueError:
+        reply_text = "❌ Formato de fecha u hora inválido. Usa DD/MM HH:MM (ej: 25/10 14:00)."
+    return reply_text
+
+
+def mis_citas(ctx):
+    """/mis_citas: próximas citas del usuario."""
+    bot = ctx.bot
+    reply_text = ""
+    user_appts = bot.load_appointments(ctx.chat_id)
+
+    if not user_appts:
+        reply_text = "🗓️ No tienes ninguna cita agendada."
+    else:
+        future_appts = []
+        now = datetime.datetime.now()
+
+        for appt in user_appts:
+            try:
+                # Asume el año actual. Para una cita de enero hecha en diciembre, podría fallar.
+                # Para este caso de uso, es una simplificación aceptable.
+                appt_dt = datetime.datetime.strptime(f"{now.year}/{appt['date']} {appt['time']}", "%Y/%d/%m %H:%M")
+                if appt_dt >= now:
+                    future_appts.append(appt)
+            except ValueError:
+                continue # Ignorar citas con formato de fecha/hora corrupto
+
+        if not future_appts:
+            reply_text = "🗓️ No tienes citas pendientes. (Todas tus citas agendadas ya pasaron)."
+        else:
+            future_appts.sort(key=lambda x: datetime.datetime.strptime(f"{now.year}/{x['date']} {x['time']}", "%Y/%d/%m %H:%M"))
+            reply_text = "🗓️ *Tus Próximas Citas:*\n\n"
+            for appt in future_appts:
+                reply_text += f"▫️ *{appt['date']}* a las *{appt['time']}* - {appt['reason']}\n"
+    return reply_text
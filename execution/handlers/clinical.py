@@ -0,0 +1,260 @@
+"""Herramientas clínicas (solo rol médico): cámara, telemetría y pacientes simulados."""
+import os
+import time
+
+from command_router import requires_role
+from handlers import chat_tmp_path
+
+
+@requires_role("medico", denied="⛔ *Acceso Denegado:* Solo personal médico puede acceder a la cámara de vigilancia.")
+def foto(ctx):
+    """/foto: captura de la cámara de aislamiento (ESP32-CAM)."""
+    bot = ctx.bot
+    reply_text = ""
+    cam_ip = os.getenv("ESP32_CAM_IP")
+    if not cam_ip:
+        reply_text = "⚠️ Error de Configuración: La variable `ESP32_CAM_IP` no está definida en el archivo `.env`."
+    else:
+        print(f"   📸 Solicitando foto a {cam_ip}...")
+        bot.send_progress(ctx.chat_id, "📸 Conectando con la cámara de aislamiento...")
+
+        filename = f"cam_{int(time.time())}.jpg"
+        local_path = chat_tmp_path(ctx.chat_id, filename)
+
+        # Ejecutar script de captura
+        res = bot.run_tool("capture_image.py", ["--ip", cam_ip, "--output-file", local_path])
+
+        if res and res.get("status") == "success":
+            # Enviar foto
+            bot.send_file(ctx.chat_id, "photo", local_path, "Vista en tiempo real del paciente.")
+            reply_text = "✅ Captura completada."
+        else:
+            err = res.get("message", "Error desconocido") if res else "No se pudo conectar con la cámara."
+            reply_text = f"❌ Error al capturar imagen: {err}\n\nVerifique que la ESP32-CAM esté encendida y conectada al WiFi."
+    return reply_text
+
+
+@requires_role("medico", denied="⛔ *Acceso Denegado:* Este comando es exclusivo para personal médico.")
+def monitorear(ctx):
+    """/monitorear [ID]: signos vitales de todos los pacientes o de uno."""
+    bot = ctx.bot
+    reply_text = ""
+    patients = bot.load_patients()
+    parts = ctx.text.split(" ", 1)
+
+    if len(parts) < 2:
+        # Mostrar resumen de todos
+        if not patients:
+            reply_text = "🏥 No hay pacientes registrados en el sistema."
+        else:
+            reply_text = "📡 *Pacientes Activos:*\n\n"
+            for pid, p in patients.items():
+                ews = bot.early_warning(pid)
+                status = f"{ews['label']} (NEWS2 {ews['score']})" if ews else "⚪ Sin evaluar"
+                reply_text += f"👤 *{p.get('name')}* (`{pid}`)\n   Riesgo: {status} | HR: {p['heart_rate']} | SpO2: {p['spo2']}%\n\n"
+            reply_text += "Usa `/monitorear [ID]` para ver detalles."
+    else:
+        # Mostrar detalle de uno
+        pid = parts[1].strip()
+        vitals = patients.get(pid)
+        if vitals:
+            reply_text = (
+                f"📡 *Telemetría: {vitals.get('name')} ({pid})*\n\n"
+                f"💓 *Ritmo Cardíaco:* {vitals.get('heart_rate')} bpm\n"
+                f"🌡️ *Temperatura:* {vitals.get('temperature')}°C\n"
+                f"🫁 *SpO2:* {vitals.get('spo2')}%\n"
+                f"📉 *Presión:* {vitals.get('systolic')}/{vitals.get('diastolic')} mmHg\n"
+                f"_Última actualización: Hace {int(time.time() - vitals.get('last_update', 0))}s_"
+            )
+            ews = bot.early_warning(pid)
+            if ews:
+                reply_text += f"\n\n🧮 *NEWS2:* {ews['score']} — Riesgo {ews['label']}"
+                news = ews["trends"]["news2"]
+                if abs(news["slope_per_hour"]) >= 0.5:
+                    reply_text += f" ({news['slope_per_hour']:+.1f}/h)"
+                out = [(label, ews["trends"][field]["seconds_out_of_range"] // 60)
+                       for label, field in (("HR", "heart_rate"), ("SpO2", "spo2"), ("Temp", "temperature"), ("PAS", "systolic"))]
+                out = [f"{label} {minutes} min" for label, minutes in out if minutes]
+                if out:
+                    reply_text += "\n⏱️ *Tiempo fuera de rango (reciente):* " + ", ".join(out)
+            trend = bot.vitals_summary(pid)
+            if trend:
+                reply_text += "\n\n📈 *Última hora:*"
+                for label, t in (("💓 HR", trend["heart_rate"]), ("🫁 SpO2", trend["spo2"]), ("🌡️ Temp", trend["temperature"])):
+                    reply_text += f"\n{label}: {t['min']}–{t['max']} (media {t['mean']}"
+                    slope = t["slope_per_hour"]
+                    if slope is not None:
+                        arrow = "↗" if slope > 0.5 else "↘" if slope < -0.5 else "→"
+                        reply_text += f", {arrow} {slope:+}/h"
+                    reply_text += ")"
+        else:
+            reply_text = f"❌ Paciente `{pid}` no encontrado."
+    return reply_text
+
+
+@requires_role("medico", denied="⛔ Solo médicos pueden ejecutar simulaciones.")
+def simular_crisis(ctx):
+    """/simular_crisis [ID]: altera los signos vitales para probar las alertas."""
+    bot = ctx.bot
+    reply_text = ""
+    parts = ctx.text.split(" ", 1)
+    pid = parts[1].strip() if len(parts) > 1 else "SIM-001"
+
+    vitals = bot.get_patient(pid)
+    if vitals:
+        vitals["heart_rate"] = 145
+        vitals["spo2"] = 88
+        vitals["temperature"] = 39.2
+        vitals["last_alert"] = 0
+        bot.update_patient(pid, vitals)
+        reply_text = f"⚠️ *Simulación Iniciada para {vitals['name']}*: Signos vitales alterados."
+    else:
+        reply_text = f"❌ Paciente `{pid}` no encontrado. Usa `/monitorear` para ver IDs."
+    return reply_text
+
+
+@requires_role("medico", denied="⛔ Solo médicos pueden realizar procedimientos de estabilización.")
+def estabilizar(ctx):
+    """/estabilizar [ID]: normaliza los signos vitales."""
+    bot = ctx.bot
+    reply_text = ""
+    parts = ctx.text.split(" ", 1)
+    pid = parts[1].strip() if len(parts) > 1 else "SIM-001"
+
+    vitals = bot.get_patient(pid)
+    if vitals:
+        vitals["heart_rate"] = 75
+        vitals["temperature"] = 36.5
+        vitals["spo2"] = 98
+        vitals["systolic"] = 120
+        vitals["diastolic"] = 80
+        bot.update_patient(pid, vitals)
+        reply_text = f"✅ *{vitals['name']} Estabilizado/a*."
+    else:
+        reply_text = f"❌ Paciente `{pid}` no encontrado."
+    return reply_text
+
+
+@requires_role("medico", denied="⛔ Solo médicos pueden resetear los valores del paciente.")
+def paciente_reset(ctx):
+    """/paciente_reset [ID]: restablece los valores y el estado de alerta."""
+    bot = ctx.bot
+    reply_text = ""
+    parts = ctx.text.split(" ", 1)
+    pid = parts[1].strip() if len(parts) > 1 else "SIM-001"
+
+    vitals = bot.get_patient(pid)
+    if vitals:
+        vitals["heart_rate"] = 75
+        vitals["temperature"] = 36.5
+        vitals["spo2"] = 98
+        vitals["last_alert"] = 0
+        bot.update_patient(pid, vitals)
+        reply_text = f"🔄 *Valores de {vitals['name']} Reseteados*."
+    else:
+        reply_text = f"❌ Paciente `{pid}` no encontrado."
+    return reply_text
+
+
+@requires_role("medico", denied="⛔ Acceso denegado.")
+def ack(ctx):
+    """/ack [ID|todos]: confirma las alertas abiertas y detiene su escalado."""
+    bot = ctx.bot
+    parts = ctx.text.split(" ", 1)
+    target = parts[1].strip() if len(parts) > 1 else "todos"
+    pid = None if target.lower() in ("todos", "all") else target
+    count = bot.ack_alerts(pid, by=ctx.chat_id)
+    if count:
+        scope = "de todos los pacientes" if pid is None else f"de `{pid}`"
+        return f"✅ {count} alerta(s) {scope} confirmada(s). No se escalarán al administrador."
+    return "ℹ️ No hay alertas pendientes de confirmar" + ("." if pid is None else f" para `{pid}`.")
+
+
+@requires_role("medico", denied="⛔ Acceso denegado.")
+def historial_alertas(ctx):
+    """/historial_alertas [ID] [horas] | resumen [días]: últimas alertas o recuento por paciente y día."""
+    bot = ctx.bot
+    args = ctx.text.split()[1:]
+
+    if args and args[0].lower() in ("resumen", "summary"):
+        days = int(args[1]) if len(args) > 1 and args[1].isdigit() else 7
+        counts = bot.alert_counts(start=time.time() - days * 86400)
+        if not counts:
+            return f"📋 Sin alertas en los últimos {days} días."
+        reply_text = f"📊 *Alertas por paciente y día ({days} días):*\n"
+        current_day = None
+        for row in counts[:40]:
+            if row["day"] != current_day:
+                current_day = row["day"]
+                reply_text += f"\n📅 *{current_day}*\n"
+            reply_text += f"   `{row['patient_id']}`: {row['count']}\n"
+        return reply_text
+
+    pid = next((a for a in args if not a.isdigit()), None)
+    hours = next((int(a) for a in args if a.isdigit()), None)
+    start = time.time() - hours * 3600 if hours else None
+    # Las 10 últimas, sin leer el historial completo
+    alerts = bot.recent_alerts(10, patient_id=pid, start=start)
+    if not alerts:
+        return "📋 No hay alertas registradas" + (f" para `{pid}`." if pid else " aún.")
+    lines = []
+    for a in reversed(alerts):
+        stamp = time.strftime("%Y-%m-%d %H:%M:%S", time.localtime(a["ts"]))
+        status = " ✅" if a["resolved_at"] else ""
+        lines.append(f"[{stamp}] [{a['patient_id']}] {a['message']}{status}\n")
+    return "📋 *Historial de Alertas Recientes:*\n\n" + "".join(lines)
+
+
+@requires_role("medico", denied="⛔ Solo médicos pueden registrar pacientes.")
+def nuevo_paciente(ctx):
+    """/nuevo_paciente [ID] Nombre: registra un paciente simulado."""
+    bot = ctx.bot
+    reply_text = ""
+    patients = bot.load_patients()
+    args = ctx.text.split(" ", 1)
+
+    if len(args) < 2:
+        reply_text = "⚠️ Uso: `/nuevo_paciente [Nombre]` (ID automático) o `/nuevo_paciente [ID] [Nombre]`"
+    else:
+        content = args[1].strip()
+
+        # Detectar si el primer término es un ID manual (ej: SIM-005)
+        first_word = content.split(" ")[0]
+        if first_word.upper().startswith("SIM-") and " " in content:
+            new_id = first_word.upper()
+            new_name = content.split(" ", 1)[1].strip()
+        else:
+            # Generar ID automático (SIM-XXX)
+            max_n = 0
+            for pid in patients:
+                if pid.startswith("SIM-"):
+                    try:
+                        n = int(pid.split("-")[1])
+                        if n > max_n: max_n = n
+                    except: pass
+            new_id = f"SIM-{max_n + 1:03d}"
+            new_name = content
+
+        if new_id in patients:
+            reply_text = f"⚠️ El paciente con ID `{new_id}` ya existe."
+        else:
+            # Crear paciente con valores vitales por defecto (estables)
+            bot.update_patient(new_id, { "name": new_name, "heart_rate": 75, "temperature": 36.5, "spo2": 98, "systolic": 120, "diastolic": 80, "last_update": time.time(), "last_alert": 0 })
+            reply_text = f"✅ *Paciente Registrado*\n\n👤 Nombre: {new_name}\n🆔 ID: `{new_id}`\n\nYa está activo en el sistema de monitoreo."
+    return reply_text
+
+
+@requires_role("medico", denied="⛔ Acceso denegado.")
+def pacientes(ctx):
+    """/pacientes: lista de pacientes registrados."""
+    bot = ctx.bot
+    reply_text = ""
+    patients = bot.load_patients()
+    if not patients:
+        reply_text = "🏥 No hay pacientes registrados."
+    else:
+        reply_text = "🏥 *Lista de Pacientes:*\n\n"
+        for pid, p in patients.items():
+            reply_text += f"👤 *{p.get('name')}* (ID: `{pid}`)\n"
+        reply_text += "\nUsa `/monitorear [ID]` para ver sus signos vitales."
+    return reply_text
@@ -0,0 +1,141 @@
+"""Traducción y resumen de textos, archivos locales y páginas web."""
+import os
+
+from handlers import BASE_DIR, chat_tmp_path, remove_quietly
+
+
+def traducir(ctx):
+    """/traducir [texto | archivo]: traducción al español."""
+    bot = ctx.bot
+    reply_text = ""
+    content = ctx.text.split(" ", 1)[1].strip() if " " in ctx.text else ""
+    if not content:
+        reply_text = "⚠️ Uso: /traducir [texto | nombre_archivo]"
+    else:
+        # Verificar si es un archivo local (docs o la carpeta temporal de este chat)
+        base_dir = BASE_DIR
+        docs_file = os.path.join(base_dir, "docs", os.path.basename(content))
+        tmp_file = os.path.join(base_dir, chat_tmp_path(ctx.chat_id, content))
+
+        target_file = None
+        if os.path.exists(docs_file): target_file = docs_file
+        elif os.path.exists(tmp_file): target_file = tmp_file
+
+        if target_file:
+            print(f"   📄 Traduciendo archivo: {content}")
+            bot.send_progress(ctx.chat_id, f"⏳ Traduciendo `{content}` al español...")
+
+            res = bot.run_tool("translate_text.py", ["--file", target_file, "--lang", "Español"])
+
+            if res and res.get("status") == "success":
+                out_path = res.get("file_path")
+                bot.send_file(ctx.chat_id, "document", out_path, "📄 Traducción al Español")
+                reply_text = "✅ Archivo traducido enviado."
+            else:
+                err = res.get("message", "Error desconocido") if res else "Error en script"
+                reply_text = f"❌ Error al traducir archivo: {err}"
+        else:
+            # Traducir texto plano
+            print(f"   🔤 Traduciendo texto...")
+            prompt = f"Traduce el siguiente texto al Español. Devuelve solo la traducción:\n\n{content}"
+            llm_res = bot.run_tool("chat_with_llm.py", ["--prompt", prompt, "--chat-id", ctx.chat_id])
+            if llm_res and "content" in llm_res:
+                reply_text = f"🇪🇸 *Traducción:*\n\n{llm_res['content']}"
+            else:
+                reply_text = "❌ Error al traducir texto."
+    return reply_text
+
+
+def resumir_archivo(ctx):
+    """/resumir_archivo [nombre]: resume un archivo de docs/ leído en el sandbox."""
+    bot = ctx.bot
+    reply_text = ""
+    filename = ctx.text.split(" ", 1)[1].strip() if " " in ctx.text else ""
+    if not filename:
+        reply_text = "⚠️ Uso: /resumir_archivo [nombre_del_archivo_en_docs]"
+    else:
+        print(f"   📄 Resumiendo archivo local: {filename}")
+        bot.send_progress(ctx.chat_id, f"⏳ Leyendo y resumiendo `{filename}`...")
+
+        # 1. Leer el archivo desde el Sandbox
+        path_in_container = f"/mnt/docs/{filename}"
+
+        if filename.lower().endswith(".pdf"):
+            # Código para extraer texto de PDF usando pypdf
+            read_code = (
+                f"from pypdf import PdfReader; "
+                f"reader = PdfReader('{path_in_container}'); "
+                f"print('\\n'.join([page.extract_text() for page in reader.pages]))"
+            )
+        else:
+            read_code = f"with open('{path_in_container}', 'r', encoding='utf-8') as f: print(f.read())"
+
+        read_res = bot.run_tool("run_sandbox.py", ["--code", read_code])
+
+        if read_res and read_res.get("status") == "success" and read_res.get("stdout"):
+            content = read_res.get("stdout")
+
+            if len(content) > 10000:
+                content = content[:10000] + "... (truncado)"
+
+            # 2. Enviar a LLM para resumir
+            prompt = f"Resume el siguiente documento llamado '{filename}':\n\n{content}"
+            llm_res = bot.run_tool("chat_with_llm.py", ["--prompt", prompt, "--chat-id", ctx.chat_id])
+
+            if llm_res and "content" in llm_res:
+                reply_text = llm_res["content"]
+            else:
+                reply_text = "❌ Error generando el resumen."
+        else:
+            error_details = read_res.get("stderr") or read_res.get("message", "No se pudo leer el archivo.")
+            reply_text = f"❌ Error al leer el archivo `{filename}` desde el Sandbox:\n`{error_details}`"
+    return reply_text
+
+
+def resumir(ctx):
+    """/resumir [url]: resume una página web."""
+    bot = ctx.bot
+    reply_text = ""
+    url = ctx.text.split(" ", 1)[1] if " " in ctx.text else ""
+    if not url:
+        reply_text = "⚠️ Uso: /resumir [url]"
+    else:
+        print(f"   🌐 Resumiendo URL: {url}")
+        bot.send_progress(ctx.chat_id, f"⏳ Leyendo {url}...")
+
+        # 1. Scrape
+        output_file = chat_tmp_path(ctx.chat_id, "web_content.txt")
+        scrape_res = bot.run_tool("scrape_single_site.py", ["--url", url, "--output-file", output_file])
+
+        if scrape_res and scrape_res.get("status") == "success":
+            # 2. Summarize
+            try:
+                with open(output_file, "r", encoding="utf-8") as f:
+                    content = f.read()
+                remove_quietly(output_file)
+
+                # Truncar si es muy largo (ej. 10k caracteres) para no saturar CLI args
+                if len(content) > 10000:
+                    content = content[:10000] + "... (truncado)"
+
+                prompt = f"Resume el siguiente contenido web para Telegram:\n\n{content}"
+                llm_res = bot.run_tool("chat_with_llm.py", ["--prompt", prompt, "--chat-id", ctx.chat_id])
+
+                if llm_res and "content" in llm_res:
+                    reply_text = llm_res["content"]
+                elif llm_res and "error" in llm_res:
+                    reply_text = f"⚠️ Error del modelo: {llm_res['error']}"
+                else:
+                    reply_text = "❌ Error generando resumen."
+
+            except Exception as e:
+                reply_text = f"❌ Error leyendo contenido: {e}"
+        else:
+            err = scrape_res.get("message") if scrape_res else "Error desconocido"
+            # Ayuda contextual si el usuario intenta usar /resumir con un archivo local
+            if "No scheme supplied" in str(err):
+                filename = url.split('/')[-1]
+                reply_text = f"🤔 El comando `/resumir` es para URLs (ej: `https://...`).\n\nSi querías resumir el archivo local `{filename}`, el comando correcto es:\n`/resumir_archivo {filename}`"
+            else:
+                reply_text = f"❌ Error leyendo la web: {err}"
+    return reply_text
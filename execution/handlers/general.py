@@ -0,0 +1,185 @@
+"""Ayuda, idioma de voz, sandbox, saludos y chat general con el LLM."""
+import datetime
+import os
+
+from handlers import BASE_DIR
+from response_cache import is_general_question
+
+
+def idioma(ctx):
+    """/idioma [es/en/fr/pt]: idioma de las notas de voz."""
+    bot = ctx.bot
+    reply_text = ""
+    parts = ctx.text.split(" ")
+    if len(parts) < 2:
+        reply_text = "⚠️ Uso: /idioma [es/en]\nEj: `/idioma en` (para inglés)"
+    else:
+        lang_map = {"es": "es-ES", "en": "en-US", "fr": "fr-FR", "pt": "pt-BR"}
+        selection = parts[1].lower()
+        code = lang_map.get(selection, "es-ES")
+        bot.set_config("voice_lang", code)
+        reply_text = f"✅ Idioma de voz cambiado a: `{code}`.\nAhora te escucharé en ese idioma."
+    return reply_text
+
+
+def ayuda_medica(ctx):
+    """/ayuda_medica: envía el manual PDF de recuperación."""
+    bot = ctx.bot
+    reply_text = ""
+    manual_path = os.path.join(BASE_DIR, "docs", "manual_medico.pdf")
+    if os.path.exists(manual_path):
+        print(f"   🏥 Enviando manual médico a {ctx.chat_id}...")
+        bot.send_text(ctx.chat_id, "📘 Aquí tienes la guía de uso para tu recuperación.")
+        bot.send_file(ctx.chat_id, "document", manual_path, "Manual de Asistente Médico (IA)")
+    else:
+        reply_text = "⚠️ El manual PDF no ha sido generado aún. Pide al administrador que ejecute `pdflatex`."
+    return reply_text
+
+
+def ayuda(ctx):
+    """/ayuda: comandos disponibles según el rol."""
+    bot = ctx.bot
+    reply_text = ""
+    role = bot.get_role(ctx.chat_id)
+
+    if role == "medico":
+        reply_text = (
+            "👨‍⚕️ *Panel de Control Médico:*\n\n"
+            "📡 `/monitorear`: Ver signos vitales de pacientes (Sensores).\n"
+            "📸 `/foto`: Ver cámara en tiempo real.\n"
+            "➕ `/nuevo_paciente`: Registrar nuevo ingreso.\n"
+            "🔬 `/reporte [tema]`: Generar informe clínico detallado.\n"
+            "🔍 `/investigar [tema]`: Búsqueda médica avanzada.\n"
+            "📋 `/historial_alertas [ID|resumen]`: Ver registro de crisis pasadas.\n"
+            "✅ `/ack [ID|todos]`: Confirmar alertas (evita el escalado).\n"
+            "🏥 `/pacientes`: Lista de pacientes activos.\n"
+            "📄 `/resumir_archivo [pdf]`: Analizar historia clínica.\n"
+            "⚙️ `/status`: Estado del servidor.\n"
+            "⚠️ `/simular_crisis`: Test de alertas.\n"
+            "💉 `/estabilizar`: Normalizar signos vitales.\n"
+            "👤 `/rol paciente`: Cambiar a vista de paciente.\n"
+        )
+    else:
+        reply_text = (
+            "🤖 *Asistente de Paciente:*\n\n"
+            "📅 `/cita [fecha]`: Agendar nueva cita.\n"
+            "🗓️ `/mis_citas`: Ver mis citas pendientes.\n"
+            "⏰ `/recordatorio`: Configurar alarma de medicamentos.\n"
+            "📘 `/ayuda_medica`: Ver manual de recuperación.\n"
+            "🗣️ *Notas de voz*: Puedes hablarme para consultas.\n"
+            "👨‍⚕️ `/rol medico`: (Solo personal autorizado).\n"
+        )
+    return reply_text
+
+
+def py(ctx):
+    """/py [código]: ejecuta Python en el sandbox y devuelve salida y archivos."""
+    bot = ctx.bot
+    reply_text = ""
+    code_to_run = ctx.text.split(" ", 1)[1].strip()
+    print(f"   🐍 Ejecutando en Sandbox: {code_to_run}")
+
+    res = bot.run_tool("run_sandbox.py", ["--code", code_to_run])
+
+    reply_text = "" # Resetear
+    if res and res.get("status") == "success":
+        stdout = res.get("stdout", "")
+        stderr = res.get("stderr", "")
+
+        # --- Manejo de Salida de Archivos ---
+        sent_file = False
+        clean_stdout_lines = []
+        if stdout:
+            for line in stdout.splitlines():
+                potential_path_in_container = line.strip()
+                if potential_path_in_container.startswith('/mnt/out/'):
+                    filename = os.path.basename(potential_path_in_container)
+                    local_path = os.path.join(".tmp", filename)
+                    if os.path.exists(local_path):
+                        print(f"   🖼️  Detectado archivo de salida: {local_path}. Enviando...")
+                        bot.send_file(ctx.chat_id, "photo", local_path, "Archivo generado por el Sandbox.")
+                        sent_file = True
+                        continue # No añadir esta línea a la respuesta de texto
+                clean_stdout_lines.append(line)
+
+        clean_stdout = "\n".join(clean_stdout_lines)
+
+        # --- Manejo de Salida de Texto ---
+        text_output_exists = clean_stdout or stderr
+        if text_output_exists:
+            reply_text = "📦 *Resultado del Sandbox:*\n\n"
+            if clean_stdout:
+                reply_text += f"*Salida:*\n```\n{clean_stdout}\n```\n"
+            if stderr:
+                reply_text += f"*Errores:*\n```\n{stderr}\n```\n"
+        elif not sent_file: # No hay salida de texto Y no se envió archivo
+            reply_text = "📦 *Resultado del Sandbox:*\n\n_El código se ejecutó sin producir salida._"
+    else:
+        reply_text = f"❌ *Error en Sandbox:*\n{res.get('message', 'Error desconocido.')}"
+    return reply_text
+
+
+def saludo(ctx):
+    """Saludo inicial según el rol."""
+    bot = ctx.bot
+    reply_text = ""
+    role = bot.get_role(ctx.chat_id)
+    if role == "medico":
+        reply_text = "👨‍⚕️ *Bienvenido, Doctor.*\n\nEl sistema de telemetría y asistencia clínica está activo. Use `/monitorear` para ver el estado de los pacientes o `/ayuda` para ver las herramientas profesionales."
+    else:
+        reply_text = """👋 ¡Hola! Soy tu Asistente de Telemedicina.
+
+    Estoy aquí para ayudarte a gestionar tu salud y responder tus consultas.
+
+    Puedes interactuar conmigo de varias formas:
+    - Envíame un informe en PDF para que lo analice.
+    - Pídeme un reporte sobre una condición médica con `/reporte [tema]`.
+    - Usa `/ayuda` para ver todos los comandos disponibles."""
+    return reply_text
+
+
+def gracias(ctx):
+    """Respuesta a los agradecimientos."""
+    reply_text = ""
+    reply_text = "¡De nada! Estoy aquí para ayudar. 🤖"
+    return reply_text
+
+
+def conversar(ctx):
+    """Chat general con el LLM (memoria RAG, persona y fecha actual)."""
+    bot = ctx.bot
+    reply_text = ""
+    # Estrategia Directa con RAG:
+    # Enviamos el mensaje al LLM. El script chat_with_llm.py se encarga de
+    # buscar en la memoria e inyectar el contexto si es relevante.
+    print("   🤔 Consultando al Agente (con memoria)...")
+    # La persona es fija (el proveedor la cachea); fecha e idioma van aparte
+    current_sys = bot.get_current_persona()
+    extra_sys = []
+
+    # Las preguntas de conocimiento general ("¿qué es la hemoglobina?") no dependen
+    # de la conversación ni de la hora: se pueden responder desde la caché
+    cacheable = is_general_question(ctx.text)
+    if not cacheable:
+        # Inyectar fecha y hora actual para que el LLM lo sepa
+        now_str = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        extra_sys.append(f"[Contexto Temporal: Fecha y Hora actual del servidor: {now_str}]")
+
+    # Si la interacción fue por voz, instruir al LLM que responda en ese idioma
+    if ctx.is_voice and ctx.voice_lang != "es":
+        extra_sys.append(f"IMPORTANT: The user is speaking in '{ctx.voice_lang}'. You MUST respond in '{ctx.voice_lang}', regardless of your default instructions.")
+
+    ctx.stream_reply = bot.open_stream(ctx.chat_id)
+    args = ["--prompt", ctx.text, "--system", current_sys, "--chat-id", ctx.chat_id]
+    if extra_sys:
+        args += ["--system-extra", "\n".join(extra_sys)]
+    if cacheable:
+        args.append("--cache")
+    llm_response = bot.ask_llm(args, ctx.stream_reply)
+
+    if llm_response and "content" in llm_response:
+        reply_text = llm_response["content"]
+    else:
+        error_msg = llm_response.get('error', 'Respuesta vacía') if llm_response else "Error desconocido"
+        reply_text = f"⚠️ Error del Modelo: {error_msg}"
+    return reply_text
@@ -0,0 +1,143 @@
+"""Archivos recibidos por Telegram: fotos, documentos PDF y notas de voz."""
+import os
+import time
+
+from command_router import REDISPATCH
+from handlers import chat_tmp_path, remove_quietly
+
+# Instrucción fija del análisis de PDF: va como sistema para que el proveedor la cachee
+PDF_ANALYSIS_SYSTEM = """Actúa como un Asistente Médico experto y empático. Analiza el documento PDF proporcionado por el usuario.
+
+TAREA:
+1.  **Identifica el tipo de documento** (ej: informe de laboratorio, receta, artículo médico, guía de uso, etc.).
+2.  **Si es un informe médico o de laboratorio:**
+    - Resume los hallazgos principales.
+    - Explica los términos técnicos en lenguaje sencillo para un paciente.
+    - Si hay diagnósticos o tratamientos, explícalos brevemente.
+    - **IMPORTANTE:** Termina tu respuesta con el disclaimer: "Nota: Soy una IA. Este análisis es informativo y no sustituye la opinión de un médico."
+3.  **Si es cualquier otro tipo de documento:**
+    - Simplemente resume su contenido y propósito principal de forma clara.
+"""
+
+
+def foto_recibida(ctx):
+    """Foto enviada al chat: se descarga y se describe con analyze_image."""
+    bot = ctx.bot
+    content = ctx.text
+    reply_text = ""
+    parts = content.replace("__PHOTO__:", "").split("|||")
+    file_id = parts[0]
+    caption = parts[1] if len(parts) > 1 else "Describe esta imagen."
+    if not caption.strip(): caption = "Describe qué ves en esta imagen."
+
+    print(f"   📸 Foto recibida. Descargando ID: {file_id}...")
+    bot.send_progress(ctx.chat_id, "👀 Analizando imagen...")
+
+    # Descargar
+    local_path = os.path.join(".tmp", f"photo_{ctx.chat_id}_{int(time.time())}.jpg")
+    bot.run_tool("telegram_tool.py", ["--action", "download", "--file-id", file_id, "--dest", local_path])
+
+    # Analizar
+    res = bot.run_tool("analyze_image.py", ["--image", local_path, "--prompt", caption])
+    if res and res.get("status") == "success":
+        reply_text = f"👁️ *Análisis Visual:*\n{res.get('description')}"
+    else:
+        reply_text = f"❌ Error analizando imagen: {res.get('message')}"
+    return reply_text
+
+
+def documento_recibido(ctx):
+    """PDF enviado al chat: se extrae el texto en el sandbox y lo analiza el LLM."""
+    bot = ctx.bot
+    content = ctx.text
+    reply_text = ""
+
+    parts = content.replace("__DOCUMENT__:", "").split("|||")
+    file_id = parts[0]
+    file_name = parts[1]
+    caption = parts[2] if len(parts) > 2 else ""
+
+    print(f"   📄 Documento recibido: {file_name}. Descargando...")
+    bot.send_progress(ctx.chat_id, f"📂 Recibí `{file_name}`. Leyendo contenido...")
+
+    # Descargar a la carpeta del chat dentro de .tmp (que se monta en /mnt/out en el sandbox)
+    local_path = chat_tmp_path(ctx.chat_id, file_name)
+    bot.run_tool("telegram_tool.py", ["--action", "download", "--file-id", file_id, "--dest", local_path])
+
+    # Extraer texto usando el Sandbox (ya tiene pypdf)
+    # Nota: .tmp está montado en /mnt/out dentro del contenedor
+    path_in_sandbox = "/mnt/out/" + os.path.relpath(local_path, ".tmp").replace(os.sep, "/")
+
+    read_code = (
+        f"from pypdf import PdfReader; "
+        f"reader = PdfReader('{path_in_sandbox}'); "
+        f"print('\\n'.join([page.extract_text() for page in reader.pages]))"
+    )
+
+    res_sandbox = bot.run_tool("run_sandbox.py", ["--code", read_code])
+    remove_quietly(local_path)
+
+    if res_sandbox and res_sandbox.get("status") == "success":
+        content = res_sandbox.get("stdout", "")
+        if len(content) > 15000:
+            content = content[:15000] + "... (truncado)"
+
+        if not content.strip():
+            reply_text = "⚠️ El documento parece estar vacío o es una imagen escaneada sin texto (OCR no disponible en sandbox)."
+        else:
+            # Analizar con LLM
+            # Solo lo variable va en el prompt; la tarea está en PDF_ANALYSIS_SYSTEM
+            analysis_prompt = f"""CONTEXTO DEL USUARIO (si lo hay): {caption}
+
+CONTENIDO DEL DOCUMENTO:
+---
+{content}
+---
+"""
+            bot.send_progress(ctx.chat_id, "🧠 Analizando informe médico...")
+
+            ctx.stream_reply = bot.open_stream(ctx.chat_id)
+            llm_res = bot.ask_llm(["--prompt", analysis_prompt, "--system", PDF_ANALYSIS_SYSTEM, "--chat-id", ctx.chat_id],
+                                  ctx.stream_reply)
+
+            if llm_res and "content" in llm_res:
+                reply_text = llm_res["content"]
+            else:
+                reply_text = "❌ Error al analizar el documento con la IA."
+    else:
+        err = res_sandbox.get("stderr") or res_sandbox.get("message")
+        reply_text = f"❌ Error leyendo el PDF: {err}"
+    return reply_text
+
+
+def nota_de_voz(ctx):
+    """Nota de voz: se transcribe y el texto vuelve a pasar por el router."""
+    bot = ctx.bot
+    content = ctx.text
+    reply_text = ""
+
+    ctx.is_voice = True
+    file_id = content.replace("__VOICE__:", "")
+    print(f"   🎤 Nota de voz recibida. Descargando ID: {file_id}...")
+
+    bot.send_progress(ctx.chat_id, "👂 Escuchando...")
+
+    local_path = os.path.join(".tmp", f"voice_{ctx.chat_id}_{int(time.time())}.ogg")
+    bot.run_tool("telegram_tool.py", ["--action", "download", "--file-id", file_id, "--dest", local_path])
+
+    # Transcribir
+    # Cargar idioma configurado (default es-ES)
+    lang_code = bot.get_config("voice_lang", "es-ES")
+    ctx.voice_lang = lang_code.split('-')[0] # 'es-ES' -> 'es'
+
+    res = bot.run_tool("transcribe_audio.py", ["--file", local_path, "--lang", lang_code])
+    if res and res.get("status") == "success":
+        text = res.get("text")
+        print(f"   📝 Transcripción: '{text}'")
+        # ¡Truco! Reemplazamos el mensaje de voz por su texto y dejamos que el flujo continúe
+        ctx.text = text
+        bot.send_text(ctx.chat_id, f"🗣️ Dijiste: \"{text}\"")
+    else:
+        err_msg = res.get("message", "Error desconocido") if res else "Falló el script de transcripción"
+        reply_text = f"❌ No pude entender el audio. Detalle: {err_msg}"
+    return reply_text or REDISPATCH
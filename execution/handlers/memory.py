@@ -0,0 +1,63 @@
+"""Memoria a largo plazo (ChromaDB): guardar, listar y borrar recuerdos."""
+
+
+def recordar(ctx):
+    """/recordar [dato]: guarda una nota en la memoria a largo plazo."""
+    bot = ctx.bot
+    reply_text = ""
+    memory_text = ctx.text.split(" ", 1)[1] if " " in ctx.text else ""
+    if not memory_text:
+        reply_text = "⚠️ Uso: /recordar [dato a guardar]"
+    else:
+        print(f"   💾 Guardando en memoria: {memory_text}")
+        bot.send_progress(ctx.chat_id, "💾 Guardando nota...")
+
+        # Ejecutar herramienta de memoria (save_memory.py)
+        res = bot.run_tool("save_memory.py", ["--text", memory_text, "--category", "telegram_note"])
+
+        if res and res.get("status") == "success":
+            reply_text = "✅ Nota guardada en memoria a largo plazo."
+        else:
+            reply_text = "❌ Error al guardar. (Verifica que save_memory.py exista y funcione)."
+    return reply_text
+
+
+def memorias(ctx):
+    """/memorias: últimos recuerdos guardados."""
+    bot = ctx.bot
+    reply_text = ""
+    print("   🧠 Consultando lista de recuerdos...")
+    bot.send_progress(ctx.chat_id, "🧠 Consultando base de datos...")
+
+    res = bot.run_tool("list_memories.py", ["--limit", "5"])
+    if res and res.get("status") == "success":
+        memories = res.get("memories", [])
+        if not memories:
+            reply_text = "📭 No tengo recuerdos guardados aún."
+        else:
+            reply_text = "🧠 *Últimos recuerdos:*\n"
+            for m in memories:
+                date = m.get("timestamp", "").replace("T", " ").split(".")[0]
+                content = m.get("content", "")
+                mem_id = m.get("id", "N/A")
+                reply_text += f"🆔 `{mem_id}`\n📅 {date}: {content}\n\n"
+    else:
+        reply_text = "❌ Error al consultar la memoria."
+    return reply_text
+
+
+def olvidar(ctx):
+    """/olvidar [ID]: borra un recuerdo."""
+    bot = ctx.bot
+    reply_text = ""
+    mem_id = ctx.text.split(" ", 1)[1] if " " in ctx.text else ""
+    if not mem_id:
+        reply_text = "⚠️ Uso: /olvidar [ID]"
+    else:
+        print(f"   🗑️ Eliminando recuerdo: {mem_id}")
+        res = bot.run_tool("delete_memory.py", ["--id", mem_id])
+        if res and res.get("status") == "success":
+            reply_text = "✅ Recuerdo eliminado."
+        else:
+            reply_text = f"❌ Error al eliminar: {res.get('message', 'Desconocido')}"
+    return reply_text
@@ -0,0 +1,126 @@
+"""Investigación web y reportes médicos generados por el LLM."""
+import os
+
+from handlers import BASE_DIR, chat_tmp_path, remove_quietly
+
+# Plantilla fija de /reporte: va como sistema para que el proveedor la cachee
+REPORT_SYSTEM = """Actúa como un Asistente Médico de Investigación experto y empático.
+Basado en los resultados de búsqueda que te dé el usuario, genera un REPORTE DETALLADO en formato Markdown sobre el tema indicado.
+
+Estructura sugerida:
+1. 📋 Resumen Ejecutivo
+2. 💊 Tratamientos Convencionales
+3. 🧘 Terapias de Rehabilitación y Fisioterapia (Ejercicios recomendados)
+4. ⏱️ Tiempos de Recuperación Estimados
+5. 🏠 Recomendaciones y Cuidados en Casa
+
+IMPORTANTE:
+- Usa un tono profesional pero claro y esperanzador.
+- INCLUYE UN DISCLAIMER AL INICIO: "Nota: Soy una IA. Este reporte es informativo y no sustituye el consejo médico profesional."
+"""
+
+
+def investigar(ctx):
+    """/investigar [tema]: búsqueda web resumida por el LLM."""
+    bot = ctx.bot
+    reply_text = ""
+    topic = ctx.text.split(" ", 1)[1] if " " in ctx.text else ""
+    if not topic:
+        reply_text = "⚠️ Uso: /investigar [tema]"
+    else:
+        print(f"   🔍 Ejecutando investigación sobre: {topic}")
+        bot.send_progress(ctx.chat_id, f"🕵️‍♂️ Investigando sobre '{topic}'... dame unos segundos.")
+
+        # Ejecutar herramienta de research
+        output_file = chat_tmp_path(ctx.chat_id, "research.txt")
+        res = bot.run_tool("research_topic.py", ["--query", topic, "--output-file", output_file])
+
+        if res and res.get("status") == "success":
+            # Leer y resumir resultados
+            try:
+                with open(output_file, "r", encoding="utf-8") as f:
+                    data = f.read()
+                remove_quietly(output_file)
+                print("   🧠 Resumiendo resultados...")
+
+                # Prompt mejorado: pide al LLM que use su memoria (RAG) y los resultados de la búsqueda.
+                summarization_prompt = f"""Considerando lo que ya sabes en tu memoria y los siguientes resultados de búsqueda sobre '{topic}', crea un resumen conciso para Telegram.
+
+Resultados de Búsqueda:
+---
+{data}"""
+                llm_res = bot.run_tool("chat_with_llm.py", ["--prompt", summarization_prompt, "--memory-query", topic, "--chat-id", ctx.chat_id,
+                                                          "--cache", "--cache-key", f"investigar: {topic}"])
+
+                if llm_res and "content" in llm_res:
+                    reply_text = llm_res["content"]
+                elif llm_res and "error" in llm_res:
+                    reply_text = f"⚠️ Error del modelo: {llm_res['error']}"
+                else:
+                    reply_text = "❌ No se pudo generar el resumen (Respuesta vacía o inválida)."
+            except Exception as e:
+                reply_text = f"Error procesando resultados: {e}"
+        else:
+            reply_text = "❌ Error al ejecutar la herramienta de investigación."
+    return reply_text
+
+
+def reporte(ctx):
+    """/reporte [tema]: informe médico detallado guardado en docs/."""
+    bot = ctx.bot
+    reply_text = ""
+    topic = ctx.text.split(" ", 1)[1] if " " in ctx.text else ""
+    if not topic:
+        reply_text = "⚠️ Uso: /reporte [tema médico o de investigación]"
+    else:
+        print(f"   🏥 Generando reporte sobre: {topic}")
+        bot.send_progress(ctx.chat_id, f"👩‍⚕️ Iniciando investigación profunda sobre '{topic}'... Esto tomará unos segundos.")
+
+        # 1. Investigar (Search)
+        # Buscamos específicamente tratamientos y terapias
+        query = f"tratamientos terapias y recuperación para {topic}"
+        output_file = chat_tmp_path(ctx.chat_id, "med_research.txt")
+        res_search = bot.run_tool("research_topic.py", ["--query", query, "--output-file", output_file])
+
+        if res_search and res_search.get("status") == "success":
+            try:
+                with open(output_file, "r", encoding="utf-8") as f:
+                    search_data = f.read()
+                remove_quietly(output_file)
+
+                # 2. Generar Reporte (LLM)
+                # La plantilla del informe está en REPORT_SYSTEM; aquí solo lo que cambia
+                report_prompt = f"""TEMA DEL REPORTE: '{topic}'
+
+    RESULTADOS DE BÚSQUEDA:
+    {search_data}
+    """
+                bot.send_progress(ctx.chat_id, "🧠 Analizando datos y redactando informe...")
+
+                # Usamos --memory-query para que busque en memoria solo el tema, no el prompt entero
+                ctx.stream_reply = bot.open_stream(ctx.chat_id)
+                llm_res = bot.ask_llm(["--prompt", report_prompt, "--system", REPORT_SYSTEM, "--memory-query", topic,
+                                       "--chat-id", ctx.chat_id, "--cache", "--cache-key", f"reporte: {topic}"],
+                                      ctx.stream_reply)
+
+                if llm_res and "content" in llm_res:
+                    report_content = llm_res["content"]
+
+                    # 3. Guardar en docs/
+                    safe_topic = "".join([c if c.isalnum() else "_" for c in topic])[:30]
+                    filename = f"Reporte_Medico_{safe_topic}.md"
+                    # Construir ruta absoluta a docs/
+                    docs_path = os.path.join(BASE_DIR, "docs", filename)
+
+                    with open(docs_path, "w", encoding="utf-8") as f:
+                        f.write(report_content)
+
+                    reply_text = f"✅ *Reporte Generado Exitosamente*\n\nHe guardado el informe detallado en:\n`docs/{filename}`\n\nAquí tienes un resumen:\n\n" + report_content[:400] + "...\n\n_(Lee el archivo completo en tu carpeta docs)_"
+                else:
+                    reply_text = "❌ Error al redactar el reporte con el modelo."
+
+            except Exception as e:
+                reply_text = f"❌ Error procesando el reporte: {e}"
+        else:
+            reply_text = "❌ Error en la fase de investigación (Búsqueda)."
+    return reply_text
@@ -10,14 +10,14 @@ except ImportError:
     sys.exit(10)
 
 
-def main():
+def main(argv=None):
     """
     Lists the most recent memories stored in ChromaDB by sorting metadata timestamps.
     """
     parser = argparse.ArgumentParser(description="List recent agent memories.")
     parser.add_argument("--limit", type=int, default=10, help="Number of memories to return.")
     parser.add_argument("--db-path", default=".tmp/chroma_db", help="Path to ChromaDB.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         client = chromadb.PersistentClient(path=args.db_path)
@@ -0,0 +1,471 @@
+#!/usr/bin/env python3
+"""
+Clientes HTTP de los proveedores de LLM con conexiones compartidas.
+
+Las funciones `chat_*` de `chat_with_llm.py` hacían un `requests.post` suelto
+por petición: una conexión TLS nueva cada vez, y la única forma de atender
+más conversaciones a la vez era tener más procesos. Aquí se reúne lo común:
+
+- la construcción de cada petición (URL, cabeceras y cuerpo) y la lectura
+  de su respuesta, compartidas por los clientes síncrono y asíncrono;
+- `http_session()`: una `requests.Session` con pool de conexiones para la
+  ruta síncrona;
+- `AsyncLLM`: variantes asíncronas de OpenAI, Anthropic, Groq (sobre un
+  `httpx.AsyncClient` compartido, HTTP/2 si `h2` está instalado) y Gemini
+  (`generate_content_async` del SDK), con un semáforo por proveedor
+  (LLM_PROVIDER_CONCURRENCY) y como mucho LLM_MAX_CONNECTIONS sockets.
+
+El cliente asíncrono vive en un bucle de eventos propio, en un hilo: desde
+código asíncrono se espera con `await llm.achat(...)` (desde cualquier
+bucle) y desde los handlers, que son bloqueantes, con `llm.run(...)`. Así
+decenas de respuestas en curso comparten unas pocas conexiones. Si `httpx`
+no está instalado (o con LLM_ASYNC=0) se usa la ruta síncrona.
+
+Caché de prompts del proveedor (PROMPT_CACHE): la instrucción de sistema
+llega partida en una parte fija (`system`: persona, plantilla de informe...)
+y otra variable (`system_extra`: fecha, idioma...). La fija va siempre
+primero y tal cual, para que el proveedor reutilice el prefijo:
+
+- Anthropic: bloque de sistema con `cache_control` efímero y, detrás, el
+  variable;
+- OpenAI y Groq: la caché es automática por prefijo; el variable va en un
+  segundo mensaje de sistema;
+- Gemini: contenido cacheado (ver `gemini_client.py`); el variable va al
+  principio del último turno del usuario.
+
+Los tokens de prompt servidos desde la caché se anotan en
+`get_prompt_cache_stats()` a partir del `usage` de cada respuesta.
+"""
+import asyncio
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+try:
+    import httpx
+except ImportError:
+    httpx = None
+
+try:
+    import h2  # noqa: F401  (HTTP/2 en httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+from gemini_client import DEFAULT_MODEL as GEMINI_DEFAULT_MODEL, PROMPT_CACHE, get_gemini
+from llm_hedging import PROVIDER_CONCURRENCY, Cancelled
+from provider_health import get_health
+
+ASYNC_ENABLED = os.getenv("LLM_ASYNC", "1") != "0"
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "8"))
+REQUEST_TIMEOUT = 30
+
+DEFAULT_MODELS = {
+    "openai": "gpt-4o-mini",
+    "anthropic": "claude-3-5-sonnet-20240620",
+    "groq": "llama-3.3-70b-versatile",
+    "gemini": GEMINI_DEFAULT_MODEL,
+}
+
+_ORCHESTRATOR = "Eres un asistente de IA útil actuando como la capa de Orquestación en una arquitectura de 3 capas."
+_GROQ_SYSTEM = "Eres un asistente de IA útil (Llama 3 en Groq) actuando como la capa de Orquestación. Si en el historial ves que te llamaste 'Gemini', ignóralo; ahora eres Llama 3."
+_GEMINI_SYSTEM = "Eres Gemini, un modelo de IA de Google, actuando como la capa de Orquestación en una arquitectura de 3 capas. Identifícate siempre como Gemini/Google si te preguntan."
+
+
+# --- Peticiones y respuestas (comunes a los clientes síncrono y asíncrono) ---
+
+def build_request(provider, messages, model=None, system=None, stream=False, system_extra=None):
+    """(url, cabeceras, cuerpo) de una petición a OpenAI, Anthropic o Groq. ValueError si falta la key."""
+    model = model or DEFAULT_MODELS[provider]
+    if provider == "anthropic":
+        api_key = os.getenv("ANTHROPIC_API_KEY")
+        if not api_key:
+            raise ValueError("Falta ANTHROPIC_API_KEY en .env")
+        headers = {"x-api-key": api_key, "anthropic-version": "2023-06-01", "content-type": "application/json"}
+        # Bloques de sistema: el fijo marcado como cacheable, el variable detrás
+        blocks = [{"type": "text", "text": system or _ORCHESTRATOR}]
+        if PROMPT_CACHE:
+            blocks[0]["cache_control"] = {"type": "ephemeral"}
+        if system_extra:
+            blocks.append({"type": "text", "text": system_extra})
+        data = {"model": model, "max_tokens": 1024, "messages": messages, "system": blocks}
+        url = "https://api.anthropic.com/v1/messages"
+    elif provider in ("openai", "groq"):
+        key_name = "OPENAI_API_KEY" if provider == "openai" else "GROQ_API_KEY"
+        api_key = os.getenv(key_name)
+        if not api_key:
+            raise ValueError(f"Falta {key_name} en .env")
+        headers = {"Authorization": f"Bearer {api_key}", "Content-Type": "application/json"}
+        if provider == "groq":
+            # Sanitizar mensajes para evitar errores de formato (ej. campos extra o nulos)
+            messages = [{"role": m.get("role", "user"), "content": str(m.get("content", ""))} for m in messages]
+            url = "https://api.groq.com/openai/v1/chat/completions"  # Endpoint compatible con OpenAI
+        else:
+            url = "https://api.openai.com/v1/chat/completions"
+        sys_msg = system or (_GROQ_SYSTEM if provider == "groq" else _ORCHESTRATOR)
+        # El prefijo fijo se cachea solo en el proveedor: lo variable va en otro mensaje, después
+        system_messages = [{"role": "system", "content": sys_msg}]
+        if system_extra:
+            system_messages.append({"role": "system", "content": system_extra})
+        data = {"model": model, "messages": system_messages + messages, "temperature": 0.7}
+        if stream and provider == "openai":
+            data["stream_options"] = {"include_usage": True}
+    else:
+        raise ValueError(f"Proveedor sin API HTTP: {provider}")
+    if stream:
+        data["stream"] = True
+    return url, headers, data
+
+
+def parse_response(provider, result):
+    """Texto de una respuesta completa (sin streaming)."""
+    if provider == "anthropic":
+        return result['content'][0]['text']
+    return result['choices'][0]['message']['content']
+
+
+def usage_from(provider, payload):
+    """(tokens de prompt, leídos de caché, escritos en caché) de una respuesta o evento, o None."""
+    if provider == "anthropic":
+        # En streaming el uso del prompt llega en message_start; message_delta solo trae la salida
+        if payload.get("type") == "message_start":
+            usage = (payload.get("message") or {}).get("usage")
+        else:
+            usage = payload.get("usage") if payload.get("type") == "message" else None
+        if not usage:
+            return None
+        read = usage.get("cache_read_input_tokens") or 0
+        written = usage.get("cache_creation_input_tokens") or 0
+        return (usage.get("input_tokens") or 0) + read + written, read, written
+    # Groq devuelve el uso del stream en x_groq.usage
+    usage = payload.get("usage") or (payload.get("x_groq") or {}).get("usage")
+    if not usage or "prompt_tokens" not in usage:
+        return None
+    details = usage.get("prompt_tokens_details") or {}
+    return usage["prompt_tokens"], details.get("cached_tokens") or 0, 0
+
+
+def gemini_usage(response):
+    """Lo mismo para una respuesta del SDK de Gemini (el contenido cacheado cuenta como leído)."""
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None or not getattr(usage, "prompt_token_count", 0):
+        return None
+    return usage.prompt_token_count, getattr(usage, "cached_content_token_count", 0) or 0, 0
+
+
+class PromptCacheStats:
+    """Tokens de prompt enviados y servidos desde la caché del proveedor, por proveedor."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}
+
+    def record(self, provider, usage):
+        if usage is None:
+            return
+        prompt, read, written = usage
+        with self._lock:
+            c = self._counters.setdefault(provider, {"responses": 0, "prompt_tokens": 0,
+                                                     "cached_tokens": 0, "cache_write_tokens": 0})
+            c["responses"] += 1
+            c["prompt_tokens"] += prompt
+            c["cached_tokens"] += read
+            c["cache_write_tokens"] += written
+
+    def stats(self):
+        with self._lock:
+            return {provider: dict(c, hit_rate=round(c["cached_tokens"] / c["prompt_tokens"], 3) if c["prompt_tokens"] else 0.0)
+                    for provider, c in self._counters.items()}
+
+
+_prompt_cache_stats = PromptCacheStats()
+
+
+def get_prompt_cache_stats():
+    return _prompt_cache_stats
+
+
+def record_usage(provider, payload):
+    """Anota el uso de una respuesta o evento de stream (ignora los que no lo traen)."""
+    _prompt_cache_stats.record(provider, usage_from(provider, payload))
+
+
+def _openai_delta(event):
+    choices = event.get("choices") or [{}]
+    return choices[0].get("delta", {}).get("content")
+
+
+def _anthropic_delta(event):
+    # Solo los content_block_delta traen texto; el resto son eventos de control
+    if event.get("type") == "content_block_delta":
+        return event.get("delta", {}).get("text")
+    return None
+
+
+STREAM_DELTAS = {"openai": _openai_delta, "groq": _openai_delta, "anthropic": _anthropic_delta}
+
+# Marca de fin de stream en parse_sse_line
+SSE_DONE = object()
+
+
+def parse_sse_line(line):
+    """Evento de una línea `data:` de Server-Sent Events: dict, SSE_DONE o None si no aplica."""
+    if not line or not line.startswith("data:"):
+        return None
+    data = line[5:].strip()
+    if data == "[DONE]":
+        return SSE_DONE
+    try:
+        return json.loads(data)
+    except ValueError:
+        return None
+
+
+def check_stream_event(event):
+    """Lanza RuntimeError si el evento del stream es un error del proveedor."""
+    if event.get("type") == "error" or (event.get("error") and not event.get("choices")):
+        error = event.get("error") or {}
+        raise RuntimeError(error.get("message", str(error)) if isinstance(error, dict) else str(error))
+
+
+def gemini_request(messages, system_instruction=None, image_path=None, model=GEMINI_DEFAULT_MODEL, system_extra=None):
+    """(instrucción de sistema, contenidos, modelos a probar) para Gemini. ValueError si no se puede enviar."""
+    sys_msg = system_instruction or _GEMINI_SYSTEM
+    history = []
+    for msg in messages:
+        if msg["role"] == "user":
+            history.append({"role": "user", "parts": [msg["content"]]})
+        elif msg["role"] == "assistant":
+            history.append({"role": "model", "parts": [msg["content"]]})
+
+    # La conversación debe terminar con un mensaje del usuario
+    if not history or history[-1]["role"] != "user":
+        raise ValueError("El historial debe terminar con un mensaje del usuario.")
+
+    # Lo variable no toca la instrucción de sistema, que así sigue siendo la misma (cacheable)
+    if system_extra:
+        history[-1]["parts"].insert(0, system_extra)
+
+    if image_path:
+        if not Image:
+            raise ValueError("Librería 'Pillow' no instalada. Ejecuta: pip install Pillow")
+        try:
+            history[-1]["parts"].append(Image.open(image_path))
+        except Exception as e:
+            raise ValueError(f"Error cargando imagen: {e}")
+
+    # Estrategia de Fallback: Intentar modelos alternativos si el principal falla
+    models_to_try = [model]
+    # Si hay imagen, evitamos gemini-pro (1.0) que es solo texto
+    if image_path:
+        fallbacks = ["gemini-1.5-flash", "gemini-1.5-pro", "gemini-1.5-flash-latest"]
+    else:
+        fallbacks = ["gemini-1.5-flash", "gemini-pro"]
+    models_to_try += [fb for fb in fallbacks if fb != model]
+    return sys_msg, history, models_to_try
+
+
+def gemini_models(models_to_try):
+    """Modelos de Gemini en orden de salud; salta los de circuito abierto mientras quede otro."""
+    health = get_health()
+    keys = health.order([f"gemini/{m}" for m in models_to_try])
+    for i, key in enumerate(keys):
+        model = key.split("/", 1)[1]
+        if i < len(keys) - 1 and not health.allow(key):
+            print(f"🩺 [HEALTH] Saltando {model} (circuito abierto)", file=sys.stderr)
+            continue
+        yield key, model
+
+
+# --- Cliente síncrono ---
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def http_session():
+    """Sesión de `requests` compartida: reutiliza las conexiones TLS con cada proveedor."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            _session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=MAX_CONNECTIONS))
+        return _session
+
+
+# --- Cliente asíncrono ---
+
+def async_available():
+    return ASYNC_ENABLED and httpx is not None
+
+
+class AsyncLLM:
+    """Llamadas asíncronas a los proveedores sobre un cliente HTTP compartido."""
+
+    def __init__(self, concurrency=PROVIDER_CONCURRENCY, max_connections=MAX_CONNECTIONS, http2=HTTP2_AVAILABLE,
+                 transport=None):
+        self.concurrency = concurrency
+        self.max_connections = max_connections
+        self.http2 = http2
+        self.transport = transport
+        self._client = None
+        self._semaphores = {}
+        self._loop = None
+        self._started = threading.Lock()
+        self.counters = {"requests": 0, "errors": 0, "in_flight": 0, "peak_in_flight": 0}
+
+    # El bucle propio es el dueño del cliente HTTP y de los semáforos
+    def _ensure_loop(self):
+        with self._started:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="llm-async", daemon=True).start()
+                self._loop = loop
+            return self._loop
+
+    def _http(self):
+        if self._client is None:
+            limits = httpx.Limits(max_connections=self.max_connections, max_keepalive_connections=self.max_connections)
+            self._client = httpx.AsyncClient(http2=self.http2, limits=limits, timeout=REQUEST_TIMEOUT,
+                                             transport=self.transport)
+        return self._client
+
+    def _semaphore(self, provider):
+        semaphore = self._semaphores.get(provider)
+        if semaphore is None:
+            semaphore = self._semaphores[provider] = asyncio.Semaphore(self.concurrency)
+        return semaphore
+
+    async def achat(self, provider, messages, system=None, image_path=None, on_partial=None, system_extra=None):
+        """Interfaz común: {"content"} o {"error"}. Se puede esperar desde cualquier bucle de eventos."""
+        loop = self._ensure_loop()
+        try:
+            running = asyncio.get_running_loop()
+        except RuntimeError:
+            running = None
+        coro = self._chat(provider, messages, system, image_path, on_partial, system_extra)
+        if running is loop:
+            return await coro
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, loop))
+
+    def run(self, provider, messages, system=None, image_path=None, on_partial=None, system_extra=None):
+        """Versión bloqueante de `achat` para los handlers (el trabajo ocurre en el bucle compartido)."""
+        coro = self._chat(provider, messages, system, image_path, on_partial, system_extra)
+        return asyncio.run_coroutine_threadsafe(coro, self._ensure_loop()).result()
+
+    async def _chat(self, provider, messages, system, image_path, on_partial, system_extra=None):
+        async with self._semaphore(provider):
+            self.counters["requests"] += 1
+            self.counters["in_flight"] += 1
+            self.counters["peak_in_flight"] = max(self.counters["peak_in_flight"], self.counters["in_flight"])
+            try:
+                if provider == "gemini":
+                    result = await self._gemini(messages, system, image_path, on_partial, system_extra)
+                else:
+                    result = await self._http_chat(provider, messages, system, on_partial, system_extra)
+            except Exception as e:
+                result = {"error": str(e)}
+            finally:
+                self.counters["in_flight"] -= 1
+            if "error" in result:
+                self.counters["errors"] += 1
+            return result
+
+    async def _http_chat(self, provider, messages, system, on_partial, system_extra=None):
+        url, headers, data = build_request(provider, messages, system=system, stream=bool(on_partial),
+                                           system_extra=system_extra)
+        client = self._http()
+        if not on_partial:
+            resp = await client.post(url, headers=headers, json=data)
+            if resp.status_code >= 400:
+                return {"error": f"{provider} API Error ({resp.status_code}): {resp.text}"}
+            result = resp.json()
+            record_usage(provider, result)
+            return {"content": parse_response(provider, result)}
+        async with client.stream("POST", url, headers=headers, json=data) as resp:
+            if resp.status_code >= 400:
+                body = (await resp.aread()).decode("utf-8", "replace")
+                return {"error": f"{provider} API Error ({resp.status_code}): {body}"}
+            return {"content": await stream_text(resp.aiter_lines(), STREAM_DELTAS[provider], on_partial,
+                                                 observe=lambda event: record_usage(provider, event))}
+
+    async def _gemini(self, messages, system, image_path, on_partial, system_extra=None):
+        sys_msg, contents, models_to_try = gemini_request(messages, system, image_path, system_extra=system_extra)
+        client = get_gemini()
+        client.configure()
+        health = get_health()
+        last_error = None
+        for key, model in gemini_models(models_to_try):
+            start = time.time()
+            try:
+                response = await client.model(model, sys_msg).generate_content_async(contents, stream=bool(on_partial))
+                if on_partial:
+                    text = ""
+                    async for chunk in response:
+                        text += chunk.text
+                        on_partial(text)
+                else:
+                    text = response.text
+                health.record(key, True, time.time() - start)
+                _prompt_cache_stats.record("gemini", gemini_usage(response))
+                return {"content": text}
+            except Cancelled:
+                health.release(key)
+                raise
+            except Exception as e:
+                health.record(key, False, error=str(e))
+                print(f"⚠️  Advertencia: Falló {model} ({e}). Intentando siguiente...", file=sys.stderr)
+                last_error = e
+        return {"error": f"Todos los modelos fallaron. Último error: {str(last_error)}"}
+
+    def close(self):
+        if self._loop is None:
+            return
+        if self._client is not None:
+            asyncio.run_coroutine_threadsafe(self._client.aclose(), self._loop).result(timeout=5)
+        self._loop.call_soon_threadsafe(self._loop.stop)
+
+    def stats(self):
+        return dict(self.counters, http2=self.http2, max_connections=self.max_connections)
+
+
+async def stream_text(lines, extract, on_partial, observe=None):
+    """Versión asíncrona de la lectura de un stream SSE: acumula el texto y llama a on_partial."""
+    text = ""
+    async for line in lines:
+        event = parse_sse_line(line)
+        if event is SSE_DONE:
+            break
+        if event is None:
+            continue
+        check_stream_event(event)
+        if observe is not None:
+            observe(event)
+        piece = extract(event)
+        if piece:
+            text += piece
+            on_partial(text)
+    return text
+
+
+_async_llm = None
+_async_lock = threading.Lock()
+
+
+def get_async_llm():
+    """Cliente asíncrono compartido por todo el proceso."""
+    global _async_llm
+    with _async_lock:
+        if _async_llm is None:
+            _async_llm = AsyncLLM()
+        return _async_llm
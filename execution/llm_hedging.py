@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+Peticiones con réplica (hedging) entre proveedores de LLM.
+
+`chat_with_llm` probaba los proveedores uno detrás de otro (Groq → Gemini →
+OpenAI → Anthropic) con 30 s de timeout cada uno: un proveedor colgado
+sumaba su timeout entero antes de pasar al siguiente. `HedgedRunner.run`
+mantiene ese orden, pero:
+
+- si un proveedor falla, el siguiente arranca en el acto (como antes);
+- con LLM_HEDGE=1, si el proveedor en curso tarda más que su p95 reciente
+  (acotado entre LLM_HEDGE_MIN_DELAY y LLM_HEDGE_MAX_DELAY), se lanza una
+  réplica al siguiente y gana la primera respuesta correcta. En streaming
+  gana el primero que emite texto y los demás se cortan en su siguiente
+  fragmento; sin streaming la respuesta perdedora se descarta al llegar
+  (`requests` no permite abortar una petición en vuelo).
+
+Para que las réplicas no dupliquen el gasto:
+
+- cada proveedor tiene un límite de peticiones simultáneas
+  (LLM_PROVIDER_CONCURRENCY); una réplica solo sale si hay hueco libre;
+- como mucho LLM_HEDGE_BUDGET de las peticiones llevan réplica;
+- los prompts de más de LLM_HEDGE_MAX_TOKENS tokens no se replican.
+
+Con un registro de salud (`provider_health.py`) el orden se adapta al estado
+de cada proveedor, se saltan los circuitos abiertos mientras quede otro y
+cada resultado (salvo las réplicas canceladas) se anota en el registro.
+"""
+import os
+import queue
+import sys
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from provider_health import get_health
+
+HEDGE_ENABLED = os.getenv("LLM_HEDGE", "0") == "1"
+HEDGE_MIN_DELAY = float(os.getenv("LLM_HEDGE_MIN_DELAY", "1.5"))
+HEDGE_MAX_DELAY = float(os.getenv("LLM_HEDGE_MAX_DELAY", "10"))
+# Espera antes de replicar mientras no haya suficientes muestras de latencia
+HEDGE_DEFAULT_DELAY = 4.0
+HEDGE_MIN_SAMPLES = 20
+HEDGE_BUDGET = float(os.getenv("LLM_HEDGE_BUDGET", "0.2"))
+HEDGE_MAX_TOKENS = int(os.getenv("LLM_HEDGE_MAX_TOKENS", "4000"))
+PROVIDER_CONCURRENCY = int(os.getenv("LLM_PROVIDER_CONCURRENCY", "4"))
+LATENCY_WINDOW = 200
+
+
+class Cancelled(Exception):
+    """Otro proveedor ya ganó la carrera."""
+
+
+class LatencyTracker:
+    """Latencias recientes por proveedor (primer token en streaming, respuesta completa si no)."""
+
+    def __init__(self, window=LATENCY_WINDOW, min_samples=HEDGE_MIN_SAMPLES):
+        self.window = window
+        self.min_samples = min_samples
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, key, seconds):
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None:
+                samples = self._samples[key] = deque(maxlen=self.window)
+            samples.append(seconds)
+
+    def percentile(self, key, q=95):
+        """Percentil q de las muestras de `key`, o None si aún hay pocas."""
+        with self._lock:
+            samples = self._samples.get(key)
+            if samples is None or len(samples) < self.min_samples:
+                return None
+            return float(np.percentile(np.fromiter(samples, dtype=float), q))
+
+
+class HedgedRunner:
+    """Ejecuta una petición contra una lista ordenada de proveedores con fallback y réplicas."""
+
+    def __init__(self, hedge=HEDGE_ENABLED, concurrency=PROVIDER_CONCURRENCY, budget=HEDGE_BUDGET,
+                 max_tokens=HEDGE_MAX_TOKENS, min_delay=HEDGE_MIN_DELAY, max_delay=HEDGE_MAX_DELAY,
+                 default_delay=HEDGE_DEFAULT_DELAY, latencies=None, health=None, clock=time.monotonic):
+        self.hedge = hedge
+        self.concurrency = concurrency
+        self.budget = budget
+        self.max_tokens = max_tokens
+        self.min_delay = min_delay
+        self.max_delay = max_delay
+        self.default_delay = default_delay
+        self.latencies = latencies or LatencyTracker()
+        self.health = health
+        self.clock = clock
+        self._slots = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max(8, 4 * concurrency), thread_name_prefix="llm")
+        self.counters = {"requests": 0, "fallbacks": 0, "hedges": 0, "hedge_wins": 0,
+                         "hedges_skipped": 0, "cancelled": 0, "circuit_skips": 0}
+
+    def _slot(self, provider):
+        with self._lock:
+            slot = self._slots.get(provider)
+            if slot is None:
+                slot = self._slots[provider] = threading.BoundedSemaphore(self.concurrency)
+            return slot
+
+    def hedge_delay(self, provider, streaming):
+        """Segundos de espera antes de replicar: el p95 del proveedor, acotado."""
+        p95 = self.latencies.percentile((provider, streaming))
+        delay = self.default_delay if p95 is None else p95
+        return min(max(delay, self.min_delay), self.max_delay)
+
+    def _may_hedge(self, tokens):
+        with self._lock:
+            return tokens <= self.max_tokens and self.counters["hedges"] < self.budget * self.counters["requests"]
+
+    def run(self, providers, attempt, on_partial=None, tokens=0):
+        """
+        `attempt(proveedor, on_partial)` hace la llamada y devuelve {"content"} o {"error"}.
+
+        Devuelve (proveedor ganador o el último que falló, resultado).
+        """
+        with self._lock:
+            self.counters["requests"] += 1
+        streaming = on_partial is not None
+        results = queue.Queue()
+        race = {"winner": None}
+        race_lock = threading.Lock()
+
+        def claim(provider):
+            with race_lock:
+                if race["winner"] is None:
+                    race["winner"] = provider
+                return race["winner"] == provider
+
+        def launch(provider, hedged):
+            state = {"cancelled": False}
+
+            def partial(text):
+                if not claim(provider):
+                    state["cancelled"] = True
+                    raise Cancelled(provider)
+                if "ttft" not in state:
+                    state["ttft"] = self.clock() - state["start"]
+                on_partial(text)
+
+            def work():
+                slot = self._slot(provider)
+                if not hedged:
+                    slot.acquire()      # las réplicas reservan su hueco antes de lanzarse
+                state["start"] = self.clock()
+                try:
+                    result = attempt(provider, partial if streaming else None)
+                except Exception as e:
+                    result = {"error": str(e)}
+                finally:
+                    slot.release()
+                ok = "content" in result and "error" not in result
+                if ok:
+                    self.latencies.record((provider, streaming), state.get("ttft", self.clock() - state["start"]))
+                if self.health is not None:
+                    if state["cancelled"]:
+                        self.health.release(provider)
+                    else:
+                        self.health.record(provider, ok, self.clock() - state["start"], result.get("error"))
+                results.put((provider, result, hedged, state["cancelled"]))
+
+            self._executor.submit(work)
+
+        pending = list(providers) if self.health is None else self.health.order(providers)
+        if not pending:
+            return None, {"error": "No hay proveedores disponibles"}
+        current = self._next(pending)
+        launch(current, False)
+        running, launched_at = 1, self.clock()
+        may_hedge = self.hedge and self._may_hedge(tokens)
+        last = (current, {"error": "Sin respuesta"})
+
+        while running:
+            timeout = None
+            if may_hedge and pending:
+                timeout = max(0.0, self.hedge_delay(current, streaming) - (self.clock() - launched_at))
+            try:
+                provider, result, hedged, cancelled = results.get(timeout=timeout)
+            except queue.Empty:
+                # El proveedor en curso va lento: réplica al siguiente si tiene hueco y está sano
+                slot = self._slot(pending[0])
+                if slot.acquire(blocking=False):
+                    if self.health is not None and not self.health.allow(pending[0]):
+                        slot.release()
+                        with self._lock:
+                            self.counters["hedges_skipped"] += 1
+                        may_hedge = False
+                        continue
+                    current = pending.pop(0)
+                    print(f"⏱️  [HEDGE] Sin respuesta tras {self.clock() - launched_at:.1f}s; "
+                          f"replicando en '{current}'", file=sys.stderr)
+                    launch(current, True)
+                    running, launched_at = running + 1, self.clock()
+                    with self._lock:
+                        self.counters["hedges"] += 1
+                else:
+                    with self._lock:
+                        self.counters["hedges_skipped"] += 1
+                may_hedge = False      # una réplica por petición como mucho
+                continue
+
+            running -= 1
+            if cancelled:
+                with self._lock:
+                    self.counters["cancelled"] += 1
+                continue
+            if "content" in result and "error" not in result and claim(provider):
+                with self._lock:
+                    if hedged:
+                        self.counters["hedge_wins"] += 1
+                return provider, result
+
+            if "error" in result or "content" not in result:
+                print(f"⚠️ Proveedor '{provider}' falló: {result.get('error', 'Error desconocido')}. "
+                      "Intentando siguiente...", file=sys.stderr)
+                last = (provider, result)
+                with race_lock:
+                    # Un stream que falla a mitad deja paso al siguiente (el texto vuelve a empezar)
+                    if race["winner"] == provider:
+                        race["winner"] = None
+            if not running and pending:
+                current = self._next(pending)
+                launch(current, False)
+                running, launched_at = 1, self.clock()
+                with self._lock:
+                    self.counters["fallbacks"] += 1
+        return last
+
+    def _next(self, pending):
+        """Saca el siguiente proveedor, saltando los circuitos abiertos mientras quede alguno."""
+        while self.health is not None and len(pending) > 1 and not self.health.allow(pending[0]):
+            print(f"🩺 [HEALTH] Saltando '{pending.pop(0)}' (circuito abierto)", file=sys.stderr)
+            with self._lock:
+                self.counters["circuit_skips"] += 1
+        return pending.pop(0)
+
+    def stats(self):
+        with self._lock:
+            return dict(self.counters, hedge=self.hedge)
+
+
+_runner = None
+_runner_lock = threading.Lock()
+
+
+def get_runner():
+    """Ejecutor compartido por todo el proceso (límites de concurrencia globales)."""
+    global _runner
+    with _runner_lock:
+        if _runner is None:
+            _runner = HedgedRunner(health=get_health())
+        return _runner
@@ -12,11 +12,11 @@ except ImportError:
     sys.exit(1)
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Monitorear uso de CPU y Memoria.")
     parser.add_argument("--cpu-threshold", type=float, default=90.0, help="Umbral de alerta para CPU (%)")
     parser.add_argument("--mem-threshold", type=float, default=85.0, help="Umbral de alerta para Memoria (%)")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     # Medir CPU (requiere un pequeño intervalo para ser preciso)
     cpu_usage = psutil.cpu_percent(interval=1)
@@ -0,0 +1,407 @@
+#!/usr/bin/env python3
+"""
+Cola de salida hacia Telegram con control de ritmo.
+
+Los handlers encolan textos, archivos y mensajes de progreso ("🧠 Analizando...")
+y siguen trabajando; un grupo de hilos los envía en paralelo respetando los
+límites del Bot API con dos token buckets: uno global (~30 msg/s por bot) y
+uno por chat (~1 msg/s sostenido). Dentro de un chat se mantiene el orden.
+
+Los mensajes de progreso consecutivos de un chat se fusionan: si el anterior
+sigue en cola se reemplaza su texto y, si ya se envió, se edita con
+editMessageText en lugar de mandar un mensaje nuevo. Los envíos que fallan
+tras los reintentos del cliente pasan a una lista que `retry_failed()` vuelve
+a encolar; los rechazos definitivos (4xx salvo 429) y los que agotan
+OUTBOX_MAX_ATTEMPTS se descartan. Los buckets de chats inactivos se olvidan.
+
+`stream()` devuelve un `StreamingReply`: publica un marcador y lo va editando
+(como mensajes de progreso, con un intervalo mínimo entre ediciones) mientras
+el LLM genera la respuesta; `finish()` deja el texto definitivo en ese mismo
+mensaje (si pasa de MAX_MESSAGE_CHARS, el resto va en mensajes nuevos). Se
+mide el tiempo hasta el primer token visible en Telegram.
+"""
+import heapq
+import itertools
+import os
+import threading
+import time
+from collections import deque
+
+from chat_dispatcher import _percentile
+
+GLOBAL_RATE = float(os.getenv("OUTBOX_GLOBAL_RATE", "25"))
+CHAT_RATE = float(os.getenv("OUTBOX_CHAT_RATE", "1"))
+CHAT_BURST = int(os.getenv("OUTBOX_CHAT_BURST", "3"))
+# Intervalo mínimo entre ediciones de una respuesta en streaming
+STREAM_EDIT_INTERVAL = float(os.getenv("STREAM_EDIT_INTERVAL", "1.5"))
+# Límite de Telegram para el texto de un mensaje
+MAX_MESSAGE_CHARS = 4096
+# Intentos de un envío (contando los de retry_failed) antes de descartarlo
+MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "3"))
+# Cada cuánto se olvidan los buckets de los chats sin actividad
+BUCKET_PRUNE_SECONDS = 60
+
+
+class TokenBucket:
+    """Token bucket con reserva: devuelve cuánto hay que esperar para usar un token."""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self):
+        """Segundos hasta que haya un token disponible (0 si ya lo hay)."""
+        with self._lock:
+            self._refill(time.monotonic())
+            return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def reserve(self):
+        """Consume un token (puede quedar en negativo) y devuelve la espera necesaria."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.tokens -= 1
+            return 0.0 if self.tokens >= 0 else -self.tokens / self.rate
+
+
+class OutMessage:
+    """Un envío pendiente: texto, progreso, cierre de progreso (final) o archivo (photo/document/voice)."""
+
+    __slots__ = ("chat_id", "kind", "text", "file_path", "caption", "attempts", "error", "status", "on_sent")
+
+    def __init__(self, chat_id, kind, text="", file_path=None, caption="", on_sent=None):
+        self.chat_id = str(chat_id)
+        self.kind = kind
+        self.text = text
+        self.file_path = file_path
+        self.caption = caption
+        self.attempts = 0
+        self.error = None
+        self.status = None      # código HTTP del último fallo, si lo hubo
+        self.on_sent = on_sent
+
+
+def split_message(text, limit=MAX_MESSAGE_CHARS):
+    """Parte un texto en trozos que caben en un mensaje, cortando por líneas o espacios si se puede."""
+    chunks = []
+    while len(text) > limit:
+        cut = text.rfind("\n", 0, limit + 1)
+        if cut < limit // 2:
+            cut = text.rfind(" ", 0, limit + 1)
+        if cut < limit // 2:
+            chunks.append(text[:limit])     # una sola palabra enorme: se corta a pelo
+            text = text[limit:]
+        else:
+            chunks.append(text[:cut])
+            text = text[cut + 1:]
+    return chunks + [text]
+
+
+def telegram_sender(item, progress_message_id=None):
+    """Envío real con telegram_tool; devuelve el message_id cuando lo hay."""
+    import telegram_tool
+
+    if item.kind in ("progress", "final") and progress_message_id and len(item.text) <= MAX_MESSAGE_CHARS:
+        telegram_tool.edit_message(item.chat_id, progress_message_id, item.text)
+        return progress_message_id
+    if item.kind in ("text", "progress", "final"):
+        message = telegram_tool.deliver_message(item.text, item.chat_id)
+        return (message or {}).get("message_id")
+    telegram_tool.deliver_file(item.kind, item.file_path, item.chat_id, item.caption)
+    return None
+
+
+class Outbox:
+    """Envía mensajes en paralelo entre chats, en orden dentro de cada chat y sin pasarse de ritmo."""
+
+    def __init__(self, sender=telegram_sender, workers=4, global_rate=GLOBAL_RATE,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, max_attempts=MAX_ATTEMPTS):
+        self.sender = sender
+        self.max_attempts = max_attempts
+        self.workers = workers
+        self.global_bucket = TokenBucket(global_rate, max(1, int(global_rate)))
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self._buckets = {}
+        self._buckets_pruned = time.monotonic()
+        self._chats = {}          # chat_id -> deque de OutMessage
+        self._scheduled = set()   # chats presentes en el heap o en manos de un hilo
+        self._ready = []          # heap (no_antes_de, seq, chat_id)
+        self._seq = itertools.count()
+        self._progress = {}       # chat_id -> message_id del último progreso enviado
+        self._cond = threading.Condition()
+        self._threads = []
+        self._stopping = False
+        self.failed = deque(maxlen=500)
+        self.dropped = 0
+        self.sent = 0
+        self.edits = 0
+        self.merged = 0
+        self.in_flight = 0
+        self.ttft = deque(maxlen=500)
+
+    def start(self):
+        for i in range(self.workers):
+            t = threading.Thread(target=self._worker, name=f"outbox-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    # --- Encolado ---
+
+    def _enqueue(self, item, urgent=False):
+        with self._cond:
+            queue = self._chats.setdefault(item.chat_id, deque())
+            if item.kind in ("progress", "final") and queue and queue[-1].kind == "progress":
+                # El progreso anterior ni siquiera salió: basta con actualizar su texto
+                queue[-1].text = item.text
+                queue[-1].kind = item.kind
+                # Sin perder el aviso de envío (p. ej. el primer token visible de un stream)
+                queue[-1].on_sent = queue[-1].on_sent or item.on_sent
+                self.merged += 1
+                return
+            if urgent:
+                queue.appendleft(item)
+            else:
+                queue.append(item)
+            if item.chat_id not in self._scheduled:
+                self._scheduled.add(item.chat_id)
+                heapq.heappush(self._ready, (0.0, next(self._seq), item.chat_id))
+                self._cond.notify()
+
+    def send(self, chat_id, text, urgent=False, on_sent=None):
+        """
+        Encola un texto. Las alertas (urgent) se adelantan al resto de la cola de su chat.
+
+        `on_sent` se llama cuando Telegram acepta el texto completo (su último trozo).
+        """
+        chunks = [OutMessage(chat_id, "text", chunk) for chunk in split_message(text)]
+        chunks[-1].on_sent = on_sent
+        # Las urgentes entran por delante: al revés para que salgan en orden
+        for item in reversed(chunks) if urgent else chunks:
+            self._enqueue(item, urgent=urgent)
+
+    def progress(self, chat_id, text, on_sent=None):
+        """Encola un aviso de progreso que se fusiona con el anterior del mismo chat."""
+        self._enqueue(OutMessage(chat_id, "progress", text, on_sent=on_sent))
+
+    def finalize(self, chat_id, text):
+        """
+        Deja `text` en el último mensaje de progreso del chat (o lo envía si no hay) y cierra la racha.
+
+        Si no cabe en un mensaje, el progreso se queda con el primer trozo y el
+        resto sale en mensajes nuevos a continuación.
+        """
+        first, *rest = split_message(text)
+        self._enqueue(OutMessage(chat_id, "final", first))
+        for chunk in rest:
+            self._enqueue(OutMessage(chat_id, "text", chunk))
+
+    def stream(self, chat_id, placeholder="✍️ ..."):
+        """Abre una respuesta en streaming para el chat."""
+        return StreamingReply(self, chat_id, placeholder)
+
+    def send_file(self, chat_id, kind, file_path, caption=""):
+        """Encola un archivo: kind es "photo", "document" o "voice"."""
+        self._enqueue(OutMessage(chat_id, kind, file_path=file_path, caption=caption))
+
+    def broadcast(self, chat_ids, text):
+        """Encola el mismo texto para muchos chats; el ritmo lo marca el bucket global."""
+        count = 0
+        for chat_id in chat_ids:
+            self.send(chat_id, text)
+            count += 1
+        return count
+
+    def retry_failed(self):
+        """Vuelve a encolar los envíos fallidos. Devuelve cuántos se reintentan."""
+        with self._cond:
+            items = list(self.failed)
+            self.failed.clear()
+        for item in items:
+            self._enqueue(item)
+        return len(items)
+
+    # --- Envío ---
+
+    def _chat_bucket(self, chat_id):
+        bucket = self._buckets.get(chat_id)
+        if bucket is None:
+            bucket = self._buckets[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def _next(self):
+        """Saca el siguiente mensaje enviable respetando el bucket de su chat (o None al parar)."""
+        with self._cond:
+            while True:
+                if self._stopping and not self._ready:
+                    return None
+                if not self._ready:
+                    self._cond.wait()
+                    continue
+                not_before, _, chat_id = self._ready[0]
+                now = time.monotonic()
+                if not_before > now:
+                    self._cond.wait(not_before - now)
+                    continue
+                heapq.heappop(self._ready)
+                wait = self._chat_bucket(chat_id).wait_time()
+                if wait > 0:
+                    # Este chat va demasiado rápido: otros chats pueden avanzar mientras tanto
+                    heapq.heappush(self._ready, (now + wait, next(self._seq), chat_id))
+                    continue
+                self._chat_bucket(chat_id).reserve()
+                item = self._chats[chat_id].popleft()
+                progress_id = self._progress.get(chat_id) if item.kind in ("progress", "final") else None
+                self.in_flight += 1
+                return item, progress_id
+
+    def _worker(self):
+        while True:
+            entry = self._next()
+            if entry is None:
+                return
+            item, progress_id = entry
+            time.sleep(self.global_bucket.reserve())
+            try:
+                item.attempts += 1
+                message_id = self.sender(item, progress_id)
+                item.error = None
+                if item.on_sent:
+                    item.on_sent()
+            except Exception as e:
+                item.error = str(e)
+                item.status = getattr(e, "status_code", None)
+                message_id = None
+                print(f"   ❌ [OUTBOX] Falló envío a {item.chat_id}: {e}")
+            self._done(item, progress_id, message_id)
+
+    def _done(self, item, progress_id, message_id):
+        with self._cond:
+            self.in_flight -= 1
+            if item.error:
+                if self._retryable(item):
+                    self.failed.append(item)
+                else:
+                    self.dropped += 1
+                    print(f"   🗑️ [OUTBOX] Descartado envío a {item.chat_id} tras {item.attempts} intento(s): {item.error}")
+            else:
+                if progress_id:
+                    self.edits += 1
+                if item.kind == "progress":
+                    self._progress[item.chat_id] = message_id
+                else:
+                    # Un mensaje normal corta la racha: el próximo progreso será un mensaje nuevo
+                    self._progress.pop(item.chat_id, None)
+                self.sent += 1
+            queue = self._chats.get(item.chat_id)
+            if queue:
+                heapq.heappush(self._ready, (0.0, next(self._seq), item.chat_id))
+                self._cond.notify()
+            else:
+                self._chats.pop(item.chat_id, None)
+                self._scheduled.discard(item.chat_id)
+            now = time.monotonic()
+            if now - self._buckets_pruned > BUCKET_PRUNE_SECONDS:
+                self._prune_buckets(now)
+            self._cond.notify_all()
+
+    def _retryable(self, item):
+        """Los 4xx (salvo 429, límite de ritmo) no cambian al reintentar; el resto, hasta max_attempts."""
+        if item.status is not None and 400 <= item.status < 500 and item.status != 429:
+            return False
+        return item.attempts < self.max_attempts
+
+    def _prune_buckets(self, now):
+        """Olvida los buckets de chats sin cola que ya se rellenaron: uno nuevo arranca igual de lleno."""
+        refill = self.chat_burst / self.chat_rate
+        idle = [chat_id for chat_id, bucket in self._buckets.items()
+                if chat_id not in self._chats and now - bucket.updated >= refill]
+        for chat_id in idle:
+            del self._buckets[chat_id]
+        self._buckets_pruned = now
+        return len(idle)
+
+    # --- Estado ---
+
+    def pending(self):
+        with self._cond:
+            return sum(len(q) for q in self._chats.values())
+
+    def flush(self, timeout=None):
+        """Espera a que se vacíe la cola. Devuelve True si no quedó nada pendiente."""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        with self._cond:
+            while self._chats or self.in_flight:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._cond.wait(remaining)
+            return True
+
+    def stats(self):
+        ttft = list(self.ttft)
+        with self._cond:
+            return {
+                "ttft_p50_s": round(_percentile(ttft, 50), 2),
+                "ttft_p95_s": round(_percentile(ttft, 95), 2),
+                "pending": sum(len(q) for q in self._chats.values()),
+                "active_chats": len(self._scheduled),
+                "in_flight": self.in_flight,
+                "sent": self.sent,
+                "edits": self.edits,
+                "merged": self.merged,
+                "failed": len(self.failed),
+                "dropped": self.dropped,
+                "chat_buckets": len(self._buckets),
+            }
+
+    def stop(self, timeout=10):
+        """Intenta vaciar la cola y detiene los hilos."""
+        self.flush(timeout)
+        with self._cond:
+            self._stopping = True
+            self._ready.clear()
+            self._cond.notify_all()
+        for t in self._threads:
+            t.join(timeout=1)
+
+
+class StreamingReply:
+    """Respuesta que se escribe en Telegram mientras el LLM la genera."""
+
+    def __init__(self, outbox, chat_id, placeholder="✍️ ...", interval=STREAM_EDIT_INTERVAL):
+        self.outbox = outbox
+        self.chat_id = str(chat_id)
+        self.interval = interval
+        self.started = time.monotonic()
+        self.first_visible = None
+        self._last_push = time.monotonic()
+        outbox.progress(self.chat_id, placeholder)
+
+    def _visible(self):
+        if self.first_visible is None:
+            self.first_visible = time.monotonic() - self.started
+            self.outbox.ttft.append(self.first_visible)
+
+    def update(self, text):
+        """Callback on_partial: publica el texto acumulado como mucho una vez por intervalo."""
+        now = time.monotonic()
+        # El primer fragmento sale enseguida; luego se limita el ritmo de ediciones
+        if self.first_visible is not None and now - self._last_push < self.interval:
+            return
+        if not text.strip():
+            return
+        self._last_push = now
+        on_sent = self._visible if self.first_visible is None else None
+        self.outbox.progress(self.chat_id, text[:MAX_MESSAGE_CHARS - 2] + " ▌", on_sent=on_sent)
+
+    def finish(self, text):
+        """Sustituye el marcador por la respuesta definitiva."""
+        self.outbox.finalize(self.chat_id, text)
@@ -0,0 +1,243 @@
+#!/usr/bin/env python3
+"""
+Salud de los proveedores de LLM con circuit breakers.
+
+`chat_with_llm` no recordaba nada entre llamadas: si Groq llevaba cinco
+minutos devolviendo 429, se le volvía a probar primero en cada mensaje, y
+`chat_gemini` recorría su lista entera de modelos de respaldo. Este registro
+guarda por proveedor (y por modelo de Gemini, con claves `gemini/<modelo>`):
+
+- tasa de error de los últimos HEALTH_WINDOW segundos;
+- latencia media móvil (EWMA);
+- estado del circuito: cerrado, abierto (no se prueba salvo que no quede
+  otro) o semiabierto (pasada la espera, una sola petición de prueba).
+
+El circuito se abre con FAILURE_THRESHOLD fallos seguidos, con una tasa de
+error de al menos ERROR_RATE_OPEN o en el acto ante un 429/cuota agotada; la
+espera se duplica en cada reapertura hasta MAX_COOLDOWN. `order()` reordena
+las listas de proveedores y modelos según ese estado, conservando el orden
+de preferencia entre los sanos.
+
+El estado se guarda en `.tmp/provider_health.json` (PROVIDER_HEALTH_FILE)
+para que también lo compartan las llamadas por subproceso. Cada guardado
+toma un cerrojo de archivo, vuelve a leer lo que dejaron los demás procesos
+y lo combina con lo propio (resultados unidos; del circuito, el anotado más
+tarde), así un proceso no pisa lo que aprendió otro.
+"""
+import json
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+
+try:
+    import fcntl
+except ImportError:   # Windows: se combina igual, sin cerrojo entre procesos
+    fcntl = None
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEALTH_FILE = os.getenv("PROVIDER_HEALTH_FILE", os.path.join(BASE_DIR, ".tmp", "provider_health.json"))
+
+HEALTH_WINDOW = 300
+FAILURE_THRESHOLD = 3
+ERROR_RATE_OPEN = 0.5
+MIN_SAMPLES = 5
+BASE_COOLDOWN = 30
+RATE_LIMIT_COOLDOWN = 60
+MAX_COOLDOWN = 600
+LATENCY_ALPHA = 0.2
+# Como mucho un guardado cada SAVE_INTERVAL segundos salvo cambios de estado del circuito
+SAVE_INTERVAL = 5
+MAX_OUTCOMES = 50
+
+CLOSED, OPEN, HALF_OPEN = "closed", "open", "half_open"
+
+_RATE_LIMITED = re.compile(r"\b429\b|rate.?limit|quota|resource.?exhausted|too many requests", re.IGNORECASE)
+
+
+class ProviderHealth:
+    """Registro de salud por clave (proveedor o `gemini/<modelo>`), con persistencia opcional."""
+
+    def __init__(self, path=HEALTH_FILE, clock=time.time):
+        self.path = path
+        self.clock = clock
+        self._state = {}
+        self._lock = threading.Lock()
+        self._last_save = 0.0
+        self._load()
+
+    def _entry(self, key):
+        entry = self._state.get(key)
+        if entry is None:
+            entry = self._state[key] = {"state": CLOSED, "opened_at": 0.0, "cooldown": 0, "failures": 0,
+                                        "latency": None, "updated": 0.0, "probing": False,
+                                        "outcomes": deque(maxlen=MAX_OUTCOMES)}
+        return entry
+
+    def _refresh(self, entry, now):
+        """Pasa a semiabierto un circuito cuya espera terminó. Llamar con el lock."""
+        if entry["state"] == OPEN and now - entry["opened_at"] >= entry["cooldown"]:
+            entry["state"] = HALF_OPEN
+            entry["probing"] = False
+
+    def _error_rate(self, entry, now):
+        recent = [ok for ts, ok in entry["outcomes"] if now - ts < HEALTH_WINDOW]
+        if not recent:
+            return 0.0, 0
+        return 1 - sum(recent) / len(recent), len(recent)
+
+    # --- Consultas ---
+
+    def order(self, keys):
+        """
+        Claves en orden de uso: primero las disponibles, luego las de alta tasa de
+        error y al final las de circuito abierto (por si no queda otra opción).
+        Dentro de cada grupo se respeta el orden de preferencia recibido.
+        """
+        now = self.clock()
+        with self._lock:
+            def rank(key):
+                entry = self._state.get(key)
+                if entry is None:
+                    return 0
+                self._refresh(entry, now)
+                if entry["state"] == OPEN or (entry["state"] == HALF_OPEN and entry["probing"]):
+                    return 2
+                rate, samples = self._error_rate(entry, now)
+                return 1 if samples >= MIN_SAMPLES and rate >= ERROR_RATE_OPEN / 2 else 0
+            return sorted(keys, key=rank)
+
+    def allow(self, key):
+        """¿Se puede llamar ya? En semiabierto solo pasa una petición de prueba a la vez."""
+        now = self.clock()
+        with self._lock:
+            entry = self._state.get(key)
+            if entry is None:
+                return True
+            self._refresh(entry, now)
+            if entry["state"] == OPEN:
+                return False
+            if entry["state"] == HALF_OPEN:
+                if entry["probing"]:
+                    return False
+                entry["probing"] = True
+            return True
+
+    # --- Registro ---
+
+    def release(self, key):
+        """Libera la prueba de un circuito semiabierto sin anotar resultado (llamada cancelada)."""
+        with self._lock:
+            entry = self._state.get(key)
+            if entry is not None:
+                entry["probing"] = False
+
+    def record(self, key, ok, latency=None, error=None):
+        """Anota el resultado de una llamada y actualiza el circuito."""
+        now = self.clock()
+        with self._lock:
+            entry = self._entry(key)
+            self._refresh(entry, now)
+            previous = entry["state"]
+            entry["outcomes"].append((now, bool(ok)))
+            entry["updated"] = now
+            entry["probing"] = False
+            if ok:
+                if latency is not None:
+                    old = entry["latency"]
+                    entry["latency"] = latency if old is None else old + LATENCY_ALPHA * (latency - old)
+                entry["failures"] = 0
+                entry["state"] = CLOSED
+                entry["cooldown"] = 0
+            else:
+                entry["failures"] += 1
+                rate, samples = self._error_rate(entry, now)
+                limited = bool(error and _RATE_LIMITED.search(str(error)))
+                if (limited or previous == HALF_OPEN or entry["failures"] >= FAILURE_THRESHOLD
+                        or (samples >= MIN_SAMPLES and rate >= ERROR_RATE_OPEN)):
+                    base = RATE_LIMIT_COOLDOWN if limited else BASE_COOLDOWN
+                    entry["cooldown"] = min(max(base, 2 * entry["cooldown"]), MAX_COOLDOWN)
+                    entry["opened_at"] = now
+                    entry["state"] = OPEN
+            changed = entry["state"] != previous
+            if changed:
+                print(f"🩺 [HEALTH] Circuito de '{key}': {previous} → {entry['state']}"
+                      + (f" ({entry['cooldown']}s)" if entry["state"] == OPEN else ""), file=sys.stderr)
+            if changed or now - self._last_save >= SAVE_INTERVAL:
+                self._save(now)
+
+    # --- Persistencia ---
+
+    def _load(self):
+        with self._lock:
+            self._merge(self._read())
+
+    def _read(self):
+        if not self.path:
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        return data if isinstance(data, dict) else {}
+
+    def _merge(self, data):
+        """Combina el estado guardado (quizá por otro proceso) con el propio. Llamar con el lock."""
+        for key, saved in data.items():
+            entry = self._entry(key)
+            # Del circuito manda el último resultado anotado, sea de quien sea
+            if saved.get("updated", 0.0) >= entry["updated"]:
+                for field in ("state", "opened_at", "cooldown", "failures", "latency", "updated"):
+                    if field in saved:
+                        entry[field] = saved[field]
+            outcomes = set(entry["outcomes"]).union((ts, ok) for ts, ok in saved.get("outcomes", []))
+            entry["outcomes"] = deque(sorted(outcomes), maxlen=MAX_OUTCOMES)
+
+    def _save(self, now):
+        """Escritura atómica del estado combinado con el del archivo. Llamar con el lock."""
+        self._last_save = now
+        if not self.path:
+            return
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            with open(self.path + ".lock", "a") as lock:
+                if fcntl is not None:
+                    fcntl.flock(lock, fcntl.LOCK_EX)
+                self._merge(self._read())
+                data = {key: {"state": e["state"], "opened_at": e["opened_at"], "cooldown": e["cooldown"],
+                              "failures": e["failures"], "latency": e["latency"], "updated": e["updated"],
+                              "outcomes": list(e["outcomes"])}
+                        for key, e in self._state.items()}
+                tmp = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    json.dump(data, f)
+                os.replace(tmp, self.path)
+        except OSError as e:
+            print(f"⚠️  [HEALTH] No se pudo guardar el estado: {e}", file=sys.stderr)
+
+    def stats(self):
+        now = self.clock()
+        with self._lock:
+            out = {}
+            for key, entry in self._state.items():
+                self._refresh(entry, now)
+                rate, samples = self._error_rate(entry, now)
+                out[key] = {"state": entry["state"], "error_rate": round(rate, 2), "samples": samples,
+                            "latency": round(entry["latency"], 2) if entry["latency"] is not None else None}
+            return out
+
+
+_health = None
+_health_lock = threading.Lock()
+
+
+def get_health():
+    """Registro compartido por todo el proceso."""
+    global _health
+    with _health_lock:
+        if _health is None:
+            _health = ProviderHealth()
+        return _health
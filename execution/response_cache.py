@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Caché de respuestas del LLM.
+
+Los pacientes repiten casi las mismas preguntas ("¿qué es la hemoglobina?") y
+`/investigar` o `/reporte` sobre temas populares volvían a pagar la llamada
+completa al proveedor cada vez. `chat_with_llm.complete` consulta esta caché
+antes de llamar a ningún proveedor cuando quien llama marca el prompt como
+cacheable (`--cache`):
+
+- acierto exacto: prompt normalizado (minúsculas, sin tildes ni signos,
+  espacios colapsados) + ámbito (instrucción de sistema y contexto de memoria
+  inyectado) + proveedor;
+- acierto semántico (desactivado por defecto, RESPONSE_CACHE_SEMANTIC=1):
+  coseno entre embeddings por encima de RESPONSE_CACHE_THRESHOLD dentro del
+  mismo ámbito, con los mismos números ("diabetes tipo 1" nunca responde a
+  "tipo 2"), las mismas negaciones y los mismos términos con prefijos
+  opuestos (hipo/hiper, bradi/taqui...). Solo con el modelo de embeddings de
+  ChromaDB: los trigramas de caracteres (`ngram_embedding`) dan similitudes
+  de más de 0,9 entre "hipoglucemia" e "hiperglucemia", así que nunca se
+  usan por defecto;
+- caducidad por TTL y expulsión LRU con RESPONSE_CACHE_SIZE entradas;
+- métricas de aciertos en `stats()`.
+
+Las respuestas que dependen del historial o de la persona no se marcan como
+cacheables (ver `is_general_question`), y las consultas con imagen nunca se
+cachean. La caché vive en memoria del proceso del listener.
+"""
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+import numpy as np
+
+CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+CACHE_TTL = int(os.getenv("RESPONSE_CACHE_TTL", str(24 * 3600)))
+SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "0") == "1"
+SEMANTIC_THRESHOLD = float(os.getenv("RESPONSE_CACHE_THRESHOLD", "0.92"))
+NGRAM_DIM = 1024
+
+# Preguntas de conocimiento general, independientes de la conversación previa
+_GENERAL_QUESTION = re.compile(
+    r"^(que es|que son|que significa|para que sirve|para que sirven|cuales son los sintomas de"
+    r"|cuales son las causas de|como se trata|como se tratan|como se previene|como se previenen"
+    r"|que causa|que causan|what is|what are)\s+(?!(eso|esto|ello|este|esta|ese|esa|lo que|mi|mis)\b)\w",
+)
+
+
+def normalize(text):
+    """Forma canónica de un prompt para la clave exacta."""
+    text = unicodedata.normalize("NFKD", str(text).lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return " ".join(re.sub(r"[^\w\s]", " ", text).split())
+
+
+_NUMBERS = re.compile(r"\b(\d+|i{1,3}|iv|v|vi{1,3})\b")
+# Términos que invierten el sentido con una o dos letras de diferencia
+_OPPOSITES = re.compile(r"\b((?:hipo|hiper|hypo|hyper|bradi|taqui|brady|tachy|micro|macro|oligo|poli|poly)\w*"
+                        r"|no|sin|nunca|not|without|never)\b")
+
+
+def _guard_terms(text):
+    """Números, negaciones y términos con prefijos opuestos: deben coincidir en un acierto semántico."""
+    return frozenset(_NUMBERS.findall(text)) | frozenset(_OPPOSITES.findall(text))
+
+
+def is_general_question(text):
+    """¿Es una pregunta autocontenida de conocimiento general (sin referencias a la conversación)?"""
+    return bool(_GENERAL_QUESTION.match(normalize(text)))
+
+
+def scope_key(*parts):
+    """Huella de todo lo que, además del prompt, determina la respuesta (sistema, memoria...)."""
+    return hashlib.sha1("\x1f".join(p or "" for p in parts).encode("utf-8")).hexdigest()
+
+
+def ngram_embedding(texts):
+    """Embeddings baratos: trigramas de caracteres por hashing, normalizados."""
+    out = np.zeros((len(texts), NGRAM_DIM), dtype=np.float32)
+    for i, text in enumerate(texts):
+        padded = f"  {normalize(text)}  "
+        for j in range(len(padded) - 2):
+            digest = hashlib.md5(padded[j:j + 3].encode("utf-8")).digest()
+            out[i, int.from_bytes(digest[:4], "little") % NGRAM_DIM] += 1.0
+    return out
+
+
+def default_embedding():
+    """Modelo de embeddings de ChromaDB, o None (sin aciertos semánticos) si no está disponible."""
+    try:
+        from chromadb.utils import embedding_functions
+        model = embedding_functions.DefaultEmbeddingFunction()
+    except Exception:
+        print("⚠️  [CACHE] ChromaDB no disponible: solo aciertos exactos.", file=sys.stderr)
+        return None
+    return lambda texts: np.asarray(model(list(texts)), dtype=np.float32)
+
+
+class ResponseCache:
+    """LRU con TTL de respuestas por (prompt normalizado, ámbito, proveedor), con búsqueda semántica opcional."""
+
+    def __init__(self, capacity=CACHE_SIZE, ttl=CACHE_TTL, embed=None, threshold=SEMANTIC_THRESHOLD,
+                 clock=time.time):
+        self.capacity = capacity
+        self.ttl = ttl
+        self.embed = embed
+        self.threshold = threshold
+        self.clock = clock
+        self._entries = OrderedDict()       # (prompt, ámbito, proveedor) -> [respuesta, creada, fila]
+        self._vectors = None                # (capacity, dim) embeddings normalizados
+        self._row_keys = [None] * capacity  # fila -> clave
+        self._row_guards = [None] * capacity
+        self._free = list(range(capacity - 1, -1, -1))
+        self._lock = threading.Lock()
+        self.counters = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "stores": 0, "expired": 0, "evicted": 0}
+
+    def _vector(self, text):
+        if self.embed is None:
+            return None
+        try:
+            vector = np.asarray(self.embed([text]), dtype=np.float32)[0]
+        except Exception as e:
+            print(f"⚠️  [CACHE] Embeddings no disponibles, solo aciertos exactos: {e}", file=sys.stderr)
+            self.embed = None
+            return None
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else None
+
+    def get(self, prompt, scope, providers):
+        """(respuesta, proveedor, "exact" | "semantic") o None. Se acepta cualquiera de `providers`."""
+        text = normalize(prompt)
+        now = self.clock()
+        with self._lock:
+            for provider in providers:
+                key = (text, scope, provider)
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                if now - entry[1] > self.ttl:
+                    self._drop(key)
+                    self.counters["expired"] += 1
+                    continue
+                self._entries.move_to_end(key)
+                self.counters["exact_hits"] += 1
+                return entry[0], provider, "exact"
+            has_vectors = self._vectors is not None and len(self._entries)
+        vector = self._vector(text) if has_vectors else None
+        with self._lock:
+            if vector is not None and self._vectors is not None and len(vector) == self._vectors.shape[1]:
+                sims = self._vectors @ vector
+                for row in np.flatnonzero(sims >= self.threshold)[np.argsort(-sims[sims >= self.threshold])].tolist():
+                    key = self._row_keys[row]
+                    entry = self._entries.get(key) if key else None
+                    if entry is None or key[1] != scope or key[2] not in providers or now - entry[1] > self.ttl:
+                        continue
+                    if self._row_guards[row] != _guard_terms(text):
+                        continue
+                    self._entries.move_to_end(key)
+                    self.counters["semantic_hits"] += 1
+                    return entry[0], key[2], "semantic"
+            self.counters["misses"] += 1
+        return None
+
+    def put(self, prompt, scope, provider, content):
+        text = normalize(prompt)
+        vector = self._vector(text)
+        key = (text, scope, provider)
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            while len(self._entries) >= self.capacity:
+                self._drop(next(iter(self._entries)))
+                self.counters["evicted"] += 1
+            row = None
+            if vector is not None:
+                if self._vectors is None:
+                    self._vectors = np.zeros((self.capacity, len(vector)), dtype=np.float32)
+                if len(vector) == self._vectors.shape[1]:
+                    row = self._free.pop()
+                    self._vectors[row] = vector
+                    self._row_keys[row] = key
+                    self._row_guards[row] = _guard_terms(text)
+            self._entries[key] = [content, self.clock(), row]
+            self.counters["stores"] += 1
+
+    def _drop(self, key):
+        """Quita una entrada y libera su fila de embeddings. Llamar con el lock."""
+        entry = self._entries.pop(key)
+        row = entry[2]
+        if row is not None:
+            self._vectors[row] = 0.0
+            self._row_keys[row] = None
+            self._row_guards[row] = None
+            self._free.append(row)
+
+    def clear(self):
+        with self._lock:
+            for key in list(self._entries):
+                self._drop(key)
+
+    def stats(self):
+        with self._lock:
+            hits = self.counters["exact_hits"] + self.counters["semantic_hits"]
+            lookups = hits + self.counters["misses"]
+            return dict(self.counters, size=len(self._entries),
+                        hit_rate=round(hits / lookups, 3) if lookups else 0.0)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_cache():
+    """Caché compartida por todo el proceso."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache(embed=default_embedding() if SEMANTIC else None)
+        return _cache
@@ -77,10 +77,13 @@ def run_in_sandbox(code_to_run):
         if container:
             container.remove(force=True)
 
-if __name__ == "__main__":
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Ejecutar código Python en un sandbox de Docker.")
     parser.add_argument("--code", required=True, help="El código Python a ejecutar.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     output = run_in_sandbox(args.code)
-    print(json.dumps(output, indent=2))
\ No newline at end of file
+    print(json.dumps(output, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -25,7 +25,7 @@ def print_error(message: str, details: str, exit_code: int):
     sys.exit(exit_code)
 
 
-def main():
+def main(argv=None):
     """
     Saves a text snippet to the local ChromaDB vector store.
     Generates a unique ID and timestamps the entry.
@@ -34,7 +34,7 @@ def main():
     parser.add_argument("--text", required=True, help="The content to remember.")
     parser.add_argument("--category", default="general", help="Category tag (e.g., error_fix, preference).")
     parser.add_argument("--db-path", default=".tmp/chroma_db", help="Path to ChromaDB.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         client = chromadb.PersistentClient(path=args.db_path)
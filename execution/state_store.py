@@ -0,0 +1,476 @@
+#!/usr/bin/env python3
+"""
+Estado persistente del listener de Telegram en SQLite (modo WAL).
+
+Sustituye a los archivos sueltos de .tmp (usuarios, roles, recordatorios,
+citas, pacientes, configuración, personalidad y el log de alertas clínicas),
+que se releían y reescribían
+completos en cada iteración. Cada operación es ahora una consulta o un upsert
+sobre tablas indexadas; WAL permite lecturas concurrentes mientras otro hilo
+escribe. Cada hilo usa su propia conexión.
+
+La primera vez que se abre la base se importan los archivos antiguos (si
+existen); los originales se conservan como copia de seguridad.
+"""
+import argparse
+import datetime
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TMP_DIR = os.path.join(BASE_DIR, ".tmp")
+DB_FILE = os.getenv("STATE_DB", os.path.join(TMP_DIR, "state.db"))
+
+# Archivos del formato anterior que se migran una sola vez
+LEGACY_FILES = {
+    "users": os.path.join(TMP_DIR, "telegram_users.txt"),
+    "roles": os.path.join(TMP_DIR, "telegram_roles.json"),
+    "config": os.path.join(TMP_DIR, "telegram_config.json"),
+    "persona": os.path.join(TMP_DIR, "telegram_persona.txt"),
+    "reminders": os.path.join(TMP_DIR, "telegram_reminders.json"),
+    "appointments": os.path.join(TMP_DIR, "telegram_appointments.json"),
+    "patients": os.path.join(TMP_DIR, "telegram_vitals.json"),
+    "alerts": os.path.join(TMP_DIR, "telegram_alerts.log"),
+}
+
+# Días que se conservan en el historial de alertas (0 = sin límite)
+ALERT_RETENTION_DAYS = int(os.getenv("ALERT_RETENTION_DAYS", "365"))
+_ALERT_LINE = re.compile(r"^\[(.+?)\] \[(.+?)\] (.*)$")
+
+PATIENT_FIELDS = ("name", "heart_rate", "temperature", "spo2", "systolic", "diastolic", "last_update", "last_alert")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS users (chat_id TEXT PRIMARY KEY, created_at REAL);
+CREATE TABLE IF NOT EXISTS roles (chat_id TEXT PRIMARY KEY, role TEXT NOT NULL);
+CREATE INDEX IF NOT EXISTS idx_roles_role ON roles(role);
+CREATE TABLE IF NOT EXISTS config (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS reminders (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    time TEXT NOT NULL,
+    message TEXT NOT NULL,
+    last_sent TEXT DEFAULT ''
+);
+CREATE INDEX IF NOT EXISTS idx_reminders_time ON reminders(time);
+CREATE INDEX IF NOT EXISTS idx_reminders_chat ON reminders(chat_id);
+CREATE TABLE IF NOT EXISTS appointments (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    chat_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    time TEXT NOT NULL,
+    reason TEXT,
+    created_at TEXT,
+    notified INTEGER DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_appointments_due ON appointments(date, time, notified);
+CREATE INDEX IF NOT EXISTS idx_appointments_chat ON appointments(chat_id);
+CREATE TABLE IF NOT EXISTS patients (
+    id TEXT PRIMARY KEY,
+    name TEXT,
+    heart_rate REAL,
+    temperature REAL,
+    spo2 REAL,
+    systolic REAL,
+    diastolic REAL,
+    last_update REAL DEFAULT 0,
+    last_alert REAL DEFAULT 0,
+    extra TEXT
+);
+CREATE TABLE IF NOT EXISTS alerts (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    ts REAL NOT NULL,
+    patient_id TEXT NOT NULL,
+    rule TEXT,
+    severity TEXT,
+    value REAL,
+    message TEXT NOT NULL,
+    resolved_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_alerts_ts ON alerts(ts);
+CREATE INDEX IF NOT EXISTS idx_alerts_patient ON alerts(patient_id, ts);
+"""
+
+
+def _read_json(path, default):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+class StateStore:
+    """Acceso al estado del bot con una conexión SQLite por hilo."""
+
+    def __init__(self, path=DB_FILE, legacy_files=None):
+        self.path = path
+        self.legacy_files = LEGACY_FILES if legacy_files is None else legacy_files
+        self._local = threading.local()
+        self._roles = None          # índice en memoria rol -> [chat_id], ver chats_with_role
+        self._roles_lock = threading.Lock()
+        if path != ":memory:":
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+        self.migrate_legacy()
+        self.migrate_alerts_log()
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            # En WAL, NORMAL no pierde consistencia y evita un fsync por transacción
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            self._local.conn = conn
+        return conn
+
+    # --- Migración ---
+
+    def migrate_legacy(self):
+        """Importa una sola vez los archivos JSON/texto del formato anterior. Devuelve lo importado."""
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'legacy_migrated'").fetchone():
+            return {}
+        files = self.legacy_files
+        counts = {}
+        with conn:
+            path = files.get("users")
+            if path and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    users = [line.strip() for line in f if line.strip()]
+                conn.executemany("INSERT OR IGNORE INTO users (chat_id, created_at) VALUES (?, ?)",
+                                 [(u, time.time()) for u in users])
+                counts["users"] = len(users)
+
+            roles = _read_json(files.get("roles", ""), {})
+            if isinstance(roles, dict) and roles:
+                conn.executemany("INSERT OR REPLACE INTO roles (chat_id, role) VALUES (?, ?)",
+                                 [(str(k), v) for k, v in roles.items()])
+                counts["roles"] = len(roles)
+
+            config = _read_json(files.get("config", ""), {})
+            if isinstance(config, dict) and config:
+                conn.executemany("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)",
+                                 [(k, json.dumps(v)) for k, v in config.items()])
+                counts["config"] = len(config)
+
+            path = files.get("persona")
+            if path and os.path.exists(path):
+                with open(path, "r", encoding="utf-8") as f:
+                    conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('persona', ?)", (f.read().strip(),))
+                counts["persona"] = 1
+
+            reminders = _read_json(files.get("reminders", ""), [])
+            if isinstance(reminders, list) and reminders:
+                conn.executemany(
+                    "INSERT INTO reminders (chat_id, time, message, last_sent) VALUES (?, ?, ?, ?)",
+                    [(str(r.get("chat_id")), r.get("time", ""), r.get("message", ""), r.get("last_sent", ""))
+                     for r in reminders],
+                )
+                counts["reminders"] = len(reminders)
+
+            appts = _read_json(files.get("appointments", ""), [])
+            if isinstance(appts, list) and appts:
+                conn.executemany(
+                    "INSERT INTO appointments (chat_id, date, time, reason, created_at, notified) VALUES (?, ?, ?, ?, ?, ?)",
+                    [(str(a.get("chat_id")), a.get("date", ""), a.get("time", ""), a.get("reason", ""),
+                      a.get("created_at", ""), int(bool(a.get("notified")))) for a in appts],
+                )
+                counts["appointments"] = len(appts)
+
+            patients = _read_json(files.get("patients", ""), {})
+            if isinstance(patients, dict) and patients:
+                # Formato antiguo: un solo paciente sin ID
+                if "heart_rate" in patients:
+                    patients = {"SIM-001": patients}
+                self._upsert_patients(conn, patients)
+                counts["patients"] = len(patients)
+
+            conn.execute("INSERT INTO meta (key, value) VALUES ('legacy_migrated', ?)", (json.dumps(counts),))
+        if counts:
+            print(f"🗄️  [STATE] Migrados a SQLite: {counts}")
+        return counts
+
+    def migrate_alerts_log(self):
+        """
+        Importa una sola vez `telegram_alerts.log` (`[fecha] [paciente] texto` por línea).
+
+        Lleva su propia marca porque llegó después de la migración general. Se lee
+        en streaming y se inserta por lotes: el log puede ser muy grande.
+        """
+        conn = self._conn()
+        if conn.execute("SELECT 1 FROM meta WHERE key = 'alerts_log_migrated'").fetchone():
+            return 0
+        path = self.legacy_files.get("alerts")
+        count = 0
+        with conn:
+            if path and os.path.exists(path):
+                batch = []
+                with open(path, "r", encoding="utf-8", errors="replace") as f:
+                    for line in f:
+                        match = _ALERT_LINE.match(line.strip())
+                        if not match:
+                            continue
+                        try:
+                            ts = datetime.datetime.strptime(match.group(1), "%Y-%m-%d %H:%M:%S").timestamp()
+                        except ValueError:
+                            continue
+                        batch.append((ts, match.group(2), match.group(3)))
+                        if len(batch) >= 5000:
+                            count += self._insert_legacy_alerts(conn, batch)
+                            batch = []
+                count += self._insert_legacy_alerts(conn, batch)
+            conn.execute("INSERT INTO meta (key, value) VALUES ('alerts_log_migrated', ?)", (str(count),))
+        if count:
+            print(f"🗄️  [STATE] Migradas {count} alertas del log a SQLite")
+        return count
+
+    @staticmethod
+    def _insert_legacy_alerts(conn, batch):
+        conn.executemany("INSERT INTO alerts (ts, patient_id, message) VALUES (?, ?, ?)", batch)
+        return len(batch)
+
+    # --- Usuarios y roles ---
+
+    def add_user(self, chat_id):
+        with self._conn() as conn:
+            conn.execute("INSERT OR IGNORE INTO users (chat_id, created_at) VALUES (?, ?)", (str(chat_id), time.time()))
+
+    def list_users(self, limit=None):
+        """IDs registrados en orden de alta (los últimos `limit` si se indica)."""
+        if limit:
+            rows = self._conn().execute(
+                "SELECT chat_id FROM (SELECT rowid, chat_id FROM users ORDER BY rowid DESC LIMIT ?) ORDER BY rowid",
+                (limit,)).fetchall()
+        else:
+            rows = self._conn().execute("SELECT chat_id FROM users ORDER BY rowid").fetchall()
+        return [r["chat_id"] for r in rows]
+
+    def get_role(self, chat_id, default="paciente"):
+        row = self._conn().execute("SELECT role FROM roles WHERE chat_id = ?", (str(chat_id),)).fetchone()
+        return row["role"] if row else default
+
+    def set_role(self, chat_id, role):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO roles (chat_id, role) VALUES (?, ?)", (str(chat_id), role))
+        with self._roles_lock:
+            if self._roles is not None:
+                for chats in self._roles.values():
+                    if str(chat_id) in chats:
+                        chats.remove(str(chat_id))
+                self._roles.setdefault(role, []).append(str(chat_id))
+
+    def chats_with_role(self, role):
+        """Chats con el rol indicado, servidos desde un índice en memoria (cada alerta lo consulta)."""
+        with self._roles_lock:
+            if self._roles is None:
+                self._roles = {}
+                for r in self._conn().execute("SELECT chat_id, role FROM roles ORDER BY rowid"):
+                    self._roles.setdefault(r["role"], []).append(r["chat_id"])
+            return list(self._roles.get(role, ()))
+
+    # --- Configuración y personalidad ---
+
+    def get_config(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM config WHERE key = ?", (key,)).fetchone()
+        return json.loads(row["value"]) if row else default
+
+    def set_config(self, key, value):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO config (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+
+    def get_meta(self, key, default=None):
+        row = self._conn().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else default
+
+    def set_meta(self, key, value):
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+
+    # --- Recordatorios ---
+
+    def add_reminder(self, chat_id, time_str, message):
+        with self._conn() as conn:
+            cur = conn.execute("INSERT INTO reminders (chat_id, time, message, last_sent) VALUES (?, ?, ?, '')",
+                               (str(chat_id), time_str, message))
+            return cur.lastrowid
+
+    def reminders_for(self, chat_id):
+        rows = self._conn().execute("SELECT * FROM reminders WHERE chat_id = ? ORDER BY time", (str(chat_id),))
+        return [dict(r) for r in rows]
+
+    def delete_reminders(self, chat_id):
+        """Borra los recordatorios de un chat. Devuelve cuántos había."""
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM reminders WHERE chat_id = ?", (str(chat_id),)).rowcount
+
+    def mark_reminder_sent(self, reminder_id, today):
+        with self._conn() as conn:
+            conn.execute("UPDATE reminders SET last_sent = ? WHERE id = ?", (today, reminder_id))
+
+    def all_reminders(self):
+        return [dict(r) for r in self._conn().execute("SELECT * FROM reminders ORDER BY id")]
+
+    # --- Citas ---
+
+    def add_appointment(self, chat_id, date_str, time_str, reason, created_at=""):
+        with self._conn() as conn:
+            cur = conn.execute(
+                "INSERT INTO appointments (chat_id, date, time, reason, created_at, notified) VALUES (?, ?, ?, ?, ?, 0)",
+                (str(chat_id), date_str, time_str, reason, created_at))
+            return cur.lastrowid
+
+    def appointments_for(self, chat_id):
+        rows = self._conn().execute("SELECT * FROM appointments WHERE chat_id = ? ORDER BY id", (str(chat_id),))
+        return [dict(r) for r in rows]
+
+    def mark_appointment_notified(self, appointment_id):
+        with self._conn() as conn:
+            conn.execute("UPDATE appointments SET notified = 1 WHERE id = ?", (appointment_id,))
+
+    def pending_appointments(self):
+        return [dict(r) for r in self._conn().execute("SELECT * FROM appointments WHERE notified = 0 ORDER BY id")]
+
+    def all_appointments(self):
+        return [dict(r) for r in self._conn().execute("SELECT * FROM appointments ORDER BY id")]
+
+    # --- Pacientes ---
+
+    @staticmethod
+    def _patient_row(pid, data):
+        extra = {k: v for k, v in data.items() if k not in PATIENT_FIELDS}
+        return (pid,) + tuple(data.get(k) for k in PATIENT_FIELDS) + (json.dumps(extra) if extra else None,)
+
+    @staticmethod
+    def _row_patient(row):
+        data = {k: row[k] for k in PATIENT_FIELDS if row[k] is not None}
+        for k in ("heart_rate", "spo2", "systolic", "diastolic"):
+            # SQLite devuelve REAL: conservamos enteros donde el simulador los usa
+            if isinstance(data.get(k), float) and data[k].is_integer():
+                data[k] = int(data[k])
+        if row["extra"]:
+            data.update(json.loads(row["extra"]))
+        return data
+
+    def _upsert_patients(self, conn, patients):
+        columns = PATIENT_FIELDS + ("extra",)
+        conn.executemany(
+            f"INSERT INTO patients (id, {', '.join(columns)}) VALUES ({', '.join('?' * (len(columns) + 1))}) "
+            f"ON CONFLICT(id) DO UPDATE SET {', '.join(f'{c} = excluded.{c}' for c in columns)}",
+            [self._patient_row(pid, data) for pid, data in patients.items()],
+        )
+
+    def load_patients(self):
+        return {r["id"]: self._row_patient(r) for r in self._conn().execute("SELECT * FROM patients ORDER BY rowid")}
+
+    def get_patient(self, pid):
+        row = self._conn().execute("SELECT * FROM patients WHERE id = ?", (pid,)).fetchone()
+        return self._row_patient(row) if row else None
+
+    def upsert_patient(self, pid, data):
+        self.upsert_patients({pid: data})
+
+    def upsert_patients(self, patients):
+        """Inserta o actualiza solo los pacientes indicados, en una transacción."""
+        if not patients:
+            return
+        with self._conn() as conn:
+            self._upsert_patients(conn, patients)
+
+    def patient_ids(self):
+        return [r["id"] for r in self._conn().execute("SELECT id FROM patients ORDER BY rowid")]
+
+    # --- Historial de alertas ---
+
+    def add_alerts(self, alerts):
+        """Registra [(ts, patient_id, regla, gravedad, valor, texto)] en una transacción."""
+        if not alerts:
+            return
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO alerts (ts, patient_id, rule, severity, value, message) VALUES (?, ?, ?, ?, ?, ?)",
+                alerts)
+
+    def resolve_alerts(self, resolved):
+        """Marca como resueltas las alertas abiertas de [(patient_id, regla, ts)]."""
+        if not resolved:
+            return
+        with self._conn() as conn:
+            conn.executemany(
+                "UPDATE alerts SET resolved_at = ? WHERE patient_id = ? AND rule = ? AND resolved_at IS NULL",
+                [(ts, pid, rule) for pid, rule, ts in resolved])
+
+    @staticmethod
+    def _alert_filter(patient_id, start, end):
+        clauses, params = [], []
+        if patient_id:
+            clauses.append("patient_id = ?")
+            params.append(patient_id)
+        if start is not None:
+            clauses.append("ts >= ?")
+            params.append(start)
+        if end is not None:
+            clauses.append("ts < ?")
+            params.append(end)
+        return (" WHERE " + " AND ".join(clauses) if clauses else ""), params
+
+    def recent_alerts(self, limit=10, patient_id=None, start=None, end=None):
+        """Las últimas `limit` alertas (más recientes primero), opcionalmente por paciente y rango."""
+        where, params = self._alert_filter(patient_id, start, end)
+        rows = self._conn().execute(f"SELECT * FROM alerts{where} ORDER BY ts DESC, id DESC LIMIT ?",
+                                    params + [limit if limit else -1])
+        return [dict(r) for r in rows]
+
+    def alert_counts(self, patient_id=None, start=None, end=None):
+        """Alertas por paciente y día local: [{"day", "patient_id", "count"}], días recientes primero."""
+        where, params = self._alert_filter(patient_id, start, end)
+        rows = self._conn().execute(
+            f"SELECT date(ts, 'unixepoch', 'localtime') AS day, patient_id, COUNT(*) AS count FROM alerts{where} "
+            "GROUP BY day, patient_id ORDER BY day DESC, count DESC", params)
+        return [dict(r) for r in rows]
+
+    def prune_alerts(self, days=ALERT_RETENTION_DAYS, now=None):
+        """Borra las alertas más antiguas que `days` días. Devuelve cuántas."""
+        if not days:
+            return 0
+        cutoff = (time.time() if now is None else now) - days * 86400
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM alerts WHERE ts < ?", (cutoff,)).rowcount
+
+    def stats(self):
+        conn = self._conn()
+        return {table: conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                for table in ("users", "roles", "reminders", "appointments", "patients", "alerts")}
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """Store compartido por todo el proceso."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = StateStore()
+        return _store
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Inspecciona el estado del bot guardado en SQLite.")
+    parser.add_argument("--db", default=DB_FILE, help="Ruta de la base de datos.")
+    args = parser.parse_args(argv)
+    store = StateStore(args.db)
+    print(json.dumps({"status": "success", "db": args.db, "tables": store.stats()}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+"""
+Cliente compartido del Bot API de Telegram.
+
+Usa una `requests.Session` con keep-alive y pool de conexiones, de modo que los
+envíos consecutivos reutilizan la misma conexión TLS con api.telegram.org.
+Reintenta con backoff ante 429/5xx (respetando `retry_after`) y acumula
+métricas de tiempo por endpoint.
+"""
+import os
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+DEFAULT_API_BASE = "https://api.telegram.org"
+
+
+class TelegramAPIError(Exception):
+    """Error devuelto por el Bot API (ok=false o código HTTP de error)."""
+
+    def __init__(self, description, status_code=None, retry_after=None):
+        super().__init__(description)
+        self.status_code = status_code
+        self.retry_after = retry_after
+
+
+class BotAPIClient:
+    """Cliente HTTP con sesión persistente, reintentos y métricas por endpoint."""
+
+    def __init__(self, token, api_base=DEFAULT_API_BASE, pool_size=20, max_retries=3, backoff=0.5):
+        self.token = token
+        self.api_base = api_base.rstrip("/")
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def _record(self, endpoint, elapsed, error=False, retried=False):
+        with self._lock:
+            m = self._metrics.setdefault(endpoint, {"calls": 0, "errors": 0, "retries": 0, "total_ms": 0.0, "max_ms": 0.0})
+            m["calls"] += 1
+            m["total_ms"] += elapsed * 1000
+            m["max_ms"] = max(m["max_ms"], elapsed * 1000)
+            if error:
+                m["errors"] += 1
+            if retried:
+                m["retries"] += 1
+
+    def metrics(self):
+        """Resumen por endpoint: llamadas, errores, reintentos y latencia media/máxima (ms)."""
+        with self._lock:
+            return {
+                endpoint: {
+                    "calls": m["calls"],
+                    "errors": m["errors"],
+                    "retries": m["retries"],
+                    "avg_ms": round(m["total_ms"] / m["calls"], 1) if m["calls"] else 0.0,
+                    "max_ms": round(m["max_ms"], 1),
+                }
+                for endpoint, m in self._metrics.items()
+            }
+
+    def _retry_delay(self, response, attempt):
+        """Espera antes del siguiente intento: retry_after del 429 o backoff exponencial."""
+        if response is not None and response.status_code == 429:
+            try:
+                retry_after = response.json().get("parameters", {}).get("retry_after")
+            except ValueError:
+                retry_after = None
+            retry_after = retry_after or response.headers.get("Retry-After")
+            if retry_after:
+                return float(retry_after)
+        return self.backoff * (2 ** attempt)
+
+    def request(self, http_method, url, endpoint, timeout=10, files=None, **kwargs):
+        """Petición con reintentos ante 429/5xx y errores de conexión. Devuelve la respuesta."""
+        attempt = 0
+        while True:
+            start = time.time()
+            if files:
+                # Rebobinar los archivos para poder reenviarlos en un reintento
+                for f in files.values():
+                    if hasattr(f, "seek"):
+                        f.seek(0)
+            try:
+                response = self.session.request(http_method, url, timeout=timeout, files=files, **kwargs)
+            except requests.exceptions.ConnectionError:
+                self._record(endpoint, time.time() - start, error=True, retried=attempt < self.max_retries)
+                if attempt >= self.max_retries:
+                    raise
+                time.sleep(self._retry_delay(None, attempt))
+                attempt += 1
+                continue
+            except requests.exceptions.RequestException:
+                # Los ReadTimeout no se reintentan: un envío podría duplicarse
+                self._record(endpoint, time.time() - start, error=True)
+                raise
+
+            retryable = response.status_code == 429 or response.status_code >= 500
+            self._record(endpoint, time.time() - start, error=not response.ok, retried=retryable and attempt < self.max_retries)
+            if retryable and attempt < self.max_retries:
+                time.sleep(self._retry_delay(response, attempt))
+                attempt += 1
+                continue
+            return response
+
+    def call(self, method, params=None, json=None, data=None, files=None, timeout=10, http_method="POST"):
+        """Invoca un método del Bot API y devuelve su campo `result`."""
+        url = f"{self.api_base}/bot{self.token}/{method}"
+        response = self.request(http_method, url, method, timeout=timeout, params=params, json=json, data=data, files=files)
+        try:
+            payload = response.json()
+        except ValueError:
+            response.raise_for_status()
+            raise TelegramAPIError(f"Respuesta no JSON de {method}", response.status_code)
+        if not response.ok or not payload.get("ok", False):
+            raise TelegramAPIError(
+                payload.get("description", f"HTTP {response.status_code}"),
+                response.status_code,
+                payload.get("parameters", {}).get("retry_after"),
+            )
+        return payload.get("result")
+
+    def download(self, file_path, timeout=20):
+        """Descarga el contenido de un archivo ya resuelto con getFile."""
+        url = f"{self.api_base}/file/bot{self.token}/{file_path}"
+        response = self.request("GET", url, "file", timeout=timeout)
+        response.raise_for_status()
+        return response.content
+
+
+_clients = {}
+_clients_lock = threading.Lock()
+
+
+def get_client(token, api_base=None):
+    """Cliente compartido por (token, api_base) para reutilizar conexiones en todo el proceso."""
+    api_base = (api_base or os.getenv("TELEGRAM_API_BASE", DEFAULT_API_BASE)).rstrip("/")
+    key = (token, api_base)
+    with _clients_lock:
+        if key not in _clients:
+            _clients[key] = BotAPIClient(token, api_base)
+        return _clients[key]
@@ -7,6 +7,8 @@ import requests
 import time
 from dotenv import load_dotenv
 
+from telegram_client import TelegramAPIError, get_client
+
 # Cargar entorno para obtener credenciales
 load_dotenv()
 
@@ -14,100 +16,149 @@ TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 ALLOWED_USERS = os.getenv("TELEGRAM_ALLOWED_USERS", CHAT_ID or "").strip()
 OFFSET_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".tmp", "telegram_offset.txt")
+# Permite apuntar a un Bot API local (pruebas o servidor propio)
+API_BASE = os.getenv("TELEGRAM_API_BASE", "https://api.telegram.org").rstrip("/")
 
-def send_message(text, target_chat_id=None):
-    """Envía un mensaje al chat configurado."""
-    dest_id = target_chat_id or CHAT_ID
-    if not TOKEN or not dest_id:
-        print(json.dumps({"status": "error", "message": "Faltan credenciales o Chat ID destino."}))
-        sys.exit(1)
-    
-    url = f"https://api.telegram.org/bot{TOKEN}/sendMessage"
-    payload = {"chat_id": dest_id, "text": text, "parse_mode": "Markdown"}
-    
+def api():
+    """Cliente del Bot API compartido (sesión keep-alive con pool de conexiones)."""
+    return get_client(TOKEN, API_BASE)
+
+# Método del Bot API, campo del archivo y timeout (las subidas tardan más que un texto)
+FILE_METHODS = {
+    "photo": ("sendPhoto", "photo", 30),
+    "document": ("sendDocument", "document", 60),
+    "voice": ("sendVoice", "voice", 40),
+}
+
+def _call_markdown(method, payload):
+    """Llama al método con Markdown y, si Telegram rechaza el formato, reintenta como texto plano."""
     try:
-        response = requests.post(url, json=payload, timeout=10)
-        response.raise_for_status()
-        print(json.dumps({"status": "success", "message": "Mensaje enviado."}))
-    except Exception:
-        # Si falla (común por errores de sintaxis Markdown), reintentar como texto plano
-        try:
-            payload.pop("parse_mode", None)
-            response = requests.post(url, json=payload, timeout=10)
-            response.raise_for_status()
-            print(json.dumps({"status": "success", "message": "Mensaje enviado (texto plano por error de formato)."}))
-        except Exception as e:
-            print(json.dumps({"status": "error", "message": str(e)}))
-            sys.exit(1)
+        return api().call(method, json={**payload, "parse_mode": "Markdown"}, timeout=10)
+    except TelegramAPIError as e:
+        if e.status_code != 400:
+            raise
+        return api().call(method, json=payload, timeout=10)
 
-def send_photo(file_path, target_chat_id=None, caption=""):
-    """Envía una foto desde una ruta local."""
+def deliver_message(text, chat_id):
+    """Envía un texto y devuelve el Message del Bot API (incluye `message_id`)."""
+    return _call_markdown("sendMessage", {"chat_id": chat_id, "text": text})
+
+def edit_message(chat_id, message_id, text):
+    """Reemplaza el texto de un mensaje ya enviado (editMessageText)."""
+    try:
+        return _call_markdown("editMessageText", {"chat_id": chat_id, "message_id": message_id, "text": text})
+    except TelegramAPIError as e:
+        # Editar con el mismo texto no es un error real
+        if "not modified" in str(e):
+            return None
+        raise
+
+def deliver_file(kind, file_path, chat_id, caption=""):
+    """Sube una foto, documento o nota de voz desde una ruta local."""
+    method, field, timeout = FILE_METHODS[kind]
+    data = {"chat_id": chat_id}
+    if caption:
+        data["caption"] = caption
+    # El archivo se abre en modo binario 'rb'
+    with open(file_path, 'rb') as f:
+        return api().call(method, files={field: f}, data=data, timeout=timeout)
+
+def send_message(text, target_chat_id=None):
+    """Envía un mensaje al chat configurado."""
     dest_id = target_chat_id or CHAT_ID
     if not TOKEN or not dest_id:
         print(json.dumps({"status": "error", "message": "Faltan credenciales o Chat ID destino."}))
         sys.exit(1)
     
-    url = f"https://api.telegram.org/bot{TOKEN}/sendPhoto"
-    
     try:
-        # El archivo se abre en modo binario 'rb'
-        with open(file_path, 'rb') as photo_file:
-            files = {'photo': photo_file}
-            data = {'chat_id': dest_id, 'caption': caption}
-            response = requests.post(url, files=files, data=data, timeout=30) # Timeout aumentado para subidas
-            response.raise_for_status()
-            print(json.dumps({"status": "success", "message": "Foto enviada."}))
+        # Si el Markdown es inválido (común en respuestas del LLM) se reenvía como texto plano
+        message = deliver_message(text, dest_id)
+        print(json.dumps({"status": "success", "message": "Mensaje enviado.", "message_id": (message or {}).get("message_id")}))
     except Exception as e:
         print(json.dumps({"status": "error", "message": str(e)}))
         sys.exit(1)
 
-def send_document(file_path, target_chat_id=None, caption=""):
-    """Envía un documento (PDF, etc.) desde una ruta local."""
+def _send_file(kind, file_path, target_chat_id, caption, done_msg):
     dest_id = target_chat_id or CHAT_ID
     if not TOKEN or not dest_id:
         print(json.dumps({"status": "error", "message": "Faltan credenciales o Chat ID destino."}))
         sys.exit(1)
     
-    url = f"https://api.telegram.org/bot{TOKEN}/sendDocument"
-    
     try:
-        # El archivo se abre en modo binario 'rb'
-        with open(file_path, 'rb') as doc_file:
-            files = {'document': doc_file}
-            data = {'chat_id': dest_id, 'caption': caption}
-            response = requests.post(url, files=files, data=data, timeout=60) # Timeout mayor para docs
-            response.raise_for_status()
-            print(json.dumps({"status": "success", "message": "Documento enviado."}))
+        deliver_file(kind, file_path, dest_id, caption)
+        print(json.dumps({"status": "success", "message": done_msg}))
     except Exception as e:
         print(json.dumps({"status": "error", "message": str(e)}))
         sys.exit(1)
 
+def send_photo(file_path, target_chat_id=None, caption=""):
+    """Envía una foto desde una ruta local."""
+    _send_file("photo", file_path, target_chat_id, caption, "Foto enviada.")
+
+def send_document(file_path, target_chat_id=None, caption=""):
+    """Envía un documento (PDF, etc.) desde una ruta local."""
+    _send_file("document", file_path, target_chat_id, caption, "Documento enviado.")
+
 def send_voice(file_path, target_chat_id=None):
     """Envía una nota de voz (.ogg)."""
-    dest_id = target_chat_id or CHAT_ID
-    if not TOKEN or not dest_id:
-        print(json.dumps({"status": "error", "message": "Faltan credenciales o Chat ID destino."}))
-        sys.exit(1)
-    
-    url = f"https://api.telegram.org/bot{TOKEN}/sendVoice"
-    
-    try:
-        with open(file_path, 'rb') as voice_file:
-            files = {'voice': voice_file}
-            data = {'chat_id': dest_id}
-            response = requests.post(url, files=files, data=data, timeout=40)
-            response.raise_for_status()
-            print(json.dumps({"status": "success", "message": "Nota de voz enviada."}))
-    except Exception as e:
-        print(json.dumps({"status": "error", "message": str(e)}))
-        sys.exit(1)
+    _send_file("voice", file_path, target_chat_id, "", "Nota de voz enviada.")
 
-def check_messages():
-    """Consulta nuevos mensajes (polling) manteniendo el estado del offset."""
-    if not TOKEN:
-        print(json.dumps({"status": "error", "message": "Falta TELEGRAM_BOT_TOKEN en .env"}))
-        sys.exit(1)
-        
+def parse_updates(results, offset=0):
+    """Convierte updates del Bot API al formato "CHAT_ID|CONTENIDO". Devuelve (mensajes, nuevo_offset)."""
+    messages = []
+    max_update_id = offset
+
+    for result in results:
+        update_id = result["update_id"]
+        # Solo procesamos mensajes nuevos
+        if update_id >= offset:
+            max_update_id = max(max_update_id, update_id + 1)
+            
+            # Solo procesamos mensajes nuevos (ignoramos ediciones, posts de canal, etc.)
+            message = result.get("message")
+            if not message:
+                continue
+
+            # Seguridad: Filtrar por CHAT_ID si está definido para ignorar extraños
+            msg_chat_id = str(message.get("chat", {}).get("id", ""))
+            
+            # Si ALLOWED_USERS es "*", permite a todos. Si no, verifica la lista.
+            if ALLOWED_USERS != "*":
+                allowed_list = [u.strip() for u in ALLOWED_USERS.split(",") if u.strip()]
+                if msg_chat_id not in allowed_list:
+                    print(f"⚠️ Ignorando mensaje de {msg_chat_id} (No autorizado. Permitidos: '{ALLOWED_USERS}')", file=sys.stderr)
+                    continue
+                
+            text = message.get("text", "")
+            photo = message.get("photo")
+            
+            if text:
+                messages.append(f"{msg_chat_id}|{text}")
+            elif photo:
+                # Telegram envía varias resoluciones, la última es la mejor
+                file_id = photo[-1]["file_id"]
+                caption = message.get("caption", "") or ""
+                # Usamos un prefijo especial para identificar fotos en el listener
+                messages.append(f"{msg_chat_id}|__PHOTO__:{file_id}|||{caption}")
+            elif message.get("document"):
+                doc = message["document"]
+                file_id = doc["file_id"]
+                file_name = doc.get("file_name", "unknown.pdf")
+                mime_type = doc.get("mime_type", "")
+                caption = message.get("caption", "") or ""
+                
+                # Solo procesamos PDFs por ahora
+                if "pdf" in mime_type or file_name.lower().endswith(".pdf"):
+                    messages.append(f"{msg_chat_id}|__DOCUMENT__:{file_id}|||{file_name}|||{caption}")
+            elif message.get("voice"):
+                voice = message["voice"]
+                file_id = voice["file_id"]
+                messages.append(f"{msg_chat_id}|__VOICE__:{file_id}")
+
+    return messages, max_update_id
+
+def fetch_updates(timeout=5, limit=10):
+    """Obtiene mensajes nuevos con getUpdates (long polling si timeout es grande) y guarda el offset."""
     offset = 0
     if os.path.exists(OFFSET_FILE):
         with open(OFFSET_FILE, 'r') as f:
@@ -116,76 +167,62 @@ def check_messages():
             except:
                 offset = 0
     
-    url = f"https://api.telegram.org/bot{TOKEN}/getUpdates"
-    params = {"offset": offset, "limit": 10, "timeout": 5}
+    params = {"offset": offset, "limit": limit, "timeout": timeout}
     
     try:
-        response = requests.get(url, params=params, timeout=20)
-        response.raise_for_status()
-        data = response.json()
-        
-        messages = []
-        max_update_id = offset
-        
-        for result in data.get("result", []):
-            update_id = result["update_id"]
-            # Solo procesamos mensajes nuevos
-            if update_id >= offset:
-                max_update_id = max(max_update_id, update_id + 1)
-                
-                # Solo procesamos mensajes nuevos (ignoramos ediciones, posts de canal, etc.)
-                message = result.get("message")
-                if not message:
-                    continue
+        # El timeout HTTP debe superar al del long polling para no cortar la espera del servidor
+        results = api().call("getUpdates", params=params, timeout=timeout + 15, http_method="GET")
+    except requests.exceptions.ReadTimeout:
+        # Timeout de lectura es normal en polling; devolvemos lista vacía para reintentar silenciosamente
+        return []
+    
+    messages, max_update_id = parse_updates(results or [], offset)
+    
+    # Guardar nuevo offset para no repetir mensajes
+    if max_update_id > offset:
+        os.makedirs(os.path.dirname(OFFSET_FILE), exist_ok=True)
+        with open(OFFSET_FILE, 'w') as f:
+            f.write(str(max_update_id))
+    return messages
 
-                # Seguridad: Filtrar por CHAT_ID si está definido para ignorar extraños
-                msg_chat_id = str(message.get("chat", {}).get("id", ""))
-                
-                # Si ALLOWED_USERS es "*", permite a todos. Si no, verifica la lista.
-                if ALLOWED_USERS != "*":
-                    allowed_list = [u.strip() for u in ALLOWED_USERS.split(",") if u.strip()]
-                    if msg_chat_id not in allowed_list:
-                        print(f"⚠️ Ignorando mensaje de {msg_chat_id} (No autorizado. Permitidos: '{ALLOWED_USERS}')", file=sys.stderr)
-                        continue
-                    
-                text = message.get("text", "")
-                photo = message.get("photo")
-                
-                if text:
-                    messages.append(f"{msg_chat_id}|{text}")
-                elif photo:
-                    # Telegram envía varias resoluciones, la última es la mejor
-                    file_id = photo[-1]["file_id"]
-                    caption = message.get("caption", "") or ""
-                    # Usamos un prefijo especial para identificar fotos en el listener
-                    messages.append(f"{msg_chat_id}|__PHOTO__:{file_id}|||{caption}")
-                elif message.get("document"):
-                    doc = message["document"]
-                    file_id = doc["file_id"]
-                    file_name = doc.get("file_name", "unknown.pdf")
-                    mime_type = doc.get("mime_type", "")
-                    caption = message.get("caption", "") or ""
-                    
-                    # Solo procesamos PDFs por ahora
-                    if "pdf" in mime_type or file_name.lower().endswith(".pdf"):
-                        messages.append(f"{msg_chat_id}|__DOCUMENT__:{file_id}|||{file_name}|||{caption}")
-                elif message.get("voice"):
-                    voice = message["voice"]
-                    file_id = voice["file_id"]
-                    messages.append(f"{msg_chat_id}|__VOICE__:{file_id}")
+def check_messages(timeout=5, limit=10):
+    """Consulta nuevos mensajes (polling) manteniendo el estado del offset."""
+    if not TOKEN:
+        print(json.dumps({"status": "error", "message": "Falta TELEGRAM_BOT_TOKEN en .env"}))
+        sys.exit(1)
         
-        # Guardar nuevo offset para no repetir mensajes
-        if max_update_id > offset:
-            os.makedirs(os.path.dirname(OFFSET_FILE), exist_ok=True)
-            with open(OFFSET_FILE, 'w') as f:
-                f.write(str(max_update_id))
-                
+    try:
+        messages = fetch_updates(timeout=timeout, limit=limit)
         print(json.dumps({"status": "success", "messages": messages}))
-        
-    except requests.exceptions.ReadTimeout:
-        # Timeout de lectura es normal en polling; devolvemos lista vacía para reintentar silenciosamente
-        print(json.dumps({"status": "success", "messages": []}))
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+
+def set_webhook(webhook_url, secret=None):
+    """Registra la URL del webhook; Telegram dejará de aceptar getUpdates mientras esté activo."""
+    if not TOKEN:
+        print(json.dumps({"status": "error", "message": "Falta TELEGRAM_BOT_TOKEN en .env"}))
+        sys.exit(1)
+
+    payload = {"url": webhook_url, "allowed_updates": ["message"]}
+    if secret:
+        payload["secret_token"] = secret
+    try:
+        api().call("setWebhook", json=payload, timeout=10)
+        print(json.dumps({"status": "success", "message": f"Webhook registrado en {webhook_url}"}))
+    except Exception as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+
+def delete_webhook():
+    """Elimina el webhook para volver al modo polling."""
+    if not TOKEN:
+        print(json.dumps({"status": "error", "message": "Falta TELEGRAM_BOT_TOKEN en .env"}))
+        sys.exit(1)
 
+    try:
+        api().call("deleteWebhook", timeout=10)
+        print(json.dumps({"status": "success", "message": "Webhook eliminado."}))
     except Exception as e:
         print(json.dumps({"status": "error", "message": str(e)}))
         sys.exit(1)
@@ -196,16 +233,10 @@ def get_chat_id():
         print(json.dumps({"status": "error", "message": "Falta TELEGRAM_BOT_TOKEN en .env"}))
         sys.exit(1)
         
-    url = f"https://api.telegram.org/bot{TOKEN}/getUpdates"
-    
     # Intentar varias veces (polling) para dar tiempo al usuario
     for _ in range(20):
         try:
-            response = requests.get(url, timeout=10)
-            response.raise_for_status()
-            data = response.json()
-            
-            results = data.get("result", [])
+            results = api().call("getUpdates", timeout=10, http_method="GET") or []
             if results:
                 # Procesar los últimos mensajes para obtener IDs únicos
                 users = {}
@@ -239,14 +270,10 @@ def download_file(file_id, dest_path):
         
     try:
         # 1. Obtener la ruta del archivo
-        info_url = f"https://api.telegram.org/bot{TOKEN}/getFile"
-        res = requests.get(info_url, params={"file_id": file_id}, timeout=10)
-        res.raise_for_status()
-        file_path_remote = res.json()["result"]["file_path"]
+        file_path_remote = api().call("getFile", params={"file_id": file_id}, timeout=10, http_method="GET")["file_path"]
         
         # 2. Descargar el contenido
-        download_url = f"https://api.telegram.org/file/bot{TOKEN}/{file_path_remote}"
-        img_data = requests.get(download_url, timeout=20).content
+        img_data = api().download(file_path_remote, timeout=20)
         
         with open(dest_path, 'wb') as f:
             f.write(img_data)
@@ -256,17 +283,21 @@ def download_file(file_id, dest_path):
         print(json.dumps({"status": "error", "message": str(e)}))
         sys.exit(1)
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Herramienta de integración con Telegram.")
-    parser.add_argument("--action", choices=["send", "check", "get-id", "download", "send-photo", "send-document", "send-voice"], required=True, help="Acción a realizar.")
+    parser.add_argument("--action", choices=["send", "check", "get-id", "download", "send-photo", "send-document", "send-voice", "set-webhook", "delete-webhook"], required=True, help="Acción a realizar.")
     parser.add_argument("--message", help="Mensaje a enviar (requerido para --action send).")
     parser.add_argument("--chat-id", help="ID del chat destino (opcional, por defecto usa el del .env).")
     parser.add_argument("--file-id", help="ID del archivo a descargar (para --action download).")
     parser.add_argument("--dest", help="Ruta destino (para --action download).")
     parser.add_argument("--file-path", help="Ruta del archivo local a enviar (para --action send-photo).")
     parser.add_argument("--caption", help="Texto para la foto (para --action send-photo).")
+    parser.add_argument("--timeout", type=int, default=5, help="Segundos de long polling (para --action check).")
+    parser.add_argument("--limit", type=int, default=10, help="Máximo de updates por consulta (para --action check).")
+    parser.add_argument("--url", help="URL pública del webhook (para --action set-webhook).")
+    parser.add_argument("--secret", help="Secret token del webhook (para --action set-webhook).")
     
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
     
     if args.action == "send":
         send_message(args.message or "Notificación vacía", args.chat_id)
@@ -286,7 +317,14 @@ def main():
             sys.exit(1)
         send_voice(args.file_path, args.chat_id)
     elif args.action == "check":
-        check_messages()
+        check_messages(timeout=args.timeout, limit=args.limit)
+    elif args.action == "set-webhook":
+        if not args.url:
+            print(json.dumps({"status": "error", "message": "Falta argumento --url"}))
+            sys.exit(1)
+        set_webhook(args.url, args.secret or os.getenv("TELEGRAM_WEBHOOK_SECRET"))
+    elif args.action == "delete-webhook":
+        delete_webhook()
     elif args.action == "get-id":
         get_chat_id()
     elif args.action == "download":
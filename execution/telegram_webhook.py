@@ -0,0 +1,139 @@
+#!/usr/bin/env python3
+"""
+Servidor HTTP local para recibir updates de Telegram por webhook.
+
+Telegram hace POST de cada update a la URL registrada con
+`telegram_tool.py --action set-webhook`; el servidor valida el secret token,
+convierte el update al formato "CHAT_ID|CONTENIDO" con `parse_updates()` y
+lo entrega directamente al dispatcher del listener (sin esperar al polling).
+
+Por defecto escucha solo en 127.0.0.1, detrás del proxy que termina el TLS
+(Telegram exige HTTPS). Para escuchar en otra interfaz hace falta el secret
+(TELEGRAM_WEBHOOK_SECRET): sin él, cualquiera podría inyectar mensajes.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import os
+import sys
+import threading
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from telegram_tool import parse_updates
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class WebhookServer:
+    """Recibe updates por HTTP y llama a on_message(msg) por cada mensaje válido."""
+
+    def __init__(self, on_message, host="127.0.0.1", port=8443, path="/telegram", secret=None):
+        if not secret and not _is_loopback(host):
+            raise ValueError(f"El webhook en {host} necesita TELEGRAM_WEBHOOK_SECRET (o escuchar en 127.0.0.1).")
+        self.on_message = on_message
+        self.path = path
+        self.secret = secret
+        # Telegram reintenta si no respondemos 200: evitamos procesar dos veces el mismo update
+        self._seen = deque(maxlen=1000)
+        self._seen_lock = threading.Lock()
+        self.received = 0
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._thread = None
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    def _is_duplicate(self, update_id):
+        with self._seen_lock:
+            if update_id in self._seen:
+                return True
+            self._seen.append(update_id)
+            return False
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                if self.path != server.path:
+                    self.send_response(404)
+                    self.end_headers()
+                    return
+                if server.secret and not hmac.compare_digest(
+                        self.headers.get("X-Telegram-Bot-Api-Secret-Token", "").encode(), server.secret.encode()):
+                    self.send_response(403)
+                    self.end_headers()
+                    return
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    update = json.loads(self.rfile.read(length) or b"{}")
+                except (ValueError, json.JSONDecodeError):
+                    self.send_response(400)
+                    self.end_headers()
+                    return
+
+                # on_message solo encola (queue.put / call_soon_threadsafe), así que
+                # respondemos enseguida y Telegram no reintenta
+                if "update_id" in update and not server._is_duplicate(update["update_id"]):
+                    server.received += 1
+                    messages, _ = parse_updates([update])
+                    for msg in messages:
+                        try:
+                            server.on_message(msg)
+                        except Exception as e:
+                            print(f"❌ [WEBHOOK] Error entregando mensaje: {e}", file=sys.stderr)
+                self.send_response(200)
+                self.end_headers()
+
+            def log_message(self, format, *args):
+                # Silenciar el log por petición de http.server
+                pass
+
+        return Handler
+
+    def start(self):
+        self._thread = threading.Thread(target=self._httpd.serve_forever, name="telegram-webhook", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servidor webhook de Telegram (imprime los mensajes recibidos).")
+    parser.add_argument("--host", default=os.getenv("TELEGRAM_WEBHOOK_HOST", "127.0.0.1"),
+                        help="Interfaz de escucha (fuera de loopback exige TELEGRAM_WEBHOOK_SECRET).")
+    parser.add_argument("--port", type=int, default=int(os.getenv("TELEGRAM_WEBHOOK_PORT", "8443")), help="Puerto de escucha.")
+    parser.add_argument("--path", default=os.getenv("TELEGRAM_WEBHOOK_PATH", "/telegram"), help="Ruta del webhook.")
+    args = parser.parse_args(argv)
+
+    def on_message(msg):
+        print(json.dumps({"status": "success", "message": msg}, ensure_ascii=False), flush=True)
+
+    try:
+        server = WebhookServer(on_message, host=args.host, port=args.port, path=args.path,
+                               secret=os.getenv("TELEGRAM_WEBHOOK_SECRET"))
+    except ValueError as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+    print(f"🌐 Webhook escuchando en {args.host}:{server.port}{args.path}", file=sys.stderr)
+    try:
+        server._httpd.serve_forever()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
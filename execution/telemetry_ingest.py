@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""
+Ingesta de telemetría real desde los monitores de cabecera.
+
+Hasta ahora los signos vitales solo se simulaban dentro del listener. Este
+servicio local recibe lecturas por lotes desde dispositivos (p. ej. las
+placas ESP32 que ya usamos para la cámara) por dos vías:
+
+- HTTP: `POST /telemetry` con JSON (`{"readings": [...]}` o una lista) o con
+  texto en protocolo de líneas (`Content-Type: text/plain`);
+- TCP: una línea por lectura, para dispositivos que mantienen el socket
+  abierto y no quieren pagar una petición HTTP por lote.
+
+Con TELEMETRY_TOKEN definido, HTTP exige la cabecera `X-Telemetry-Token` y
+TCP una primera línea `token=<valor>`; sin ella se cierra la conexión. Sin
+token solo se escucha en loopback: para recibir de la red hace falta.
+Los valores NaN o infinitos se rechazan como lecturas inválidas.
+
+Protocolo de líneas (estilo InfluxDB; el timestamp es opcional, en segundos
+o en nanosegundos):
+
+    vitals,patient=SIM-001 heart_rate=82,spo2=97,temperature=36.9 1712345678.5
+
+Cada paciente tiene un buffer circular de tamaño fijo (columnas NumPy), así
+que la memoria no crece con el tiempo. El listener recoge la última lectura
+de los pacientes que recibieron datos (`take_updates`) y la vuelca en el
+motor de signos vitales, donde se evalúan los mismos umbrales de alerta que
+en la simulación.
+"""
+import argparse
+import hmac
+import ipaddress
+import json
+import math
+import os
+import socketserver
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+RING_SIZE = int(os.getenv("TELEMETRY_RING_SIZE", "512"))
+# Bytes máximos que se aceptan de un cliente TCP antes de que se identifique
+AUTH_LINE_MAX = 1024
+
+FIELDS = ("heart_rate", "temperature", "spo2", "systolic", "diastolic")
+ALIASES = {"hr": "heart_rate", "temp": "temperature", "sys": "systolic", "dia": "diastolic"}
+
+
+class RingBuffer:
+    """Últimas `capacity` lecturas de un paciente: timestamps y una columna por signo vital."""
+
+    def __init__(self, capacity=RING_SIZE):
+        self.capacity = capacity
+        self.ts = np.zeros(capacity, dtype=np.float64)
+        self.values = np.full((capacity, len(FIELDS)), np.nan, dtype=np.float64)
+        self.head = 0          # siguiente posición a escribir
+        self.count = 0
+        # Último valor conocido de cada signo (una lectura puede traer solo algunos)
+        self.last = np.full(len(FIELDS), np.nan, dtype=np.float64)
+        self.last_ts = 0.0
+
+    def extend(self, ts, values):
+        k = len(ts)
+        if k > self.capacity:
+            ts, values, k = ts[-self.capacity:], values[-self.capacity:], self.capacity
+        idx = (self.head + np.arange(k)) % self.capacity
+        self.ts[idx] = ts
+        self.values[idx] = values
+        self.head = (self.head + k) % self.capacity
+        self.count = min(self.capacity, self.count + k)
+        # Último valor no nulo de cada columna dentro del lote
+        seen = ~np.isnan(values)
+        has = seen.any(axis=0)
+        last_rows = k - 1 - np.argmax(seen[::-1], axis=0)
+        self.last[has] = values[last_rows[has], np.flatnonzero(has)]
+        self.last_ts = max(self.last_ts, float(ts.max()))
+
+    def window(self, since=None):
+        """(timestamps, valores) en orden cronológico, opcionalmente desde `since`."""
+        order = (self.head - self.count + np.arange(self.count)) % self.capacity
+        ts, values = self.ts[order], self.values[order]
+        if since is not None:
+            keep = ts >= since
+            ts, values = ts[keep], values[keep]
+        return ts, values
+
+    def latest(self):
+        data = {f: self.last[i].item() for i, f in enumerate(FIELDS) if not np.isnan(self.last[i])}
+        data["last_update"] = self.last_ts
+        return data
+
+
+class TelemetryBuffers:
+    """Buffers circulares por paciente, con registro de quién recibió datos desde la última consulta."""
+
+    def __init__(self, capacity=RING_SIZE):
+        self.capacity = capacity
+        self._rings = {}
+        self._updated = set()
+        self._lock = threading.Lock()
+        self.accepted = 0
+        self.rejected = 0
+        self.started = time.time()
+
+    def ingest(self, readings):
+        """Guarda [(patient_id, ts, {campo: valor})]. Devuelve cuántas lecturas se aceptaron."""
+        grouped = {}
+        for pid, ts, fields in readings:
+            row = [np.nan] * len(FIELDS)
+            for key, value in fields.items():
+                row[FIELDS.index(key)] = value
+            entry = grouped.setdefault(pid, ([], []))
+            entry[0].append(ts)
+            entry[1].append(row)
+        with self._lock:
+            for pid, (ts, rows) in grouped.items():
+                ring = self._rings.get(pid)
+                if ring is None:
+                    ring = self._rings[pid] = RingBuffer(self.capacity)
+                ring.extend(np.asarray(ts, dtype=np.float64), np.asarray(rows, dtype=np.float64))
+                self._updated.add(pid)
+            self.accepted += len(readings)
+        return len(readings)
+
+    def reject(self, n):
+        with self._lock:
+            self.rejected += n
+
+    def take_updates(self):
+        """{patient_id: última lectura} de los pacientes con datos nuevos desde la llamada anterior."""
+        with self._lock:
+            updated, self._updated = self._updated, set()
+            return {pid: self._rings[pid].latest() for pid in updated}
+
+    def window(self, pid, since=None):
+        with self._lock:
+            ring = self._rings.get(pid)
+            if ring is None:
+                return np.zeros(0), np.zeros((0, len(FIELDS)))
+            return ring.window(since)
+
+    def stats(self):
+        with self._lock:
+            elapsed = max(time.time() - self.started, 1e-9)
+            return {"patients": len(self._rings), "accepted": self.accepted, "rejected": self.rejected,
+                    "per_second": round(self.accepted / elapsed, 1)}
+
+
+# --- Formatos de entrada ---
+
+def _field(key):
+    key = ALIASES.get(key, key)
+    if key not in FIELDS:
+        raise ValueError(f"campo desconocido: {key}")
+    return key
+
+
+def _value(raw):
+    value = float(raw)
+    # Un NaN o un infinito se colaría en los umbrales de alerta y en las medias del histórico
+    if not math.isfinite(value):
+        raise ValueError(f"valor no finito: {raw}")
+    return value
+
+
+def _timestamp(value, now):
+    if value is None or value == "":
+        return now
+    ts = _value(value)
+    # Nanosegundos (protocolo de InfluxDB) o milisegundos
+    if ts > 1e17:
+        ts /= 1e9
+    elif ts > 1e11:
+        ts /= 1e3
+    return ts
+
+
+def parse_lines(text, now=None):
+    """Protocolo de líneas. Devuelve (lecturas, número de líneas inválidas)."""
+    now = time.time() if now is None else now
+    readings, bad = [], 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        try:
+            parts = line.split(" ")
+            if len(parts) not in (2, 3):
+                raise ValueError(line)
+            tags = dict(t.split("=", 1) for t in parts[0].split(",")[1:])
+            pid = tags.get("patient") or tags.get("id")
+            if not pid:
+                raise ValueError("sin paciente")
+            fields = {}
+            for pair in parts[1].split(","):
+                key, value = pair.split("=", 1)
+                fields[_field(key)] = _value(value.rstrip("i"))
+            readings.append((pid, _timestamp(parts[2] if len(parts) == 3 else None, now), fields))
+        except ValueError:
+            bad += 1
+    return readings, bad
+
+
+def parse_json(payload, now=None):
+    """`{"readings": [...]}` o una lista de `{"patient": ID, "ts": ..., campos...}`."""
+    now = time.time() if now is None else now
+    items = payload.get("readings", []) if isinstance(payload, dict) else payload
+    if not isinstance(items, list):
+        raise ValueError("se esperaba una lista de lecturas")
+    readings, bad = [], 0
+    for item in items:
+        try:
+            pid = item.get("patient") or item.get("id")
+            if not pid:
+                raise ValueError("sin paciente")
+            fields = {_field(k): _value(v) for k, v in item.items() if k not in ("patient", "id", "ts")}
+            readings.append((str(pid), _timestamp(item.get("ts"), now), fields))
+        except (AttributeError, TypeError, ValueError):
+            bad += 1
+    return readings, bad
+
+
+def _is_loopback(host):
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+class TelemetryServer:
+    """Servidor HTTP (y opcionalmente TCP de líneas) que vuelca las lecturas en `buffers`."""
+
+    def __init__(self, buffers, host="127.0.0.1", port=8765, tcp_port=None, path="/telemetry", token=None):
+        if not token and not _is_loopback(host):
+            raise ValueError(f"La telemetría en {host} necesita TELEMETRY_TOKEN (o escuchar en 127.0.0.1).")
+        self.buffers = buffers
+        self.path = path
+        self.token = token
+        self._httpd = ThreadingHTTPServer((host, port), self._make_handler())
+        self._tcp = None
+        if tcp_port is not None:
+            self._tcp = socketserver.ThreadingTCPServer((host, tcp_port), self._make_line_handler())
+            self._tcp.daemon_threads = True
+        self._threads = []
+
+    @property
+    def port(self):
+        return self._httpd.server_address[1]
+
+    @property
+    def tcp_port(self):
+        return self._tcp.server_address[1] if self._tcp else None
+
+    def _authorized(self, token):
+        return not self.token or hmac.compare_digest(str(token or ""), self.token)
+
+    def _accept(self, readings, bad):
+        if bad:
+            self.buffers.reject(bad)
+        return self.buffers.ingest(readings) if readings else 0
+
+    def _make_handler(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code, body=None):
+                data = json.dumps(body).encode() if body is not None else b""
+                self.send_response(code)
+                if data:
+                    self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_POST(self):
+                if self.path != server.path:
+                    return self._reply(404)
+                if not server._authorized(self.headers.get("X-Telemetry-Token")):
+                    return self._reply(403)
+                try:
+                    length = int(self.headers.get("Content-Length", 0))
+                    body = self.rfile.read(length)
+                    if self.headers.get("Content-Type", "").startswith("text/plain"):
+                        readings, bad = parse_lines(body.decode("utf-8"))
+                    else:
+                        readings, bad = parse_json(json.loads(body or b"[]"))
+                except (ValueError, UnicodeDecodeError):
+                    return self._reply(400, {"error": "cuerpo inválido"})
+                accepted = server._accept(readings, bad)
+                self._reply(200, {"accepted": accepted, "rejected": bad})
+
+            def do_GET(self):
+                if self.path == server.path + "/stats":
+                    return self._reply(200, server.buffers.stats())
+                self._reply(404)
+
+            def log_message(self, format, *args):
+                # Silenciar el log por petición de http.server
+                pass
+
+        return Handler
+
+    def _make_line_handler(self):
+        server = self
+
+        class LineHandler(socketserver.StreamRequestHandler):
+            def handle(self):
+                pending = b""
+                authorized = not server.token
+                while True:
+                    chunk = self.request.recv(65536)
+                    if not chunk:
+                        break
+                    pending += chunk
+                    if not authorized:
+                        # Con token, la primera línea debe ser `token=<valor>`
+                        if b"\n" not in pending:
+                            if len(pending) > AUTH_LINE_MAX:
+                                break
+                            continue
+                        first, _, pending = pending.partition(b"\n")
+                        key, _, value = first.decode("utf-8", "replace").strip().partition("=")
+                        if key != "token" or not server._authorized(value):
+                            server.buffers.reject(1)
+                            self.request.sendall(b"ERR token\n")
+                            return
+                        authorized = True
+                    # Se ingiere por bloques de líneas completas: un lock por recv, no por lectura
+                    complete, _, pending = pending.rpartition(b"\n")
+                    if complete:
+                        server._accept(*parse_lines(complete.decode("utf-8", "replace")))
+                if authorized and pending.strip():
+                    server._accept(*parse_lines(pending.decode("utf-8", "replace")))
+
+        return LineHandler
+
+    def start(self):
+        servers = [("telemetry-http", self._httpd)] + ([("telemetry-tcp", self._tcp)] if self._tcp else [])
+        for name, srv in servers:
+            thread = threading.Thread(target=srv.serve_forever, name=name, daemon=True)
+            thread.start()
+            self._threads.append(thread)
+        return self
+
+    def stop(self):
+        for srv in (self._httpd, self._tcp):
+            if srv is not None:
+                srv.shutdown()
+                srv.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Servicio local de ingesta de telemetría (HTTP + protocolo de líneas).")
+    parser.add_argument("--host", default=os.getenv("TELEMETRY_HOST", "127.0.0.1"),
+                        help="Interfaz de escucha (fuera de loopback exige TELEMETRY_TOKEN).")
+    parser.add_argument("--port", type=int, default=int(os.getenv("TELEMETRY_PORT", "8765")), help="Puerto HTTP.")
+    parser.add_argument("--tcp-port", type=int, default=int(os.getenv("TELEMETRY_TCP_PORT", "8766")), help="Puerto TCP de líneas.")
+    parser.add_argument("--interval", type=float, default=10, help="Segundos entre resúmenes por pantalla.")
+    args = parser.parse_args(argv)
+
+    buffers = TelemetryBuffers()
+    try:
+        server = TelemetryServer(buffers, host=args.host, port=args.port, tcp_port=args.tcp_port,
+                                 token=os.getenv("TELEMETRY_TOKEN")).start()
+    except ValueError as e:
+        print(json.dumps({"status": "error", "message": str(e)}))
+        sys.exit(1)
+    print(f"📡 Telemetría en http://{args.host}:{server.port}{server.path} y tcp://{args.host}:{server.tcp_port}", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(args.interval)
+            print(json.dumps({"status": "success", "stats": buffers.stats()}), flush=True)
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Generador de carga para `telemetry_ingest.py`.
+
+Simula N monitores de cabecera que envían lecturas por lotes, por HTTP (JSON
+o protocolo de líneas) o por TCP, y mide cuántas lecturas por segundo acepta
+el servicio.
+
+Uso:
+    python execution/telemetry_loadgen.py --patients 2000 --duration 10 --mode tcp
+"""
+import argparse
+import json
+import os
+import random
+import socket
+import sys
+import threading
+import time
+
+import requests
+
+
+def make_lines(pids, rnd, now):
+    return "".join(
+        f"vitals,patient={pid} heart_rate={rnd.randint(55, 125)},spo2={rnd.randint(89, 100)},"
+        f"temperature={rnd.uniform(36.0, 39.0):.1f},systolic={rnd.randint(100, 150)},diastolic={rnd.randint(60, 95)} {now:.3f}\n"
+        for pid in pids
+    )
+
+
+def make_json(pids, rnd, now):
+    return {"readings": [
+        {"patient": pid, "ts": now, "hr": rnd.randint(55, 125), "spo2": rnd.randint(89, 100),
+         "temp": round(rnd.uniform(36.0, 39.0), 1)}
+        for pid in pids
+    ]}
+
+
+def worker(args, pids, deadline, counts, index):
+    rnd = random.Random(index)
+    sent = errors = 0
+    session = requests.Session()
+    sock = None
+    if args.mode == "tcp":
+        sock = socket.create_connection((args.host, args.tcp_port))
+    url = f"http://{args.host}:{args.port}/telemetry"
+    headers = {"X-Telemetry-Token": os.getenv("TELEMETRY_TOKEN", "")}
+    try:
+        while time.time() < deadline:
+            batch = rnd.sample(pids, min(args.batch, len(pids)))
+            now = time.time()
+            try:
+                if args.mode == "tcp":
+                    sock.sendall(make_lines(batch, rnd, now).encode())
+                elif args.mode == "lines":
+                    resp = session.post(url, data=make_lines(batch, rnd, now).encode(),
+                                        headers=dict(headers, **{"Content-Type": "text/plain"}), timeout=10)
+                    resp.raise_for_status()
+                else:
+                    resp = session.post(url, json=make_json(batch, rnd, now), headers=headers, timeout=10)
+                    resp.raise_for_status()
+                sent += len(batch)
+            except (OSError, requests.RequestException):
+                errors += 1
+            if args.rate:
+                # Ritmo objetivo repartido entre los hilos
+                time.sleep(len(batch) * args.concurrency / args.rate)
+    finally:
+        if sock:
+            sock.close()
+        counts[index] = (sent, errors)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Genera carga de telemetría contra el servicio de ingesta.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=int(os.getenv("TELEMETRY_PORT", "8765")))
+    parser.add_argument("--tcp-port", type=int, default=int(os.getenv("TELEMETRY_TCP_PORT", "8766")))
+    parser.add_argument("--mode", choices=["json", "lines", "tcp"], default="json")
+    parser.add_argument("--patients", type=int, default=1000)
+    parser.add_argument("--batch", type=int, default=200, help="Lecturas por envío.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Dispositivos/hilos enviando en paralelo.")
+    parser.add_argument("--rate", type=float, default=0, help="Lecturas/s objetivo (0 = lo más rápido posible).")
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args(argv)
+
+    pids = [f"BED-{i:05d}" for i in range(args.patients)]
+    counts = [(0, 0)] * args.concurrency
+    deadline = time.time() + args.duration
+    start = time.time()
+    threads = [threading.Thread(target=worker, args=(args, pids, deadline, counts, i)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.time() - start
+
+    sent = sum(c[0] for c in counts)
+    errors = sum(c[1] for c in counts)
+    result = {"status": "success", "mode": args.mode, "sent": sent, "errors": errors,
+              "seconds": round(elapsed, 2), "readings_per_second": round(sent / elapsed, 1)}
+    try:
+        result["server"] = requests.get(f"http://{args.host}:{args.port}/telemetry/stats", timeout=5).json()
+    except (requests.RequestException, ValueError):
+        pass
+    print(json.dumps(result))
+    return 0 if not errors else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,103 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from alert_engine import AlertEngine  # noqa: E402
+
+
+def columns(hr=(75,), temp=None, spo2=None):
+    n = len(hr)
+    return {"heart_rate": np.array(hr, dtype=float),
+            "temperature": np.array(temp or [36.5] * n, dtype=float),
+            "spo2": np.array(spo2 or [98] * n, dtype=float)}
+
+
+class TestAlertEngine(unittest.TestCase):
+
+    def setUp(self):
+        self.sent = {"medico": ["111", "222"], "admin": ["999"]}
+        self.engine = AlertEngine(lambda role: self.sent[role], dedup_window=300, digest_interval=60,
+                                  tiers=((0, "medico"), (300, "admin")))
+
+    def test_hysteresis_keeps_alert_open_between_thresholds(self):
+        opened, _ = self.engine.observe(["A"], columns(hr=[115]), now=0)
+        self.assertEqual([a.rule.name for a in opened], ["taquicardia"])
+        # 108 está por debajo de la entrada pero por encima de la salida: sigue abierta
+        opened, resolved = self.engine.observe(["A"], columns(hr=[108]), now=5)
+        self.assertEqual((opened, resolved), ([], []))
+        opened, _ = self.engine.observe(["A"], columns(hr=[112]), now=10)
+        self.assertEqual(opened, [])
+        _, resolved = self.engine.observe(["A"], columns(hr=[104]), now=15)
+        self.assertEqual(len(resolved), 1)
+        self.assertEqual(self.engine.stats()["active"], 0)
+
+    def test_digest_groups_patients_per_doctor(self):
+        self.engine.observe(["A", "B", "C"], columns(hr=[120, 75, 75], temp=[39.0, 36.5, 39.1]),
+                            names=lambda row: "ABC"[row], now=0)
+        digests = self.engine.take_digests(now=100)
+        self.assertEqual([chat for chat, _ in digests], ["111", "222"])
+        text = digests[0][1]
+        self.assertIn("(2 paciente(s))", text)
+        self.assertIn("Taquicardia", text)
+        self.assertNotIn("`B`", text)
+        # Nada nuevo: no se repite
+        self.assertEqual(self.engine.take_digests(now=200), [])
+
+    def test_reopen_within_dedup_window_is_not_notified(self):
+        self.engine.observe(["A"], columns(hr=[120]), now=0)
+        self.engine.take_digests(now=100)
+        self.engine.observe(["A"], columns(hr=[90]), now=110)
+        self.engine.take_digests(now=200)
+        opened, _ = self.engine.observe(["A"], columns(hr=[120]), now=210)
+        self.assertEqual(len(opened), 1)
+        self.assertEqual(self.engine.take_digests(now=400), [])
+        self.assertEqual(self.engine.stats()["deduped"], 1)
+
+    def test_critical_alert_skips_digest_interval(self):
+        self.engine.take_digests(now=100)
+        self.engine.observe(["A"], columns(spo2=[82]), now=110)
+        digests = self.engine.take_digests(now=111)
+        self.assertEqual(len(digests), 2)
+        self.assertIn("Hipoxia crítica", digests[0][1])
+
+    def test_unacknowledged_alerts_escalate_to_admin(self):
+        self.engine.observe(["A", "B"], columns(hr=[120, 125]), now=0)
+        self.engine.take_digests(now=60)
+        self.assertEqual(self.engine.ack("A", by="111"), 1)
+        digests = self.engine.take_digests(now=400)
+        self.assertEqual([chat for chat, _ in digests], ["999"])
+        self.assertIn("SIN CONFIRMAR", digests[0][1])
+        self.assertIn("`B`", digests[0][1])
+        self.assertNotIn("`A`", digests[0][1])
+        # Ya escalada: no se repite
+        self.assertEqual(self.engine.take_digests(now=500), [])
+
+
+    def test_news2_rules_use_derived_columns(self):
+        cols = columns(hr=[95, 95])
+        cols["news2"] = np.array([5, 7])
+        opened, _ = self.engine.observe(["A", "B"], cols, now=0)
+        self.assertEqual(sorted((a.pid, a.rule.name) for a in opened),
+                         [("A", "news2_medio"), ("B", "news2_alto"), ("B", "news2_medio")])
+        # news2_alto es crítica: sale al momento y solo se muestra la regla más grave del signo
+        text = self.engine.take_digests(now=1)[0][1]
+        self.assertIn("NEWS2: 7 (riesgo alto)", text)
+        self.assertNotIn("NEWS2: 7 (riesgo medio)", text)
+
+    def test_silent_sensor_opens_alert_until_data_returns(self):
+        cols = columns(hr=[80, 80])
+        cols["sensor_silence"] = np.array([0.0, 90.0])
+        opened, _ = self.engine.observe(["SIM-001", "BED-1"], cols, now=0)
+        self.assertEqual([(a.pid, a.rule.name) for a in opened], [("BED-1", "monitor_sin_datos")])
+        cols["sensor_silence"] = np.array([0.0, 1.0])
+        _, resolved = self.engine.observe(["SIM-001", "BED-1"], cols, now=5)
+        self.assertEqual([a.rule.name for a in resolved], ["monitor_sin_datos"])
+
+
+if __name__ == '__main__':
+    unittest.main()
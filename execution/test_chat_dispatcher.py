@@ -0,0 +1,121 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_dispatcher import (  # noqa: E402
+    ChatDispatcher, DeliveryLatency, PriorityScheduler, PRIORITY_ALERT, PRIORITY_CHAT, PRIORITY_COMMAND, classify_message
+)
+
+
+class TestChatDispatcher(unittest.TestCase):
+
+    def test_per_chat_order_and_cross_chat_concurrency(self):
+        processed = []
+        running = set()
+        overlap = threading.Event()
+        lock = threading.Lock()
+
+        def handler(msg):
+            chat = msg.split("|", 1)[0]
+            with lock:
+                running.add(chat)
+                if len(running) > 1:
+                    overlap.set()
+            time.sleep(0.05)
+            with lock:
+                running.discard(chat)
+                processed.append(msg)
+
+        async def scenario():
+            executor = ThreadPoolExecutor(max_workers=4)
+            dispatcher = ChatDispatcher(handler, max_concurrency=4, executor=executor)
+            for i in range(3):
+                dispatcher.submit(f"A|{i}")
+                dispatcher.submit(f"B|{i}")
+            await dispatcher.drain(timeout=5)
+            executor.shutdown()
+            return dispatcher.stats()
+
+        stats = asyncio.run(scenario())
+        self.assertEqual([m for m in processed if m.startswith("A")], ["A|0", "A|1", "A|2"])
+        self.assertEqual([m for m in processed if m.startswith("B")], ["B|0", "B|1", "B|2"])
+        self.assertTrue(overlap.is_set())
+        self.assertEqual(stats["processed"], 6)
+        self.assertEqual(stats["active_chats"], 0)
+
+    def test_global_concurrency_cap(self):
+        peak = [0]
+        current = [0]
+        lock = threading.Lock()
+
+        def handler(msg):
+            with lock:
+                current[0] += 1
+                peak[0] = max(peak[0], current[0])
+            time.sleep(0.03)
+            with lock:
+                current[0] -= 1
+
+        async def scenario():
+            executor = ThreadPoolExecutor(max_workers=8)
+            dispatcher = ChatDispatcher(handler, max_concurrency=2, executor=executor)
+            for i in range(6):
+                dispatcher.submit(f"{i}|hola")
+            await dispatcher.drain(timeout=5)
+            executor.shutdown()
+
+        asyncio.run(scenario())
+        self.assertLessEqual(peak[0], 2)
+
+
+class TestPriorityScheduler(unittest.TestCase):
+
+    def test_alert_uses_reserved_worker_while_chat_is_busy(self):
+        order = []
+
+        def slow_chat(name):
+            time.sleep(0.3)
+            order.append(name)
+
+        def alert(name):
+            order.append(name)
+
+        async def scenario():
+            executor = ThreadPoolExecutor(max_workers=2)
+            scheduler = PriorityScheduler(workers=1, reserved=1, executor=executor).start()
+            first = scheduler.submit(PRIORITY_CHAT, slow_chat, "chat-1")
+            second = scheduler.submit(PRIORITY_CHAT, slow_chat, "chat-2")
+            await asyncio.sleep(0.05)
+            urgent = scheduler.submit(PRIORITY_ALERT, alert, "alerta")
+            await asyncio.gather(first, second, urgent)
+            stats = scheduler.stats()
+            await scheduler.stop()
+            executor.shutdown()
+            return stats
+
+        stats = asyncio.run(scenario())
+        self.assertEqual(order[0], "alerta")
+        self.assertLess(stats["alert_dispatch_max_s"], 0.2)
+
+    def test_delivery_latency_counts_slo_violations(self):
+        latency = DeliveryLatency(slo_seconds=1)
+        latency.record(PRIORITY_ALERT, 0.4)
+        latency.record(PRIORITY_ALERT, 2.5)
+        latency.record(PRIORITY_CHAT, 30)        # el SLO solo vale para alertas
+        stats = latency.stats()
+        self.assertEqual((stats["alert_slo_violations"], stats["alert_latency_max_s"]), (1, 2.5))
+
+    def test_classify_message(self):
+        self.assertEqual(classify_message("1|/cita 25/10 10:00 control"), PRIORITY_COMMAND)
+        self.assertEqual(classify_message("1|hola doctor"), PRIORITY_CHAT)
+
+
+if __name__ == '__main__':
+    unittest.main()
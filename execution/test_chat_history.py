@@ -0,0 +1,58 @@
+import json
+import os
+import sys
+import tempfile
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import chat_history  # noqa: E402
+from chat_history import ChatHistory  # noqa: E402
+
+
+def msg(role, content):
+    return {"role": role, "content": content}
+
+
+class TestChatHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = os.path.join(self.tmp.name, "history")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_chats_are_isolated_and_clear_is_scoped(self):
+        history = ChatHistory(self.root, limit=4, legacy_file=None)
+        history.append("111", msg("user", "me duele la cabeza"), msg("assistant", "¿desde cuándo?"))
+        history.append("222", msg("user", "hola"))
+        self.assertEqual([m["content"] for m in history.get("222")], ["hola"])
+        history.clear("111")
+        self.assertEqual(history.get("111"), [])
+        self.assertEqual(len(history.get("222")), 1)
+
+    def test_window_lru_reload_and_compaction(self):
+        history = ChatHistory(self.root, limit=3, capacity=1, legacy_file=None)
+        for i in range(chat_history.COMPACT_LINES + 5):
+            history.append("111", msg("user", str(i)))
+        history.append("222", msg("user", "otro"))   # expulsa a 111 del LRU
+        self.assertEqual(history.stats()["cached_chats"], 1)
+        # Se recarga desde disco con la misma ventana
+        self.assertEqual([m["content"] for m in history.get("111")], ["202", "203", "204"])
+        with open(os.path.join(self.root, "111.jsonl"), encoding="utf-8") as f:
+            self.assertLess(len(f.readlines()), 10)
+
+    def test_legacy_global_history_goes_to_local_chat(self):
+        legacy = os.path.join(self.tmp.name, "chat_history.json")
+        with open(legacy, "w", encoding="utf-8") as f:
+            json.dump([msg("user", "viejo"), msg("assistant", "respuesta")], f)
+        history = ChatHistory(self.root, legacy_file=legacy)
+        self.assertEqual(len(history.get(chat_history.DEFAULT_CHAT)), 2)
+        self.assertFalse(os.path.exists(legacy))
+        self.assertEqual(history.get("111"), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
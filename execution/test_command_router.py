@@ -0,0 +1,110 @@
+import os
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from command_router import CommandRouter, MessageContext, requires_role  # noqa: E402
+
+
+class FakeBot:
+    """Sustituto mínimo del módulo del listener."""
+
+    def __init__(self, role="paciente"):
+        self.role = role
+
+    def get_role(self, chat_id):
+        return self.role
+
+
+class TestManifestRouting(unittest.TestCase):
+
+    def setUp(self):
+        self.router = CommandRouter.from_manifest()
+
+    def test_longest_prefix_and_aliases(self):
+        self.assertEqual(self.router.match("/reset_patient SIM-001").func, "paciente_reset")
+        self.assertEqual(self.router.match("/reset").func, "reiniciar")
+        self.assertEqual(self.router.match("/resumir_archivo informe.pdf").func, "resumir_archivo")
+        self.assertEqual(self.router.match("/resumir https://example.com").func, "resumir")
+        self.assertEqual(self.router.match("/appointment 25/10 10:00 control").name, "/cita")
+        self.assertEqual(self.router.match("  Hola! ").func, "saludo")
+        self.assertIsNone(self.router.match("¿qué es la hipertensión?"))
+
+    def test_role_guard_on_clinical_handlers(self):
+        ctx = MessageContext(FakeBot("paciente"), "1", "/pacientes")
+        self.assertEqual(self.router.dispatch(ctx), "⛔ Acceso denegado.")
+        self.assertEqual(self.router.stats()["/pacientes"]["calls"], 1)
+
+
+class TestRouterMechanics(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.pkg = f"fake_handlers_{id(self)}"
+        os.makedirs(os.path.join(self.tmp.name, self.pkg))
+        open(os.path.join(self.tmp.name, self.pkg, "__init__.py"), "w").close()
+        self.write("cmds", 'def eco(ctx):\n    return "v1:" + ctx.text\n')
+        sys.path.insert(0, self.tmp.name)
+
+    def tearDown(self):
+        sys.path.remove(self.tmp.name)
+        for name in [m for m in sys.modules if m.startswith(self.pkg)]:
+            del sys.modules[name]
+        self.tmp.cleanup()
+
+    def write(self, module, code):
+        path = os.path.join(self.tmp.name, self.pkg, f"{module}.py")
+        with open(path, "w") as f:
+            f.write(textwrap.dedent(code))
+        # Forzar un mtime distinto aunque la escritura caiga en el mismo segundo
+        stamp = time.time() + len(code)
+        os.utime(path, (stamp, stamp))
+
+    def test_lazy_load_and_hot_reload(self):
+        router = CommandRouter(self.pkg, hot_reload=True)
+        router.add(("/eco", "/echo"), "cmds", "eco")
+        self.assertNotIn(f"{self.pkg}.cmds", sys.modules)
+        self.assertEqual(router.dispatch(MessageContext(FakeBot(), "1", "/echo hola")), "v1:/echo hola")
+        self.write("cmds", 'def eco(ctx):\n    return "version 2:" + ctx.text\n')
+        self.assertEqual(router.dispatch(MessageContext(FakeBot(), "1", "/eco")), "version 2:/eco")
+        self.assertEqual(router.reloads, 1)
+        self.assertEqual(router.stats()["/eco"]["calls"], 2)
+
+    def test_redispatch_and_fallback(self):
+        router = CommandRouter(self.pkg)
+        self.write("cmds", '''
+            from command_router import REDISPATCH
+
+            def voz(ctx):
+                ctx.text = "/eco transcrito"
+                return REDISPATCH
+
+            def eco(ctx):
+                return "eco:" + ctx.text
+
+            def chat(ctx):
+                return "chat:" + ctx.text
+        ''')
+        router.add(("__VOICE__:",), "cmds", "voz")
+        router.add(("/eco",), "cmds", "eco")
+        router.set_fallback("cmds", "chat")
+        self.assertEqual(router.dispatch(MessageContext(FakeBot(), "1", "__VOICE__:abc")), "eco:/eco transcrito")
+        self.assertEqual(router.dispatch(MessageContext(FakeBot(), "1", "buenas")), "chat:buenas")
+
+    def test_requires_role(self):
+        @requires_role("medico", denied="no")
+        def handler(ctx):
+            return "si"
+
+        self.assertEqual(handler(MessageContext(FakeBot("medico"), "1", "")), "si")
+        self.assertEqual(handler(MessageContext(FakeBot("paciente"), "1", "")), "no")
+        self.assertEqual(handler.required_roles, ("medico",))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,96 @@
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from chat_history import ChatHistory  # noqa: E402
+from context_builder import (RollingSummarizer, build_context, count_tokens,  # noqa: E402
+                             extractive_summary)
+
+
+def msg(role, content):
+    return {"role": role, "content": content}
+
+
+class TestContextBuilder(unittest.TestCase):
+
+    def test_fills_budget_from_newest_and_clamps_huge_messages(self):
+        history = [msg("user", "hola"), msg("assistant", "x" * 30000),   # análisis de un PDF
+                   msg("user", "¿y la dosis?"), msg("assistant", "500 mg cada 8 h")]
+        messages, tokens = build_context(history, msg("user", "gracias"), budget=1000)
+        self.assertLessEqual(tokens, 1000)
+        self.assertEqual(messages[-1]["content"], "gracias")
+        self.assertEqual(messages[-2]["content"], "500 mg cada 8 h")
+        # El mensaje enorme entra recortado y empieza por el usuario
+        self.assertTrue(any(m["content"].endswith("[…recortado…]") for m in messages))
+        self.assertEqual(messages[0]["role"], "user")
+
+        # Con un presupuesto mínimo solo queda el prompt (recortado si hace falta)
+        messages, _ = build_context(history, msg("user", "y" * 3000), budget=100)
+        self.assertEqual(len(messages), 1)
+        self.assertLess(count_tokens(messages[0]["content"]), 100)
+
+    def test_summary_goes_first(self):
+        messages, _ = build_context([msg("assistant", "suelto")], msg("user", "hola"), 500, summary="- dolor lumbar")
+        self.assertIn("dolor lumbar", messages[0]["content"])
+        self.assertEqual([m["role"] for m in messages], ["user", "assistant", "user"])
+
+    def test_evicted_messages_are_summarized_in_background(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            history = ChatHistory(tmp, limit=2, legacy_file=None)
+            calls = []
+
+            def summarize(previous, messages):
+                calls.append((previous, [m["content"] for m in messages]))
+                if len(calls) > 1:
+                    raise RuntimeError("sin proveedor")
+                return "resumen 1"
+
+            summarizer = RollingSummarizer(history, summarize, batch=2)
+            history.on_evict = summarizer.on_evict
+            for i in range(6):
+                history.append("111", msg("user" if i % 2 == 0 else "assistant", f"m{i}"))
+            self.assertTrue(summarizer.wait(5))
+            self.assertEqual(calls[0], (None, ["m0", "m1"]))
+            # Si el LLM falla se cae al resumen extractivo, sin perder el anterior
+            summary = history.get_summary("111")
+            self.assertIn("resumen 1", summary)
+            self.assertIn("m3", summary)
+            self.assertEqual(ChatHistory(tmp, legacy_file=None).get_summary("111"), summary)
+            history.clear("111")
+            self.assertIsNone(history.get_summary("111"))
+
+    def test_clear_during_summary_discards_it(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            history = ChatHistory(tmp, limit=2, legacy_file=None)
+            started, release = threading.Event(), threading.Event()
+
+            def summarize(previous, messages):
+                started.set()
+                release.wait(5)
+                return "resumen viejo"
+
+            summarizer = RollingSummarizer(history, summarize, batch=2)
+            history.on_evict = summarizer.on_evict
+            for i in range(4):
+                history.append("111", msg("user", f"m{i}"))
+            self.assertTrue(started.wait(5))
+            # /clear mientras el resumen está en curso
+            summarizer.discard("111")
+            history.clear("111")
+            release.set()
+            self.assertTrue(summarizer.wait(5))
+            self.assertIsNone(history.get_summary("111"))
+            self.assertFalse(os.path.exists(os.path.join(tmp, "111.summary.json")))
+
+    def test_extractive_summary_is_bounded(self):
+        text = extractive_summary("previo", [msg("user", "palabra " * 500)] * 50, max_tokens=100)
+        self.assertLessEqual(count_tokens(text), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
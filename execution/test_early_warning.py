@@ -0,0 +1,56 @@
+import os
+import sys
+import unittest
+
+import numpy as np
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from early_warning import EarlyWarning, news2_components, risk_level  # noqa: E402
+
+
+def columns(rows, ts):
+    """rows: [(hr, spo2, sistólica, temperatura)]"""
+    data = np.asarray(rows, dtype=float)
+    return {"heart_rate": data[:, 0], "spo2": data[:, 1], "systolic": data[:, 2], "temperature": data[:, 3],
+            "last_update": np.asarray(ts, dtype=float)}
+
+
+class TestEarlyWarning(unittest.TestCase):
+
+    def test_news2_bands_and_risk_levels(self):
+        cols = columns([(75, 98, 120, 36.5),     # normal
+                        (95, 95, 105, 38.2),     # 1+1+1+1 = 4
+                        (40, 97, 120, 36.5),     # un 3 aislado: bajo-medio
+                        (125, 93, 100, 38.6),    # 2+2+2+1 = 7
+                        (91, 92, 219, 39.1)],    # 1+2+0+2 = 5
+                       [0] * 5)
+        comps = news2_components(cols)
+        total = comps.sum(axis=1)
+        self.assertEqual(total.tolist(), [0, 4, 3, 7, 5])
+        self.assertEqual(risk_level(total, comps).tolist(), [0, 0, 1, 3, 2])
+
+    def test_incremental_update_and_trends(self):
+        ew = EarlyWarning(capacity=1, tau=600)
+        cols = columns([(80, 98, 120, 36.5), (80, 98, 120, 36.5)], [0, 0])
+        self.assertEqual(ew.update(cols).tolist(), [0, 1])
+        # Sin lectura nueva no se recalcula nada
+        self.assertEqual(ew.update(cols).tolist(), [])
+        # El paciente 0 sube 1 bpm por minuto durante 30 minutos
+        for minute in range(1, 31):
+            cols["heart_rate"][0] = 80 + minute
+            cols["last_update"][0] = minute * 60
+            self.assertEqual(ew.update(cols).tolist(), [0])
+        hr = ew.features(0)["trends"]["heart_rate"]
+        self.assertGreater(hr["slope_per_hour"], 50)
+        self.assertGreater(hr["std"], 1)
+        # HR > 90 desde el minuto 11: unos 19 minutos fuera de rango (con decaimiento)
+        self.assertTrue(400 < hr["seconds_out_of_range"] < 19 * 60)
+        self.assertEqual(ew.features(0)["score"], 1)
+        self.assertEqual(ew.features(1)["trends"]["heart_rate"]["slope_per_hour"], 0)
+        self.assertEqual(ew.columns()["news2"].tolist(), [1, 0])
+
+
+if __name__ == '__main__':
+    unittest.main()
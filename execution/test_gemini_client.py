@@ -0,0 +1,111 @@
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from gemini_client import GeminiClient  # noqa: E402
+
+
+class FakeSDK:
+    """Sustituto del SDK que cuenta configuraciones y modelos creados."""
+
+    def __init__(self):
+        self.configured = []
+        self.created = []
+
+    def configure(self, api_key):
+        self.configured.append(api_key)
+
+    def GenerativeModel(self, model_name, system_instruction=None):
+        self.created.append((model_name, system_instruction))
+        return object()
+
+    def get_model(self, name):
+        return {"name": name}
+
+
+class CachingSDK(FakeSDK):
+    """SDK simulado con caché de contexto (`caching.CachedContent`)."""
+
+    def __init__(self, fail=False):
+        super().__init__()
+        self.caches = []
+        sdk = self
+
+        class CachedContent:
+            @staticmethod
+            def create(model, system_instruction, ttl):
+                if fail:
+                    raise ValueError("model does not support caching")
+                sdk.caches.append((model, ttl.total_seconds()))
+                return {"name": f"cachedContents/{len(sdk.caches)}"}
+
+        class GenerativeModel:
+            def __new__(cls, model_name, system_instruction=None):
+                return FakeSDK.GenerativeModel(sdk, model_name, system_instruction)
+
+            @staticmethod
+            def from_cached_content(cached_content):
+                return ("cached", cached_content["name"])
+
+        self.caching = type("caching", (), {"CachedContent": CachedContent})
+        self.GenerativeModel = GenerativeModel
+
+
+class TestGeminiClient(unittest.TestCase):
+
+    def test_configures_once_and_reuses_models(self):
+        sdk = FakeSDK()
+        client = GeminiClient(capacity=2, sdk=sdk)
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "k1"}):
+            a = client.model("gemini-flash-latest", "persona")
+            self.assertIs(client.model("gemini-flash-latest", "persona"), a)
+            client.model("gemini-pro", "persona")
+            client.model("gemini-pro", "otra")          # expulsa el menos usado
+            self.assertIsNot(client.model("gemini-flash-latest", "persona"), a)
+            self.assertEqual(sdk.configured, ["k1"])
+        # Cambiar la key reconfigura y descarta los modelos creados con la anterior
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "k2"}):
+            client.model("gemini-pro", "otra")
+        self.assertEqual(sdk.configured, ["k1", "k2"])
+        self.assertEqual(client.stats()["model_hits"], 1)
+
+    def test_long_system_prompts_use_cached_content(self):
+        now = [0.0]
+        sdk = CachingSDK()
+        client = GeminiClient(sdk=sdk, prompt_cache=True, cache_min_tokens=100, cache_ttl=600, clock=lambda: now[0])
+        long_system = "plantilla clínica " * 200
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "k"}):
+            self.assertEqual(client.model("gemini-1.5-flash-001", long_system), ("cached", "cachedContents/1"))
+            self.assertEqual(client.model("gemini-1.5-flash-001", long_system), ("cached", "cachedContents/1"))
+            self.assertEqual(sdk.caches, [("models/gemini-1.5-flash-001", 600.0)])
+            client.model("gemini-1.5-flash-001", "breve")          # por debajo del mínimo: modelo normal
+            self.assertEqual(sdk.created, [("gemini-1.5-flash-001", "breve")])
+            now[0] = 600                                          # caducada: se vuelve a subir
+            self.assertEqual(client.model("gemini-1.5-flash-001", long_system), ("cached", "cachedContents/2"))
+
+        failing = CachingSDK(fail=True)
+        client = GeminiClient(sdk=failing, prompt_cache=True, cache_min_tokens=100)
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "k"}):
+            client.model("gemini-flash-latest", long_system)
+            client.model("gemini-flash-latest", long_system + "!")
+        self.assertEqual(len(failing.created), 2)
+        self.assertEqual(client.stats()["cache_failures"], 1)     # no se reintenta con ese modelo
+
+    def test_warm_up_and_missing_configuration(self):
+        client = GeminiClient(sdk=FakeSDK())
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": ""}):
+            with self.assertRaises(RuntimeError):
+                client.configure()
+            client.warm_up()        # sin key solo avisa
+        self.assertEqual(client.stats()["warmups"], 0)
+        with mock.patch.dict(os.environ, {"GOOGLE_API_KEY": "k"}):
+            client.warm_up()
+        self.assertEqual(client.stats()["warmups"], 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,101 @@
+import asyncio
+import os
+import sys
+import unittest
+from unittest import mock
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_clients import (AsyncLLM, PromptCacheStats, build_request, gemini_request, parse_response,  # noqa: E402
+                         stream_text, usage_from, STREAM_DELTAS)
+
+
+class SlowLLM(AsyncLLM):
+    """Cliente con una llamada HTTP simulada para probar el bucle compartido y los semáforos."""
+
+    async def _http_chat(self, provider, messages, system, on_partial, system_extra=None):
+        await asyncio.sleep(0.05)
+        return {"content": f"{provider}: {messages[-1]['content']}"}
+
+
+async def lines(*items):
+    for item in items:
+        yield item
+
+
+class TestLLMClients(unittest.TestCase):
+
+    def test_requests_and_responses(self):
+        with mock.patch.dict(os.environ, {"GROQ_API_KEY": "g", "ANTHROPIC_API_KEY": ""}):
+            url, headers, data = build_request("groq", [{"role": "user", "content": 5, "extra": 1}],
+                                               system="breve", stream=True)
+            self.assertIn("api.groq.com", url)
+            self.assertEqual(headers["Authorization"], "Bearer g")
+            self.assertEqual(data["messages"], [{"role": "system", "content": "breve"}, {"role": "user", "content": "5"}])
+            self.assertTrue(data["stream"])
+            with self.assertRaises(ValueError):
+                build_request("anthropic", [])
+        self.assertEqual(parse_response("anthropic", {"content": [{"text": "hola"}]}), "hola")
+        self.assertEqual(parse_response("openai", {"choices": [{"message": {"content": "hola"}}]}), "hola")
+
+        system, contents, models = gemini_request([{"role": "user", "content": "a"}, {"role": "assistant", "content": "b"},
+                                                   {"role": "user", "content": "c"}], "sistema")
+        self.assertEqual([c["role"] for c in contents], ["user", "model", "user"])
+        self.assertEqual((system, models[0]), ("sistema", "gemini-flash-latest"))
+        with self.assertRaises(ValueError):
+            gemini_request([{"role": "assistant", "content": "b"}])
+
+    def test_stable_system_prefix_and_cache_usage(self):
+        with mock.patch.dict(os.environ, {"ANTHROPIC_API_KEY": "a", "OPENAI_API_KEY": "o"}):
+            _, _, data = build_request("anthropic", [], system="plantilla", system_extra="fecha")
+            self.assertEqual(data["system"], [{"type": "text", "text": "plantilla", "cache_control": {"type": "ephemeral"}},
+                                              {"type": "text", "text": "fecha"}])
+            _, _, data = build_request("openai", [{"role": "user", "content": "x"}], system="plantilla",
+                                       system_extra="fecha", stream=True)
+            self.assertEqual([m["content"] for m in data["messages"]], ["plantilla", "fecha", "x"])
+            self.assertEqual(data["stream_options"], {"include_usage": True})
+        _, contents, _ = gemini_request([{"role": "user", "content": "x"}], "plantilla", system_extra="fecha")
+        self.assertEqual(contents[-1]["parts"], ["fecha", "x"])
+
+        self.assertEqual(usage_from("anthropic", {"type": "message_start", "message": {"usage": {
+            "input_tokens": 10, "cache_read_input_tokens": 900, "cache_creation_input_tokens": 0}}}), (910, 900, 0))
+        self.assertIsNone(usage_from("anthropic", {"type": "message_delta", "usage": {"output_tokens": 5}}))
+        self.assertEqual(usage_from("openai", {"usage": {"prompt_tokens": 1200, "prompt_tokens_details": {"cached_tokens": 1024}}}),
+                         (1200, 1024, 0))
+        self.assertEqual(usage_from("groq", {"x_groq": {"usage": {"prompt_tokens": 50}}}), (50, 0, 0))
+        self.assertIsNone(usage_from("openai", {"choices": [{"delta": {"content": "a"}}]}))
+        stats = PromptCacheStats()
+        stats.record("openai", (1200, 1024, 0))
+        stats.record("openai", (800, 0, 0))
+        self.assertEqual(stats.stats()["openai"]["hit_rate"], 0.512)
+
+    def test_async_stream_parsing(self):
+        seen = []
+        text = asyncio.run(stream_text(lines('data: {"choices": [{"delta": {"content": "Ho"}}]}', "",
+                                             'data: {"choices": [{"delta": {"content": "la"}}]}', "data: [DONE]",
+                                             'data: {"choices": [{"delta": {"content": "!"}}]}'),
+                                       STREAM_DELTAS["openai"], seen.append))
+        self.assertEqual((text, seen), ("Hola", ["Ho", "Hola"]))
+        with self.assertRaises(RuntimeError):
+            asyncio.run(stream_text(lines('data: {"type": "error", "error": {"message": "overloaded"}}'),
+                                    STREAM_DELTAS["anthropic"], seen.append))
+
+    def test_shared_loop_caps_concurrency_per_provider(self):
+        llm = SlowLLM(concurrency=2)
+        try:
+            async def many():
+                calls = [llm.achat("groq", [{"role": "user", "content": str(i)}]) for i in range(6)]
+                return await asyncio.gather(*calls)
+
+            results = asyncio.run(many())       # desde otro bucle de eventos
+            self.assertEqual(results[3], {"content": "groq: 3"})
+            self.assertEqual(llm.run("openai", [{"role": "user", "content": "x"}]), {"content": "openai: x"})
+            stats = llm.stats()
+            self.assertEqual((stats["requests"], stats["peak_in_flight"], stats["in_flight"]), (7, 2, 0))
+        finally:
+            llm.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
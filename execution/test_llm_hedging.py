@@ -0,0 +1,99 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_hedging import HedgedRunner, LatencyTracker  # noqa: E402
+
+
+def runner(**kwargs):
+    options = dict(hedge=True, budget=1.0, min_delay=0.05, max_delay=1.0, default_delay=0.05)
+    options.update(kwargs)
+    return HedgedRunner(**options)
+
+
+class TestHedgedRunner(unittest.TestCase):
+
+    def test_fallback_starts_right_after_a_failure(self):
+        calls = []
+
+        def attempt(provider, partial):
+            calls.append(provider)
+            return {"error": "caído"} if provider == "groq" else {"content": f"hola desde {provider}"}
+
+        r = runner(hedge=False)
+        self.assertEqual(r.run(["groq", "gemini"], attempt), ("gemini", {"content": "hola desde gemini"}))
+        self.assertEqual(calls, ["groq", "gemini"])
+        self.assertEqual(r.run(["groq"], attempt), ("groq", {"error": "caído"}))
+        self.assertEqual(r.stats()["fallbacks"], 1)
+
+    def test_slow_provider_is_hedged_and_loses(self):
+        release = threading.Event()
+
+        def attempt(provider, partial):
+            if provider == "groq":
+                release.wait(2)
+            return {"content": provider}
+
+        r = runner()
+        start = time.monotonic()
+        self.assertEqual(r.run(["groq", "gemini"], attempt), ("gemini", {"content": "gemini"}))
+        self.assertLess(time.monotonic() - start, 1.0)
+        release.set()
+        stats = r.stats()
+        self.assertEqual((stats["hedges"], stats["hedge_wins"]), (1, 1))
+
+    def test_streaming_winner_cancels_the_other_stream(self):
+        seen = []
+        late = threading.Event()
+
+        def attempt(provider, partial):
+            if provider == "groq":
+                time.sleep(0.3)
+            text = ""
+            try:
+                for piece in ("uno ", "dos"):
+                    text += f"{provider}:{piece}"
+                    partial(text)
+            except Exception:
+                late.set()
+                return {"error": "cortado"}
+            return {"content": text}
+
+        r = runner()
+        provider, result = r.run(["groq", "gemini"], attempt, on_partial=seen.append)
+        self.assertEqual(provider, "gemini")
+        self.assertTrue(late.wait(2))
+        self.assertTrue(all(text.startswith("gemini:") for text in seen))
+
+    def test_cost_guards(self):
+        def attempt(provider, partial):
+            time.sleep(0.2 if provider == "groq" else 0)
+            return {"content": provider}
+
+        # Sin presupuesto de réplicas, o con un prompt demasiado grande, se espera al primero
+        self.assertEqual(runner(budget=0.0).run(["groq", "gemini"], attempt)[0], "groq")
+        self.assertEqual(runner(max_tokens=100).run(["groq", "gemini"], attempt, tokens=500)[0], "groq")
+
+        # Sin hueco libre en el proveedor de respaldo tampoco se replica
+        r = runner(concurrency=1)
+        r._slot("gemini").acquire()
+        self.assertEqual(r.run(["groq", "gemini"], attempt)[0], "groq")
+        self.assertEqual(r.stats()["hedges_skipped"], 1)
+
+    def test_hedge_delay_follows_p95(self):
+        latencies = LatencyTracker(min_samples=5)
+        r = runner(latencies=latencies, min_delay=0.1, max_delay=5.0, default_delay=2.0)
+        self.assertEqual(r.hedge_delay("groq", False), 2.0)
+        for seconds in (0.5, 0.6, 0.7, 0.8, 3.0):
+            latencies.record(("groq", False), seconds)
+        self.assertAlmostEqual(r.hedge_delay("groq", False), 2.56, places=2)
+        self.assertEqual(r.hedge_delay("groq", True), 2.0)
+
+
+if __name__ == '__main__':
+    unittest.main()
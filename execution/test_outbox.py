@@ -0,0 +1,203 @@
+import os
+import sys
+import threading
+import time
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telegram_client import TelegramAPIError  # noqa: E402
+from outbox import MAX_MESSAGE_CHARS, Outbox, TokenBucket, split_message  # noqa: E402
+
+
+class FakeSender:
+    """Registra los envíos; puede fallar las primeras `fail` llamadas (con el código `status`)."""
+
+    def __init__(self, fail=0, delay=0.0, status=502):
+        self.calls = []
+        self.fail = fail
+        self.status = status
+        self.delay = delay
+        self._ids = iter(range(100, 10000))
+        self._lock = threading.Lock()
+
+    def __call__(self, item, progress_message_id=None):
+        time.sleep(self.delay)
+        with self._lock:
+            if self.fail > 0:
+                self.fail -= 1
+                raise TelegramAPIError("Bad Gateway", status_code=self.status)
+            action = "edit" if progress_message_id else "send"
+            self.calls.append((item.chat_id, action, item.text))
+            return progress_message_id or next(self._ids)
+
+
+class TestOutbox(unittest.TestCase):
+
+    def test_per_chat_order_is_preserved(self):
+        sender = FakeSender(delay=0.005)
+        outbox = Outbox(sender, workers=4, global_rate=1000, chat_rate=1000, chat_burst=1000).start()
+        for i in range(5):
+            outbox.send("A", f"a{i}")
+            outbox.send("B", f"b{i}")
+        self.assertTrue(outbox.flush(timeout=5))
+        outbox.stop()
+        self.assertEqual([t for c, _, t in sender.calls if c == "A"], [f"a{i}" for i in range(5)])
+        self.assertEqual([t for c, _, t in sender.calls if c == "B"], [f"b{i}" for i in range(5)])
+
+    def test_consecutive_progress_becomes_edit(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000).start()
+        outbox.progress("A", "👂 Escuchando...")
+        outbox.flush(timeout=5)
+        outbox.progress("A", "🧠 Analizando...")
+        outbox.send("A", "respuesta")
+        outbox.progress("A", "⏳ Otra vez...")
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual(sender.calls, [
+            ("A", "send", "👂 Escuchando..."),
+            ("A", "edit", "🧠 Analizando..."),
+            ("A", "send", "respuesta"),
+            ("A", "send", "⏳ Otra vez..."),
+        ])
+        self.assertEqual(outbox.stats()["edits"], 1)
+
+    def test_failed_sends_go_to_retry_list(self):
+        sender = FakeSender(fail=1)
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000).start()
+        outbox.send("A", "alerta")
+        outbox.flush(timeout=5)
+        self.assertEqual(outbox.stats()["failed"], 1)
+        self.assertEqual(outbox.retry_failed(), 1)
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual(sender.calls, [("A", "send", "alerta")])
+
+    def test_failed_sends_are_dropped_after_max_attempts(self):
+        sender = FakeSender(fail=10)
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000,
+                        max_attempts=2).start()
+        outbox.send("A", "alerta")
+        outbox.flush(timeout=5)
+        self.assertEqual(outbox.retry_failed(), 1)
+        outbox.flush(timeout=5)
+        self.assertEqual(outbox.retry_failed(), 0)
+        outbox.stop()
+        self.assertEqual((outbox.stats()["failed"], outbox.stats()["dropped"]), (0, 1))
+
+    def test_client_errors_are_not_retried_except_429(self):
+        for status, retried in ((400, 0), (403, 0), (429, 1)):
+            sender = FakeSender(fail=1, status=status)
+            outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000).start()
+            outbox.send("A", "hola")
+            outbox.flush(timeout=5)
+            self.assertEqual(outbox.retry_failed(), retried, status)
+            outbox.flush(timeout=5)
+            outbox.stop()
+            self.assertEqual(outbox.stats()["dropped"], 1 - retried)
+
+    def test_idle_chat_buckets_are_pruned(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=2, global_rate=1000, chat_rate=1, chat_burst=2).start()
+        for i in range(50):
+            outbox.send(f"chat-{i}", "hola")
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual(outbox.stats()["chat_buckets"], 50)
+        # Recién usados aún se están rellenando: olvidarlos dejaría pasar una ráfaga de más
+        self.assertEqual(outbox._prune_buckets(time.monotonic()), 0)
+        self.assertEqual(outbox._prune_buckets(time.monotonic() + 3), 50)
+        self.assertEqual(outbox.stats()["chat_buckets"], 0)
+
+    def test_chat_bucket_paces_a_single_chat(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=4, global_rate=1000, chat_rate=20, chat_burst=1).start()
+        start = time.monotonic()
+        for i in range(5):
+            outbox.send("A", str(i))
+        outbox.flush(timeout=5)
+        outbox.stop()
+        # 1 inmediato + 4 a 20/s => al menos ~0.2 s
+        self.assertGreaterEqual(time.monotonic() - start, 0.18)
+
+    def test_streaming_reply_edits_placeholder_and_records_ttft(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000).start()
+        reply = outbox.stream("A")
+        outbox.flush(timeout=5)
+        for text in ["Hola", "Hola, ¿qué", "Hola, ¿qué tal?"]:
+            reply.update(text)  # solo la primera pasa el intervalo mínimo
+            outbox.flush(timeout=5)
+        reply.finish("Hola, ¿qué tal?")
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual([a for _, a, _ in sender.calls], ["send", "edit", "edit"])
+        self.assertEqual(sender.calls[-1][2], "Hola, ¿qué tal?")
+        self.assertIsNotNone(reply.first_visible)
+        self.assertEqual(len(outbox.ttft), 1)
+
+    def test_streaming_before_placeholder_is_sent_records_ttft(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        reply = outbox.stream("A")
+        reply.update("Hola")        # se fusiona con el marcador, que aún está en cola
+        outbox.start()
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual(sender.calls, [("A", "send", "Hola ▌")])
+        self.assertIsNotNone(reply.first_visible)
+        self.assertEqual(len(outbox.ttft), 1)
+
+    def test_long_final_edits_first_chunk_and_sends_the_rest(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000).start()
+        reply = outbox.stream("A")
+        outbox.flush(timeout=5)
+        text = "\n".join(f"Línea {i}: " + "x" * 90 for i in range(120))   # ~12k caracteres
+        reply.finish(text)
+        outbox.send("A", "siguiente")
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual([a for _, a, _ in sender.calls], ["send", "edit", "send", "send", "send"])
+        chunks = [t for _, _, t in sender.calls[1:-1]]
+        self.assertTrue(all(len(c) <= MAX_MESSAGE_CHARS for c in chunks))
+        self.assertEqual("\n".join(chunks), text)          # se corta por líneas
+        self.assertEqual(sender.calls[-1][2], "siguiente")
+
+    def test_split_message(self):
+        self.assertEqual(split_message("hola"), ["hola"])
+        self.assertEqual(split_message("a" * 10, limit=4), ["aaaa", "aaaa", "aa"])
+        self.assertEqual(split_message("uno dos tres", limit=8), ["uno dos", "tres"])
+
+    def test_urgent_long_text_keeps_its_order(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        outbox.send("A", "normal")
+        outbox.send("A", "y" * (MAX_MESSAGE_CHARS + 10), urgent=True)
+        outbox.start()
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual([len(t) for _, _, t in sender.calls], [MAX_MESSAGE_CHARS, 10, 6])
+
+    def test_on_sent_fires_after_the_last_chunk(self):
+        sender = FakeSender()
+        outbox = Outbox(sender, workers=1, global_rate=1000, chat_rate=1000, chat_burst=1000)
+        sent_before = []
+        outbox.send("A", "z" * (MAX_MESSAGE_CHARS + 5), urgent=True,
+                    on_sent=lambda: sent_before.append(len(sender.calls)))
+        outbox.start()
+        outbox.flush(timeout=5)
+        outbox.stop()
+        self.assertEqual(sent_before, [2])
+
+    def test_token_bucket_reserve(self):
+        bucket = TokenBucket(rate=10, capacity=2)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertEqual(bucket.reserve(), 0.0)
+        self.assertGreater(bucket.reserve(), 0.05)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,105 @@
+import os
+import sys
+import tempfile
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from llm_hedging import HedgedRunner  # noqa: E402
+from provider_health import CLOSED, HALF_OPEN, OPEN, ProviderHealth  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestProviderHealth(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.tmp.name, "health.json")
+        self.clock = FakeClock()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_rate_limit_opens_circuit_and_reorders(self):
+        health = ProviderHealth(self.path, clock=self.clock)
+        health.record("groq", False, error="Groq API Error (429): Rate limit reached")
+        self.assertEqual(health.stats()["groq"]["state"], OPEN)
+        self.assertEqual(health.order(["groq", "gemini", "openai"]), ["gemini", "openai", "groq"])
+        self.assertFalse(health.allow("groq"))
+
+        # Pasada la espera, una sola petición de prueba; si sale bien el circuito se cierra
+        self.clock.now += 61
+        self.assertTrue(health.allow("groq"))
+        self.assertFalse(health.allow("groq"))
+        self.assertEqual(health.stats()["groq"]["state"], HALF_OPEN)
+        health.record("groq", True, latency=0.8)
+        self.assertEqual(health.stats()["groq"]["state"], CLOSED)
+        self.assertEqual(health.order(["groq", "gemini"]), ["groq", "gemini"])
+
+    def test_consecutive_failures_and_backoff(self):
+        health = ProviderHealth(None, clock=self.clock)
+        for _ in range(2):
+            health.record("gemini/gemini-pro", False, error="timeout")
+        self.assertEqual(health.stats()["gemini/gemini-pro"]["state"], CLOSED)
+        health.record("gemini/gemini-pro", False, error="timeout")
+        self.assertEqual(health.stats()["gemini/gemini-pro"]["state"], OPEN)
+        # Una prueba fallida en semiabierto reabre con el doble de espera
+        self.clock.now += 30
+        self.assertTrue(health.allow("gemini/gemini-pro"))
+        health.record("gemini/gemini-pro", False, error="timeout")
+        self.clock.now += 59
+        self.assertFalse(health.allow("gemini/gemini-pro"))
+        self.clock.now += 1
+        self.assertTrue(health.allow("gemini/gemini-pro"))
+
+    def test_state_is_shared_through_the_file(self):
+        health = ProviderHealth(self.path, clock=self.clock)
+        health.record("openai", True, latency=2.0)
+        health.record("groq", False, error="quota exceeded")
+        reloaded = ProviderHealth(self.path, clock=self.clock).stats()
+        self.assertEqual(reloaded["groq"]["state"], OPEN)
+        self.assertEqual(reloaded["openai"]["latency"], 2.0)
+
+    def test_processes_merge_instead_of_overwriting(self):
+        # Dos procesos que cargaron el archivo vacío y anotan cosas distintas
+        first = ProviderHealth(self.path, clock=self.clock)
+        second = ProviderHealth(self.path, clock=self.clock)
+        first.record("groq", False, error="429")
+        self.clock.now += 1
+        second.record("openai", True, latency=1.5)
+        second.record("groq", True, latency=0.5)      # más reciente: el circuito se cierra
+        reloaded = ProviderHealth(self.path, clock=self.clock).stats()
+        self.assertEqual(reloaded["openai"]["latency"], 1.5)
+        self.assertEqual((reloaded["groq"]["state"], reloaded["groq"]["samples"]), (CLOSED, 2))
+        # El que guardó primero también aprende lo de los demás en su siguiente guardado
+        self.clock.now += 10
+        first.record("gemini", True)
+        self.assertEqual(first.stats()["openai"]["latency"], 1.5)
+
+    def test_runner_skips_open_circuits(self):
+        health = ProviderHealth(None, clock=self.clock)
+        health.record("groq", False, error="429")
+        calls = []
+
+        def attempt(provider, partial):
+            calls.append(provider)
+            return {"error": "caído"} if provider == "gemini" else {"content": provider}
+
+        runner = HedgedRunner(hedge=False, health=health)
+        self.assertEqual(runner.run(["groq", "gemini", "openai"], attempt)[0], "openai")
+        self.assertEqual(calls, ["gemini", "openai"])
+        self.assertEqual(health.stats()["gemini"]["samples"], 1)
+        # Si solo queda el proveedor con el circuito abierto, se prueba igualmente
+        self.assertEqual(runner.run(["groq"], attempt)[0], "groq")
+
+
+if __name__ == '__main__':
+    unittest.main()
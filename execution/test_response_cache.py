@@ -0,0 +1,103 @@
+import os
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import response_cache  # noqa: E402
+from response_cache import ResponseCache, is_general_question, ngram_embedding, scope_key  # noqa: E402
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestResponseCache(unittest.TestCase):
+
+    def test_exact_hits_ttl_and_lru(self):
+        clock = FakeClock()
+        cache = ResponseCache(capacity=2, ttl=60, clock=clock)
+        scope = scope_key("persona", None)
+        cache.put("¿Qué es la hemoglobina?", scope, "gemini", "Una proteína")
+        # Normalización: tildes, signos y mayúsculas no cuentan; cualquier proveedor permitido vale
+        self.assertEqual(cache.get("que es la   HEMOGLOBINA", scope, ["groq", "gemini"]),
+                         ("Una proteína", "gemini", "exact"))
+        self.assertIsNone(cache.get("que es la hemoglobina", scope, ["groq"]))
+        self.assertIsNone(cache.get("que es la hemoglobina", scope_key("otra persona", None), ["gemini"]))
+
+        cache.put("b", scope, "groq", "B")
+        cache.get("que es la hemoglobina", scope, ["gemini"])
+        cache.put("c", scope, "groq", "C")          # expulsa "b", la menos usada
+        self.assertIsNone(cache.get("b", scope, ["groq"]))
+        clock.now += 61
+        self.assertIsNone(cache.get("c", scope, ["groq"]))
+        stats = cache.stats()
+        self.assertEqual((stats["exact_hits"], stats["evicted"], stats["expired"]), (2, 1, 1))
+        self.assertEqual(stats["hit_rate"], round(2 / 6, 3))
+
+    def test_semantic_hits_keep_numbers_apart(self):
+        cache = ResponseCache(embed=ngram_embedding, threshold=0.8)
+        cache.put("investigar: diabetes tipo 1", "s", "groq", "Resumen tipo 1")
+        self.assertEqual(cache.get("investigar: diabetis tipo 1", "s", ["groq"])[2], "semantic")
+        self.assertIsNone(cache.get("investigar: diabetes tipo 2", "s", ["groq"]))
+        self.assertIsNone(cache.get("investigar: hipertensión", "s", ["groq"]))
+        self.assertIsNone(cache.get("investigar: diabetis tipo 1", "otro", ["groq"]))
+
+    def test_semantic_never_matches_opposite_meanings(self):
+        cache = ResponseCache(embed=ngram_embedding, threshold=0.9)
+        for stored, asked in (("¿Qué es la hipoglucemia en pacientes diabéticos?", "¿Qué es la hiperglucemia en pacientes diabéticos?"),
+                              ("¿Qué causa la hipotensión?", "¿Qué causa la hipertensión?"),
+                              ("síntomas con fiebre", "síntomas sin fiebre")):
+            cache.put(stored, "s", "groq", "respuesta")
+            self.assertIsNone(cache.get(asked, "s", ["groq"]), asked)
+        # Sin un modelo de embeddings real no hay búsqueda semántica, y por defecto está apagada
+        self.assertFalse(response_cache.SEMANTIC)
+        with mock.patch.dict(sys.modules, {"chromadb": None, "chromadb.utils": None}):
+            self.assertIsNone(response_cache.default_embedding())
+
+    def test_general_questions(self):
+        self.assertTrue(is_general_question("¿Qué es la hemoglobina?"))
+        self.assertTrue(is_general_question("para qué sirve el omeprazol"))
+        self.assertFalse(is_general_question("¿Qué es eso?"))
+        self.assertFalse(is_general_question("¿y la dosis?"))
+        self.assertFalse(is_general_question("qué es mi diagnóstico"))
+
+
+class TestCachedCompletion(unittest.TestCase):
+
+    def test_cached_answers_ignore_the_chat_history(self):
+        import chat_with_llm
+        from chat_history import ChatHistory
+        from llm_hedging import HedgedRunner
+
+        sent = []
+
+        def fake_provider(provider, messages, system=None, image_path=None, on_partial=None, system_extra=None):
+            sent.append([m["content"] for m in messages])
+            return {"content": "Una proteína"}
+
+        with tempfile.TemporaryDirectory() as tmp:
+            history = ChatHistory(tmp, legacy_file=None)
+            history.append("A", {"role": "user", "content": "Soy Ana y tengo anemia"},
+                           {"role": "assistant", "content": "Entendido, Ana"})
+            history.set_summary("A", "- Ana, anemia ferropénica")
+            summarizer = mock.Mock()
+            with mock.patch.multiple(chat_with_llm, get_history=lambda: history, get_summarizer=lambda: summarizer,
+                                     get_memory_context=lambda query: None, available_providers=lambda forced=None: ["groq"],
+                                     get_cache=lambda: ResponseCache(), get_runner=lambda: HedgedRunner(),
+                                     call_provider=fake_provider):
+                chat_with_llm.complete(["--prompt", "¿Qué es la hemoglobina?", "--chat-id", "A", "--cache"])
+                chat_with_llm.complete(["--prompt", "¿Y a mí cómo me afecta?", "--chat-id", "A"])
+        self.assertEqual(sent[0], ["¿Qué es la hemoglobina?"])
+        self.assertIn("Soy Ana y tengo anemia", sent[1])
+
+
+if __name__ == '__main__':
+    unittest.main()
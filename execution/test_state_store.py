@@ -0,0 +1,124 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from state_store import StateStore  # noqa: E402
+
+
+class TestStateStore(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.db = os.path.join(self.tmp.name, "state.db")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def legacy(self, name, content):
+        path = os.path.join(self.tmp.name, name)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(content if isinstance(content, str) else json.dumps(content))
+        return path
+
+    def test_one_time_migration_from_legacy_files(self):
+        files = {
+            "users": self.legacy("users.txt", "111\n222\n\n"),
+            "roles": self.legacy("roles.json", {"111": "medico"}),
+            "config": self.legacy("config.json", {"voice_lang": "en-US"}),
+            "reminders": self.legacy("reminders.json", [{"chat_id": "111", "time": "08:00", "message": "pastilla", "last_sent": ""}]),
+            "appointments": self.legacy("appts.json", [{"chat_id": "222", "date": "25/10", "time": "10:00", "reason": "control"}]),
+            "patients": self.legacy("vitals.json", {"heart_rate": 80, "spo2": 97, "name": "Ana"}),
+        }
+        store = StateStore(self.db, legacy_files=files)
+        self.assertEqual(store.list_users(), ["111", "222"])
+        self.assertEqual(store.chats_with_role("medico"), ["111"])
+        self.assertEqual(store.get_role("222"), "paciente")
+        self.assertEqual(store.get_config("voice_lang"), "en-US")
+        self.assertEqual(store.get_patient("SIM-001")["heart_rate"], 80)
+        self.assertEqual(len(store.appointments_for("222")), 1)
+        # El índice de roles en memoria sigue a set_role
+        store.set_role("222", "medico")
+        store.set_role("111", "paciente")
+        self.assertEqual(store.chats_with_role("medico"), ["222"])
+
+        # Reabrir no vuelve a importar los archivos
+        self.assertEqual(StateStore(self.db, legacy_files=files).migrate_legacy(), {})
+        self.assertEqual(len(store.all_reminders()), 1)
+
+    def test_wal_mode_and_targeted_updates(self):
+        store = StateStore(self.db, legacy_files={})
+        mode = store._conn().execute("PRAGMA journal_mode").fetchone()[0]
+        self.assertEqual(mode, "wal")
+
+        rid = store.add_reminder("1", "08:00", "agua")
+        store.add_reminder("1", "09:00", "paseo")
+        store.add_reminder("2", "09:00", "otro chat")
+        store.mark_reminder_sent(rid, "2026-01-01")
+        self.assertEqual([r["last_sent"] for r in store.reminders_for("1")], ["2026-01-01", ""])
+        self.assertEqual(store.delete_reminders("1"), 2)
+        self.assertEqual(len(store.all_reminders()), 1)
+
+        aid = store.add_appointment("1", "25/10", "10:00", "control")
+        self.assertEqual(len(store.pending_appointments()), 1)
+        store.mark_appointment_notified(aid)
+        self.assertEqual(store.pending_appointments(), [])
+
+    def test_patient_upsert_touches_only_given_rows(self):
+        store = StateStore(self.db, legacy_files={})
+        store.upsert_patients({
+            "SIM-001": {"name": "Ana", "heart_rate": 75, "temperature": 36.5, "spo2": 98},
+            "SIM-002": {"name": "Luis", "heart_rate": 70, "temperature": 36.6, "spo2": 99, "bed": "3B"},
+        })
+        store.upsert_patient("SIM-001", {"name": "Ana", "heart_rate": 140, "temperature": 39.0, "spo2": 88})
+        patients = store.load_patients()
+        self.assertEqual(list(patients), ["SIM-001", "SIM-002"])
+        self.assertEqual(patients["SIM-001"]["heart_rate"], 140)
+        self.assertIsInstance(patients["SIM-001"]["heart_rate"], int)
+        self.assertEqual(patients["SIM-002"]["bed"], "3B")
+
+    def test_connections_are_per_thread(self):
+        store = StateStore(self.db, legacy_files={})
+
+        def worker(n):
+            for i in range(20):
+                store.add_user(f"{n}-{i}")
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(store.stats()["users"], 80)
+
+
+    def test_alert_history_migration_and_queries(self):
+        log = self.legacy("alerts.log", "[2026-01-01 10:00:00] [SIM-001] 💓 Taquicardia: 120 bpm\n"
+                                        "línea corrupta\n"
+                                        "[2026-01-02 11:00:00] [SIM-002] 🫁 Hipoxia: 90%\n")
+        store = StateStore(self.db, legacy_files={"alerts": log})
+        self.assertEqual(store.stats()["alerts"], 2)
+        self.assertEqual(StateStore(self.db, legacy_files={"alerts": log}).migrate_alerts_log(), 0)
+
+        now = 2_000_000_000
+        store.add_alerts([(now + i, "SIM-001", "fiebre", "media", 39.0, f"fiebre {i}") for i in range(20)])
+        store.resolve_alerts([("SIM-001", "fiebre", now + 30)])
+        tail = store.recent_alerts(3)
+        self.assertEqual([a["message"] for a in tail], ["fiebre 19", "fiebre 18", "fiebre 17"])
+        self.assertEqual(tail[0]["resolved_at"], now + 30)
+        self.assertEqual([a["patient_id"] for a in store.recent_alerts(10, patient_id="SIM-002")], ["SIM-002"])
+        self.assertEqual(len(store.recent_alerts(None, start=now + 15, end=now + 18)), 3)
+
+        counts = store.alert_counts(start=now - 86400)
+        self.assertEqual([(c["patient_id"], c["count"]) for c in counts], [("SIM-001", 20)])
+        self.assertEqual(store.prune_alerts(days=1, now=now), 2)
+        self.assertEqual(store.stats()["alerts"], 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,160 @@
+import json
+import os
+import sys
+import tempfile
+import threading
+import unittest
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+from urllib.parse import parse_qs, urlparse
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import telegram_tool  # noqa: E402
+from telegram_client import BotAPIClient  # noqa: E402
+from telegram_webhook import WebhookServer  # noqa: E402
+
+
+def make_update(update_id, chat_id, text):
+    return {"update_id": update_id, "message": {"chat": {"id": chat_id}, "text": text}}
+
+
+class FakeBotAPI(BaseHTTPRequestHandler):
+    """Bot API mínimo: getUpdates devuelve los updates con id >= offset."""
+    updates = []
+    requests_seen = []
+    # Respuestas 429 pendientes antes de aceptar un envío
+    throttle = 0
+
+    def reply(self, status, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        FakeBotAPI.requests_seen.append((urlparse(self.path).path, {}))
+        if FakeBotAPI.throttle > 0:
+            FakeBotAPI.throttle -= 1
+            self.reply(429, {"ok": False, "description": "Too Many Requests", "parameters": {"retry_after": 0}})
+            return
+        self.reply(200, {"ok": True, "result": {"message_id": 7}})
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        params = {k: v[0] for k, v in parse_qs(parsed.query).items()}
+        FakeBotAPI.requests_seen.append((parsed.path, params))
+        offset = int(params.get("offset", 0))
+        limit = int(params.get("limit", 100))
+        result = [u for u in FakeBotAPI.updates if u["update_id"] >= offset][:limit]
+        self.reply(200, {"ok": True, "result": result})
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestLongPolling(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.httpd = ThreadingHTTPServer(("127.0.0.1", 0), FakeBotAPI)
+        threading.Thread(target=cls.httpd.serve_forever, daemon=True).start()
+        cls.base = f"http://127.0.0.1:{cls.httpd.server_address[1]}"
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.httpd.shutdown()
+        cls.httpd.server_close()
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        FakeBotAPI.updates = [make_update(i, 100 + i, f"mensaje {i}") for i in range(1, 16)]
+        FakeBotAPI.requests_seen = []
+        self.patches = [
+            patch.object(telegram_tool, "API_BASE", self.base),
+            patch.object(telegram_tool, "TOKEN", "TEST"),
+            patch.object(telegram_tool, "ALLOWED_USERS", "*"),
+            patch.object(telegram_tool, "OFFSET_FILE", os.path.join(self.tmp.name, "offset.txt")),
+        ]
+        for p in self.patches:
+            p.start()
+
+    def tearDown(self):
+        for p in self.patches:
+            p.stop()
+        self.tmp.cleanup()
+
+    def test_long_poll_fetches_batch_and_advances_offset(self):
+        messages = telegram_tool.fetch_updates(timeout=50, limit=100)
+        self.assertEqual(len(messages), 15)
+        self.assertEqual(messages[0], "101|mensaje 1")
+        path, params = FakeBotAPI.requests_seen[0]
+        self.assertEqual(path, "/botTEST/getUpdates")
+        self.assertEqual(params["timeout"], "50")
+        # El offset guardado evita repetir mensajes
+        self.assertEqual(telegram_tool.fetch_updates(timeout=0, limit=100), [])
+
+    def test_client_retries_429_and_records_metrics(self):
+        FakeBotAPI.throttle = 2
+        client = BotAPIClient("TEST", self.base, backoff=0)
+        result = client.call("sendMessage", json={"chat_id": 1, "text": "hola"})
+        self.assertEqual(result["message_id"], 7)
+        self.assertEqual(len(FakeBotAPI.requests_seen), 3)
+        metrics = client.metrics()["sendMessage"]
+        self.assertEqual(metrics["calls"], 3)
+        self.assertEqual(metrics["retries"], 2)
+
+
+class TestWebhook(unittest.TestCase):
+
+    def post(self, server, update, secret=None):
+        req = urllib.request.Request(
+            f"http://127.0.0.1:{server.port}/telegram",
+            data=json.dumps(update).encode(),
+            headers={"Content-Type": "application/json"},
+            method="POST",
+        )
+        if secret:
+            req.add_header("X-Telegram-Bot-Api-Secret-Token", secret)
+        try:
+            with urllib.request.urlopen(req, timeout=5) as resp:
+                return resp.status
+        except urllib.error.HTTPError as e:
+            return e.code
+
+    def test_webhook_pushes_messages_and_checks_secret(self):
+        received = []
+        with patch.object(telegram_tool, "ALLOWED_USERS", "*"):
+            server = WebhookServer(received.append, host="127.0.0.1", port=0, secret="s3cr3t").start()
+            try:
+                self.assertEqual(self.post(server, make_update(1, 55, "hola"), secret="malo"), 403)
+                self.assertEqual(self.post(server, make_update(1, 55, "hola"), secret="s3cr3t"), 200)
+                # Reintento de Telegram con el mismo update_id: no se duplica
+                self.assertEqual(self.post(server, make_update(1, 55, "hola"), secret="s3cr3t"), 200)
+            finally:
+                server.stop()
+        self.assertEqual(received, ["55|hola"])
+
+    def test_webhook_needs_secret_outside_loopback(self):
+        with self.assertRaises(ValueError):
+            WebhookServer(lambda msg: None, host="0.0.0.0", port=0)
+        server = WebhookServer(lambda msg: None, port=0).start()     # 127.0.0.1 por defecto
+        try:
+            self.assertEqual(server._httpd.server_address[0], "127.0.0.1")
+            self.assertEqual(self.post(server, make_update(2, 55, "hola")), 200)
+        finally:
+            server.stop()
+        server = WebhookServer(lambda msg: None, host="0.0.0.0", port=0, secret="s3cr3t").start()
+        try:
+            self.assertEqual(self.post(server, make_update(3, 55, "hola")), 403)
+        finally:
+            server.stop()
+
+
+if __name__ == '__main__':
+    unittest.main()
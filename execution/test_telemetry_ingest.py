@@ -0,0 +1,132 @@
+import json
+import os
+import socket
+import sys
+import time
+import unittest
+
+import numpy as np
+import requests
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from telemetry_ingest import RingBuffer, TelemetryBuffers, TelemetryServer, parse_json, parse_lines  # noqa: E402
+
+
+class TestParsing(unittest.TestCase):
+
+    def test_line_protocol(self):
+        text = (
+            "vitals,patient=BED-1 heart_rate=82,spo2=97i 1712345678000000000\n"
+            "# comentario\n"
+            "vitals,patient=BED-2 hr=120,temp=38.9\n"
+            "vitals heart_rate=80\n"
+            "vitals,patient=BED-3 presion=1\n"
+        )
+        readings, bad = parse_lines(text, now=100.0)
+        self.assertEqual(bad, 2)
+        self.assertEqual(readings[0], ("BED-1", 1712345678.0, {"heart_rate": 82.0, "spo2": 97.0}))
+        self.assertEqual(readings[1], ("BED-2", 100.0, {"heart_rate": 120.0, "temperature": 38.9}))
+
+    def test_json(self):
+        readings, bad = parse_json({"readings": [{"patient": "A", "ts": 5, "hr": 70}, {"hr": 1}]})
+        self.assertEqual((readings, bad), ([("A", 5.0, {"heart_rate": 70.0})], 1))
+        with self.assertRaises(ValueError):
+            parse_json({"readings": 5})
+
+    def test_non_finite_values_are_rejected(self):
+        readings, bad = parse_lines("vitals,patient=A hr=nan\nvitals,patient=A spo2=inf\n"
+                                    "vitals,patient=A hr=80 inf\nvitals,patient=A hr=81\n", now=1.0)
+        self.assertEqual((readings, bad), ([("A", 1.0, {"heart_rate": 81.0})], 3))
+        payload = json.loads('[{"patient": "A", "hr": NaN}, {"patient": "A", "spo2": -Infinity}, {"patient": "A", "hr": 70}]')
+        readings, bad = parse_json(payload, now=1.0)
+        self.assertEqual((readings, bad), ([("A", 1.0, {"heart_rate": 70.0})], 2))
+
+
+class TestRingBuffer(unittest.TestCase):
+
+    def test_wraps_and_keeps_last_known_values(self):
+        ring = RingBuffer(capacity=4)
+        ring.extend(np.arange(1, 4, dtype=float), np.array([[70, 36.5, 98, np.nan, np.nan]] * 3))
+        ring.extend(np.arange(4, 7, dtype=float), np.array([[80, np.nan, np.nan, np.nan, np.nan]] * 3))
+        ts, values = ring.window()
+        self.assertEqual(ts.tolist(), [3, 4, 5, 6])
+        latest = ring.latest()
+        self.assertEqual((latest["heart_rate"], latest["spo2"], latest["last_update"]), (80, 98, 6))
+        self.assertNotIn("systolic", latest)
+        self.assertEqual(ring.window(since=5)[0].tolist(), [5, 6])
+
+
+class TestTelemetryServer(unittest.TestCase):
+
+    def setUp(self):
+        self.buffers = TelemetryBuffers(capacity=8)
+        self.server = TelemetryServer(self.buffers, host="127.0.0.1", port=0, tcp_port=0).start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def test_http_json_and_lines(self):
+        base = f"http://127.0.0.1:{self.server.port}/telemetry"
+        resp = requests.post(base, json=[{"patient": "BED-1", "hr": 130, "spo2": 90}], timeout=5)
+        self.assertEqual(resp.json(), {"accepted": 1, "rejected": 0})
+        resp = requests.post(base, data="vitals,patient=BED-2 temp=39.5\n",
+                             headers={"Content-Type": "text/plain"}, timeout=5)
+        self.assertEqual(resp.json()["accepted"], 1)
+        updates = self.buffers.take_updates()
+        self.assertEqual(updates["BED-1"]["heart_rate"], 130)
+        self.assertEqual(updates["BED-2"]["temperature"], 39.5)
+        self.assertEqual(self.buffers.take_updates(), {})
+
+    def test_tcp_line_stream(self):
+        with socket.create_connection(("127.0.0.1", self.server.tcp_port)) as sock:
+            payload = "".join(f"v,patient=BED-{i % 3} hr={60 + i}\n" for i in range(30))
+            sock.sendall(payload.encode())
+        deadline = time.time() + 5
+        while self.buffers.stats()["accepted"] < 30 and time.time() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(self.buffers.stats()["accepted"], 30)
+        ts, values = self.buffers.window("BED-0")
+        self.assertEqual(len(ts), 8)  # capacidad del buffer
+        self.assertEqual(values[-1, 0], 87)
+        self.assertEqual(json.loads(json.dumps(self.buffers.stats()))["patients"], 3)
+
+
+class TestTelemetryToken(unittest.TestCase):
+
+    def setUp(self):
+        self.buffers = TelemetryBuffers(capacity=8)
+        self.server = TelemetryServer(self.buffers, host="127.0.0.1", port=0, tcp_port=0, token="s3cr3t").start()
+
+    def tearDown(self):
+        self.server.stop()
+
+    def _send(self, payload):
+        with socket.create_connection(("127.0.0.1", self.server.tcp_port)) as sock:
+            sock.sendall(payload.encode())
+            sock.shutdown(socket.SHUT_WR)
+            return sock.recv(64)
+
+    def test_token_is_required_outside_loopback(self):
+        with self.assertRaises(ValueError):
+            TelemetryServer(TelemetryBuffers(), host="0.0.0.0", port=0)
+        server = TelemetryServer(TelemetryBuffers(), host="0.0.0.0", port=0, token="s3cr3t").start()
+        server.stop()
+
+    def test_tcp_requires_token(self):
+        self.assertEqual(self._send("v,patient=BED-1 hr=200\n"), b"ERR token\n")
+        self.assertEqual(self._send("token=otro\nv,patient=BED-1 hr=200\n"), b"ERR token\n")
+        self.assertEqual(self.buffers.stats()["accepted"], 0)
+        self._send("token=s3cr3t\nv,patient=BED-1 hr=70\n")
+        self.assertEqual(self.buffers.stats()["accepted"], 1)
+
+    def test_http_requires_token_and_rejects_bad_json(self):
+        base = f"http://127.0.0.1:{self.server.port}/telemetry"
+        self.assertEqual(requests.post(base, json=[{"patient": "A", "hr": 1}], timeout=5).status_code, 403)
+        resp = requests.post(base, json={"readings": 5}, headers={"X-Telemetry-Token": "s3cr3t"}, timeout=5)
+        self.assertEqual(resp.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,54 @@
+import datetime
+import os
+import sys
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from timer_scheduler import TimerScheduler, next_daily_fire  # noqa: E402
+
+
+class TestTimerScheduler(unittest.TestCase):
+
+    def test_pop_due_in_order_and_catch_up(self):
+        timers = TimerScheduler()
+        timers.schedule("b", 200)
+        timers.schedule("a", 100, payload="x")
+        timers.schedule("c", 300)
+        self.assertEqual(timers.pop_due(50), [])
+        # Un bucle atascado mucho tiempo recibe igualmente todo lo vencido
+        self.assertEqual([k for k, _, _ in timers.pop_due(250)], ["a", "b"])
+        self.assertEqual(timers.next_fire(), 300)
+        self.assertEqual(len(timers), 1)
+
+    def test_reschedule_and_cancel(self):
+        timers = TimerScheduler()
+        timers.schedule("r1", 100)
+        timers.schedule("r1", 500)  # reemplaza el disparo anterior
+        timers.schedule("r2", 150)
+        self.assertTrue(timers.cancel("r2"))
+        self.assertFalse(timers.cancel("r2"))
+        self.assertEqual(timers.pop_due(200), [])
+        self.assertEqual(timers.pop_due(600), [("r1", 500, None)])
+
+    def test_cancelled_entries_are_compacted(self):
+        timers = TimerScheduler()
+        for i in range(1000):
+            timers.schedule(i, i)
+        for i in range(900):
+            timers.cancel(i)
+        self.assertEqual(len(timers), 100)
+        self.assertLess(timers.stats()["heap"], 300)
+        self.assertEqual(timers.next_fire(), 900)
+
+    def test_next_daily_fire(self):
+        base = datetime.datetime(2026, 3, 10, 8, 30).timestamp()
+        self.assertEqual(datetime.datetime.fromtimestamp(next_daily_fire("09:00", base)),
+                         datetime.datetime(2026, 3, 10, 9, 0))
+        self.assertEqual(datetime.datetime.fromtimestamp(next_daily_fire("08:30", base)),
+                         datetime.datetime(2026, 3, 11, 8, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
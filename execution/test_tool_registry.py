@@ -0,0 +1,72 @@
+import os
+import sys
+import tempfile
+import textwrap
+import threading
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+import tool_registry  # noqa: E402
+
+FAKE_TOOL = textwrap.dedent('''
+    import argparse
+    import json
+    import sys
+
+    def main(argv=None):
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--value", required=True)
+        args = parser.parse_args(argv)
+        print("log de depuración", file=sys.stderr)
+        if args.value == "fail":
+            print(json.dumps({"status": "error", "message": "fallo"}))
+            sys.exit(1)
+        print(json.dumps({"status": "success", "value": args.value}))
+''')
+
+
+class TestToolRegistry(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(cls.tmp.name, "fake_registry_tool.py"), "w") as f:
+            f.write(FAKE_TOOL)
+        sys.path.insert(0, cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        sys.path.remove(cls.tmp.name)
+        cls.tmp.cleanup()
+
+    def setUp(self):
+        self.registry = tool_registry.ToolRegistry(tools=["fake_registry_tool.py"], mode="inprocess")
+
+    def test_runs_in_process_with_json_contract(self):
+        res = self.registry.run("fake_registry_tool.py", ["--value", "42"])
+        self.assertEqual(res, {"status": "success", "value": "42"})
+        self.assertEqual(self.registry.stats["inprocess"], 1)
+
+    def test_sys_exit_keeps_error_json(self):
+        res = self.registry.run("fake_registry_tool.py", ["--value", "fail"])
+        self.assertEqual(res["status"], "error")
+
+    def test_concurrent_calls_do_not_mix_output(self):
+        results = {}
+
+        def worker(i):
+            results[i] = self.registry.run("fake_registry_tool.py", ["--value", str(i)])
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for i in range(8):
+            self.assertEqual(results[i]["value"], str(i))
+
+
+if __name__ == '__main__':
+    unittest.main()
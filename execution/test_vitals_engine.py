@@ -0,0 +1,62 @@
+import os
+import sys
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from vitals_engine import VitalsEngine  # noqa: E402
+
+
+def patient(name, **vitals):
+    data = {"name": name, "heart_rate": 75, "temperature": 36.5, "spo2": 98, "systolic": 120,
+            "diastolic": 80, "last_update": 0, "last_alert": 0}
+    data.update(vitals)
+    return data
+
+
+class TestVitalsEngine(unittest.TestCase):
+
+    def test_tick_updates_only_due_patients_within_limits(self):
+        engine = VitalsEngine.from_patients({
+            "SIM-001": patient("Ana", heart_rate=300, spo2=50),
+            "SIM-002": patient("Luis", last_update=1000),
+        }, seed=1)
+        changed = engine.tick(now=1002)
+        self.assertEqual(changed.tolist(), [0])
+        ana = engine.get("SIM-001")
+        self.assertEqual(ana["heart_rate"], 180)
+        self.assertEqual(ana["spo2"], 80)
+        self.assertIsInstance(ana["heart_rate"], int)
+        self.assertEqual(ana["last_update"], 1002)
+        self.assertEqual(engine.get("SIM-002")["last_update"], 1000)
+
+    def test_sensor_rows_are_not_simulated(self):
+        engine = VitalsEngine(seed=1)
+        engine.upsert("BED-1", {"heart_rate": 120, "last_update": 0}, live=True)
+        engine.take_dirty()
+        self.assertEqual(engine.tick(now=100).tolist(), [])
+        self.assertEqual(engine.get("BED-1")["heart_rate"], 120)
+        self.assertEqual(engine.columns()["heart_rate"].tolist(), [120])
+        self.assertEqual(engine.take_dirty(), [])
+
+    def test_sensor_silence_counts_only_live_rows(self):
+        engine = VitalsEngine(seed=1)
+        engine.upsert("SIM-001", patient("Ana", last_update=0))
+        engine.upsert("BED-1", {"heart_rate": 120, "last_update": 40}, live=True)
+        self.assertEqual(engine.sensor_silence(now=100).tolist(), [0.0, 60.0])
+
+    def test_growth_and_dirty_rows(self):
+        engine = VitalsEngine(capacity=2)
+        for i in range(5):
+            engine.upsert(f"SIM-{i:03d}", patient(f"P{i}", bed=str(i)))
+        self.assertEqual(len(engine), 5)
+        self.assertEqual(engine.get("SIM-004")["bed"], "4")
+        self.assertEqual(engine.take_dirty(), [0, 1, 2, 3, 4])
+        self.assertEqual(engine.take_dirty(), [])
+        engine.upsert("SIM-002", {"heart_rate": 140})
+        self.assertEqual(list(engine.to_patients(engine.take_dirty())), ["SIM-002"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+import os
+import sys
+import tempfile
+import unittest
+
+import numpy as np
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from vitals_tsdb import VitalsTSDB, decode_payload, encode_block, read_blocks  # noqa: E402
+
+DAY = 86400
+T0 = 1_700_000_000 // DAY * DAY  # medianoche UTC
+
+
+class TestVitalsTSDB(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_block_roundtrip(self):
+        ts = np.array([10, 15, 20, 26])
+        values = np.array([[75, 36.5, 98, 120, 80], [76, 36.6, 97, 121, 80],
+                           [74, 36.4, 98, 119, 79], [75, 36.5, 99, 120, 81]], dtype=float)
+        block = encode_block(ts, values)
+        out_ts, out_values = decode_payload(4, 5, 10, block[30:])
+        self.assertEqual(out_ts.tolist(), ts.tolist())
+        np.testing.assert_allclose(out_values, values)
+
+    def test_range_query_spans_disk_and_memory(self):
+        db = VitalsTSDB(self.tmp.name, chunk_points=10)
+        for i in range(35):
+            db.append("SIM-001", T0 + 100 + i * 5, [70 + i % 5, 36.5, 98, 120, 80])
+        self.assertEqual(db.stats()["points_written"], 30)  # 3 bloques en disco, 5 en memoria
+        data = db.query("SIM-001", T0 + 150, T0 + 200, resolution="1s")
+        self.assertEqual(data["ts"].tolist(), list(range(T0 + 150, T0 + 201, 5)))
+        self.assertEqual(data["columns"]["heart_rate"][0], 70)
+        # Los bloques fuera de la ventana no se descomprimen
+        path = os.path.join(self.tmp.name, "1s", os.listdir(os.path.join(self.tmp.name, "1s"))[0], "SIM-001.vts")
+        self.assertEqual(len(read_blocks(path, T0 + 150, T0 + 160)), 1)
+
+    def test_rollups_minute_and_hour(self):
+        db = VitalsTSDB(self.tmp.name)
+        for s in range(0, 2 * 3600 + 120, 10):
+            db.append("SIM-001", T0 + s, [60 + (s % 60) // 10, 37.0, 95, 120, 80])
+        minutes = db.query("SIM-001", T0, T0 + 3600, resolution="1m")
+        self.assertEqual(len(minutes["ts"]), 61)
+        self.assertEqual(minutes["columns"]["heart_rate"][0], 62.5)
+        self.assertEqual(minutes["columns"]["heart_rate_min"][0], 60)
+        self.assertEqual(minutes["columns"]["heart_rate_max"][0], 65)
+        hours = db.query("SIM-001", T0, T0 + 3 * 3600, resolution="1h")
+        self.assertEqual(hours["ts"].tolist(), [T0, T0 + 3600])
+        self.assertEqual(db.pick_resolution(T0, T0 + DAY), "1m")
+        summary = db.summary("SIM-001", 3600, now=T0 + 3600)
+        self.assertEqual(summary["resolution"], "1s")
+        self.assertEqual((summary["heart_rate"]["min"], summary["heart_rate"]["max"]), (60, 65))
+        self.assertAlmostEqual(summary["heart_rate"]["slope_per_hour"], 0, delta=0.5)
+
+    def test_blocks_split_by_day_and_retention(self):
+        db = VitalsTSDB(self.tmp.name, retention={"1s": 1})
+        for d in range(4):
+            db.append("SIM-001", T0 + d * DAY + 10, [75, 36.5, 98, 120, 80])
+        db.flush(max_age=0)
+        self.assertEqual(len(os.listdir(os.path.join(self.tmp.name, "1s"))), 4)
+        self.assertEqual(db.enforce_retention(now=T0 + 3 * DAY + 100), 2)
+        data = db.query("SIM-001", T0, T0 + 4 * DAY, resolution="1s")
+        self.assertEqual(len(data["ts"]), 2)
+
+    def test_memory_is_bounded(self):
+        db = VitalsTSDB(self.tmp.name, max_buffered=50)
+        for i in range(20):
+            db.append_many([f"P{j}" for j in range(10)], T0 + i, np.full((10, 5), 75.0))
+        self.assertLessEqual(db.stats()["buffered_points"], 50)
+
+    def test_batched_appends_match_single_appends(self):
+        rng = np.random.default_rng(7)
+        single = VitalsTSDB(os.path.join(self.tmp.name, "a"), chunk_points=16)
+        batched = VitalsTSDB(os.path.join(self.tmp.name, "b"), chunk_points=16, stage_points=7)
+        t = T0 + DAY - 600                  # cruza la medianoche
+        for _ in range(400):
+            t += int(rng.choice([0, 1, 7]))
+            pids = [f"P{i}" for i in rng.integers(0, 4, size=5)]   # con camas repetidas
+            values = rng.normal(80, 10, (5, 5)).round(1)
+            batched.append_many(pids, t, values)
+            for pid, row in zip(pids, values):
+                single.append(pid, t, row)
+        single.close()
+        batched.close()
+        for pid in ("P0", "P1", "P2", "P3"):
+            for res in ("1s", "1m", "1h"):
+                a = single.query(pid, T0, T0 + 2 * DAY, resolution=res)
+                b = batched.query(pid, T0, T0 + 2 * DAY, resolution=res)
+                self.assertEqual(a["ts"].tolist(), b["ts"].tolist())
+                for name, column in a["columns"].items():
+                    np.testing.assert_allclose(b["columns"][name], column)
+        self.assertEqual(batched.stats()["buffered_points"], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
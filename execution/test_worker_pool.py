@@ -0,0 +1,112 @@
+import os
+import sys
+import tempfile
+import textwrap
+import time
+import unittest
+
+# Add execution dir to path to import the module
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from worker_pool import WorkerPool  # noqa: E402
+
+FAKE_TOOL = textwrap.dedent('''
+    import argparse
+    import json
+    import os
+    import time
+
+    _HELD = []
+
+    def main(argv=None):
+        parser = argparse.ArgumentParser()
+        parser.add_argument("--sleep", type=float, default=0)
+        parser.add_argument("--grow-mb", type=int, default=0)
+        parser.add_argument("--crash", action="store_true")
+        args = parser.parse_args(argv)
+        if args.crash:
+            os._exit(1)
+        time.sleep(args.sleep)
+        if args.grow_mb:
+            _HELD.append(b"x" * (args.grow_mb * 1024 * 1024))
+        print(json.dumps({"status": "success", "pid": os.getpid()}))
+''')
+
+TOOL = "fake_pool_tool.py"
+
+
+class TestWorkerPool(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        with open(os.path.join(cls.tmp.name, TOOL), "w") as f:
+            f.write(FAKE_TOOL)
+        # Los trabajadores se crean desde otro intérprete: heredan el entorno, no sys.path
+        cls.old_pythonpath = os.environ.get("PYTHONPATH")
+        os.environ["PYTHONPATH"] = os.pathsep.join(
+            p for p in (cls.tmp.name, os.path.dirname(os.path.abspath(__file__)), cls.old_pythonpath) if p)
+        sys.path.insert(0, cls.tmp.name)
+
+    @classmethod
+    def tearDownClass(cls):
+        sys.path.remove(cls.tmp.name)
+        if cls.old_pythonpath is None:
+            os.environ.pop("PYTHONPATH", None)
+        else:
+            os.environ["PYTHONPATH"] = cls.old_pythonpath
+        cls.tmp.cleanup()
+
+    def pool(self, **kwargs):
+        pool = WorkerPool(size=1, tools=[TOOL], preload_modules=[], **kwargs).start()
+        self.addCleanup(pool.shutdown)
+        return pool
+
+    def test_recycles_after_max_calls(self):
+        pool = self.pool(max_calls=2)
+        pids = [pool.run(TOOL, [])["pid"] for _ in range(3)]
+        self.assertEqual(pids[0], pids[1])
+        self.assertNotEqual(pids[1], pids[2])
+        self.assertNotEqual(pids[0], os.getpid())
+        self.assertEqual(pool.stats()["recycled"], 1)
+
+    def test_recycles_on_rss_growth(self):
+        pool = self.pool(max_rss_growth_mb=20)
+        first = pool.run(TOOL, ["--grow-mb", "64"])["pid"]
+        self.assertNotEqual(pool.run(TOOL, [])["pid"], first)
+        self.assertEqual(pool.stats()["recycled"], 1)
+
+    def test_timeout_kills_worker(self):
+        pool = self.pool(timeout=0.5)
+        first = pool.run(TOOL, [])["pid"]
+        self.assertIsNone(pool.run(TOOL, ["--sleep", "10"]))
+        self.assertNotEqual(pool.run(TOOL, [])["pid"], first)
+        stats = pool.stats()
+        self.assertEqual((stats["timeouts"], stats["completed"]), (1, 2))
+
+    def test_crashed_worker_is_replaced(self):
+        pool = self.pool()
+        self.assertIsNone(pool.run(TOOL, ["--crash"]))
+        self.assertEqual(pool.run(TOOL, [])["status"], "success")
+        self.assertEqual(pool.stats()["crashes"], 1)
+
+    def test_queue_depth(self):
+        pool = self.pool()
+        pool.run(TOOL, [])                  # trabajador ya precargado
+        slow = pool.submit(TOOL, ["--sleep", "1"])
+        deadline = time.time() + 5
+        while pool.stats()["busy"] == 0 and time.time() < deadline:
+            time.sleep(0.01)
+        waiting = [pool.submit(TOOL, []) for _ in range(2)]
+        self.assertEqual(pool.queue_depth(), 2)
+        self.assertEqual(slow.result(timeout=10)["status"], "success")
+        self.assertTrue(all(f.result(timeout=10)["status"] == "success" for f in waiting))
+        self.assertEqual(pool.stats()["queue_depth"], 0)
+
+    def test_submit_requires_start(self):
+        with self.assertRaises(RuntimeError):
+            WorkerPool(size=1, tools=[TOOL], preload_modules=[]).submit(TOOL, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -6,12 +6,12 @@ import os
 from gtts import gTTS
 from pydub import AudioSegment
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Convertir texto a audio (TTS).")
     parser.add_argument("--text", required=True, help="Texto a convertir.")
     parser.add_argument("--output", required=True, help="Ruta del archivo de salida (.ogg).")
     parser.add_argument("--lang", default="es", help="Código de idioma para la voz (ej: es, en).")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     try:
         # Limpiar un poco el texto de markdown básico para que no lea los asteriscos
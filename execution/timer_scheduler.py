@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""
+Planificador de temporizadores para recordatorios y citas.
+
+Antes, cada vuelta del bucle recorría todos los recordatorios buscando los que
+coincidían exactamente con la hora `HH:MM` actual: con decenas de miles de
+tomas de medicación el recorrido era caro y, si el bucle se atascaba más de un
+minuto, el recordatorio se perdía. Aquí cada temporizador guarda su próximo
+instante de disparo en un montículo (heap):
+
+- alta y cancelación en O(log n) (la cancelación marca la entrada y se
+  compacta el heap cuando acumula demasiadas entradas muertas);
+- consultar lo pendiente es mirar la cima: O(1) si no hay nada que disparar;
+- `pop_due()` devuelve todo lo vencido, aunque haya pasado más de un minuto,
+  para que el llamador decida si lo recupera (catch-up) o lo da por perdido.
+"""
+import datetime
+import heapq
+import itertools
+import threading
+import time
+
+_REMOVED = object()
+
+
+class TimerScheduler:
+    """Temporizadores identificados por clave; reprogramar una clave reemplaza su disparo anterior."""
+
+    def __init__(self, clock=time.time):
+        self.clock = clock
+        self._heap = []        # [fire_at, seq, key, payload]
+        self._entries = {}     # key -> entrada viva del heap
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+        self.fired = 0
+        self.cancelled = 0
+
+    def schedule(self, key, fire_at, payload=None):
+        with self._lock:
+            self._remove(key)
+            entry = [fire_at, next(self._counter), key, payload]
+            self._entries[key] = entry
+            heapq.heappush(self._heap, entry)
+
+    def cancel(self, key):
+        with self._lock:
+            removed = self._remove(key)
+            if removed:
+                self.cancelled += 1
+            return removed
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        entry[2] = _REMOVED
+        # Compactar cuando las entradas muertas superan a las vivas
+        if len(self._heap) > 64 and len(self._heap) > 2 * len(self._entries):
+            self._heap = [e for e in self._heap if e[2] is not _REMOVED]
+            heapq.heapify(self._heap)
+        return True
+
+    def pop_due(self, now=None):
+        """Saca y devuelve [(key, fire_at, payload)] de todos los temporizadores vencidos, en orden."""
+        now = self.clock() if now is None else now
+        due = []
+        with self._lock:
+            while self._heap and self._heap[0][0] <= now:
+                fire_at, _, key, payload = heapq.heappop(self._heap)
+                if key is _REMOVED:
+                    continue
+                del self._entries[key]
+                due.append((key, fire_at, payload))
+            self.fired += len(due)
+        return due
+
+    def next_fire(self):
+        """Instante del próximo disparo (o None si no hay temporizadores)."""
+        with self._lock:
+            while self._heap and self._heap[0][2] is _REMOVED:
+                heapq.heappop(self._heap)
+            return self._heap[0][0] if self._heap else None
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def stats(self):
+        with self._lock:
+            return {"pending": len(self._entries), "heap": len(self._heap), "fired": self.fired, "cancelled": self.cancelled}
+
+
+def next_daily_fire(hhmm, after):
+    """Primer instante con hora `HH:MM` estrictamente posterior a `after` (timestamp, hora local)."""
+    hour, minute = map(int, hhmm.split(":"))
+    base = datetime.datetime.fromtimestamp(after)
+    candidate = base.replace(hour=hour, minute=minute, second=0, microsecond=0)
+    if candidate.timestamp() <= after:
+        candidate += datetime.timedelta(days=1)
+    return candidate.timestamp()
+
+
+def daily_fire_on(hhmm, day):
+    """Instante `HH:MM` del día `day` (date), hora local."""
+    hour, minute = map(int, hhmm.split(":"))
+    return datetime.datetime.combine(day, datetime.time(hour, minute)).timestamp()
+
+
+def appointment_fire(date_str, time_str, year=None):
+    """Instante de una cita `DD/MM HH:MM` (se asume el año actual, como en /mis_citas)."""
+    year = year or datetime.datetime.now().year
+    return datetime.datetime.strptime(f"{year}/{date_str} {time_str}", "%Y/%d/%m %H:%M").timestamp()
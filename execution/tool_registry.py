@@ -0,0 +1,200 @@
+#!/usr/bin/env python3
+"""
+Registro de herramientas en proceso.
+
+Importa una sola vez los scripts de `execution/` y llama a su `main(argv)`
+directamente, capturando stdout/stderr para conservar el mismo contrato JSON
+que `subprocess.run`. Las herramientas que no se pueden importar (dependencias
+faltantes, `sys.exit` al importar) o que se marcan como aisladas se ejecutan
+en el pool de trabajadores (`worker_pool.py`) si está activo, o en un subproceso.
+"""
+import importlib
+import io
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+TOOLS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Herramientas que se importan y ejecutan dentro del proceso del listener
+IN_PROCESS_TOOLS = (
+    "telegram_tool.py",
+    "chat_with_llm.py",
+    "run_sandbox.py",
+    "transcribe_audio.py",
+    "text_to_speech.py",
+    "analyze_image.py",
+    "research_topic.py",
+    "scrape_single_site.py",
+    "translate_text.py",
+    "capture_image.py",
+    "monitor_resources.py",
+    "save_memory.py",
+    "list_memories.py",
+    "delete_memory.py",
+)
+
+
+class _ThreadLocalStream:
+    """Stream que redirige las escrituras a un buffer propio de cada hilo mientras captura."""
+
+    def __init__(self, original):
+        self._original = original
+        self._local = threading.local()
+
+    def _target(self):
+        buffer = getattr(self._local, "buffer", None)
+        return buffer if buffer is not None else self._original
+
+    def write(self, data):
+        return self._target().write(data)
+
+    def flush(self):
+        return self._target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self._original, name)
+
+    @contextmanager
+    def capture(self):
+        previous = getattr(self._local, "buffer", None)
+        buffer = io.StringIO()
+        self._local.buffer = buffer
+        try:
+            yield buffer
+        finally:
+            self._local.buffer = previous
+
+
+_install_lock = threading.Lock()
+
+
+def _install_streams():
+    """Instala (una sola vez) los streams con captura por hilo sobre sys.stdout/sys.stderr."""
+    with _install_lock:
+        if not isinstance(sys.stdout, _ThreadLocalStream):
+            sys.stdout = _ThreadLocalStream(sys.stdout)
+        if not isinstance(sys.stderr, _ThreadLocalStream):
+            sys.stderr = _ThreadLocalStream(sys.stderr)
+    return sys.stdout, sys.stderr
+
+
+def _parse_output(script, stdout, stderr):
+    """Aplica el contrato de run_tool: loguea stderr y devuelve el JSON de stdout (o None)."""
+    if stderr:
+        print(f"   🛠️  [LOG {script}]: {stderr.strip()}")
+    try:
+        return json.loads(stdout)
+    except json.JSONDecodeError:
+        print(f"❌ Error crítico: {script} falló y no devolvió JSON válido.")
+        if stderr: print(f"   Logs de error: {stderr.strip()}")
+        return None
+
+
+class ToolRegistry:
+    """Ejecuta herramientas del framework en proceso, con fallback a subproceso."""
+
+    def __init__(self, tools=IN_PROCESS_TOOLS, isolated=None, mode=None):
+        self.tools = tuple(tools)
+        env_isolated = os.getenv("TOOL_ISOLATED", "")
+        self.isolated = set(isolated or [t.strip() for t in env_isolated.split(",") if t.strip()])
+        # TOOL_MODE: "inprocess" (por defecto), "pool" (todo en trabajadores calientes)
+        # o "subprocess" (un intérprete nuevo por llamada, máximo aislamiento)
+        self.mode = mode or os.getenv("TOOL_MODE", "inprocess")
+        self.modules = {}
+        self.failed = {}
+        self.pool = None
+        self.stats = {"inprocess": 0, "subprocess": 0, "pool": 0, "seconds": 0.0}
+        self._lock = threading.Lock()
+
+    def attach_pool(self, pool):
+        """Usa un WorkerPool (procesos calientes) en lugar de subprocess.run para lo que no corre en proceso."""
+        self.pool = pool
+
+    def preload(self):
+        """Importa por adelantado todas las herramientas registradas."""
+        for script in self.tools:
+            self._load(script)
+        return list(self.modules)
+
+    def _load(self, script):
+        if script in self.modules:
+            return self.modules[script]
+        if script in self.failed or script not in self.tools:
+            return None
+        with self._lock:
+            if script in self.modules:
+                return self.modules[script]
+            if TOOLS_DIR not in sys.path:
+                sys.path.insert(0, TOOLS_DIR)
+            _install_streams()
+            name = os.path.splitext(script)[0]
+            try:
+                # Capturamos la salida de la importación (algunas herramientas imprimen avisos)
+                with sys.stdout.capture(), sys.stderr.capture() as err:
+                    module = importlib.import_module(name)
+                if not callable(getattr(module, "main", None)):
+                    raise ImportError(f"{script} no expone main(argv)")
+            except (Exception, SystemExit) as e:
+                detail = err.getvalue().strip() if isinstance(e, SystemExit) else str(e)
+                print(f"   ⚠️  [REGISTRY] {script} se ejecutará en subproceso: {detail or e}")
+                self.failed[script] = detail or str(e)
+                return None
+            self.modules[script] = module
+            return module
+
+    def run(self, script, args):
+        """Ejecuta la herramienta y devuelve su salida JSON (o None si falla)."""
+        start = time.time()
+        module = None
+        if self.mode == "inprocess" and script not in self.isolated:
+            module = self._load(script)
+        try:
+            if module is not None:
+                return self._run_inprocess(script, module, args)
+            if self.pool is not None and self.mode != "subprocess":
+                self.stats["pool"] += 1
+                return self.pool.run(script, args)
+            return self.run_subprocess(script, args)
+        finally:
+            self.stats["seconds"] += time.time() - start
+
+    def _run_inprocess(self, script, module, args):
+        self.stats["inprocess"] += 1
+        out_stream, err_stream = _install_streams()
+        with out_stream.capture() as out, err_stream.capture() as err:
+            try:
+                module.main([str(a) for a in args])
+            except SystemExit:
+                # Las herramientas usan sys.exit(1) tras imprimir su JSON de error
+                pass
+            except Exception as e:
+                print(f"Error ejecutando {script}: {e}", file=sys.stderr)
+        return _parse_output(script, out.getvalue(), err.getvalue())
+
+    def run_subprocess(self, script, args):
+        """Ejecución aislada en un intérprete nuevo (comportamiento original de run_tool)."""
+        self.stats["subprocess"] += 1
+        script_path = os.path.join(TOOLS_DIR, script)
+        cmd = [sys.executable, script_path] + list(args)
+        try:
+            result = subprocess.run(cmd, capture_output=True, text=True)
+        except Exception as e:
+            print(f"Error ejecutando {script}: {e}")
+            return None
+        return _parse_output(script, result.stdout, result.stderr)
+
+
+_default_registry = None
+
+
+def get_registry():
+    """Devuelve el registro compartido del proceso (se crea bajo demanda)."""
+    global _default_registry
+    if _default_registry is None:
+        _default_registry = ToolRegistry()
+    return _default_registry
@@ -18,11 +18,11 @@ except ImportError:
     sys.exit(1)
 
 
-def main():
+def main(argv=None):
     parser = argparse.ArgumentParser(description="Traducir archivos de texto usando IA.")
     parser.add_argument("--file", required=True, help="Ruta del archivo a traducir.")
     parser.add_argument("--lang", required=True, help="Idioma destino.")
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     file_path = args.file
     target_lang = args.lang
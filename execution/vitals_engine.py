@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Motor vectorizado de signos vitales simulados.
+
+`simulate_and_monitor_vitals()` recorría un diccionario por paciente en Python
+puro: suficiente para una sala, inviable para miles de camas. Aquí cada
+signo vital es una columna NumPy (una posición por paciente) y cada tick
+aplica homeostasis, ruido y límites fisiológicos como
+operaciones por lotes sobre todas las camas a la vez.
+
+Las reglas son las mismas que tenía el listener:
+- cada paciente se actualiza si pasaron más de SIM_INTERVAL segundos;
+- deriva hacia HR 75 / 36.5 °C / SpO2 98 y ruido uniforme.
+
+Los umbrales de alerta se evalúan aparte, en `alert_engine.py`, sobre las
+mismas columnas (`columns()`).
+"""
+import threading
+import time
+
+import numpy as np
+
+SIM_INTERVAL = 5
+
+TARGET_HR, TARGET_TEMP, TARGET_SPO2 = 75, 36.5, 98
+DEFAULTS = {"heart_rate": 75, "temperature": 36.5, "spo2": 98, "systolic": 120, "diastolic": 80,
+            "last_update": 0.0, "last_alert": 0.0}
+COLUMNS = tuple(DEFAULTS)
+VITAL_FIELDS = COLUMNS[:5]
+# Columnas que el resto del bot trata como enteros
+INT_COLUMNS = ("heart_rate", "spo2", "systolic", "diastolic")
+
+
+class VitalsEngine:
+    """Pacientes en columnas NumPy; las filas se reservan por bloques al dar de alta."""
+
+    def __init__(self, capacity=64, seed=None):
+        self.ids = []
+        self.names = []
+        self.extra = []            # claves no vitales de cada paciente (se conservan tal cual)
+        self.index = {}            # id -> fila
+        self.size = 0
+        self.cols = {c: np.full(capacity, DEFAULTS[c], dtype=np.float64) for c in COLUMNS}
+        self.dirty = np.zeros(capacity, dtype=bool)   # filas cambiadas desde el último take_dirty()
+        self.live = np.zeros(capacity, dtype=bool)    # filas alimentadas por sensores reales: no se simulan
+        self.rng = np.random.default_rng(seed)
+        self.lock = threading.RLock()
+
+    @classmethod
+    def from_patients(cls, patients, seed=None):
+        engine = cls(capacity=max(64, len(patients)), seed=seed)
+        for pid, vitals in patients.items():
+            engine.upsert(pid, vitals)
+        return engine
+
+    def __len__(self):
+        return self.size
+
+    def __contains__(self, pid):
+        return pid in self.index
+
+    def _grow(self):
+        capacity = len(self.cols["heart_rate"]) * 2
+        for c, arr in self.cols.items():
+            grown = np.full(capacity, DEFAULTS[c], dtype=np.float64)
+            grown[:self.size] = arr[:self.size]
+            self.cols[c] = grown
+        for attr in ("dirty", "live"):
+            flags = np.zeros(capacity, dtype=bool)
+            flags[:self.size] = getattr(self, attr)[:self.size]
+            setattr(self, attr, flags)
+
+    def upsert(self, pid, vitals, live=None):
+        """Alta o actualización de un paciente a partir de un diccionario como los del store."""
+        with self.lock:
+            row = self.index.get(pid)
+            if row is None:
+                if self.size == len(self.cols["heart_rate"]):
+                    self._grow()
+                row = self.size
+                self.size += 1
+                self.index[pid] = row
+                self.ids.append(pid)
+                self.names.append(None)
+                self.extra.append({})
+            for key, value in vitals.items():
+                if key in self.cols:
+                    self.cols[key][row] = DEFAULTS[key] if value is None else value
+                elif key == "name":
+                    self.names[row] = value
+                else:
+                    self.extra[row][key] = value
+            self.dirty[row] = True
+            if live is not None:
+                self.live[row] = live
+            return row
+
+    def get(self, pid):
+        with self.lock:
+            row = self.index.get(pid)
+            return None if row is None else self._row_dict(row)
+
+    def _row_dict(self, row):
+        data = {"name": self.names[row]} if self.names[row] is not None else {}
+        for c in COLUMNS:
+            value = self.cols[c][row].item()
+            data[c] = int(value) if c in INT_COLUMNS else value
+        data.update(self.extra[row])
+        return data
+
+    def to_patients(self, rows=None):
+        """Diccionario {id: signos vitales} de todas las filas o de las indicadas."""
+        with self.lock:
+            rows = range(self.size) if rows is None else rows
+            return {self.ids[r]: self._row_dict(r) for r in rows}
+
+    def tick(self, now=None):
+        """Avanza la simulación de los pacientes sin sensor. Devuelve las filas modificadas."""
+        now = time.time() if now is None else now
+        with self.lock:
+            n = self.size
+            c = {k: v[:n] for k, v in self.cols.items()}   # vistas: se escribe in situ
+
+            # Simulación de los pacientes (sin sensor) cuya última actualización es vieja
+            due_mask = (now - c["last_update"] > SIM_INTERVAL) & ~self.live[:n]
+            due = np.flatnonzero(due_mask)
+            if due.size:
+                # Con casi todas las camas vencidas sale más barato operar sobre la columna
+                # completa que recoger y volver a dispersar filas sueltas
+                sel = slice(None) if due.size == n else due
+                m = n if due.size == n else due.size
+                rng = self.rng
+                hr = c["heart_rate"][sel]
+                temp = c["temperature"][sel]
+                spo2 = c["spo2"][sel]
+                # Homeostasis + fluctuación; trunc replica el int() del cálculo original
+                hr = np.trunc(hr + (TARGET_HR - hr) * 0.1 + rng.integers(-2, 3, m))
+                temp = np.round(temp + (TARGET_TEMP - temp) * 0.1 + rng.uniform(-0.1, 0.1, m), 1)
+                spo2 = np.trunc(spo2 + (TARGET_SPO2 - spo2) * 0.2 + rng.integers(-1, 2, m))
+                c["systolic"][sel] = np.trunc(c["systolic"][sel] + rng.integers(-2, 3, m))
+                c["diastolic"][sel] = np.trunc(c["diastolic"][sel] + rng.integers(-2, 3, m))
+                # Límites fisiológicos
+                c["heart_rate"][sel] = np.clip(hr, 40, 180)
+                c["temperature"][sel] = np.clip(temp, 35.0, 42.0)
+                c["spo2"][sel] = np.clip(spo2, 80, 100)
+                c["last_update"][sel] = now
+                self.dirty[:n] |= due_mask
+            return due
+
+    def columns(self):
+        """Vistas de las columnas de los pacientes dados de alta (llamar con `lock` tomado)."""
+        return {k: v[:self.size] for k, v in self.cols.items()}
+
+    def snapshot(self, rows):
+        """(ids, matriz de signos vitales en el orden de VITAL_FIELDS, last_update) de las filas indicadas."""
+        with self.lock:
+            rows = np.asarray(rows, dtype=np.int64)
+            values = np.column_stack([self.cols[f][rows] for f in VITAL_FIELDS])
+            return [self.ids[r] for r in rows.tolist()], values, self.cols["last_update"][rows]
+
+    def sensor_silence(self, now=None):
+        """Segundos desde la última lectura de cada cama con sensor real (0 en las simuladas)."""
+        now = time.time() if now is None else now
+        with self.lock:
+            n = self.size
+            return np.where(self.live[:n], now - self.cols["last_update"][:n], 0.0)
+
+    def take_dirty(self):
+        """Filas modificadas desde la última llamada (para persistirlas por lotes)."""
+        with self.lock:
+            rows = np.flatnonzero(self.dirty[:self.size])
+            self.dirty[:self.size] = False
+            return rows.tolist()
+
+    def name(self, row):
+        return self.names[row] or "Desconocido"
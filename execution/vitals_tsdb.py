@@ -0,0 +1,497 @@
+#!/usr/bin/env python3
+"""
+Histórico de signos vitales en disco (serie temporal por paciente).
+
+El store solo guarda el último valor de cada paciente, así que `/monitorear`
+no podía mostrar tendencias ni quedaba nada para revisar después. Aquí cada
+paciente tiene tres series:
+
+- `1s`: las lecturas tal cual llegan (como mucho una por segundo);
+- `1m` y `1h`: agregados (media, mínimo y máximo de cada signo) que se
+  calculan al vuelo: las lecturas alimentan el minuto abierto y los minutos
+  cerrados alimentan la hora abierta.
+
+Formato en disco (solo se añade, nunca se reescribe):
+
+    .tmp/vitals_ts/<resolución>/<AAAA-MM-DD>/<paciente>.vts
+
+Cada archivo es una secuencia de bloques. Un bloque guarda una tanda de
+puntos con las columnas en punto fijo (una décima), codificadas como
+diferencias respecto al punto anterior y comprimidas con zlib; la cabecera
+del bloque lleva su rango de tiempo, así que una consulta salta los bloques
+que no le interesan sin descomprimirlos. Los bloques nunca cruzan el día
+(UTC), y la retención borra días completos.
+
+La memoria está acotada: cada paciente acumula como mucho CHUNK_POINTS
+puntos por serie antes de escribirlos, y `flush()` vuelca además los que
+llevan más de FLUSH_SECONDS en memoria o cuando el total supera
+MAX_BUFFERED_POINTS.
+
+Las lecturas no se reparten por paciente en cada tick: `append_many`
+actualiza los agregados abiertos por columnas (NumPy) y deja las lecturas
+en tandas que se ordenan y reparten de una vez cada STAGE_POINTS puntos, al
+volcar o al consultar.
+"""
+import argparse
+import json
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+
+import numpy as np
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TS_DIR = os.getenv("VITALS_TS_DIR", os.path.join(BASE_DIR, ".tmp", "vitals_ts"))
+
+FIELDS = ("heart_rate", "temperature", "spo2", "systolic", "diastolic")
+ROLLUP_COLUMNS = tuple(f"{f}{suffix}" for f in FIELDS for suffix in ("", "_min", "_max"))
+RESOLUTIONS = {"1s": 1, "1m": 60, "1h": 3600}
+
+# Días que se conserva cada resolución
+RETENTION_DAYS = {
+    "1s": float(os.getenv("VITALS_TS_RETENTION_RAW_DAYS", "2")),
+    "1m": float(os.getenv("VITALS_TS_RETENTION_1M_DAYS", "30")),
+    "1h": float(os.getenv("VITALS_TS_RETENTION_1H_DAYS", "365")),
+}
+
+CHUNK_POINTS = 256
+MIN_TREND_SECONDS = 600
+FLUSH_SECONDS = 300
+MAX_BUFFERED_POINTS = int(os.getenv("VITALS_TS_MAX_BUFFERED", "2000000"))
+STAGE_POINTS = int(os.getenv("VITALS_TS_STAGE_POINTS", "500000"))
+
+SCALE = 10      # punto fijo: una décima
+_HEADER = struct.Struct("<4sIHqqI")   # magia, puntos, columnas, t_inicio, t_fin, bytes de datos
+_MAGIC = b"VTS1"
+
+
+def encode_block(ts, values):
+    """Bloque binario: cabecera + (Δt, Δvalores) en int32 comprimidos."""
+    ts = np.asarray(ts, dtype=np.int64)
+    fixed = np.round(np.nan_to_num(np.asarray(values, dtype=np.float64)) * SCALE).astype(np.int64)
+    dts = np.diff(ts, prepend=ts[0]).astype(np.int32)
+    dvals = np.diff(fixed, axis=0, prepend=np.zeros((1, fixed.shape[1]), dtype=np.int64)).astype(np.int32)
+    payload = zlib.compress(dts.tobytes() + dvals.tobytes(), 6)
+    return _HEADER.pack(_MAGIC, len(ts), fixed.shape[1], int(ts[0]), int(ts[-1]), len(payload)) + payload
+
+
+def decode_payload(n, ncols, t_start, payload):
+    raw = np.frombuffer(zlib.decompress(payload), dtype=np.int32)
+    ts = t_start + np.cumsum(raw[:n], dtype=np.int64)
+    values = np.cumsum(raw[n:].reshape(n, ncols), axis=0, dtype=np.int64) / SCALE
+    return ts, values
+
+
+def read_blocks(path, start, end):
+    """Bloques del archivo que se solapan con [start, end]; los demás se saltan sin leer sus datos."""
+    out = []
+    with open(path, "rb") as f:
+        while True:
+            header = f.read(_HEADER.size)
+            if len(header) < _HEADER.size:
+                break
+            magic, n, ncols, t_start, t_end, length = _HEADER.unpack(header)
+            if magic != _MAGIC:
+                break  # cola corrupta (escritura interrumpida): se ignora el resto
+            if t_end < start or t_start > end:
+                f.seek(length, os.SEEK_CUR)
+                continue
+            payload = f.read(length)
+            if len(payload) < length:
+                break
+            out.append(decode_payload(n, ncols, t_start, payload))
+    return out
+
+
+class _Rollups:
+    """Intervalos abiertos de todos los pacientes (una fila por paciente): suma, cuenta, mínimo y máximo."""
+
+    def __init__(self, step, ncols=len(FIELDS)):
+        self.step = step
+        self.bucket = np.zeros(0, dtype=np.int64)   # inicio del intervalo abierto, -1 si no hay
+        self.sum = np.zeros((0, ncols))
+        self.count = np.zeros(0, dtype=np.int64)
+        self.min = np.zeros((0, ncols))
+        self.max = np.zeros((0, ncols))
+
+    def grow(self, size):
+        old = len(self.bucket)
+        if size <= old:
+            return
+        size = max(size, 2 * old, 64)
+        self.bucket = np.concatenate([self.bucket, np.full(size - old, -1, dtype=np.int64)])
+        self.count = np.concatenate([self.count, np.zeros(size - old, dtype=np.int64)])
+        for name in ("sum", "min", "max"):
+            col = getattr(self, name)
+            setattr(self, name, np.concatenate([col, np.zeros((size - old, col.shape[1]))]))
+
+    def add(self, codes, t, mean, vmin, vmax, count):
+        """Añade un punto por paciente (`codes` sin repetidos); devuelve los intervalos que se cerraron."""
+        bucket = t // self.step * self.step
+        current = self.bucket[codes]
+        closed = self.emit(codes[(current >= 0) & (current != bucket)])
+        fresh = self.bucket[codes] < 0
+        new, old = codes[fresh], codes[~fresh]
+        self.bucket[new] = bucket[fresh]
+        self.sum[new] = mean[fresh] * count[fresh, None]
+        self.count[new] = count[fresh]
+        self.min[new] = vmin[fresh]
+        self.max[new] = vmax[fresh]
+        if old.size:
+            keep = ~fresh
+            self.sum[old] += mean[keep] * count[keep, None]
+            self.count[old] += count[keep]
+            self.min[old] = np.minimum(self.min[old], vmin[keep])
+            self.max[old] = np.maximum(self.max[old], vmax[keep])
+        return closed
+
+    def emit(self, codes):
+        """Cierra los intervalos abiertos de `codes`: (códigos, inicio, media, mínimo, máximo, cuenta)."""
+        codes = codes[self.bucket[codes] >= 0]
+        count = self.count[codes]
+        point = (codes, self.bucket[codes], self.sum[codes] / count[:, None],
+                 self.min[codes], self.max[codes], count)
+        self.bucket[codes] = -1
+        return point
+
+
+class _Series:
+    """Puntos pendientes de escribir de una serie (paciente, resolución)."""
+
+    __slots__ = ("ts", "rows", "since", "day")
+
+    def __init__(self):
+        self.ts = []
+        self.rows = []
+        self.since = None
+        self.day = None     # día UTC (t // 86400) del bloque en curso
+
+
+def _day(t):
+    return time.strftime("%Y-%m-%d", time.gmtime(t))
+
+
+def _safe_name(pid):
+    return re.sub(r"[^A-Za-z0-9_.-]", "_", str(pid))
+
+
+def _rollup_rows(mean, vmin, vmax):
+    """Filas en el orden de ROLLUP_COLUMNS: media, mínimo y máximo de cada signo."""
+    return np.stack([mean, vmin, vmax], axis=2).reshape(len(mean), -1)
+
+
+def _passes(codes):
+    """Reparte `codes` en pasadas sin pacientes repetidos, respetando el orden de llegada."""
+    if len(codes) < 2:
+        return [slice(None)]
+    order = np.argsort(codes, kind="stable")
+    ordered = codes[order]
+    starts = np.flatnonzero(np.r_[True, ordered[1:] != ordered[:-1]])
+    if len(starts) == len(codes):
+        return [slice(None)]
+    rank = np.empty(len(codes), dtype=np.int64)
+    rank[order] = np.arange(len(codes)) - np.repeat(starts, np.diff(np.r_[starts, len(codes)]))
+    return [np.flatnonzero(rank == r) for r in range(int(rank.max()) + 1)]
+
+
+class VitalsTSDB:
+    """Series temporales de signos vitales por paciente con agregados 1s → 1m → 1h."""
+
+    def __init__(self, root=TS_DIR, retention=None, chunk_points=CHUNK_POINTS,
+                 flush_seconds=FLUSH_SECONDS, max_buffered=MAX_BUFFERED_POINTS,
+                 stage_points=STAGE_POINTS):
+        self.root = root
+        self.retention = dict(RETENTION_DAYS, **(retention or {}))
+        self.chunk_points = chunk_points
+        self.flush_seconds = flush_seconds
+        self.max_buffered = max_buffered
+        self.stage_points = stage_points
+        self._series = {}     # (pid, resolución) -> _Series
+        self._codes = {}      # pid -> fila en los rollups
+        self._pids = []
+        self._last_batch = None   # (pids, filas) de la última llamada
+        self._minute = _Rollups(60)
+        self._hour = _Rollups(3600)
+        self._staged = {res: [] for res in RESOLUTIONS}   # tandas (filas, t, valores) sin repartir
+        self._staged_points = 0
+        self._buffered = 0
+        self._lock = threading.RLock()
+        self.points_written = 0
+        self.bytes_written = 0
+
+    # --- Escritura ---
+
+    def append(self, pid, t, values):
+        """Añade una lectura (valores en el orden de FIELDS)."""
+        self.append_many([pid], t, [values])
+
+    def append_many(self, pids, ts, values):
+        """
+        Varias lecturas de una vez (p. ej. un tick del motor de signos vitales); `ts` puede ser común.
+
+        El coste por tick es de NumPy: los agregados se actualizan por columnas y
+        las lecturas quedan en tandas que se reparten por paciente cada
+        `stage_points` puntos (o al volcar o consultar).
+        """
+        values = np.asarray(values, dtype=np.float64).reshape(len(pids), len(FIELDS))
+        seconds = np.broadcast_to(np.asarray(ts, dtype=np.float64), (len(pids),)).astype(np.int64)
+        with self._lock:
+            codes = self._encode(pids)
+            self._stage("1s", codes, seconds, values)
+            ones = np.ones(len(codes), dtype=np.int64)
+            for sel in _passes(codes):
+                c, v = codes[sel], values[sel]
+                self._close_minutes(self._minute.add(c, seconds[sel], v, v, v, ones[sel]))
+            if self._staged_points >= self.stage_points:
+                self._drain()
+            if self._buffered > self.max_buffered:
+                self._flush_locked(max_age=0)
+
+    def _encode(self, pids):
+        pids = list(pids)
+        # El motor manda las mismas camas tick tras tick: comparar la lista sale más barato
+        if self._last_batch is not None and self._last_batch[0] == pids:
+            return self._last_batch[1]
+        codes = self._codes
+        out = np.array([codes.get(pid, -1) for pid in pids], dtype=np.int64)
+        missing = np.flatnonzero(out < 0)
+        if missing.size:
+            for i in missing.tolist():
+                pid = pids[i]
+                if pid not in codes:
+                    codes[pid] = len(self._pids)
+                    self._pids.append(pid)
+                out[i] = codes[pid]
+            self._minute.grow(len(self._pids))
+            self._hour.grow(len(self._pids))
+        self._last_batch = (pids, out)
+        return out
+
+    def _close_minutes(self, closed):
+        codes, bucket, mean, vmin, vmax, count = closed
+        if not codes.size:
+            return
+        self._stage("1m", codes, bucket, _rollup_rows(mean, vmin, vmax))
+        codes, bucket, mean, vmin, vmax, _ = self._hour.add(codes, bucket, mean, vmin, vmax, count)
+        if codes.size:
+            self._stage("1h", codes, bucket, _rollup_rows(mean, vmin, vmax))
+
+    def _stage(self, res, codes, ts, rows):
+        self._staged[res].append((codes, ts, rows))
+        self._staged_points += len(codes)
+        self._buffered += len(codes)
+
+    def _drain(self):
+        """Reparte las tandas acumuladas entre las series de cada paciente."""
+        for res, batches in self._staged.items():
+            if not batches:
+                continue
+            self._staged[res] = []
+            codes = np.concatenate([b[0] for b in batches])
+            ts = np.concatenate([b[1] for b in batches])
+            rows = np.concatenate([b[2] for b in batches])
+            self._buffered -= len(codes)
+            order = np.lexsort((ts, codes))     # estable: a igual segundo manda el orden de llegada
+            codes, ts, rows = codes[order], ts[order], rows[order]
+            if res == "1s":
+                # Una lectura por segundo como mucho (la más reciente gana)
+                last = np.r_[(codes[1:] != codes[:-1]) | (ts[1:] != ts[:-1]), True]
+                codes, ts, rows = codes[last], ts[last], rows[last]
+            days = ts // 86400
+            starts = np.flatnonzero(np.r_[True, codes[1:] != codes[:-1]])
+            ends = np.r_[starts[1:], len(codes)]
+            for s, e in zip(starts.tolist(), ends.tolist()):
+                self._push_many(self._pids[codes[s]], res, ts[s:e], rows[s:e], days[s:e])
+        self._staged_points = 0
+
+    def _get_series(self, pid, res):
+        series = self._series.get((pid, res))
+        if series is None:
+            series = self._series[(pid, res)] = _Series()
+        return series
+
+    def _push_many(self, pid, res, ts, rows, days):
+        """Añade puntos ordenados de un paciente, escribiendo cada bloque que se llena."""
+        series = self._get_series(pid, res)
+        if res == "1s" and series.ts and series.ts[-1] == ts[0]:
+            series.rows[-1] = rows[0]
+            ts, rows, days = ts[1:], rows[1:], days[1:]
+        i, n = 0, len(ts)
+        while i < n:
+            day = int(days[i])
+            # Un bloque nunca cruza el día: así la retención borra días enteros
+            if series.ts and (day != series.day or len(series.ts) >= self.chunk_points):
+                self._write(pid, res, series)
+            if not series.ts:
+                series.since = time.time()
+                series.day = day
+            end = min(n, i + self.chunk_points - len(series.ts))
+            if days[end - 1] != day:
+                end = i + int(np.searchsorted(days[i:end], day, side="right"))
+            series.ts.extend(ts[i:end].tolist())
+            series.rows.extend(rows[i:end])
+            self._buffered += end - i
+            i = end
+
+    def _write(self, pid, res, series):
+        block = encode_block(series.ts, np.vstack(series.rows))
+        directory = os.path.join(self.root, res, _day(series.day * 86400))
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, _safe_name(pid) + ".vts"), "ab") as f:
+            f.write(block)
+        self.points_written += len(series.ts)
+        self.bytes_written += len(block)
+        self._buffered -= len(series.ts)
+        series.ts, series.rows, series.since = [], [], None
+
+    def flush(self, max_age=None):
+        """Escribe los bloques pendientes con más de `max_age` segundos (todos si es 0)."""
+        with self._lock:
+            return self._flush_locked(self.flush_seconds if max_age is None else max_age)
+
+    def _flush_locked(self, max_age):
+        self._drain()
+        now = time.time()
+        written = 0
+        for (pid, res), series in self._series.items():
+            if series.ts and now - series.since >= max_age:
+                written += len(series.ts)
+                self._write(pid, res, series)
+        return written
+
+    def close(self):
+        """Cierra los intervalos abiertos (parciales) y escribe todo lo pendiente."""
+        with self._lock:
+            everyone = np.arange(len(self._pids))
+            self._close_minutes(self._minute.emit(everyone))
+            codes, bucket, mean, vmin, vmax, _ = self._hour.emit(everyone)
+            if codes.size:
+                self._stage("1h", codes, bucket, _rollup_rows(mean, vmin, vmax))
+            self._flush_locked(max_age=0)
+
+    # --- Retención ---
+
+    def enforce_retention(self, now=None):
+        """Borra los días que superan la retención de cada resolución. Devuelve cuántos se borraron."""
+        now = time.time() if now is None else now
+        removed = 0
+        for res, days in self.retention.items():
+            directory = os.path.join(self.root, res)
+            if not os.path.isdir(directory):
+                continue
+            # Se conserva el día si alguna parte cae dentro de la ventana
+            cutoff = _day(now - days * 86400)
+            for day in os.listdir(directory):
+                if day < cutoff:
+                    shutil.rmtree(os.path.join(directory, day), ignore_errors=True)
+                    removed += 1
+        return removed
+
+    # --- Consultas ---
+
+    @staticmethod
+    def pick_resolution(start, end):
+        span = end - start
+        if span <= 2 * 3600:
+            return "1s"
+        if span <= 3 * 86400:
+            return "1m"
+        return "1h"
+
+    def query(self, pid, start, end, resolution=None):
+        """
+        Serie de un paciente en [start, end].
+
+        Devuelve {"resolution", "ts", "columns": {nombre: array}}; si no se indica
+        resolución se elige por la amplitud de la ventana.
+        """
+        res = resolution or self.pick_resolution(start, end)
+        with self._lock:
+            self._drain()
+        names = FIELDS if res == "1s" else ROLLUP_COLUMNS
+        parts = []
+        day = int(start) // 86400 * 86400
+        while day <= end:
+            path = os.path.join(self.root, res, _day(day), _safe_name(pid) + ".vts")
+            if os.path.exists(path):
+                parts.extend(read_blocks(path, start, end))
+            day += 86400
+        with self._lock:
+            series = self._series.get((pid, res))
+            if series and series.ts:
+                parts.append((np.asarray(series.ts, dtype=np.int64), np.vstack(series.rows)))
+        if parts:
+            ts = np.concatenate([p[0] for p in parts])
+            values = np.concatenate([p[1] for p in parts])
+            keep = (ts >= start) & (ts <= end)
+            order = np.argsort(ts[keep], kind="stable")
+            ts, values = ts[keep][order], values[keep][order]
+        else:
+            ts, values = np.zeros(0, dtype=np.int64), np.zeros((0, len(names)))
+        return {"resolution": res, "ts": ts, "columns": {n: values[:, i] for i, n in enumerate(names)}}
+
+    def summary(self, pid, seconds=3600, now=None):
+        """Media, mínimo, máximo y pendiente (por hora, o None si hay pocos datos) de cada signo en la ventana."""
+        now = time.time() if now is None else now
+        data = self.query(pid, now - seconds, now)
+        ts = data["ts"]
+        if not len(ts):
+            return {}
+        out = {"points": int(len(ts)), "resolution": data["resolution"]}
+        for field in FIELDS:
+            mean = data["columns"][field]
+            lo = data["columns"].get(field + "_min", mean)
+            hi = data["columns"].get(field + "_max", mean)
+            slope = None
+            # Con menos de MIN_TREND_SECONDS de datos la pendiente solo extrapola ruido
+            if ts[-1] - ts[0] >= MIN_TREND_SECONDS:
+                slope = round(float(np.polyfit((ts - ts[0]) / 3600.0, mean, 1)[0]), 2)
+            out[field] = {"mean": round(float(mean.mean()), 1), "min": round(float(lo.min()), 1),
+                          "max": round(float(hi.max()), 1), "slope_per_hour": slope}
+        return out
+
+    def stats(self):
+        with self._lock:
+            self._drain()
+            return {"series": len(self._series), "buffered_points": self._buffered,
+                    "points_written": self.points_written, "bytes_written": self.bytes_written}
+
+
+_tsdb = None
+_tsdb_lock = threading.Lock()
+
+
+def get_tsdb():
+    """Histórico compartido por todo el proceso."""
+    global _tsdb
+    with _tsdb_lock:
+        if _tsdb is None:
+            _tsdb = VitalsTSDB()
+        return _tsdb
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Consulta el histórico de signos vitales de un paciente.")
+    parser.add_argument("--patient", required=True, help="ID del paciente (ej: SIM-001).")
+    parser.add_argument("--hours", type=float, default=1, help="Ventana hacia atrás, en horas.")
+    parser.add_argument("--resolution", choices=sorted(RESOLUTIONS), help="Forzar resolución.")
+    args = parser.parse_args(argv)
+
+    tsdb = VitalsTSDB()
+    now = time.time()
+    data = tsdb.query(args.patient, now - args.hours * 3600, now, args.resolution)
+    print(json.dumps({
+        "status": "success",
+        "patient": args.patient,
+        "resolution": data["resolution"],
+        "ts": data["ts"].tolist(),
+        "columns": {k: v.tolist() for k, v in data["columns"].items()},
+    }))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,245 @@
+#!/usr/bin/env python3
+"""
+Pool de procesos trabajadores "calientes" para ejecutar herramientas.
+
+Cada trabajador es un proceso de larga vida creado desde un forkserver con los
+módulos pesados (chromadb, google-generativeai, ...) ya importados. Recibe
+invocaciones `(script, args)` por un Pipe, las ejecuta con el `ToolRegistry`
+en proceso y devuelve el mismo JSON que `run_tool`. Los trabajadores se
+reciclan tras N llamadas o si su memoria crece por encima de un límite.
+"""
+import argparse
+import json
+import multiprocessing
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import Future
+
+try:
+    import psutil
+except ImportError:
+    psutil = None
+
+from tool_registry import IN_PROCESS_TOOLS, TOOLS_DIR
+
+# Módulos que se importan en el forkserver y heredan todos los trabajadores.
+# Solo incluimos los que toleran dependencias faltantes (chat_with_llm ya importa
+# chromadb y google-generativeai si están instalados); un sys.exit() al importar
+# tumbaría el forkserver.
+PRELOAD_MODULES = ["tool_registry", "telegram_tool", "chat_with_llm"]
+
+
+def _rss_mb():
+    """Memoria residente del proceso actual en MB."""
+    if psutil:
+        return psutil.Process().memory_info().rss / (1024 * 1024)
+    import resource
+    # ru_maxrss está en KB en Linux (es el pico, suficiente para detectar crecimiento)
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _worker_main(conn, tools):
+    """Bucle del trabajador: recibe (script, args) y responde (resultado, rss_mb)."""
+    if TOOLS_DIR not in sys.path:
+        sys.path.insert(0, TOOLS_DIR)
+    from tool_registry import ToolRegistry
+
+    registry = ToolRegistry(tools=tools, mode="inprocess")
+    registry.preload()
+    conn.send(("ready", _rss_mb()))
+    while True:
+        try:
+            task = conn.recv()
+        except (EOFError, KeyboardInterrupt):
+            break
+        if task is None:
+            break
+        script, args = task
+        try:
+            result = registry.run(script, args)
+        except Exception as e:
+            result = {"status": "error", "message": f"Trabajador: {e}"}
+        conn.send((result, _rss_mb()))
+    conn.close()
+
+
+class _Worker:
+    """Un proceso trabajador y su extremo del Pipe."""
+
+    def __init__(self, ctx, tools):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, tools), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.calls = 0
+        self.rss_mb = 0.0
+        self.started = time.time()
+
+    def wait_ready(self, timeout):
+        if not self.conn.poll(timeout):
+            raise TimeoutError("El trabajador no terminó de precargar a tiempo.")
+        _, self.rss_mb = self.conn.recv()
+        self.base_rss_mb = self.rss_mb
+
+    def stop(self):
+        try:
+            self.conn.send(None)
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=2)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """Pool de trabajadores precargados que reemplaza a `subprocess.run` por llamada."""
+
+    def __init__(self, size=2, tools=IN_PROCESS_TOOLS, max_calls=200, max_rss_growth_mb=512,
+                 timeout=300, preload_modules=PRELOAD_MODULES):
+        self.size = size
+        self.tools = tuple(tools)
+        self.max_calls = max_calls
+        self.max_rss_growth_mb = max_rss_growth_mb
+        self.timeout = timeout
+        methods = multiprocessing.get_all_start_methods()
+        self._ctx = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        if self._ctx.get_start_method() == "forkserver":
+            # El forkserver importa los módulos pesados una sola vez; cada fork los hereda
+            if TOOLS_DIR not in sys.path:
+                sys.path.insert(0, TOOLS_DIR)
+            self._ctx.set_forkserver_preload(list(preload_modules))
+        self._tasks = queue.Queue()
+        self._threads = []
+        self._busy = 0
+        self._lock = threading.Lock()
+        self._running = False
+        self.stats_counters = {"completed": 0, "timeouts": 0, "recycled": 0, "crashes": 0}
+
+    def start(self):
+        self._running = True
+        for i in range(self.size):
+            t = threading.Thread(target=self._slot_loop, name=f"tool-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def _spawn(self):
+        worker = _Worker(self._ctx, self.tools)
+        worker.wait_ready(timeout=120)
+        return worker
+
+    def _needs_recycle(self, worker):
+        if worker.calls >= self.max_calls:
+            return True
+        return worker.rss_mb - worker.base_rss_mb > self.max_rss_growth_mb
+
+    def _count(self, name):
+        with self._lock:
+            self.stats_counters[name] += 1
+
+    def _slot_loop(self):
+        worker = None
+        while self._running:
+            try:
+                item = self._tasks.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if item is None:
+                break
+            script, args, future = item
+            if not future.set_running_or_notify_cancel():
+                continue
+            with self._lock:
+                self._busy += 1
+            try:
+                if worker is None or not worker.process.is_alive():
+                    worker = self._spawn()
+                worker.conn.send((script, [str(a) for a in args]))
+                if worker.conn.poll(self.timeout):
+                    result, worker.rss_mb = worker.conn.recv()
+                    worker.calls += 1
+                    self._count("completed")
+                    future.set_result(result)
+                else:
+                    print(f"   ⏱️  [POOL] {script} excedió {self.timeout}s. Reiniciando trabajador...", file=sys.stderr)
+                    self._count("timeouts")
+                    worker.process.kill()
+                    worker.stop()
+                    worker = None
+                    future.set_result(None)
+                    continue
+                if self._needs_recycle(worker):
+                    self._count("recycled")
+                    worker.stop()
+                    worker = None
+            except Exception as e:
+                print(f"   ❌ [POOL] Trabajador caído ejecutando {script}: {e}", file=sys.stderr)
+                self._count("crashes")
+                if worker is not None:
+                    worker.stop()
+                worker = None
+                if not future.done():
+                    future.set_result(None)
+            finally:
+                with self._lock:
+                    self._busy -= 1
+        if worker is not None:
+            worker.stop()
+
+    def submit(self, script, args):
+        """Encola una invocación y devuelve un Future con el JSON de la herramienta."""
+        if not self._running:
+            raise RuntimeError("El pool de trabajadores no está iniciado.")
+        future = Future()
+        self._tasks.put((script, list(args), future))
+        return future
+
+    def run(self, script, args):
+        """Versión bloqueante de submit() con el mismo contrato que run_tool."""
+        return self.submit(script, args).result()
+
+    def queue_depth(self):
+        return self._tasks.qsize()
+
+    def stats(self):
+        with self._lock:
+            return {"workers": self.size, "busy": self._busy, "queue_depth": self.queue_depth(), **self.stats_counters}
+
+    def shutdown(self):
+        self._running = False
+        for _ in self._threads:
+            self._tasks.put(None)
+        for t in self._threads:
+            t.join(timeout=5)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Ejecutar una herramienta a través del pool de trabajadores (diagnóstico).")
+    parser.add_argument("--workers", type=int, default=2, help="Número de trabajadores.")
+    parser.add_argument("--tool", required=True, help="Script a ejecutar (ej: monitor_resources.py).")
+    parser.add_argument("--repeat", type=int, default=3, help="Número de invocaciones.")
+    parser.add_argument("tool_args", nargs=argparse.REMAINDER, help="Argumentos para la herramienta.")
+    args = parser.parse_args(argv)
+
+    tool_args = args.tool_args[1:] if args.tool_args[:1] == ["--"] else args.tool_args
+
+    pool = WorkerPool(size=args.workers).start()
+    timings = []
+    result = None
+    try:
+        for _ in range(args.repeat):
+            start = time.time()
+            result = pool.run(args.tool, tool_args)
+            timings.append(round(time.time() - start, 3))
+    finally:
+        stats = pool.stats()
+        pool.shutdown()
+    print(json.dumps({"status": "success", "timings_s": timings, "pool": stats, "last_result": result}, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()